@@ -7,12 +7,26 @@ from discord.ext import commands, tasks
 from discord import app_commands
 import time
 from datetime import datetime, timedelta, date
-import redis.asyncio as redis
 import math
 from collections import defaultdict
 import re
 import json
 
+from shared.activity_bitmap import queue_active, user_indexes
+from shared.backfill import BackfillEngine, BackfillSource, BackfillTask
+from shared.jobs import JobWorker
+from shared.event_index import index_member, event_members
+from shared.event_codec import encode_event, decode_event
+from shared.rollups import rebuild_rollup_days
+from shared.batch_reader import read_ranges
+from shared.ingest_bus import get_ingest_bus
+from shared.event_stream import append as append_stream, start_consumers
+from shared.stream_aggregators import default_aggregators
+from shared.metrics import REGISTRY
+from shared.profile_cache import ProfileCache
+from shared.redis_client import shared_client
+from shared.retention import SWEEP_INTERVAL, sweep_guilds
+
 
 
 
@@ -30,16 +44,148 @@ LEAD_IN_CHAR = 1.0
 LEAD_IN_REPLY = 60.0  
 
 import os
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# rate() of this counter gives events per second per guild
+EVENTS = REGISTRY.counter("events", "Activity events ingested, by guild and kind")
+
+VERIFICATION_LOG_CHANNEL_ID = 1404416148077809705
+RE_VERIFY_APPROVE = re.compile(r"Schválil <@!?(\d+)>")
+RE_VERIFY_BYPASS = re.compile(r"Manuální bypass - <@!?(\d+)>")
+
+
+def _action_type(entry: discord.AuditLogEntry):
+    if entry.action == discord.AuditLogAction.ban:
+        return "ban"
+    if entry.action == discord.AuditLogAction.kick:
+        return "kick"
+    if entry.action == discord.AuditLogAction.unban:
+        return "unban"
+    if entry.action == discord.AuditLogAction.member_update:
+        if hasattr(entry.after, "timed_out_until") and entry.after.timed_out_until:
+            return "timeout"
+    elif entry.action == discord.AuditLogAction.member_role_update:
+        return "role_update"
+    elif entry.action == discord.AuditLogAction.message_delete:
+        return "msg_delete"
+    return None
+
+
+def _history_after(cursor, window_start: float):
+    return discord.Object(id=cursor) if cursor else datetime.fromtimestamp(window_start)
+
+
+def _backfill_start(days: int) -> datetime:
+    discord_epoch = datetime(2015, 1, 1)
+    return max(datetime.now() - timedelta(days=days), discord_epoch)
+
+
+def _backfill_sources(guild: discord.Guild) -> list:
+    sources = [
+        BackfillSource(str(channel.id), lambda cursor, start, channel=channel: channel.history(
+            limit=None, after=_history_after(cursor, start), oldest_first=True))
+        for channel in guild.text_channels
+    ]
+    sources.append(BackfillSource("audit", lambda cursor, start: guild.audit_logs(
+        limit=None, after=_history_after(cursor, start), oldest_first=True)))
+    log_ch = guild.get_channel(VERIFICATION_LOG_CHANNEL_ID)
+    if log_ch:
+        sources.append(BackfillSource("verification", lambda cursor, start: log_ch.history(
+            limit=None, after=_history_after(cursor, start), oldest_first=True)))
+    return sources
+
+
+class ActivityBackfill(BackfillTask):
+    """Raw msg/action events of the backfill window, written in the live member format."""
+
+    job = "activity"
+
+    def __init__(self, cog: "ActivityMonitor"):
+        self.cog = cog
+
+    def skip_error(self, exc):
+        return isinstance(exc, discord.Forbidden)
+
+    async def reset(self, r, gid):
+        keys = []
+        async for k in r.scan_iter(f"activity:stats:{gid}:*"): keys.append(k)
+        async for k in r.scan_iter(f"activity:day:*:{gid}:*"): keys.append(k)
+        for i in range(0, len(keys), 500):
+            await r.delete(*keys[i:i + 500])
+
+    async def apply(self, pipe, gid, batch):
+        # mid/id in the member make re-reads (resume, overlap with live events) idempotent
+        events = defaultdict(dict)
+        counts = defaultdict(int)
+        profiles = {}
+        active_days = defaultdict(set)
+        for source, item in batch:
+            ts = item.created_at.timestamp()
+            if source == "audit":
+                action_type = _action_type(item) if item.user and not item.user.bot else None
+                if not action_type:
+                    continue
+                events[("action", item.user.id)][encode_event("action", {"type": action_type, "id": item.id})] = ts
+                counts["actions"] += 1
+                if isinstance(item.user, discord.Member):
+                    profiles[item.user.id] = item.user
+            elif source == "verification":
+                if item.author.id != self.cog.bot.user.id:
+                    continue
+                m = RE_VERIFY_APPROVE.search(item.content) or RE_VERIFY_BYPASS.search(item.content)
+                if not m:
+                    continue
+                member = encode_event("action", {"type": "verification", "id": item.id})
+                events[("action", int(m.group(1)))][member] = ts
+                counts["verifications"] += 1
+            elif not item.author.bot:
+                member = encode_event("msg", {"mid": item.id, "len": len(item.content),
+                                              "reply": item.reference is not None})
+                events[("msg", item.author.id)][member] = ts
+                active_days[item.created_at.strftime("%Y%m%d")].add(item.author.id)
+                counts["messages"] += 1
+                profiles[item.author.id] = item.author
+        for (kind, uid), mapping in events.items():
+            pipe.zadd(f"events:{kind}:{gid}:{uid}", mapping)
+            index_member(pipe, gid, kind, uid)
+        if active_days:
+            indexes = await user_indexes(self.cog.r, gid, {uid for uids in active_days.values() for uid in uids})
+            for day, uids in active_days.items():
+                queue_active(pipe, gid, day, sorted(indexes[str(uid)] for uid in uids))
+        # Unchanged profiles are skipped by the profile cache
+        for user in profiles.values():
+            await self.cog._update_user_info(user)
+        return counts
+
+    async def finish(self, r, gid, window_start):
+        # Imported history lands in days that may already have live rollups
+        start = datetime.fromtimestamp(window_start)
+        touched = [start + timedelta(days=i) for i in range((datetime.now() - start).days + 1)]
+        await rebuild_rollup_days(r, gid, touched)
 
 class ActivityMonitor(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.pool = redis.ConnectionPool.from_url(REDIS_URL, decode_responses=True)
-        self.r = redis.Redis(connection_pool=self.pool)
+        self.r = shared_client()
+        self.bus = get_ingest_bus(bot)
+        # Fingerprints of the last written user:info fields, so unchanged profiles are not rewritten per message
+        self.profiles = ProfileCache()
+        # Stream aggregators run in the bot too; STREAM_INLINE_CONSUMERS=0 leaves them to scripts.stream_aggregator
+        self._stream_tasks = []
+        if os.getenv("STREAM_INLINE_CONSUMERS", "1") != "0":
+            self._stream_tasks = start_consumers(self.r, default_aggregators())
+        # Dashboard backfills are queued jobs; only a bot that is in the guild claims them
+        self.jobs = JobWorker(self.r, {"backfill": self._backfill_job},
+                              concurrency=int(os.getenv("BACKFILL_JOB_CONCURRENCY", "2")),
+                              accepts=lambda job: self.bot.get_guild(int(job["gid"])) is not None,
+                              name=f"bot-{os.getpid()}")
 
     async def cog_unload(self):
-        await self.pool.disconnect()
+        self.retention_loop.cancel()
+        await self.jobs.stop()
+        for task in self._stream_tasks:
+            task.cancel()
+        # The shared pool outlives the cog
+        await self.bus.flush()
 
     async def get_action_weights(self) -> dict:
         """Fetch action weights from Redis or use defaults."""
@@ -74,34 +220,68 @@ class ActivityMonitor(commands.Cog):
     def _k_state(self, gid: int, uid: int, key: str) -> str:
         return f"activity:state:{gid}:{uid}:{key}"
 
-    async def _update_user_info(self, user: discord.Union[discord.Member, discord.User]):
-        """Cache user info in Redis for Dashboard."""
+    async def _update_user_info(self, user: discord.Union[discord.Member, discord.User], force: bool = False):
+        """Cache user info in Redis for Dashboard (only fields that changed since the last write)."""
         if user.bot: return
         key = f"user:info:{user.id}"
         
-        
-        
-        name = user.display_name
-        avatar = user.display_avatar.url
-        
-        
-        roles = ""
+        mapping = {"name": user.display_name, "avatar": user.display_avatar.url}
+        # Roles and join date are per guild; a bare User must not blank them
         if isinstance(user, discord.Member):
-            roles = ",".join(str(r.id) for r in user.roles)
-            
-        mapping = {"name": name, "avatar": avatar, "roles": roles}
-        if isinstance(user, discord.Member) and user.joined_at:
-            mapping["joined_at"] = str(user.joined_at.timestamp())
+            mapping["roles"] = ",".join(str(r.id) for r in user.roles)
+            if user.joined_at:
+                mapping["joined_at"] = str(user.joined_at.timestamp())
         
+        changed = self.profiles.diff(user.id, mapping, force=force)
+        if changed:
+            # Remembered only once written, so a failed write is retried by the next event
+            full = True if force else None
+            self.bus.emit("user_info", lambda pipe: pipe.hset(key, mapping=changed),
+                          on_done=lambda: self.profiles.mark(user.id, changed, full=full))
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if (before.display_name, before.display_avatar, before.roles) != (after.display_name, after.display_avatar, after.roles):
+            await self._update_user_info(after)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before: discord.User, after: discord.User):
+        if (before.display_name, before.display_avatar) != (after.display_name, after.display_avatar):
+            await self._update_user_info(after)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        await self._sync_guild_roles(role.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if before.name != after.name:
+            await self._sync_guild_roles(after.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        await self._sync_guild_roles(role.guild)
+
+    async def _sync_guild_roles(self, guild: discord.Guild) -> int:
+        """Rewrite the role ID -> name hash of the guild."""
+        roles_key = f"guild:roles:{guild.id}"
+        role_map = {str(r.id): r.name for r in guild.roles if r.name != "@everyone"}
         async with self.r.pipeline() as pipe:
-            pipe.hset(key, mapping=mapping)
+            pipe.delete(roles_key)
+            if role_map:
+                pipe.hset(roles_key, mapping=role_map)
             await pipe.execute()
+        return len(role_map)
 
     
     @commands.Cog.listener()
     async def on_ready(self):
         print(f"Logged in as {self.bot.user} (ID: {self.bot.user.id})")
         self.usage_loop.start()
+        if not self.retention_loop.is_running():
+            self.retention_loop.start()
+        if os.getenv("BOT_LITE_MODE") != "1":
+            self.jobs.start()
 
     @tasks.loop(minutes=1.0)
     async def usage_loop(self):
@@ -110,6 +290,17 @@ class ActivityMonitor(commands.Cog):
         
         now = time.time()
         
+    @tasks.loop(seconds=SWEEP_INTERVAL)
+    async def retention_loop(self):
+        """Expire old events (and enforce the per-guild budget) off the ingestion path."""
+        from shared.config import settings
+        reports = await sweep_guilds(self.r, [g.id for g in self.bot.guilds],
+                                     settings.event_retention_days, settings.event_budget_per_guild)
+        reclaimed = {gid: rep for gid, rep in reports.items() if rep["expired"] or rep["trimmed"]}
+        for gid, rep in reclaimed.items():
+            print(f"[Retention] Guild {gid}: expired {rep['expired']}, trimmed {rep['trimmed']}, "
+                  f"emptied {rep['emptied']} keys, {rep['remaining']} events left")
+
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
@@ -144,22 +335,34 @@ class ActivityMonitor(commands.Cog):
         
         
         
-        key = f"events:msg:{message.guild.id}:{message.author.id}"
         ts = message.created_at.timestamp()
-        event_data = json.dumps({
+        # cid/len feed the dashboard counters; the lock makes a message count once across bot processes
+        await self._write_event(message.guild.id, message.author.id, "msg", {
             "mid": message.id,
             "len": len(message.content),
             "reply": message.reference is not None
-        })
-        
-        await self.r.zadd(key, {event_data: ts})
-        
-        from shared.config import settings
-        cutoff = time.time() - (settings.event_retention_days * 86400)
-        await self.r.zremrangebyscore(key, "-inf", cutoff)
+        }, ts, extra={"cid": message.channel.id, "len": len(message.content)},
+            once_key=f"lock:msg:{message.id}")
         
         await self._update_user_info(message.author)
 
+    async def _write_event(self, gid: int, uid: int, kind: str, event: dict, ts: float,
+                           extra: dict = None, once_key: str = None):
+        """Store the raw event and append it to the guild stream, from which the aggregators derive counters."""
+        member = encode_event(kind, event)
+        fields = {"type": "event", "kind": kind, "uid": uid, "ts": ts, "member": member}
+        fields.update(extra or {})
+        EVENTS.labels(guild=gid, kind=kind).inc()
+
+        def apply(pipe):
+            # The raw event does not depend on the stream outliving a stalled aggregator
+            pipe.zadd(f"events:{kind}:{gid}:{uid}", {member: ts})
+            index_member(pipe, gid, kind, uid)
+            append_stream(pipe, gid, fields)
+
+        # Raw events are the source of truth: wait for queue space rather than drop
+        await self.bus.emit_wait("event", apply, once_key=once_key)
+
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
@@ -190,47 +393,18 @@ class ActivityMonitor(commands.Cog):
                     lock_key = f"lock:voice:{uid}:{int(start)}"
                     if await self.r.set(lock_key, "1", ex=60, nx=True):
                         
-                        key = f"events:voice:{gid}:{uid}"
-                        event_data = json.dumps({"duration": int(duration), "ts": int(start)})
-                        await self.r.zadd(key, {event_data: start})
-                        from shared.config import settings
-                        cutoff = time.time() - (settings.event_retention_days * 86400)
-                        await self.r.zremrangebyscore(key, "-inf", cutoff)
+                        await self._write_event(gid, uid, "voice", {"duration": int(duration), "ts": int(start)}, start)
                 await self.r.delete(k_voice)
 
     @commands.Cog.listener()
     async def on_audit_log_entry_create(self, entry: discord.AuditLogEntry):
         if not entry.guild or not entry.user or entry.user.bot: return
         
-        gid = entry.guild.id
-        uid = entry.user.id
-        ts = entry.created_at.timestamp()
-        
-        action_type = None
-        
-        if entry.action == discord.AuditLogAction.ban:
-            action_type = "ban"
-        elif entry.action == discord.AuditLogAction.kick:
-            action_type = "kick"
-        elif entry.action == discord.AuditLogAction.unban:
-            action_type = "unban"
-        elif entry.action == discord.AuditLogAction.member_update:
-            
-            if hasattr(entry.after, "timed_out_until") and entry.after.timed_out_until:
-                action_type = "timeout"
-        elif entry.action == discord.AuditLogAction.member_role_update:
-            action_type = "role_update"
-        elif entry.action == discord.AuditLogAction.message_delete:
-            action_type = "msg_delete"
-            
+        action_type = _action_type(entry)
         if action_type:
             
-            key = f"events:action:{gid}:{uid}"
-            event_data = json.dumps({"type": action_type, "id": entry.id})
-            await self.r.zadd(key, {event_data: ts})
-            from shared.config import settings
-            cutoff = time.time() - (settings.event_retention_days * 86400)
-            await self.r.zremrangebyscore(key, "-inf", cutoff)
+            await self._write_event(entry.guild.id, entry.user.id, "action", {"type": action_type, "id": entry.id},
+                                    entry.created_at.timestamp())
             await self._update_user_info(entry.user)
 
     
@@ -271,29 +445,30 @@ class ActivityMonitor(commands.Cog):
         
         
         msg_key = f"events:msg:{gid}:{uid}"
-        messages = await self.r.zrangebyscore(msg_key, day_start, day_end)
+        voice_key = f"events:voice:{gid}:{uid}"
+        action_key = f"events:action:{gid}:{uid}"
+        rows = await read_ranges(self.r, [msg_key, voice_key, action_key], day_start, day_end)
+        messages = rows[msg_key]
         
         for msg_json in messages:
-            msg_data = json.loads(msg_json)
+            msg_data = decode_event(msg_json)
             stats["messages"] += 1
             stats["chat_time"] += msg_data["len"] * weights.get("chat_time", 1)
             
             
         
         
-        voice_key = f"events:voice:{gid}:{uid}"
-        voice_sessions = await self.r.zrangebyscore(voice_key, day_start, day_end)
+        voice_sessions = rows[voice_key]
         
         for vs_json in voice_sessions:
-            vs_data = json.loads(vs_json)
+            vs_data = decode_event(vs_json)
             stats["voice_time"] += vs_data["duration"] * weights.get("voice_time", 1)
         
         
-        action_key = f"events:action:{gid}:{uid}"
-        actions = await self.r.zrangebyscore(action_key, day_start, day_end)
+        actions = rows[action_key]
         
         for action_json in actions:
-            action_data = json.loads(action_json)
+            action_data = decode_event(action_json)
             action_type = action_data["type"]
             
             
@@ -320,23 +495,15 @@ class ActivityMonitor(commands.Cog):
         await itx.response.defer()
         
         
-        roles_key = f"guild:roles:{itx.guild.id}"
-        role_map = {str(r.id): r.name for r in itx.guild.roles if r.name != "@everyone"}
-        
-        async with self.r.pipeline() as pipe:
-            pipe.delete(roles_key)
-            if role_map:
-                pipe.hset(roles_key, mapping=role_map)
-            await pipe.execute()
-            
+        role_count = await self._sync_guild_roles(itx.guild)
         
         count = 0
         for member in itx.guild.members:
             if not member.bot:
-                await self._update_user_info(member)
+                await self._update_user_info(member, force=True)
                 count += 1
                 
-        await itx.followup.send(f"✅ Synchronizováno **{count}** členů a **{len(role_map)}** rolí.")
+        await itx.followup.send(f"✅ Synchronizováno **{count}** členů a **{role_count}** rolí.")
 
     @act_group.command(name="stats", description="Zobrazí statistiky (lze filtrovat datem).")
     @app_commands.describe(
@@ -389,29 +556,30 @@ class ActivityMonitor(commands.Cog):
         
         
         msg_key = f"events:msg:{gid}:{uid}"
-        messages = await self.r.zrangebyscore(msg_key, ts_start, ts_end)
+        voice_key = f"events:voice:{gid}:{uid}"
+        action_key = f"events:action:{gid}:{uid}"
+        rows = await read_ranges(self.r, [msg_key, voice_key, action_key], ts_start, ts_end)
+        messages = rows[msg_key]
         for msg_json in messages:
-            msg_data = json.loads(msg_json)
+            msg_data = decode_event(msg_json)
             data["messages"] += 1
             data["chat_time"] += msg_data["len"] * weights.get("chat_time", 1)
         
         
-        voice_key = f"events:voice:{gid}:{uid}"
-        voice_sessions = await self.r.zrangebyscore(voice_key, ts_start, ts_end)
+        voice_sessions = rows[voice_key]
         for vs_json in voice_sessions:
-            vs_data = json.loads(vs_json)
+            vs_data = decode_event(vs_json)
             data["voice_time"] += vs_data["duration"] * weights.get("voice_time", 1)
         
         
-        action_key = f"events:action:{gid}:{uid}"
-        actions = await self.r.zrangebyscore(action_key, ts_start, ts_end)
+        actions = rows[action_key]
         metric_map = {
             "ban": "bans", "kick": "kicks", "timeout": "timeouts",
             "unban": "unbans", "role_update": "role_updates",
             "msg_delete": "msg_deleted", "verification": "verifications"
         }
         for action_json in actions:
-            action_data = json.loads(action_json)
+            action_data = decode_event(action_json)
             action_type = action_data["type"]
             metric = metric_map.get(action_type, action_type + "s")
             data[metric] += 1
@@ -510,11 +678,10 @@ class ActivityMonitor(commands.Cog):
         
         
         active_users = set()
-        for pattern in [f"events:msg:{gid}:*", f"events:voice:{gid}:*", f"events:action:{gid}:*"]:
-            async for key in self.r.scan_iter(pattern):
-                parts = key.split(":")
-                if len(parts) == 4:
-                    active_users.add(int(parts[3]))
+        for kind in ("msg", "voice", "action"):
+            for member in await event_members(self.r, gid, kind):
+                if member.isdigit():
+                    active_users.add(int(member))
         
         
         current_day = d_after if d_after else (date.today() - timedelta(days=365))
@@ -548,195 +715,67 @@ class ActivityMonitor(commands.Cog):
         e.set_footer(text="Řazeno podle váženého času")
         await itx.followup.send(embed=e)
 
+    async def _backfill_job(self, ctx):
+        """Handler of ``backfill`` jobs queued by the dashboard and on guild join."""
+        guild = self.bot.get_guild(int(ctx.gid))
+        if guild is None:
+            raise RuntimeError(f"Guild {ctx.gid} is not available to this bot")
+        days = int(ctx.params.get("days", 30))
+        engine = BackfillEngine(self.r, guild.id, ActivityBackfill(self), _backfill_start(days).timestamp(),
+                                restart=bool(ctx.params.get("restart")), on_progress=ctx.progress)
+        report = await engine.run(_backfill_sources(guild))
+        if report["status"] != "done":
+            # The checkpoint stays, a new job continues where this one stopped
+            raise RuntimeError(f"Backfill {report['status']} after {report['processed']} items "
+                               f"({report['sources_done']}/{report['sources_total']} sources)")
+        return report
+
     @act_group.command(name="backfill", description="ADMIN: Resetuje a přepočítá data do denních statistik.")
-    @app_commands.describe(days="Počet dní zpětně (např. 365).")
+    @app_commands.describe(days="Počet dní zpětně (např. 365).",
+                           restart="Začít znovu místo pokračování přerušeného běhu")
     @app_commands.checks.has_permissions(administrator=True)
-    async def backfill(self, itx: discord.Interaction, days: int = 30):
+    async def backfill(self, itx: discord.Interaction, days: int = 30, restart: bool = False):
         await itx.response.defer(thinking=True)
-        gid = itx.guild.id
-        
-        
-        await itx.followup.send("🗑️ Mazání staré databáze aktivity...")
-        
-        keys = []
-        
-        async for k in self.r.scan_iter(f"activity:stats:{gid}:*"): keys.append(k)
-        async for k in self.r.scan_iter(f"activity:day:*:{gid}:*"): keys.append(k)
-        
-        if keys:
-            chunk_size = 500
-            for i in range(0, len(keys), chunk_size):
-                await self.r.delete(*keys[i:i+chunk_size])
-                
-        
-        discord_epoch = datetime(2015, 1, 1)
-        limit_date = datetime.now() - timedelta(days=days)
-        if limit_date < discord_epoch: limit_date = discord_epoch
-        
-        await itx.followup.send(f"⏳ Začínám Backfill od {limit_date.date()}... (Režim: 3min Base + Chars)")
-        
-        
-        msg_count = 0
-        user_messages = defaultdict(list)  
-        BATCH_SIZE = 10000  
+        guild = itx.guild
         
-        for channel in itx.guild.text_channels:
-            try:
-                async for msg in channel.history(limit=None, after=limit_date):
-                    if not msg.author.bot:
-                        ts = msg.created_at.timestamp()
-                        length = len(msg.content)
-                        is_reply = (msg.reference is not None)
-                        
-                        user_messages[msg.author.id].append((ts, length, is_reply))
-                        msg_count += 1
-                        
-                        
-                        await self._update_user_info(msg.author)
-                        
-                        
-                        if msg_count % BATCH_SIZE == 0:
-                            
-                            for uid, messages in user_messages.items():
-                                key = f"events:msg:{gid}:{uid}"
-                                mapping = {}
-                                for ts, length, is_reply in messages:
-                                    event_data = json.dumps({"len": length, "reply": is_reply})
-                                    mapping[event_data] = ts
-                                
-                                if mapping:
-                                    await self.r.zadd(key, mapping)
-                                    from shared.config import settings
-                                    cutoff = time.time() - (settings.event_retention_days * 86400)
-                                    await self.r.zremrangebyscore(key, "-inf", cutoff)
-                            
-                            
-                            user_messages.clear()
-                            
-                            try:
-                                await itx.edit_original_response(content=f"⏳ Zpracováno: {msg_count} zpráv...")
-                            except discord.HTTPException:
-                                
-                                print(f"Progress: {msg_count} messages")
-                                
-            except discord.Forbidden:
-                pass
-            except Exception as e:
-                print(f"Error in {channel.name}: {e}")
-        
-        
-        for uid, messages in user_messages.items():
-            key = f"events:msg:{gid}:{uid}"
-            mapping = {}
-            for ts, length, is_reply in messages:
-                event_data = json.dumps({"len": length, "reply": is_reply})
-                mapping[event_data] = ts
-            
-            if mapping:
-                await self.r.zadd(key, mapping)
-                from shared.config import settings
-                cutoff = time.time() - (settings.event_retention_days * 86400)
-                await self.r.zremrangebyscore(key, "-inf", cutoff)
+        limit_date = _backfill_start(days)
 
-        
-        audit_ops = 0
-        user_actions = defaultdict(list)  
-        
-        try:
-            async for entry in itx.guild.audit_logs(limit=None, after=limit_date):
-                if entry.user and not entry.user.bot:
-                    action_type = None
-                    
-                    if entry.action == discord.AuditLogAction.ban:
-                        action_type = "ban"
-                    elif entry.action == discord.AuditLogAction.kick:
-                        action_type = "kick"
-                    elif entry.action == discord.AuditLogAction.unban:
-                        action_type = "unban"
-                    elif entry.action == discord.AuditLogAction.message_delete:
-                        action_type = "msg_delete"
-                    elif entry.action == discord.AuditLogAction.member_role_update:
-                        action_type = "role_update"
-                    elif entry.action == discord.AuditLogAction.member_update:
-                        if hasattr(entry.after, "timed_out_until") and entry.after.timed_out_until:
-                            action_type = "timeout"
-                    
-                    if action_type:
-                        ts = entry.created_at.timestamp()
-                        user_actions[entry.user.id].append((ts, action_type))
-                        audit_ops += 1
-                        
-                        if isinstance(entry.user, discord.Member):
-                            await self._update_user_info(entry.user)
-        except Exception as e:
-            print(f"Audit error: {e}")
-        
-        
-        for uid, actions in user_actions.items():
-            key = f"events:action:{gid}:{uid}"
-            mapping = {}
-            for ts, action_type in actions:
-                event_data = json.dumps({"type": action_type})
-                mapping[event_data] = ts
-            
-            if mapping:
-                await self.r.zadd(key, mapping)
-                from shared.config import settings
-                cutoff = time.time() - (settings.event_retention_days * 86400)
-                await self.r.zremrangebyscore(key, "-inf", cutoff)
+        last_edit = [0.0]
 
-        
-        verifs = 0
-        VERIFICATION_LOG_CHANNEL_ID = 1404416148077809705
-        log_ch = itx.guild.get_channel(VERIFICATION_LOG_CHANNEL_ID)
-        
-        if log_ch:
-            re_approve = re.compile(r"Schválil <@!?(\d+)>")
-            re_bypass = re.compile(r"Manuální bypass - <@!?(\d+)>")
-            
-            verification_events = defaultdict(list)  
-            
+        async def progress(report):
+            if time.monotonic() - last_edit[0] < 5:
+                return
+            last_edit[0] = time.monotonic()
             try:
-                async for msg in log_ch.history(limit=None, after=limit_date):
-                    if msg.author.id == self.bot.user.id:
-                        uid = None
-                        m = re_approve.search(msg.content)
-                        if m:
-                            uid = int(m.group(1))
-                        else:
-                            m = re_bypass.search(msg.content)
-                            if m:
-                                uid = int(m.group(1))
-                        
-                        if uid:
-                            ts = msg.created_at.timestamp()
-                            verification_events[uid].append(ts)
-                            verifs += 1
-            except:
-                pass
-            
-            
-            for uid, timestamps in verification_events.items():
-                key = f"events:action:{gid}:{uid}"
-                mapping = {}
-                for ts in timestamps:
-                    event_data = json.dumps({"type": "verification"})
-                    mapping[event_data] = ts
-                
-                if mapping:
-                    await self.r.zadd(key, mapping)
-                    from shared.config import settings
-                    cutoff = time.time() - (settings.event_retention_days * 86400)
-                    await self.r.zremrangebyscore(key, "-inf", cutoff)
+                await itx.edit_original_response(
+                    content=f"⏳ Zpracováno: {report['counts'].get('messages', 0)} zpráv, "
+                            f"kanály {report['sources_done']}/{report['sources_total']}...")
+            except discord.HTTPException:
+                print(f"Progress: {report['processed']} items")
+
+        engine = BackfillEngine(self.r, guild.id, ActivityBackfill(self), limit_date.timestamp(),
+                                restart=restart, on_progress=progress)
+        await itx.followup.send(f"⏳ Začínám Backfill od {limit_date.date()}... (Režim: 3min Base + Chars)")
+        report = await engine.run(_backfill_sources(guild))
+        counts = report["counts"]
+        summary = (f"{counts.get('messages', 0)} zpráv, {counts.get('actions', 0)} audit akcí, "
+                   f"{counts.get('verifications', 0)} verifikací")
 
         try:
-            await itx.followup.send(f"✅ **Hotovo!**\n"
-                                    f"Zpracováno: {msg_count} zpráv, {audit_ops} audit akcí, {verifs} verifikací.\n"
-                                    f"Data uložena do event systému.\n"
-                                    f"Zkus: `/activity stats after:01-01-2025`.")
+            if report["status"] == "locked":
+                await itx.followup.send("⚠️ Backfill pro tento server už běží.")
+            elif report["status"] != "done":
+                await itx.followup.send(f"⚠️ **Backfill přerušen** po {summary} "
+                                        f"({report['sources_done']}/{report['sources_total']} zdrojů).\n"
+                                        f"Spusť příkaz znovu, naváže na uložený postup.")
+            else:
+                await itx.followup.send(f"✅ **Hotovo!**\n"
+                                        f"Zpracováno: {summary}.\n"
+                                        f"Data uložena do event systému.\n"
+                                        f"Zkus: `/activity stats after:01-01-2025`.")
         except discord.HTTPException:
             
-            print(f"Backfill completed: {msg_count} msgs, {audit_ops} actions, {verifs} verifs")
+            print(f"Backfill {report['status']}: {summary}")
 
     @act_group.command(name="report", description="Zobrazí report aktivity týmu (7 a 30 dní).")
     @app_commands.checks.has_permissions(administrator=True) 
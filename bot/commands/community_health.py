@@ -2,18 +2,101 @@ from __future__ import annotations
 
 import json
 import time
-from datetime import datetime, timezone
+from collections import Counter
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 import discord
 from discord.ext import commands
 from discord import app_commands
-import redis.asyncio as redis
 
+from shared.backfill import BackfillEngine, BackfillSource, BackfillTask
 from shared.community_health import is_probable_question, normalise_config
 from shared.config import settings
-
-REDIS_URL = __import__("os").getenv("REDIS_URL", "redis://localhost:6379/0")
+from shared.event_stream import append as append_stream
+from shared.ingest_bus import get_ingest_bus
+from shared.redis_client import shared_client
+
+CONFIG_CACHE_SECONDS = 60
+AUDIT_SOURCE = "audit"
+
+MOD_ACTIONS = {
+    discord.AuditLogAction.ban: "ban",
+    discord.AuditLogAction.kick: "kick",
+    discord.AuditLogAction.unban: "unban",
+    discord.AuditLogAction.member_role_update: "role_update",
+    discord.AuditLogAction.message_delete: "message_delete",
+}
+
+
+def _history_after(cursor: Optional[int], window_start: float):
+    return discord.Object(id=cursor) if cursor else datetime.fromtimestamp(window_start, timezone.utc)
+
+
+class HealthBackfill(BackfillTask):
+    """Message metadata, help requests and moderation events of the backfill window."""
+
+    job = "health"
+
+    def __init__(self, cog: "CommunityHealthTracker", cfg: dict, support_ids: set):
+        self.cog = cog
+        self.cfg = cfg
+        self.support_ids = support_ids
+
+    def skip_error(self, exc):
+        return isinstance(exc, discord.Forbidden)
+
+    def _is_help_request(self, message: discord.Message) -> bool:
+        return (self.cfg["help_requests_enabled"] and str(message.channel.id) in self.support_ids
+                and (self.cfg["question_mode"] == "all" or is_probable_question(message.content)))
+
+    async def apply(self, pipe, gid, batch):
+        counts: Counter = Counter()
+        messages = [item for sid, item in batch if sid != AUDIT_SOURCE and not item.author.bot]
+        mod_events = [ev for ev in (self.cog._mod_event(item) for sid, item in batch if sid == AUDIT_SOURCE) if ev]
+        questions = [m for m in messages if self._is_help_request(m)]
+        replies = [m for m in messages if m.reference and m.reference.message_id]
+
+        # One round-trip for everything that depends on existing state
+        parents = {m.reference.message_id for m in replies}
+        async with self.cog.r.pipeline(transaction=False) as reads:
+            for m in questions:
+                reads.exists(f"health:help:{gid}:{m.id}")
+            for parent_id in parents:
+                reads.hmget(f"health:help:{gid}:{parent_id}", "created_at", "status")
+            for ev in mod_events:
+                reads.exists(f"health:mod_event:{gid}:{ev['event_id']}")
+            results = await reads.execute()
+        exists_q = results[:len(questions)]
+        parent_state = dict(zip(parents, results[len(questions):len(questions) + len(parents)]))
+        exists_mod = results[len(questions) + len(parents):]
+
+        # Help requests opened in this batch can be answered later in the same batch
+        help_state = {parent_id: (created, status) for parent_id, (created, status) in parent_state.items()
+                      if created is not None or status is not None}
+        for m, exists in zip(questions, exists_q):
+            if not exists:
+                self.cog._queue_help_request(pipe, gid, m)
+                help_state[m.id] = (str(m.created_at.timestamp()), "open")
+                counts["questions"] += 1
+        for m in messages:
+            fields = self.cog._message_fields(m)
+            append_stream(pipe, gid, fields)
+            counts["messages"] += 1
+            if m.reference and m.reference.message_id:
+                counts["replies"] += 1
+                parent_id = m.reference.message_id
+                created, status = help_state.get(parent_id, (None, None))
+                if (created is None and status is None) or status == "answered":
+                    continue
+                answered_at = m.created_at.timestamp()
+                self.cog._queue_help_answered(pipe, gid, parent_id, m.author.id, m.id,
+                                              float(created or answered_at), answered_at)
+                help_state[parent_id] = (created, "answered")
+        for ev, exists in zip(mod_events, exists_mod):
+            self.cog._queue_mod_event(pipe, gid, ev)
+            counts["audits"] += 0 if exists else 1
+        return counts
 
 
 class CommunityHealthTracker(commands.Cog):
@@ -25,21 +108,35 @@ class CommunityHealthTracker(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.pool = redis.ConnectionPool.from_url(REDIS_URL, decode_responses=True)
-        self.r = redis.Redis(connection_pool=self.pool)
+        self.r = shared_client()
+        self.bus = get_ingest_bus(bot)
+        # guild_id -> (expires_at, config, support channel ids); settings change rarely
+        self._cfg_cache: dict = {}
 
     async def cog_unload(self):
-        await self.pool.disconnect()
+        await self.bus.flush()
+
+    async def _guild_settings(self, guild_id: int) -> tuple:
+        cached = self._cfg_cache.get(guild_id)
+        now = time.monotonic()
+        if cached and cached[0] > now:
+            return cached[1], cached[2]
+        async with self.r.pipeline(transaction=False) as pipe:
+            pipe.hgetall(f"cfg:health:{guild_id}")
+            pipe.smembers(f"cfg:health:support_channels:{guild_id}")
+            raw, channels = await pipe.execute()
+        cfg = normalise_config(raw)
+        self._cfg_cache[guild_id] = (now + CONFIG_CACHE_SECONDS, cfg, set(channels))
+        return cfg, set(channels)
 
     async def _config(self, guild_id: int) -> dict:
-        raw = await self.r.hgetall(f"cfg:health:{guild_id}")
-        return normalise_config(raw)
+        return (await self._guild_settings(guild_id))[0]
 
     async def _is_support_channel(self, guild_id: int, channel_id: int) -> bool:
-        return bool(await self.r.sismember(f"cfg:health:support_channels:{guild_id}", str(channel_id)))
+        return str(channel_id) in (await self._guild_settings(guild_id))[1]
 
-    async def _store_message_metadata(self, message: discord.Message) -> None:
-        gid = message.guild.id
+    def _message_fields(self, message: discord.Message) -> dict:
+        """Stream entry stored by shared.stream_aggregators.HealthAggregator."""
         mid = message.id
         reply_to = None
         reply_author_id = None
@@ -49,45 +146,54 @@ class CommunityHealthTracker(commands.Cog):
             if isinstance(resolved, discord.Message):
                 reply_author_id = resolved.author.id
 
-        mapping = {
-            "message_id": str(mid),
-            "author_id": str(message.author.id),
-            "channel_id": str(message.channel.id),
-            "created_at": str(message.created_at.timestamp()),
-            "reply_to": str(reply_to or ""),
-            "reply_author_id": str(reply_author_id or ""),
-            "is_question": "1" if is_probable_question(message.content) else "0",
-            "reaction_count": str(sum(reaction.count for reaction in message.reactions)),
+        return {
+            "type": "health_msg",
+            "mid": mid,
+            "uid": message.author.id,
+            "cid": message.channel.id,
+            "cname": getattr(message.channel, "name", str(message.channel.id)),
+            "ts": message.created_at.timestamp(),
+            "reply_to": reply_to or "",
+            "reply_author_id": reply_author_id or "",
+            "q": "1" if is_probable_question(message.content) else "0",
+            "reactions": sum(reaction.count for reaction in message.reactions),
         }
-        key = f"health:message:{gid}:{mid}"
-        async with self.r.pipeline() as pipe:
-            pipe.hset(key, mapping=mapping)
-            pipe.expire(key, settings.event_retention_days * 86400)
-            pipe.hset(f"channel:info:{message.channel.id}", mapping={"name": getattr(message.channel, "name", str(message.channel.id)), "guild_id": str(gid)})
-            pipe.zadd(f"health:messages:{gid}", {str(mid): message.created_at.timestamp()})
-            pipe.zadd(f"health:user_messages:{gid}:{message.author.id}", {str(mid): message.created_at.timestamp()})
-            await pipe.execute()
+
+    async def _store_message_metadata(self, message: discord.Message) -> None:
+        gid = message.guild.id
+        fields = self._message_fields(message)
+
+        def apply(pipe):
+            append_stream(pipe, gid, fields)
+
+        await self.bus.emit_wait("health_message", apply)
 
     async def _mark_help_answered(self, guild_id: int, parent_id: int, responder_id: int, response_id: int) -> None:
         key = f"health:help:{guild_id}:{parent_id}"
-        if not await self.r.exists(key):
+        # Missing hash -> both fields None
+        created_raw, status = await self.r.hmget(key, "created_at", "status")
+        if created_raw is None and status is None:
             return
         now = time.time()
-        created = float(await self.r.hget(key, "created_at") or now)
-        if await self.r.hget(key, "status") == "answered":
+        created = float(created_raw or now)
+        if status == "answered":
             return
         async with self.r.pipeline() as pipe:
-            pipe.hset(key, mapping={
-                "status": "answered",
-                "answered_at": str(now),
-                "responder_id": str(responder_id),
-                "response_id": str(response_id),
-                "response_seconds": str(max(0, int(now - created))),
-            })
-            pipe.zrem(f"health:help:open:{guild_id}", str(parent_id))
-            pipe.zadd(f"health:help:answered:{guild_id}", {str(parent_id): now})
+            self._queue_help_answered(pipe, guild_id, parent_id, responder_id, response_id, created, now)
             await pipe.execute()
 
+    def _queue_help_answered(self, pipe, guild_id: int, parent_id: int, responder_id: int, response_id: int,
+                             created: float, answered_at: float) -> None:
+        pipe.hset(f"health:help:{guild_id}:{parent_id}", mapping={
+            "status": "answered",
+            "answered_at": str(answered_at),
+            "responder_id": str(responder_id),
+            "response_id": str(response_id),
+            "response_seconds": str(max(0, int(answered_at - created))),
+        })
+        pipe.zrem(f"health:help:open:{guild_id}", str(parent_id))
+        pipe.zadd(f"health:help:answered:{guild_id}", {str(parent_id): answered_at})
+
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if message.author.bot or not message.guild:
@@ -109,26 +215,30 @@ class CommunityHealthTracker(commands.Cog):
         if cfg["question_mode"] == "heuristic" and not is_probable_question(message.content):
             return
 
+        def apply(pipe):
+            self._queue_help_request(pipe, gid, message)
+
+        await self.bus.emit_wait("health_help", apply)
+
+    def _queue_help_request(self, pipe, gid: int, message: discord.Message) -> None:
         key = f"health:help:{gid}:{message.id}"
-        mapping = {
-            "message_id": str(message.id),
-            "author_id": str(message.author.id),
+        mid, author_id, created = str(message.id), message.author.id, message.created_at.timestamp()
+        pipe.hset(key, mapping={
+            "message_id": mid,
+            "author_id": str(author_id),
             "channel_id": str(message.channel.id),
-            "created_at": str(message.created_at.timestamp()),
+            "created_at": str(created),
             "status": "open",
             "answered_at": "",
             "responder_id": "",
             "response_id": "",
             "response_seconds": "",
             "acknowledged_by_reaction": "0",
-        }
-        async with self.r.pipeline() as pipe:
-            pipe.hset(key, mapping=mapping)
-            pipe.expire(key, settings.event_retention_days * 86400)
-            pipe.zadd(f"health:help:all:{gid}", {str(message.id): message.created_at.timestamp()})
-            pipe.zadd(f"health:help:open:{gid}", {str(message.id): message.created_at.timestamp()})
-            pipe.zadd(f"health:help:user:{gid}:{message.author.id}", {str(message.id): message.created_at.timestamp()})
-            await pipe.execute()
+        })
+        pipe.expire(key, settings.event_retention_days * 86400)
+        pipe.zadd(f"health:help:all:{gid}", {mid: created})
+        pipe.zadd(f"health:help:open:{gid}", {mid: created})
+        pipe.zadd(f"health:help:user:{gid}:{author_id}", {mid: created})
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
@@ -148,32 +258,30 @@ class CommunityHealthTracker(commands.Cog):
 
     @commands.Cog.listener()
     async def on_audit_log_entry_create(self, entry: discord.AuditLogEntry):
-        if not entry.guild or not entry.user or entry.user.bot:
-            return
-        action_map = {
-            discord.AuditLogAction.ban: "ban",
-            discord.AuditLogAction.kick: "kick",
-            discord.AuditLogAction.unban: "unban",
-            discord.AuditLogAction.member_role_update: "role_update",
-            discord.AuditLogAction.message_delete: "message_delete",
-        }
-        action_type = action_map.get(entry.action)
-        if entry.action == discord.AuditLogAction.member_update:
-            if getattr(entry.after, "timed_out_until", None):
-                action_type = "timeout"
-        if not action_type:
+        event = self._mod_event(entry)
+        if not event:
             return
         cfg = await self._config(entry.guild.id)
         if not cfg["moderation_context_enabled"]:
             return
+        async with self.r.pipeline() as pipe:
+            self._queue_mod_event(pipe, entry.guild.id, event)
+            await pipe.execute()
 
+    def _mod_event(self, entry: discord.AuditLogEntry) -> Optional[dict]:
+        if not entry.guild or not entry.user or entry.user.bot:
+            return None
+        action_type = MOD_ACTIONS.get(entry.action)
+        if entry.action == discord.AuditLogAction.member_update:
+            if getattr(entry.after, "timed_out_until", None):
+                action_type = "timeout"
+        if not action_type:
+            return None
         target_id = getattr(entry.target, "id", None)
         channel_id = getattr(getattr(entry, "extra", None), "channel", None)
         channel_id = getattr(channel_id, "id", None)
         ts = entry.created_at.timestamp()
-        gid = entry.guild.id
-        event_key = f"health:mod_event:{gid}:{entry.id}"
-        mapping = {
+        return {
             "event_id": str(entry.id),
             "moderator_id": str(entry.user.id),
             "target_user_id": str(target_id or ""),
@@ -182,15 +290,18 @@ class CommunityHealthTracker(commands.Cog):
             "created_at": str(ts),
             "resolved_at": str(ts) if action_type == "unban" else "",
         }
-        async with self.r.pipeline() as pipe:
-            pipe.hset(event_key, mapping=mapping)
-            pipe.expire(event_key, settings.event_retention_days * 86400)
-            pipe.zadd(f"health:mod_events:{gid}", {str(entry.id): ts})
-            pipe.zadd(f"health:mod_events:moderator:{gid}:{entry.user.id}", {str(entry.id): ts})
-            if target_id:
-                pipe.zadd(f"health:mod_events:target:{gid}:{target_id}", {str(entry.id): ts})
-                pipe.zadd(f"health:mod_pair:{gid}:{target_id}:{entry.user.id}", {str(entry.id): ts})
-            await pipe.execute()
+
+    def _queue_mod_event(self, pipe, gid: int, event: dict) -> None:
+        event_id, ts = event["event_id"], float(event["created_at"])
+        moderator_id, target_id = event["moderator_id"], event["target_user_id"]
+        event_key = f"health:mod_event:{gid}:{event_id}"
+        pipe.hset(event_key, mapping=event)
+        pipe.expire(event_key, settings.event_retention_days * 86400)
+        pipe.zadd(f"health:mod_events:{gid}", {event_id: ts})
+        pipe.zadd(f"health:mod_events:moderator:{gid}:{moderator_id}", {event_id: ts})
+        if target_id:
+            pipe.zadd(f"health:mod_events:target:{gid}:{target_id}", {event_id: ts})
+            pipe.zadd(f"health:mod_pair:{gid}:{target_id}:{moderator_id}", {event_id: ts})
 
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
@@ -300,65 +411,48 @@ class CommunityHealthTracker(commands.Cog):
         )
 
     @health_group.command(name="backfill", description="Doplní historický kontext zpráv a moderace.")
-    @app_commands.describe(days="Počet dní zpětně, maximálně 180")
+    @app_commands.describe(days="Počet dní zpětně, maximálně 180",
+                           restart="Začít znovu místo pokračování přerušeného běhu")
     @app_commands.checks.has_permissions(administrator=True)
-    async def health_backfill(self, interaction: discord.Interaction, days: app_commands.Range[int, 1, 180] = 30):
+    async def health_backfill(self, interaction: discord.Interaction, days: app_commands.Range[int, 1, 180] = 30,
+                              restart: bool = False):
         await interaction.response.defer(ephemeral=True, thinking=True)
         guild = interaction.guild
         if not guild:
             await interaction.followup.send("Příkaz je dostupný pouze na serveru.", ephemeral=True)
             return
-        after = datetime.now(timezone.utc) - __import__("datetime").timedelta(days=int(days))
+        after = datetime.now(timezone.utc) - timedelta(days=int(days))
         cfg = await self._config(guild.id)
         support_ids = await self.r.smembers(f"cfg:health:support_channels:{guild.id}")
-        messages = questions = replies = audits = 0
-
-        for channel in guild.text_channels:
-            try:
-                async for message in channel.history(limit=None, after=after, oldest_first=True):
-                    if message.author.bot:
-                        continue
-                    await self._store_message_metadata(message)
-                    messages += 1
-                    if message.reference and message.reference.message_id:
-                        await self._mark_help_answered(guild.id, message.reference.message_id, message.author.id, message.id)
-                        replies += 1
-                    if cfg["help_requests_enabled"] and str(channel.id) in support_ids:
-                        if cfg["question_mode"] == "all" or is_probable_question(message.content):
-                            key = f"health:help:{guild.id}:{message.id}"
-                            if not await self.r.exists(key):
-                                await self.r.hset(key, mapping={
-                                    "message_id": str(message.id), "author_id": str(message.author.id),
-                                    "channel_id": str(channel.id), "created_at": str(message.created_at.timestamp()),
-                                    "status": "open", "answered_at": "", "responder_id": "",
-                                    "response_id": "", "response_seconds": "", "acknowledged_by_reaction": "0",
-                                })
-                                await self.r.zadd(f"health:help:all:{guild.id}", {str(message.id): message.created_at.timestamp()})
-                                await self.r.zadd(f"health:help:open:{guild.id}", {str(message.id): message.created_at.timestamp()})
-                                await self.r.zadd(f"health:help:user:{guild.id}:{message.author.id}", {str(message.id): message.created_at.timestamp()})
-                                questions += 1
-            except (discord.Forbidden, discord.HTTPException):
-                continue
 
+        # Channels are read concurrently and resume from their checkpoint after an interruption
+        sources = [
+            BackfillSource(str(channel.id), lambda cursor, start, channel=channel: channel.history(
+                limit=None, after=_history_after(cursor, start), oldest_first=True))
+            for channel in guild.text_channels
+        ]
         if cfg["moderation_context_enabled"]:
-            try:
-                async for entry in guild.audit_logs(limit=None, after=after, oldest_first=True):
-                    before = await self.r.exists(f"health:mod_event:{guild.id}:{entry.id}")
-                    await self.on_audit_log_entry_create(entry)
-                    after_exists = await self.r.exists(f"health:mod_event:{guild.id}:{entry.id}")
-                    if after_exists and not before:
-                        audits += 1
-            except (discord.Forbidden, discord.HTTPException):
-                pass
+            sources.append(BackfillSource(AUDIT_SOURCE, lambda cursor, start: guild.audit_logs(
+                limit=None, after=_history_after(cursor, start), oldest_first=True)))
+        engine = BackfillEngine(self.r, guild.id, HealthBackfill(self, cfg, support_ids), after.timestamp(),
+                                restart=restart)
+        report = await engine.run(sources)
+        if report["status"] == "locked":
+            await interaction.followup.send("Backfill už pro tento server běží.", ephemeral=True)
+            return
 
         for event in guild.scheduled_events:
             await self._store_event(event)
 
-        await interaction.followup.send(
-            f"Hotovo: {messages} zpráv, {questions} žádostí o pomoc, {replies} odpovědí a {audits} moderačních událostí.",
-            ephemeral=True,
-        )
-
+        counts = report["counts"]
+        summary = (f"{counts.get('messages', 0)} zpráv, {counts.get('questions', 0)} žádostí o pomoc, "
+                   f"{counts.get('replies', 0)} odpovědí a {counts.get('audits', 0)} moderačních událostí")
+        if report["status"] != "done":
+            await interaction.followup.send(
+                f"Backfill přerušen po {summary} ({report['sources_done']}/{report['sources_total']} zdrojů). "
+                "Spusťte příkaz znovu, naváže na uložený postup.", ephemeral=True)
+            return
+        await interaction.followup.send(f"Hotovo: {summary}.", ephemeral=True)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(CommunityHealthTracker(bot))
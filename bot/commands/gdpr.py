@@ -1,13 +1,16 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import redis.asyncio as redis
-import os
 import json
 from datetime import datetime
 from typing import Optional
+from shared.activity_bitmap import forget_user
+from shared.event_index import drop_member
+from shared.event_codec import decode_event
+from shared.batch_reader import read_ranges, zcards
+from shared.redis_client import shared_client
+from shared.result_cache import bump_watermark
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
 
 class GDPRCommands(commands.Cog):
@@ -15,11 +18,13 @@ class GDPRCommands(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.pool = redis.ConnectionPool.from_url(REDIS_URL, decode_responses=True)
-        self.r = redis.Redis(connection_pool=self.pool)
+        self.r = shared_client()
 
-    async def cog_unload(self):
-        await self.pool.disconnect()
+    def forget_cached_profile(self, user_id: str):
+        # Profil drží i ActivityMonitor v paměti; bez toho by další zprávy profil nezapsaly až do resyncu
+        activity = self.bot.get_cog("ActivityMonitor")
+        if activity is not None:
+            activity.profiles.invalidate(int(user_id))
 
     @app_commands.command(name="privacy", description="Zobrazí informace o ochraně osobních údajů a GDPR")
     async def privacy(self, interaction: discord.Interaction):
@@ -122,7 +127,13 @@ class GDPRCommands(commands.Cog):
             # 2. Get all guilds the bot is in
             guild_ids = await self.r.smembers("bot:guilds")
             
-            # 3. Collect events per guild
+            # 3. Collect events per guild (pipelined across all guilds)
+            msg_keys = {gid: f"events:msg:{gid}:{user_id}" for gid in guild_ids}
+            voice_keys = {gid: f"events:voice:{gid}:{user_id}" for gid in guild_ids}
+            action_keys = {gid: f"events:action:{gid}:{user_id}" for gid in guild_ids}
+            card_counts = await zcards(self.r, list(msg_keys.values()) + list(action_keys.values()))
+            voice_rows = await read_ranges(self.r, voice_keys.values())
+
             for guild_id in guild_ids:
                 guild_data = {
                     "messages": 0,
@@ -132,27 +143,24 @@ class GDPRCommands(commands.Cog):
                 }
                 
                 # Messages
-                msg_key = f"events:msg:{guild_id}:{user_id}"
-                msg_count = await self.r.zcard(msg_key)
+                msg_count = card_counts.get(msg_keys[guild_id], 0)
                 guild_data["messages"] = msg_count
                 
                 # Voice
-                voice_key = f"events:voice:{guild_id}:{user_id}"
-                voice_events = await self.r.zrange(voice_key, 0, -1)
+                voice_events = voice_rows.get(voice_keys[guild_id], [])
                 guild_data["voice_sessions"] = len(voice_events)
                 
                 total_duration = 0
                 for evt_json in voice_events:
                     try:
-                        evt = json.loads(evt_json)
+                        evt = decode_event(evt_json)
                         total_duration += evt.get("duration", 0)
                     except:
                         pass
                 guild_data["voice_duration"] = total_duration
                 
                 # Actions
-                action_key = f"events:action:{guild_id}:{user_id}"
-                action_count = await self.r.zcard(action_key)
+                action_count = card_counts.get(action_keys[guild_id], 0)
                 guild_data["actions"] = action_count
                 
                 # Only include guilds with data
@@ -241,6 +249,7 @@ class GDPRCommands(commands.Cog):
                     if await self.parent_cog.r.exists(key):
                         await self.parent_cog.r.delete(key)
                         deleted_keys.append(key)
+                    self.parent_cog.forget_cached_profile(self.user_id)
                     
                     # 2. Get all guilds
                     guild_ids = await self.parent_cog.r.smembers("bot:guilds")
@@ -265,6 +274,10 @@ class GDPRCommands(commands.Cog):
                             await self.parent_cog.r.delete(key)
                             deleted_keys.append(key)
                         
+                        await drop_member(self.parent_cog.r, guild_id, self.user_id)
+                        await forget_user(self.parent_cog.r, guild_id, self.user_id)
+                        await bump_watermark(self.parent_cog.r, guild_id)
+                        
                         # Activity states
                         for state_key in ["chat_start", "chat_last", "voice_start"]:
                             key = f"activity:state:{guild_id}:{self.user_id}:{state_key}"
@@ -10,7 +10,8 @@ from datetime import datetime, timedelta
 from typing import Optional, List, Dict
 import os
 
-from shared.models import CommunityModels
+from shared.markov_forecast import SEGMENT_ALL, load_forecasts
+from shared.models import CommunityModels, UserState
 from shared.redis_client import get_redis_client
 
 class HealthCog(commands.Cog):
@@ -35,8 +36,10 @@ class HealthCog(commands.Cog):
         # Activity Rate
         activity_rate = (dau / total_members) if total_members > 0 else 0
         
-        from web.backend.utils import get_health_research_data
-        research_data = await get_health_research_data(guild.id)
+        # Precomputed by the snapshot worker; only a never-computed guild triggers a live run
+        from web.backend.utils import get_snapshot
+        snapshot = await get_snapshot(guild.id, "health_research")
+        research_data = snapshot["data"] or {}
         
         # MII (Centralizovaný výpočet)
         mii_val = research_data.get("mii")
@@ -53,7 +56,7 @@ class HealthCog(commands.Cog):
         )
         
         embed.add_field(name="👥 Aktivita (AER)", value=f"**{activity_rate:.1%}** (DAU: {dau})", inline=True)
-        mii_str = f"**{mii:.2%}**" if mii_val is not None else "**N/A**"
+        mii_str = f"**{mii_val:.2%}**" if mii_val is not None else "**N/A**"
         embed.add_field(name="⚠️ Moderační zátěž (MII)", value=mii_str, inline=True)
         embed.add_field(name="🛡️ Doporučený tým", value=f"**{rec_mods} moderátorů**", inline=True)
         
@@ -75,10 +78,16 @@ class HealthCog(commands.Cog):
                 p_stay_active_str = f"**{p_stay_active / 100.0:.1%}**" if p_stay_active is not None else "**N/A**"
                 p_inactive_str = f"**{p_inactive / 100.0:.1%}**" if p_inactive is not None else "**N/A**"
                 
+                # Longer horizon from the stored daily transition counts (no event rescan)
+                forecast = (await load_forecasts(r, guild.id, [SEGMENT_ALL], horizons=30))[SEGMENT_ALL]["forecast"]
+                p_active_30_str = (f"**{forecast[-1][UserState.ACTIVE] + forecast[-1][UserState.PASSIVE]:.1%}**"
+                                   if forecast else "**N/A**")
+                
                 res_text = (
                     f"**Markovova analýza (Predikce 7 dní):**\n"
                     f"- Setrvání v aktivitě: {p_stay_active_str}\n"
-                    f"- Odhad neaktivity: {p_inactive_str}\n\n"
+                    f"- Odhad neaktivity: {p_inactive_str}\n"
+                    f"- Setrvání v aktivitě za 30 dní: {p_active_30_str}\n\n"
                     f"**Analýza aktivity (Survival):**\n"
                     f"- Očekávaná doba setrvání v pozorované aktivitě: {life_exp_str}\n"
                     f"- Medián setrvání v aktivitě: {median_survival_str}"
@@ -87,6 +96,7 @@ class HealthCog(commands.Cog):
                 res_text = "Nepodařilo se vypočítat výzkumná data (nedostatek historie nebo chyba zpracování)."
                 
             embed.add_field(name="🧪 Výzkumná data (Markov/Survival)", value=res_text, inline=False)
+            embed.set_footer(text=f"Výzkumná data spočítána {datetime.fromtimestamp(snapshot['computed_at']).strftime('%d.%m. %H:%M')}")
             
         await interaction.followup.send(embed=embed)
 
@@ -5,28 +5,36 @@
 
 
 import asyncio
+import socket
 from datetime import datetime, timezone, timedelta
-from typing import Dict, Tuple, Optional, List, Iterable
+from typing import Dict, Tuple, Optional, Iterable
 from collections import Counter, defaultdict, deque
 
 import discord
 from discord.ext import commands, tasks
 import redis.asyncio as redis
 
+from shared.cooldowns import CooldownWheel
+from shared.heavy_hitters import WINDOWS, HeavyHitterTracker, top_k
+from shared.hll_pyramid import close_days, range_uniques
+from shared.event_stream import append as append_stream
+from shared.ingest_bus import DROPS, get_ingest_bus
+from shared.metrics import publish as publish_metrics
+from shared.redis_client import shared_client
+
 
 import os
 CONFIG = {
-    "REDIS_URL": os.getenv("REDIS_URL", "redis://localhost:6379/0"),
     "RETENTION_DAYS": 40,
     "USER_COOLDOWN_SEC": 60,
     "VOICE_MIN_MINUTES": 5,
-    "QUEUE_MAXSIZE": 50000,
-    "BATCH_MAX": 500,
-    "BATCH_MAX_WAIT_MS": 50,
     "LOG_INTERVAL_SEC": 60,
+    "METRICS_INTERVAL_SEC": 15,
     "VERBOSE_LOG": True,       
     "INCIDENT_COOLDOWN_S": 300,
     "TOP_K": 32,               
+    "TOPK_PERSIST_SEC": 60,
+    "COOLDOWN_MAX_ENTRIES": 200_000,
 }
 
 
@@ -35,62 +43,14 @@ def K_DAU(gid: int, d: str) -> str: return f"hll:dau:{gid}:{d}"
 def K_LOGCHAN(gid: int) -> str: return f"hll:cfg:logchan:{gid}"
 
 
-def K_HOURLY(gid: int, d: str) -> str: return f"stats:hourly:{gid}:{d}"
-def K_MSGLEN(gid: int) -> str: return f"stats:msglen:{gid}"
-def K_HEATMAP(gid: int) -> str: return f"stats:heatmap:{gid}"
-def K_TOTAL_MSGS(gid: int) -> str: return f"stats:total_msgs:{gid}"
-
-
-class TTLSet:
-    __slots__ = ("_exp",)
-    def __init__(self): self._exp: Dict[Tuple[int,int,str], float] = {}
-    def allow(self, key: Tuple[int,int,str], ttl_s: int, now: Optional[float] = None) -> bool:
-        t = now or asyncio.get_event_loop().time()
-        e = self._exp.get(key, 0.0)
-        if t < e: return False
-        self._exp[key] = t + ttl_s
-        return True
-    def sweep(self):
-        t = asyncio.get_event_loop().time()
-        stale = [k for k,v in self._exp.items() if v <= t]
-        for k in stale: self._exp.pop(k, None)
-
-
-class SpaceSaving:
-    __slots__ = ("k","c","err")
-    def __init__(self, k: int = 32):
-        self.k = k
-        self.c: Dict[int,int] = {}     
-        self.err: Dict[int,int] = {}   
-    def update(self, key: int, w: int = 1):
-        if key in self.c:
-            self.c[key] += w
-            return
-        if len(self.c) < self.k:
-            self.c[key] = w
-            self.err[key] = 0
-            return
-        
-        mkey = min(self.c, key=self.c.get)
-        mval = self.c[mkey]
-        
-        self.err.pop(mkey, None)
-        self.c.pop(mkey, None)
-        self.c[key] = mval + w
-        self.err[key] = mval
-    def top(self, n: int) -> List[Tuple[int,int]]:
-        return sorted(self.c.items(), key=lambda kv: kv[1], reverse=True)[:max(1,n)]
-    def clear(self):
-        self.c.clear(); self.err.clear()
-
-
 class ActivityHLLOptCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.r: redis.Redis = redis.from_url(CONFIG["REDIS_URL"], decode_responses=True)
+        self.r: redis.Redis = shared_client()
 
-        self.queue: asyncio.Queue = asyncio.Queue(maxsize=CONFIG["QUEUE_MAXSIZE"])
-        self.cooldowns = TTLSet()
+        # DAU touches go to the guild event stream through the bot-wide write-behind bus
+        self.bus = get_ingest_bus(bot)
+        self.cooldowns = CooldownWheel("dau", max_entries=CONFIG["COOLDOWN_MAX_ENTRIES"])
         self._voice_start: Dict[Tuple[int,int], datetime] = {}
 
         
@@ -100,172 +60,60 @@ class ActivityHLLOptCog(commands.Cog):
         self.interval_voice_hits: Dict[int, int]   = defaultdict(int)
 
         
-        self._hh_day = day_key(datetime.now(timezone.utc))
-        self.hh_users: Dict[int, SpaceSaving]   = defaultdict(lambda: SpaceSaving(CONFIG["TOP_K"]))
-        self.hh_chans: Dict[int, SpaceSaving]   = defaultdict(lambda: SpaceSaving(CONFIG["TOP_K"]))
+        # Heavy hitters of the current hour/day, persisted to topk:* by topk_task
+        self.heavy = HeavyHitterTracker(CONFIG["TOP_K"])
 
         
-        self.stats = {"enqueued": 0, "written": 0, "drop_cooldown": 0, "drop_queue": 0}
+        self.stats = {"enqueued": 0, "drop_cooldown": 0, "drop_queue": 0}
         self.last_flush = asyncio.get_event_loop().time()
         self._incidents: Dict[int, deque] = defaultdict(lambda: deque(maxlen=5))
         self._errors_recent: Dict[int, deque] = defaultdict(lambda: deque(maxlen=3))
 
         
-        self.worker_task = self.bot.loop.create_task(self._worker())
+        self.metrics_instance = f"{socket.gethostname()}-{os.getpid()}"
         self.log_task.start()
         self.housekeep_local.start()
         self.roll_day_task.start()
+        self.metrics_task.start()
+        self.topk_task.start()
 
-    async def _collect_dashboard_stats(self, m: discord.Message):
-        # Sbírá statistiky o zprávách pro dashboard
-        try:
-            
-            
-            lock_key = f"lock:msg:{m.id}"
-            if not await self.r.set(lock_key, "1", ex=10, nx=True):
-                
-                return
-
-            now = datetime.now(timezone.utc)
-            today = day_key(now)
-            hour = now.hour
-            weekday = now.weekday()  
-            gid = m.guild.id
-            cid = m.channel.id
-            uid = m.author.id
-            msg_len = len(m.content)
-            
-            
-            pipe = self.r.pipeline()
-            
-            
-            pipe.hincrby(K_HOURLY(gid, today), hour, 1)
-            pipe.expire(K_HOURLY(gid, today), 60 * 86400)  
-            
-            
-            
-            if msg_len == 0:
-                bucket = 0
-            elif msg_len <= 10:
-                bucket = 5  
-            elif msg_len <= 50:
-                bucket = 30  
-            elif msg_len <= 100:
-                bucket = 75  
-            elif msg_len <= 200:
-                bucket = 150  
-            else:
-                bucket = 250  
-            
-            pipe.zincrby(K_MSGLEN(gid), 1, bucket)
-            
-            
-            heatmap_key = f"{weekday}_{hour}"
-            pipe.hincrby(K_HEATMAP(gid), heatmap_key, 1)
-            pipe.expire(K_HEATMAP(gid), 60 * 86400)  
-            
-            
-            pipe.incr(K_TOTAL_MSGS(gid))
-            
-            
-            
-            channel_key = f"stats:channel:{gid}:{cid}:{today}"
-            pipe.incr(channel_key)
-            pipe.expire(channel_key, 60 * 86400)
-            
-            
-            channel_total_key = f"stats:channel_total:{gid}"
-            pipe.zincrby(channel_total_key, 1, f"{cid}")
-            
-            
-            
-            leaderboard_key = f"leaderboard:messages:{gid}"
-            pipe.zincrby(leaderboard_key, 1, f"{uid}")
-            
-            
-            user_daily_key = f"stats:user_daily:{gid}:{today}"
-            pipe.zincrby(user_daily_key, 1, f"{uid}")
-            pipe.expire(user_daily_key, 60 * 86400) 
-            
-            
-            user_len_key = f"leaderboard:msg_lengths:{gid}:{uid}"
-            pipe.lpush(user_len_key, msg_len)
-            pipe.ltrim(user_len_key, 0, 99)  
-            pipe.expire(user_len_key, 30 * 86400)
-            
-            
-            channel_hourly_key = f"stats:channel_hourly:{gid}:{cid}"
-            pipe.hincrby(channel_hourly_key, hour, 1)
-            pipe.expire(channel_hourly_key, 60 * 86400)
-            
-            
-            await pipe.execute()
-        except Exception as e:
-            
-            print(f"Dashboard stats collection error: {e}")
-
-    
     def cog_unload(self):
-        for t in (self.worker_task, self.log_task, self.housekeep_local, self.roll_day_task):
+        for t in (self.log_task, self.housekeep_local, self.roll_day_task, self.metrics_task, self.topk_task):
             try: t.cancel()
             except Exception: pass
+        asyncio.ensure_future(self.heavy.persist(self.r))
 
     
     async def _enqueue(self, gid: int, uid: int, ts: Optional[datetime] = None):
+        """Append a DAU touch for activity that has no stored event (interactions, voice)."""
         ts = ts or datetime.now(timezone.utc)
         d = day_key(ts)
         if not self.cooldowns.allow((gid, uid, d), CONFIG["USER_COOLDOWN_SEC"]):
             self.stats["drop_cooldown"] += 1
+            DROPS.labels(reason="cooldown", kind="dau").inc()
             return
-        try:
-            self.queue.put_nowait((gid, uid, d))
+        fields = {"type": "touch", "uid": uid, "ts": ts.timestamp()}
+
+        def apply(pipe):
+            append_stream(pipe, gid, fields)
+
+        if self.bus.emit("dau", apply):
             self.stats["enqueued"] += 1
-        except asyncio.QueueFull:
+        else:
             self.stats["drop_queue"] += 1
 
-    async def _worker(self):
-        while not self.bot.is_closed():
-            try: item = await self.queue.get()
-            except Exception: break
-            batch = [item]
-            start = asyncio.get_event_loop().time()
-            while len(batch) < CONFIG["BATCH_MAX"] and                  (asyncio.get_event_loop().time() - start)*1000 < CONFIG["BATCH_MAX_WAIT_MS"]:
-                try: batch.append(self.queue.get_nowait())
-                except asyncio.QueueEmpty: await asyncio.sleep(0); break
-            uniq: List[Tuple[int,int,str]] = list(set(batch))
-            try:
-                pipe = self.r.pipeline()
-                ttl = CONFIG["RETENTION_DAYS"] * 86400
-                for gid, uid, d in uniq:
-                    k = K_DAU(gid, d)
-                    pipe.pfadd(k, str(uid))
-                    pipe.expire(k, ttl, nx=True)
-                await pipe.execute()
-                self.stats["written"] += len(uniq)
-            except Exception as e:
-                
-                gid = uniq[-1][0] if uniq else 0
-                self._errors_recent[gid].append(str(e))
-            finally:
-                for _ in batch: self.queue.task_done()
-
     
     @commands.Cog.listener()
     async def on_message(self, m: discord.Message):
         if m.author.bot or not m.guild: return
-        await self._enqueue(m.guild.id, m.author.id)
+        # DAU and dashboard counters come from ActivityMonitor's message event (shared.stream_aggregators)
         
         if CONFIG["VERBOSE_LOG"]:
             self.interval_msgs_by_channel[m.guild.id][m.channel.id] += 1
             self.interval_msgs_by_user[m.guild.id][m.author.id] += 1
         
-        if day_key(datetime.now(timezone.utc)) != self._hh_day:
-            self._roll_day_reset()
-        self.hh_users[m.guild.id].update(m.author.id, 1)
-        self.hh_chans[m.guild.id].update(m.channel.id, 1)
-        
-        
-        await self._collect_dashboard_stats(m)
+        self.heavy.update("users", m.guild.id, m.author.id)
+        self.heavy.update("channels", m.guild.id, m.channel.id)
 
     @commands.Cog.listener()
     async def on_interaction(self, inter: discord.Interaction):
@@ -274,9 +122,7 @@ class ActivityHLLOptCog(commands.Cog):
             if CONFIG["VERBOSE_LOG"]:
                 self.interval_interactions[inter.guild.id] += 1
             
-            if day_key(datetime.now(timezone.utc)) != self._hh_day:
-                self._roll_day_reset()
-            self.hh_users[inter.guild.id].update(inter.user.id, 1)
+            self.heavy.update("users", inter.guild.id, inter.user.id)
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, m: discord.Member,
@@ -293,44 +139,48 @@ class ActivityHLLOptCog(commands.Cog):
             if start and (now - start) >= timedelta(minutes=CONFIG["VOICE_MIN_MINUTES"]):
                 await self._enqueue(m.guild.id, m.id)
                 
-                if day_key(datetime.now(timezone.utc)) != self._hh_day:
-                    self._roll_day_reset()
-                self.hh_users[m.guild.id].update(m.id, 1)
+                self.heavy.update("users", m.guild.id, m.id)
 
     
     async def _rolling_uniques(self, gid: int, days: int) -> int:
-        now = datetime.now(timezone.utc)
-        keys = [K_DAU(gid, day_key(now - timedelta(days=i))) for i in range(days)]
-        existing = [k for k in keys if await self.r.exists(k)]
-        if not existing: return 0
-        tmp = f"_tmp:hll:{gid}:{day_key(now)}:{days}"
-        await self.r.pfmerge(tmp, *existing)
-        await self.r.expire(tmp, 30)
-        return await self.r.pfcount(tmp)
-
-    
-    def _roll_day_reset(self):
-        self._hh_day = day_key(datetime.now(timezone.utc))
-        for ss in (self.hh_users, self.hh_chans):
-            for gid in list(ss.keys()):
-                ss[gid].clear()
+        today = datetime.now(timezone.utc).date()
+        return await range_uniques(self.r, gid, today - timedelta(days=days - 1), today)
 
     @tasks.loop(minutes=1)
     async def roll_day_task(self):
-        
-        if day_key(datetime.now(timezone.utc)) != self._hh_day:
-            self._roll_day_reset()
+        # Merge closed days into the weekly/monthly HLLs (no-op once up to date)
+        for guild in self.bot.guilds:
+            try:
+                await close_days(self.r, guild.id)
+            except Exception as e:
+                self._errors_recent[guild.id].append(f"hll close: {e}")
 
     @roll_day_task.before_loop
     async def _before_roll(self): await self.bot.wait_until_ready()
 
     
-    @tasks.loop(minutes=5)
-    async def housekeep_local(self): self.cooldowns.sweep()
+    # Cooldowns expire as the wheel turns on each check; this only catches up while idle
+    @tasks.loop(minutes=1)
+    async def housekeep_local(self): self.cooldowns.advance()
     @housekeep_local.before_loop
     async def _before_hk(self): await self.bot.wait_until_ready()
 
     
+    @tasks.loop(seconds=CONFIG["TOPK_PERSIST_SEC"])
+    async def topk_task(self):
+        try:
+            await self.heavy.persist(self.r)
+        except Exception as e:
+            print(f"[ActivityHLL] Top-K persist failed: {e}")
+
+    @tasks.loop(seconds=CONFIG["METRICS_INTERVAL_SEC"])
+    async def metrics_task(self):
+        # Scraped by Prometheus through GET /metrics of the web app
+        try:
+            await publish_metrics(self.r, self.metrics_instance)
+        except Exception as e:
+            print(f"[ActivityHLL] Metrics publish failed: {e}")
+
     @tasks.loop(seconds=CONFIG["LOG_INTERVAL_SEC"])
     async def log_task(self):
         now = datetime.now(timezone.utc)
@@ -343,9 +193,12 @@ class ActivityHLLOptCog(commands.Cog):
             dau = await self.r.pfcount(K_DAU(guild.id, today))
             emb = discord.Embed(title="Analytika", color=0x5865F2, timestamp=now)
             emb.add_field(name="DAU (dnes)", value=str(dau))
-            emb.add_field(name="Queue", value=f"{self.queue.qsize()}/{CONFIG['QUEUE_MAXSIZE']}")
-            emb.add_field(name="Enq/Written", value=f"{self.stats['enqueued']}/{self.stats['written']}")
+            emb.add_field(name="Queue", value=f"{self.bus.queue.qsize()}/{self.bus.queue.maxsize}")
+            emb.add_field(name="Enq/Written", value=f"{self.stats['enqueued']}/{self.bus.stats['written']}")
             emb.add_field(name="Drops (cd/q)", value=f"{self.stats['drop_cooldown']}/{self.stats['drop_queue']}")
+            emb.add_field(name="Cooldowns", value=f"{len(self.cooldowns)}/{self.cooldowns.max_entries}")
+            if self.bus.errors:
+                emb.add_field(name="Chyby zápisu", value="\n".join(self.bus.errors), inline=False)
             
             if self._errors_recent[guild.id]:
                 emb.add_field(name="Chyby", value="\n".join(self._errors_recent[guild.id]), inline=False)
@@ -397,25 +250,28 @@ class ActivityHLLOptCog(commands.Cog):
         await self.r.set(K_LOGCHAN(ctx.guild.id), str(ctx.channel.id))
         await ctx.reply("Tento kanál nastaven jako logovací.", mention_author=False)
 
-    @commands.command(name="topusers", help="Top N uživatelé dnes (approx heavy hitters, RAM only)")
+    async def _reply_top(self, ctx: commands.Context, dim: str, n: int, window: str):
+        if window not in WINDOWS:
+            return await ctx.reply(f"Okno musí být jedno z: {', '.join(WINDOWS)}", mention_author=False)
+        await self.heavy.persist(self.r)
+        rows = await top_k(self.r, ctx.guild.id, dim, window, n=max(1, min(n, CONFIG["TOP_K"])))
+        if not rows:
+            return await ctx.reply(f"— žádná data ({window}) —", mention_author=False)
+        fmt = "<@{}>" if dim == "users" else "<#{}>"
+        lines = [f"{i+1}. {fmt.format(row['id'])} — **{row['count']}**" + (f" (±{row['error']})" if row["error"] else "")
+                 for i, row in enumerate(rows)]
+        title = "Top uživatelé" if dim == "users" else "Top kanály"
+        await ctx.reply(f"**{title} ({window}, approx):**\n" + "\n".join(lines), mention_author=False)
+
+    @commands.command(name="topusers", help="Top N uživatelé za hour/day/week (approx heavy hitters)")
     @commands.has_guild_permissions(manage_guild=True)
-    async def cmd_topusers(self, ctx: commands.Context, n: int = 10):
-        ss = self.hh_users[ctx.guild.id]
-        pairs = ss.top(n)
-        if not pairs:
-            return await ctx.reply("— žádná data dnes —", mention_author=False)
-        lines = [f"{i+1}. <@{uid}> — **{cnt}**" for i,(uid,cnt) in enumerate(pairs)]
-        await ctx.reply("**Top uživatelé (dnes, approx):**\n" + "\n".join(lines), mention_author=False)
-
-    @commands.command(name="topchannels", help="Top N kanály dnes (approx heavy hitters, RAM only)")
+    async def cmd_topusers(self, ctx: commands.Context, n: int = 10, window: str = "day"):
+        await self._reply_top(ctx, "users", n, window)
+
+    @commands.command(name="topchannels", help="Top N kanály za hour/day/week (approx heavy hitters)")
     @commands.has_guild_permissions(manage_guild=True)
-    async def cmd_topchannels(self, ctx: commands.Context, n: int = 10):
-        ss = self.hh_chans[ctx.guild.id]
-        pairs = ss.top(n)
-        if not pairs:
-            return await ctx.reply("— žádná data dnes —", mention_author=False)
-        lines = [f"{i+1}. <#{cid}> — **{cnt}**" for i,(cid,cnt) in enumerate(pairs)]
-        await ctx.reply("**Top kanály (dnes, approx):**\n" + "\n".join(lines), mention_author=False)
+    async def cmd_topchannels(self, ctx: commands.Context, n: int = 10, window: str = "day"):
+        await self._reply_top(ctx, "channels", n, window)
 
     
     @commands.Cog.listener()
@@ -425,10 +281,13 @@ class ActivityHLLOptCog(commands.Cog):
         month_key = now.strftime("%Y-%m")
         day_key_str = now.strftime("%Y-%m-%d")
         
-        pipe = self.r.pipeline()
-        pipe.hincrby(f"stats:joins:{member.guild.id}", month_key, 1)
-        pipe.hincrby(f"stats:joins:daily:{member.guild.id}", day_key_str, 1)
-        await pipe.execute()
+        gid = member.guild.id
+
+        def apply(pipe):
+            pipe.hincrby(f"stats:joins:{gid}", month_key, 1)
+            pipe.hincrby(f"stats:joins:daily:{gid}", day_key_str, 1)
+
+        await self.bus.emit_wait("member", apply)
 
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
@@ -438,10 +297,13 @@ class ActivityHLLOptCog(commands.Cog):
             month_key = now.strftime("%Y-%m")
             day_key_str = now.strftime("%Y-%m-%d")
             
-            pipe = self.r.pipeline()
-            pipe.hincrby(f"stats:leaves:{member.guild.id}", month_key, 1)
-            pipe.hincrby(f"stats:leaves:daily:{member.guild.id}", day_key_str, 1)
-            await pipe.execute()
+            gid = member.guild.id
+
+            def apply(pipe):
+                pipe.hincrby(f"stats:leaves:{gid}", month_key, 1)
+                pipe.hincrby(f"stats:leaves:daily:{gid}", day_key_str, 1)
+
+            await self.bus.emit_wait("member", apply)
         except Exception as e:
             print(f"[ActivityHLL] Error in on_member_remove: {e}")
 
@@ -36,6 +36,7 @@ except ImportError:
 from config import config
 import redis.asyncio as redis 
 from shared.redis_client import get_redis_client
+from shared.jobs import enqueue
 
 
 def ts() -> str:
@@ -275,19 +276,6 @@ async def on_guild_join(guild: discord.Guild):
     await send_console_log(f"🆕 PŘIPOJEN NA GUIDLU: {guild.name} ({guild.id})")
     
     
-    token = BOT_TOKEN
-    if token:
-        import subprocess
-        import sys
-        try:
-            script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts", "backfill_stats.py"))
-            cmd = [sys.executable, script_path, "--guild_id", str(guild.id), "--token", token]
-            subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            await send_console_log(f"⏳ Spuštěn auto-backfill pro {guild.name}")
-        except Exception as e:
-            await send_console_log(f"❌ Auto-backfill selhal: {e}")
-
-    
     try:
         r = redis.from_url(config.REDIS_URL, decode_responses=True)
         is_lite = os.getenv("BOT_LITE_MODE") == "1"
@@ -295,6 +283,13 @@ async def on_guild_join(guild: discord.Guild):
         
         await r.sadd(idx_key, str(guild.id))
         await r.sadd("bot:guilds", str(guild.id))
+        if not is_lite:
+            # Picked up by the job worker of the activity cog
+            try:
+                job, _ = await enqueue(r, "backfill", guild.id, {"days": 30})
+                await send_console_log(f"⏳ Naplánován auto-backfill pro {guild.name} (job {job['id']})")
+            except Exception as e:
+                await send_console_log(f"❌ Auto-backfill selhal: {e}")
         await r.close()
     except Exception as e:
         print(f"Redis add error: {e}")
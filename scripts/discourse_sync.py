@@ -1,8 +1,11 @@
 import asyncio
 import httpx
 import time
-import json
 from shared.redis_client import get_redis
+from collections import Counter
+from shared.event_index import index_member
+from shared.event_codec import encode_event
+from shared.rollups import add_event, apply_rollup
 
 class DiscourseSync:
     """
@@ -48,6 +51,7 @@ class DiscourseSync:
                 # Zpracování témat idempotně
                 synced_set_key = f"discourse:synced_topics:{guild_id}"
                 new_msgs = 0
+                rollup_delta = Counter()
                 
                 for topic in topics:
                     t_id = str(topic.get("id"))
@@ -76,14 +80,14 @@ class DiscourseSync:
                         "reaction_count": topic.get("like_count", 0)
                     }
                     
-                    await r.zadd(f"events:msg:{guild_id}:discourse", {json.dumps(event_data): ts})
-                    from shared.config import settings
-                    cutoff = time.time() - (settings.event_retention_days * 86400)
-                    await r.zremrangebyscore(f"events:msg:{guild_id}:discourse", "-inf", cutoff)
+                    await r.zadd(f"events:msg:{guild_id}:discourse", {encode_event("msg", event_data): ts})
+                    await index_member(r, guild_id, "msg", "discourse")
+                    add_event(rollup_delta, "msg", event_data, ts)
                     new_msgs += 1
                     
                 if new_msgs > 0:
                     await r.incrby(f"stats:total_msgs:{guild_id}", new_msgs)
+                    await apply_rollup(r, guild_id, rollup_delta)
                     
                 return True
                 
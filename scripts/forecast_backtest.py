@@ -0,0 +1,74 @@
+"""
+Zpětné testování predikcí (shared/forecasting.py) nad uloženou historií.
+
+Pro každý server načte denní řady zpráv a DAU ze stats:series za zvolený
+počet dní a postupně předpovídá posledních N oken o délce horizontu vždy jen
+z dat před nimi. Řady všech serverů se počítají jednou dávkou za metriku.
+Vypíše průměrnou absolutní chybu, sMAPE, pokrytí intervalu a čas výpočtu
+pro metody naive / ols / holt_winters.
+
+Použití:
+    python -m scripts.forecast_backtest                       # všechny servery, 120 dní
+    python -m scripts.forecast_backtest 123 456               # vybrané servery
+    python -m scripts.forecast_backtest --days 180 --horizon 7 --folds 8
+"""
+import argparse
+import asyncio
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from shared.daily_series import read_series
+from shared.forecasting import DEFAULT_LEVEL, METHODS, backtest
+from shared.redis_client import get_redis
+
+METRICS = ("msgs", "dau")
+
+
+async def load(r, gids, days):
+    end = date.today() - timedelta(days=1)   # the last finalized day
+    labels = [end - timedelta(days=days - 1 - i) for i in range(days)]
+    out = {}
+    for metric in METRICS:
+        rows = [[int(v or 0) for v in await read_series(r, gid, labels, metric)] for gid in gids]
+        out[metric] = np.array(rows, dtype=float).reshape(len(gids), days)
+    return out
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="Zpětné testování predikcí nad uloženými denními řadami.")
+    parser.add_argument("gids", nargs="*")
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--horizon", type=int, default=7)
+    parser.add_argument("--folds", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    r = await get_redis()
+    gids = args.gids or sorted(await r.smembers("bot:guilds"))
+    if not gids:
+        print("Žádné servery.")
+        return
+    series = await load(r, gids, args.days)
+    print(f"[ForecastBacktest] {len(gids)} serverů, {args.days} dní, horizont {args.horizon}, "
+          f"{args.folds} oken, interval {DEFAULT_LEVEL:.0%}")
+    for metric, y in series.items():
+        active = y[y.sum(axis=1) > 0]
+        if not len(active):
+            print(f"{metric}: bez dat")
+            continue
+        started = time.perf_counter()
+        report = backtest(active, args.horizon, folds=args.folds, methods=METHODS)
+        elapsed = time.perf_counter() - started
+        print(f"\n{metric} ({len(active)} řad, {elapsed * 1000:.0f} ms)")
+        print(f"  {'metoda':<14}{'oken':>6}{'MAE':>10}{'sMAPE %':>10}{'pokrytí':>10}")
+        for method, res in report.items():
+            if not res["folds"]:
+                print(f"  {method:<14}{0:>6}{'-':>10}{'-':>10}{'-':>10}")
+                continue
+            print(f"  {method:<14}{res['folds']:>6}{res['mae'].mean():>10.2f}"
+                  f"{np.median(res['smape']):>10.1f}{res['coverage'].mean():>10.0%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
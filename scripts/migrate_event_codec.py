@@ -0,0 +1,76 @@
+"""
+Online migrace členů events:* sorted setů z JSON do kompaktního formátu
+(viz shared/event_codec.py).
+
+Bot může během migrace dál zapisovat - nové události už jsou kompaktní a
+migrace přepisuje jen JSON členy (ZREM + ZADD se stejným skóre v jedné
+pipeline). Skript je idempotentní, lze ho kdykoliv přerušit a spustit znovu.
+
+Použití:
+    python -m scripts.migrate_event_codec             # všechny servery z bot:guilds
+    python -m scripts.migrate_event_codec 123 456     # jen vybrané servery
+"""
+import asyncio
+import sys
+from typing import Any, Dict
+
+from shared.event_codec import decode_event, encode_event, is_compact
+from shared.event_index import EVENT_KINDS, event_keys
+from shared.redis_client import get_redis
+
+BATCH_SIZE = 500
+
+
+async def migrate_key(r: Any, key: str, kind: str, batch_size: int = BATCH_SIZE) -> int:
+    """Přepíše JSON členy jednoho klíče po dávkách, vrací počet převedených."""
+    converted = 0
+    batch: Dict[str, tuple] = {}
+
+    async def flush():
+        nonlocal converted
+        if not batch:
+            return
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.zrem(key, *batch.keys())
+            pipe.zadd(key, {new: score for new, score in batch.values()})
+            await pipe.execute()
+        converted += len(batch)
+        batch.clear()
+
+    async for member, score in r.zscan_iter(key, count=batch_size):
+        if is_compact(member):
+            continue
+        data = decode_event(member)
+        if not data:
+            continue
+        batch[member] = (encode_event(kind, data), score)
+        if len(batch) >= batch_size:
+            await flush()
+    await flush()
+    return converted
+
+
+async def migrate_guild(r: Any, gid: Any, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """Převede všechny events:{kind}:{gid}:* klíče serveru."""
+    result = {}
+    for kind in EVENT_KINDS:
+        total = 0
+        for key in await event_keys(r, gid, kind):
+            total += await migrate_key(r, key, kind, batch_size)
+        result[kind] = total
+    return result
+
+
+async def main(argv):
+    r = await get_redis()
+    guild_ids = argv or sorted(await r.smembers("bot:guilds"))
+    for gid in guild_ids:
+        try:
+            result = await migrate_guild(r, gid)
+            print(f"Server {gid}: {result}")
+        except Exception as e:
+            print(f"Chyba při migraci serveru {gid}: {e}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
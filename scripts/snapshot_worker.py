@@ -0,0 +1,31 @@
+"""
+Plánovač snapshotů analytiky (viz web/backend/services/snapshot_service.py).
+
+Průběžně přepočítává trendy, engagement, bezpečnostní skóre, DQS a výzkumná
+data pro všechny servery z bot:guilds. Aktivní servery (s novými událostmi)
+se obnovují častěji než neaktivní, ruční přepočet z dashboardu je zařadí
+na začátek fronty.
+
+Použití:
+    python -m scripts.snapshot_worker           # běží trvale
+    python -m scripts.snapshot_worker 123 456   # jednorázově přepočítá vybrané servery
+"""
+import asyncio
+import sys
+
+from web.backend.core.container import AppContainer
+
+
+async def main(argv):
+    snapshots = AppContainer.snapshots
+    if argv:
+        for gid in argv:
+            result = await snapshots.compute(int(gid))
+            print(f"Server {gid}: {sorted(result)}")
+        return
+    print("[SnapshotWorker] Plánovač snapshotů byl spuštěn.")
+    await snapshots.run_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
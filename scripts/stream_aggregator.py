@@ -0,0 +1,59 @@
+"""
+Agregátory událostí ze streamů stream:events:{gid} (viz shared/event_stream.py).
+
+Bot do streamů jen zapisuje (XADD), odvozená data - surové eventy, dashboard
+čítače, DAU HLL a indexy komunitního zdraví - udržují consumer groupy.
+Každá skupina může běžet ve více procesech zároveň, zprávy si rozdělí.
+Bot spouští agregátory i sám (vypnutí: STREAM_INLINE_CONSUMERS=0).
+Proces publikuje své metriky (communitymetrics_stream_*) jako instanci
+stream-aggregator-{host}-{pid}, web je vystaví na GET /metrics.
+
+Použití:
+    python -m scripts.stream_aggregator                    # všechny agregátory
+    python -m scripts.stream_aggregator dau dashboard      # jen vybrané skupiny
+    python -m scripts.stream_aggregator --replay dau       # přehraje stream od začátku
+
+Přehrát lze jen skupiny s idempotentním zápisem (dau, bitmap, health);
+events a dashboard přičítají do čítačů a opakované přehrání by je započítalo
+dvakrát.
+"""
+import asyncio
+import os
+import socket
+import sys
+
+from shared.event_stream import StreamConsumer, replay
+from shared.metrics import publish_forever
+from shared.redis_client import get_redis
+from shared.stream_aggregators import AGGREGATORS
+
+
+async def main(argv):
+    r = await get_redis()
+    if argv[:1] == ["--replay"]:
+        for group in argv[1:]:
+            if group not in AGGREGATORS:
+                print(f"Neznámá skupina '{group}' (dostupné: {', '.join(AGGREGATORS)})")
+                continue
+            if not AGGREGATORS[group].idempotent:
+                print(f"Skupinu '{group}' nelze přehrát: přičítá do čítačů, které by se započítaly dvakrát.")
+                continue
+            rewound = await replay(r, group)
+            print(f"Skupina '{group}' přetočena na začátek ({rewound} streamů).")
+            await StreamConsumer(r, AGGREGATORS[group]()).drain()
+            print(f"Skupina '{group}' dohnala stream.")
+        return
+
+    groups = argv or list(AGGREGATORS)
+    unknown = [g for g in groups if g not in AGGREGATORS]
+    if unknown:
+        print(f"Neznámé skupiny: {', '.join(unknown)} (dostupné: {', '.join(AGGREGATORS)})")
+        return
+    print(f"[StreamAggregator] Spouštím skupiny: {', '.join(groups)}")
+    instance = f"stream-aggregator-{socket.gethostname()}-{os.getpid()}"
+    await asyncio.gather(publish_forever(r, instance),
+                         *(StreamConsumer(r, AGGREGATORS[g]()).run_forever() for g in groups))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
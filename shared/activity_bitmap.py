@@ -0,0 +1,214 @@
+"""Exact per-day activity bitmaps and the cohort engine built on them.
+
+DAU HLLs only estimate counts and cannot answer "which of the users active on
+day X were active on day Y".  Each guild therefore maps its user IDs to dense
+integers (``bitmap:index:{gid}``, assigned in first-seen order) and sets that
+bit in ``bitmap:active:{gid}:{YYYYMMDD}`` for every active day (UTC).  A day of
+100k users is ~12 KB, the size of an HLL, but unions (``BITOP OR``),
+intersections (``BITOP AND``) and ``BITCOUNT`` are exact and run server-side::
+
+    indexes = await user_indexes(r, gid, uids)
+    queue_active(pipe, gid, "20250331", indexes.values())
+
+    await active_counts(r, gid)                # {"dau": .., "wau": .., "mau": ..}
+    await cohort_retention(r, gid, weeks=8)    # weekly cohorts x weeks since start
+
+Every query is one ``MULTI``: scratch keys under ``bitmap:tmp:{gid}:*`` hold
+the unions and are deleted at its end.  Bitmaps of different lengths (users
+indexed later only extend the days they were active on) are zero-padded by
+``BITOP``.
+"""
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from shared.keys import K_ACTIVE_BITMAP, K_BITMAP_INDEX, K_BITMAP_SEQ, K_BITMAP_TMP, day_key
+
+BITMAP_TTL = 220 * 86400     # 26 weekly cohorts plus the look-back window
+DEFAULT_WEEKS = 8
+MAX_WEEKS = 26
+LOOKBACK_DAYS = 28           # activity this long before a week excludes a user from its cohort
+
+
+async def user_indexes(r: Any, gid: Any, uids: Iterable[Any]) -> Dict[str, int]:
+    """Bit index of each user, assigning the next free ones to users seen for the first time.
+
+    New users reserve a block with one ``INCRBY`` and claim it with ``HSETNX``;
+    a user claimed concurrently by another writer keeps the winner's index (the
+    loser's index stays unused).
+    """
+    uids = list(dict.fromkeys(str(u) for u in uids))
+    if not uids:
+        return {}
+    key = K_BITMAP_INDEX(gid)
+    out = {u: int(i) for u, i in zip(uids, await r.hmget(key, uids)) if i is not None}
+    missing = [u for u in uids if u not in out]
+    if not missing:
+        return out
+
+    first = await r.incrby(K_BITMAP_SEQ(gid), len(missing)) - len(missing)
+    async with r.pipeline(transaction=False) as pipe:
+        for offset, uid in enumerate(missing):
+            pipe.hsetnx(key, uid, first + offset)
+        claimed = await pipe.execute()
+    lost = [uid for uid, ok in zip(missing, claimed) if not ok]
+    out.update({uid: first + offset for offset, (uid, ok) in enumerate(zip(missing, claimed)) if ok})
+    if lost:
+        out.update({uid: int(i) for uid, i in zip(lost, await r.hmget(key, lost))})
+    return out
+
+
+def queue_active(pipe: Any, gid: Any, day: str, indexes: Iterable[int]) -> None:
+    """Queue ``SETBIT`` of the users active on ``day`` (``YYYYMMDD``)."""
+    key = K_ACTIVE_BITMAP(gid, day)
+    for index in indexes:
+        pipe.setbit(key, int(index), 1)
+    pipe.expire(key, BITMAP_TTL)
+
+
+async def mark_active(r: Any, gid: Any, day_uids: Mapping[str, Iterable[Any]]) -> int:
+    """Set the bits of ``{day: user IDs}``; returns the number of bits written."""
+    day_uids = {day: list(uids) for day, uids in day_uids.items()}
+    indexes = await user_indexes(r, gid, (u for uids in day_uids.values() for u in uids))
+    written = 0
+    async with r.pipeline(transaction=False) as pipe:
+        for day, uids in day_uids.items():
+            queue_active(pipe, gid, day, {indexes[str(u)] for u in uids})
+            written += len(set(map(str, uids)))
+        await pipe.execute()
+    return written
+
+
+async def forget_user(r: Any, gid: Any, uid: Any) -> bool:
+    """Clear a user's bits and drop their index (GDPR deletion)."""
+    index = await r.hget(K_BITMAP_INDEX(gid), str(uid))
+    if index is None:
+        return False
+    async with r.pipeline(transaction=False) as pipe:
+        async for key in r.scan_iter(K_ACTIVE_BITMAP(gid, "*")):
+            pipe.setbit(key, int(index), 0)
+        pipe.hdel(K_BITMAP_INDEX(gid), str(uid))
+        await pipe.execute()
+    return True
+
+
+def day_range(end: datetime, days: int) -> List[str]:
+    """``YYYYMMDD`` of the ``days`` days ending with ``end``'s day, oldest first."""
+    return [day_key(end - timedelta(days=days - 1 - i)) for i in range(days)]
+
+
+class _Scratch:
+    """``MULTI`` of bitmap operations whose ``BITCOUNT`` results are collected by name."""
+
+    def __init__(self, pipe: Any, gid: Any):
+        self.pipe = pipe
+        self.prefix = K_BITMAP_TMP(gid, uuid.uuid4().hex[:12])
+        self.keys: List[str] = []
+        self.counts: Dict[Any, int] = {}
+        self.queued = 0
+
+    def _bitop(self, op: str, dest: str, *sources: str) -> str:
+        self.pipe.bitop(op, dest, *sources)
+        self.queued += 1
+        return dest
+
+    def key(self, name: str) -> str:
+        key = f"{self.prefix}:{name}"
+        if key not in self.keys:
+            self.keys.append(key)
+        return key
+
+    def union(self, name: str, sources: Sequence[str]) -> str:
+        """OR of ``sources`` into the scratch key ``name`` (added to it if it already holds a union)."""
+        known = f"{self.prefix}:{name}" in self.keys
+        dest = self.key(name)
+        if sources:
+            self._bitop("OR", dest, *([dest] if known else []), *sources)
+        return dest
+
+    def new_in(self, name: str, current: str, seen: str) -> str:
+        """Bits of ``current`` not in ``seen``: ``(current | seen) ^ seen``."""
+        dest = self.key(name)
+        self._bitop("OR", dest, current, seen)
+        return self._bitop("XOR", dest, dest, seen)
+
+    def intersect(self, name: str, a: str, b: str) -> str:
+        return self._bitop("AND", self.key(name), a, b)
+
+    def count(self, name: Any, key: str) -> None:
+        self.counts[name] = self.queued
+        self.pipe.bitcount(key)
+        self.queued += 1
+
+    async def execute(self) -> Dict[Any, int]:
+        if self.keys:
+            self.pipe.delete(*self.keys)
+        results = await self.pipe.execute()
+        return {name: int(results[i]) for name, i in self.counts.items()}
+
+
+def _days(gid: Any, days: Iterable[str]) -> List[str]:
+    return [K_ACTIVE_BITMAP(gid, d) for d in days]
+
+
+async def active_counts(r: Any, gid: Any, end: Optional[datetime] = None) -> Dict[str, int]:
+    """Exact DAU, WAU and MAU: distinct users active on the last 1, 7 and 30 days up to ``end`` (UTC)."""
+    days = _days(gid, day_range(end or datetime.now(timezone.utc), 30))
+    async with r.pipeline(transaction=True) as pipe:
+        ops = _Scratch(pipe, gid)
+        ops.count("dau", days[-1])
+        ops.count("wau", ops.union("wau", days[-7:]))
+        ops.count("mau", ops.union("mau", days))
+        return await ops.execute()
+
+
+async def retained(r: Any, gid: Any, first: Sequence[str], second: Sequence[str]) -> Tuple[int, int]:
+    """``(users active on any of the days first, how many of them were active on any of the days second)``."""
+    async with r.pipeline(transaction=True) as pipe:
+        ops = _Scratch(pipe, gid)
+        base = ops.union("base", _days(gid, first))
+        ops.count("base", base)
+        ops.count("retained", ops.intersect("retained", base, ops.union("again", _days(gid, second))))
+        counts = await ops.execute()
+    return counts["base"], counts["retained"]
+
+
+async def cohort_retention(r: Any, gid: Any, weeks: int = DEFAULT_WEEKS, end: Optional[datetime] = None,
+                           lookback_days: int = LOOKBACK_DAYS) -> Dict[str, Any]:
+    """Weekly cohorts of new users and how many of them were active in each following week.
+
+    Weeks are 7-day blocks ending with ``end``'s day (UTC).  The cohort of a week
+    are its active users with no activity in the ``lookback_days`` before the
+    first week or in any earlier week; ``cohorts[w]["retained"][k]`` is the number
+    of them active in week ``w + k`` (``k = 0`` is the cohort size).
+    """
+    weeks = max(1, min(weeks, MAX_WEEKS))
+    labels = day_range(end or datetime.now(timezone.utc), weeks * 7 + lookback_days)
+    lookback, labels = labels[:lookback_days], labels[lookback_days:]
+    out: Dict[str, Any] = {"weeks": [f"{d[:4]}-{d[4:6]}-{d[6:]}" for d in labels[::7]],
+                           "lookback_days": lookback_days, "cohorts": []}
+
+    async with r.pipeline(transaction=True) as pipe:
+        ops = _Scratch(pipe, gid)
+        active = [ops.union(f"week:{w}", _days(gid, labels[w * 7:(w + 1) * 7])) for w in range(weeks)]
+        seen = ops.union("seen", _days(gid, lookback))
+        for w in range(weeks):
+            cohort = ops.new_in(f"cohort:{w}", active[w], seen)
+            ops.union("seen", [active[w]])
+            ops.count((w, 0), cohort)
+            for k in range(1, weeks - w):
+                ops.count((w, k), ops.intersect("kept", cohort, active[w + k]))
+        counts = await ops.execute()
+
+    for w, week in enumerate(out["weeks"]):
+        kept = [counts[(w, k)] for k in range(weeks - w)]
+        users = kept[0]
+        out["cohorts"].append({
+            "week": week,
+            "users": users,
+            "retained": kept,
+            "retention_pct": [round(100 * n / users, 1) for n in kept] if users else [],
+        })
+    return out
@@ -0,0 +1,128 @@
+"""Dense users x days activity matrix for state models.
+
+The Markov model classified every user on every day with Python loops, looking
+up the last active day with a list comprehension per day.  :class:`ActivityMatrix`
+holds a boolean ``users x days`` matrix built with one scatter from all
+message timestamps; "days since last activity" is a forward fill
+(``np.maximum.accumulate`` over the column index of active cells), so states
+of all users and days are classified at once and transitions are counted with
+``np.bincount``::
+
+    m = ActivityMatrix.from_timestamps(user_timestamps, end_ts=time.time(), days=30)
+    states = m.states(m.start_index(first_seen))       # users x days, -1 before the start
+    counts = transition_counts(states)                 # 4 x 4 transition counts
+    m.dau()                                            # active users per day
+
+Column ``days - 1`` is the day that ends at ``end_ts``; a timestamp belongs to
+column ``days - 1 - floor((end_ts - ts) / 86400)``.
+"""
+from __future__ import annotations
+
+from typing import Any, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from shared.models import UserState
+
+DAY = 86400.0
+ACTIVE_MAX_GAP = 2     # days since last activity still counted as ACTIVE
+PASSIVE_MAX_GAP = 7    # ... as PASSIVE; longer gaps are INACTIVE
+OUTSIDE = -1           # state of days before a user's observation start
+
+
+class ActivityMatrix:
+    def __init__(self, uids: Sequence[Any], active: np.ndarray, end_ts: float):
+        self.uids = list(uids)
+        self.active = active
+        self.end_ts = end_ts
+        self.days = active.shape[1]
+
+    @classmethod
+    def from_timestamps(cls, user_timestamps: Mapping[Any, Sequence[float]], end_ts: float, days: int = 30,
+                        only_active: bool = True) -> "ActivityMatrix":
+        """Matrix of the ``days`` days ending at ``end_ts``; ``only_active`` drops users without activity in it."""
+        uids = list(user_timestamps)
+        lengths = np.fromiter((len(user_timestamps[u]) for u in uids), dtype=np.int64, count=len(uids))
+        ts = np.fromiter((t for u in uids for t in user_timestamps[u]), dtype=float, count=int(lengths.sum()))
+        rows = np.repeat(np.arange(len(uids)), lengths)
+        cols = days - 1 - np.floor((end_ts - ts) / DAY).astype(np.int64)
+        inside = (cols >= 0) & (cols < days)
+
+        active = np.zeros((len(uids), days), dtype=bool)
+        active[rows[inside], cols[inside]] = True
+        if only_active:
+            keep = active.any(axis=1)
+            active = active[keep]
+            uids = [u for u, k in zip(uids, keep) if k]
+        return cls(uids, active, end_ts)
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    def day_index(self, ts: np.ndarray) -> np.ndarray:
+        """Column of each timestamp (may fall outside ``[0, days)``)."""
+        return self.days - 1 - np.floor((self.end_ts - np.asarray(ts, dtype=float)) / DAY).astype(np.int64)
+
+    def start_index(self, first_seen: Mapping[Any, float]) -> np.ndarray:
+        """Column of each user's observation start (join or first activity), aligned with ``uids``."""
+        return self.day_index(np.array([first_seen[u] for u in self.uids], dtype=float))
+
+    def last_active(self) -> np.ndarray:
+        """Index of the last active day on or before each day, -1 if none (forward fill)."""
+        idx = np.where(self.active, np.arange(self.days), -1)
+        return np.maximum.accumulate(idx, axis=1)
+
+    def days_since_active(self, start: Optional[np.ndarray] = None) -> np.ndarray:
+        """Days since the last activity; before any activity, days since ``start`` (or -1 without it)."""
+        last = self.last_active()
+        cols = np.arange(self.days)
+        fallback = cols - start[:, None] if start is not None else np.full_like(last, -1)
+        return np.where(last >= 0, cols - last, fallback)
+
+    def states(self, start: np.ndarray) -> np.ndarray:
+        """:class:`UserState` per user and day; ``OUTSIDE`` before the observation start.
+
+        NEW on the start day (unless the user was active before it), ACTIVE within
+        ``ACTIVE_MAX_GAP`` days of the last activity, then PASSIVE up to
+        ``PASSIVE_MAX_GAP`` days and INACTIVE after that.
+        """
+        since = self.days_since_active(start)
+        cols = np.arange(self.days)
+        states = np.full(since.shape, UserState.INACTIVE, dtype=np.int8)
+        states[since <= PASSIVE_MAX_GAP] = UserState.PASSIVE
+        states[since <= ACTIVE_MAX_GAP] = UserState.ACTIVE
+        states[(since == 0) & (cols == start[:, None])] = UserState.NEW
+        states[cols < start[:, None]] = OUTSIDE
+        return states
+
+    def dau(self) -> np.ndarray:
+        """Active users per day."""
+        return self.active.sum(axis=0)
+
+    def active_day_counts(self) -> np.ndarray:
+        """Active days per user, aligned with ``uids``."""
+        return self.active.sum(axis=1)
+
+    def retained(self, first: Tuple[int, int], second: Tuple[int, int]) -> float:
+        """Share of users active in column range ``first`` who are active again in range ``second``.
+
+        Ranges are ``(start, stop)`` column pairs, e.g. last week vs. this week.
+        """
+        base = self.active[:, slice(*first)].any(axis=1)
+        if not base.any():
+            return 0.0
+        return float((base & self.active[:, slice(*second)].any(axis=1)).sum() / base.sum())
+
+
+def transition_counts(states: np.ndarray, num_states: int = len(UserState)) -> np.ndarray:
+    """``num_states x num_states`` counts of day-to-day state changes (``OUTSIDE`` days skipped)."""
+    prev, nxt = states[:, :-1].ravel(), states[:, 1:].ravel()
+    valid = (prev >= 0) & (nxt >= 0)
+    codes = prev[valid].astype(np.int64) * num_states + nxt[valid]
+    return np.bincount(codes, minlength=num_states * num_states).reshape(num_states, num_states)
+
+
+def state_distribution(states: np.ndarray, day: int = -1, num_states: int = len(UserState)) -> List[int]:
+    """Number of users in each state on one day (default: the last)."""
+    column = states[:, day]
+    return np.bincount(column[column >= 0].astype(np.int64), minlength=num_states).tolist()
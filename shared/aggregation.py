@@ -0,0 +1,236 @@
+"""Single-pass aggregation over the ``events:*`` sorted sets of one guild.
+
+Every analytics endpoint used to walk the event keys on its own, sometimes
+twice per request.  :func:`aggregate` fetches each user's events once (through
+:mod:`shared.batch_reader`), decodes every member once and feeds
+it to any combination of accumulators.  Adding a metric means adding an
+accumulator, not another traversal.
+
+Accumulators declare the event kinds they consume and receive events per user
+in timestamp order::
+
+    class MyAcc(Accumulator):
+        kinds = ("msg",)
+        def add(self, kind, uid, ts, data): ...
+        def end_user(self, kind, uid): ...   # optional
+        def result(self): ...
+"""
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from shared.batch_reader import MAX_CONCURRENCY, PIPELINE_CHUNK, iter_ranges
+from shared.event_codec import decode_event
+from shared.event_index import event_members
+from shared.keys import day_key
+
+ACTION_METRIC_MAP = {
+    "ban": "bans", "kick": "kicks", "timeout": "timeouts",
+    "unban": "unbans", "role_update": "role_updates",
+    "msg_delete": "msg_deleted", "verification": "verifications",
+}
+
+
+class Accumulator(ABC):
+    kinds: Tuple[str, ...] = ()
+
+    @abstractmethod
+    def add(self, kind: str, uid: str, ts: float, data: Dict[str, Any]) -> None:
+        pass
+
+    def end_user(self, kind: str, uid: str) -> None:
+        pass
+
+    @abstractmethod
+    def result(self) -> Any:
+        pass
+
+
+class ChatSessionizer(Accumulator):
+    """Weighted chat time per user: a session base per gap plus per-message weights."""
+    kinds = ("msg",)
+
+    def __init__(self, weights: Dict[str, Any], session_gap: int = 300):
+        self.gap = session_gap
+        self.w_session = weights.get("session_base", 180)
+        self.w_char = weights.get("char_weight", 1)
+        self.w_msg = weights.get("msg_weight", 0)
+        self.w_reply = weights.get("reply_weight", 60)
+        self.multiplier = weights.get("chat_time", 1)
+        self.per_user: Dict[str, float] = {}
+        self._last = 0.0
+        self._raw = 0.0
+
+    def add(self, kind, uid, ts, data):
+        if self._last == 0 or (ts - self._last) > self.gap:
+            self._raw += self.w_session
+        self._last = ts
+        self._raw += (data.get("len", 0) or 0) * self.w_char + self.w_msg
+        if data.get("reply"):
+            self._raw += self.w_reply
+
+    def end_user(self, kind, uid):
+        if self._raw > 0:
+            self.per_user[uid] = float(self._raw * self.multiplier)
+        self._last = 0.0
+        self._raw = 0.0
+
+    def result(self) -> Dict[str, float]:
+        return self.per_user
+
+
+class WeightedActions(Accumulator):
+    """Moderator action counts and weighted time per user, plus counts by type."""
+    kinds = ("action",)
+
+    def __init__(self, weights: Dict[str, Any]):
+        self.weights = weights
+        self.per_user: Dict[str, Dict[str, float]] = defaultdict(lambda: {"actions": 0, "weighted": 0.0})
+        self.by_type: Counter = Counter()
+
+    def add(self, kind, uid, ts, data):
+        action_type = data.get("type") or data.get("action") or "unknown"
+        w_key = ACTION_METRIC_MAP.get(action_type, action_type + "s")
+        weight = self.weights.get(w_key, self.weights.get(action_type, 0))
+        self.per_user[uid]["actions"] += 1
+        self.per_user[uid]["weighted"] += float(weight)
+        self.by_type[action_type] += 1
+
+    def result(self) -> Dict[str, Any]:
+        return {"per_user": dict(self.per_user), "by_type": self.by_type}
+
+
+class VoiceTime(Accumulator):
+    """Voice seconds and weighted voice time per user."""
+    kinds = ("voice",)
+
+    def __init__(self, weights: Optional[Dict[str, Any]] = None):
+        self.weight = (weights or {}).get("voice_time", 1)
+        self.per_user: Dict[str, Dict[str, float]] = defaultdict(lambda: {"seconds": 0, "weighted": 0.0})
+        self.total_seconds = 0
+
+    def add(self, kind, uid, ts, data):
+        duration = data.get("duration", 0) or 0
+        self.per_user[uid]["seconds"] += duration
+        self.per_user[uid]["weighted"] += float(duration * self.weight)
+        self.total_seconds += duration
+
+    def result(self) -> Dict[str, Any]:
+        return {"per_user": dict(self.per_user), "total_seconds": self.total_seconds}
+
+
+class LengthStats(Accumulator):
+    kinds = ("msg",)
+
+    def __init__(self):
+        self.count = 0
+        self.total_len = 0
+
+    def add(self, kind, uid, ts, data):
+        self.count += 1
+        self.total_len += data.get("len", 0) or 0
+
+    def result(self) -> Dict[str, float]:
+        return {"count": self.count, "total_len": self.total_len,
+                "avg_len": round(self.total_len / max(1, self.count), 1)}
+
+
+class ReplyRatio(Accumulator):
+    kinds = ("msg",)
+
+    def __init__(self):
+        self.count = 0
+        self.replies = 0
+
+    def add(self, kind, uid, ts, data):
+        self.count += 1
+        if data.get("reply"):
+            self.replies += 1
+
+    def result(self) -> Dict[str, float]:
+        return {"replies": self.replies, "ratio_pct": round((self.replies / max(1, self.count)) * 100, 1)}
+
+
+class WeekdayDistribution(Accumulator):
+    """Message counts per weekday (0 = Monday)."""
+    kinds = ("msg",)
+
+    def __init__(self):
+        self.counts = [0] * 7
+
+    def add(self, kind, uid, ts, data):
+        self.counts[datetime.fromtimestamp(ts).weekday()] += 1
+
+    def result(self) -> List[int]:
+        return self.counts
+
+
+class DailyMetrics(Accumulator):
+    """Per-day rollup counters (see :mod:`shared.rollups`)."""
+    kinds = ("msg", "voice", "action")
+
+    def __init__(self, metrics_fn, days: Optional[Iterable[str]] = None):
+        self.metrics_fn = metrics_fn
+        self.out: Dict[str, Counter] = {d: Counter() for d in (days or [])}
+        self.restrict = days is not None
+
+    def add(self, kind, uid, ts, data):
+        d = day_key(datetime.fromtimestamp(ts))
+        if self.restrict and d not in self.out:
+            return
+        bucket = self.out.setdefault(d, Counter())
+        for metric, value in self.metrics_fn(kind, data).items():
+            bucket[metric] += value
+
+    def result(self) -> Dict[str, Counter]:
+        return self.out
+
+
+class UserTimestamps(Accumulator):
+    """Sorted activity timestamps per user (Markov timelines, survival analysis)."""
+
+    def __init__(self, kinds: Sequence[str] = ("msg",)):
+        self.kinds = tuple(kinds)
+        self.per_user: Dict[str, List[float]] = defaultdict(list)
+
+    def add(self, kind, uid, ts, data):
+        self.per_user[uid].append(ts)
+
+    def result(self) -> Dict[str, List[float]]:
+        for values in self.per_user.values():
+            values.sort()
+        return dict(self.per_user)
+
+
+async def aggregate(r: Any, gid: Any, accumulators: Sequence[Accumulator],
+                    start: Any = "-inf", end: Any = "+inf",
+                    chunk_size: int = PIPELINE_CHUNK, concurrency: int = MAX_CONCURRENCY) -> Sequence[Accumulator]:
+    """Fetch every indexed user's events in ``[start, end]`` once and feed the accumulators."""
+    kinds = []
+    for acc in accumulators:
+        for kind in acc.kinds:
+            if kind not in kinds:
+                kinds.append(kind)
+
+    for kind in kinds:
+        consumers = [acc for acc in accumulators if kind in acc.kinds]
+        prefix = f"events:{kind}:{gid}:"
+        keys = [prefix + uid for uid in sorted(await event_members(r, gid, kind))]
+
+        async for key, rows in iter_ranges(r, keys, start, end, withscores=True,
+                                           chunk_size=chunk_size, concurrency=concurrency):
+            if not rows:
+                continue
+            uid = key[len(prefix):]
+            for member, score in rows:
+                # Undecodable members still count as activity at their timestamp
+                data = decode_event(member)
+                ts = float(score)
+                for acc in consumers:
+                    acc.add(kind, uid, ts, data)
+            for acc in consumers:
+                acc.end_user(kind, uid)
+    return accumulators
@@ -0,0 +1,282 @@
+"""Concurrent, resumable history backfill.
+
+Backfill commands used to walk the channels one after another and issue one or
+more Redis round-trips per message, so 180 days of a large guild took hours
+and a failure meant starting over.  :class:`BackfillEngine` reads several
+sources (channels, the audit log) concurrently, buffers their items into large
+batches that a :class:`BackfillTask` turns into one pipeline, and checkpoints
+the last item of every source in ``backfill:checkpoint:{job}:{gid}`` in the same
+pipeline::
+
+    engine = BackfillEngine(r, gid, task, window_start=after_ts)
+    report = await engine.run([
+        BackfillSource(str(ch.id), lambda cursor, start, ch=ch: history(ch, cursor, start))
+        for ch in guild.text_channels
+    ])
+
+A source is ``fetch(cursor, window_start)`` returning an async iterator of
+items oldest first, either after the item id ``cursor`` or, on a fresh start,
+after ``window_start``.  Running the same job again continues an unfinished
+checkpoint (same window, finished sources skipped) unless ``restart`` is set
+or the requested window reaches further back.  Tasks must write idempotently:
+the items between the last checkpoint and a crash are read twice.
+
+Discord rate limits are per route plus a global limit; :class:`RateLimiter`
+keeps all concurrent readers under ``rate`` pages per second so the library
+seldom has to back off on a 429.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from shared.keys import K_BACKFILL_CHECKPOINT, K_BACKFILL_LOCK, K_BACKFILL_PROGRESS
+
+PAGE_SIZE = 100            # items per history request
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_RATE = 25.0        # pages per second across all sources
+MAX_RETRIES = 3
+CHECKPOINT_TTL = 14 * 86400
+LOCK_TTL = 600
+PROGRESS_TTL = 86400
+# A new run continues an unfinished checkpoint whose window starts at most this much later
+RESUME_TOLERANCE = 86400
+
+
+class BackfillSource(NamedTuple):
+    id: str
+    fetch: Callable[[Optional[int], float], AsyncIterator[Any]]
+
+
+class BackfillTask:
+    """Turns batches of items into pipelined writes."""
+
+    job = ""
+
+    def cursor(self, item: Any) -> int:
+        """Monotonic id of an item within its source (Discord snowflake)."""
+        return item.id
+
+    def skip_error(self, exc: BaseException) -> bool:
+        """True if ``exc`` means the source can never be read (missing permissions)."""
+        return False
+
+    async def reset(self, r: Any, gid: Any) -> None:
+        """Called once before a fresh (not resumed) run."""
+
+    async def apply(self, pipe: Any, gid: Any, batch: List[Tuple[str, Any]]) -> Optional[Dict[str, int]]:
+        """Queue the writes of ``(source_id, item)`` pairs; may return counters to accumulate."""
+        raise NotImplementedError
+
+    async def finish(self, r: Any, gid: Any, window_start: float) -> None:
+        """Called once after every source has been read completely."""
+
+
+class RateLimiter:
+    """Token bucket shared by all readers of a run."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BackfillEngine:
+    def __init__(self, r: Any, gid: Any, task: BackfillTask, window_start: float, *,
+                 restart: bool = False, concurrency: int = DEFAULT_CONCURRENCY,
+                 batch_size: int = DEFAULT_BATCH_SIZE, limiter: Optional[RateLimiter] = None,
+                 on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+                 retry_delay: float = 2.0):
+        self.r = r
+        self.gid = gid
+        self.task = task
+        self.window_start = window_start
+        self.restart = restart
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.limiter = limiter or RateLimiter()
+        self.on_progress = on_progress
+        self.retry_delay = retry_delay
+        self.checkpoint_key = K_BACKFILL_CHECKPOINT(task.job, gid)
+        self.lock_key = K_BACKFILL_LOCK(task.job, gid)
+
+        self._batch: List[Tuple[str, Any]] = []
+        self._pending: Dict[str, int] = {}
+        self._finished: List[str] = []
+        self._flush_lock = asyncio.Lock()
+        self.cursors: Dict[str, int] = {}
+        self.done: set = set()
+        self.counts: Dict[str, int] = {}
+        self.processed = 0
+        self.errors: Dict[str, str] = {}
+        self.resumed = False
+        self._total = 0
+
+    async def _prepare(self) -> None:
+        state = await self.r.hgetall(self.checkpoint_key)
+        meta = json.loads(state.get("meta") or "{}")
+        stored_start = meta.get("window_start")
+        if (not self.restart and stored_start is not None
+                and self.window_start >= float(stored_start) - RESUME_TOLERANCE):
+            self.resumed = True
+            self.window_start = float(stored_start)
+            for field, value in state.items():
+                kind, _, sid = field.partition(":")
+                if kind == "c":
+                    self.cursors[sid] = int(value)
+                elif kind == "d":
+                    self.done.add(sid)
+                elif kind == "n":
+                    self.counts[sid] = int(value)
+            self.processed = self.counts.get("items", 0)
+            return
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.delete(self.checkpoint_key)
+            pipe.hset(self.checkpoint_key, "meta", json.dumps({"window_start": self.window_start,
+                                                               "started_at": time.time()}))
+            pipe.expire(self.checkpoint_key, CHECKPOINT_TTL)
+            await pipe.execute()
+        await self.task.reset(self.r, self.gid)
+
+    def report(self, status: str) -> Dict[str, Any]:
+        return {
+            "status": status,
+            "job": self.task.job,
+            "processed": self.processed,
+            "sources_done": len(self.done),
+            "sources_total": self._total,
+            "resumed": self.resumed,
+            "counts": dict(self.counts),
+            "errors": dict(self.errors),
+        }
+
+    async def _add(self, sid: str, item: Any) -> None:
+        self._batch.append((sid, item))
+        self._pending[sid] = self.task.cursor(item)
+        if len(self._batch) >= self.batch_size:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        async with self._flush_lock:
+            batch, self._batch = self._batch, []
+            pending, self._pending = self._pending, {}
+            finished, self._finished = self._finished, []
+            if not batch and not finished:
+                return
+            try:
+                async with self.r.pipeline(transaction=False) as pipe:
+                    counts = dict(await self.task.apply(pipe, self.gid, batch) or {}) if batch else {}
+                    counts["items"] = len(batch)
+                    # Checkpoints go last: they only advance once the writes before them were sent
+                    for sid, cursor in pending.items():
+                        pipe.hset(self.checkpoint_key, f"c:{sid}", cursor)
+                    for sid in finished:
+                        pipe.hset(self.checkpoint_key, f"d:{sid}", 1)
+                    for name, n in counts.items():
+                        if n:
+                            pipe.hincrby(self.checkpoint_key, f"n:{name}", n)
+                    pipe.expire(self.checkpoint_key, CHECKPOINT_TTL)
+                    pipe.set(self.lock_key, "1", ex=LOCK_TTL)
+                    await pipe.execute()
+            except BaseException:
+                # Back in front of what was buffered meanwhile; the next flush writes them again
+                self._batch = batch + self._batch
+                for sid, cursor in pending.items():
+                    self._pending.setdefault(sid, cursor)
+                self._finished = finished + self._finished
+                raise
+            for name, n in counts.items():
+                self.counts[name] = self.counts.get(name, 0) + n
+            self.processed += len(batch)
+            self.cursors.update(pending)
+            self.done.update(finished)
+        await self._publish("running")
+
+    async def _publish(self, status: str) -> None:
+        report = self.report(status)
+        try:
+            await self.r.set(K_BACKFILL_PROGRESS(self.gid), json.dumps(report), ex=PROGRESS_TTL)
+        except Exception as e:
+            print(f"[Backfill] Progress update failed: {e}")
+        if self.on_progress:
+            try:
+                await self.on_progress(report)
+            except Exception as e:
+                print(f"[Backfill] Progress callback failed: {e}")
+
+    async def _read(self, source: BackfillSource, slots: asyncio.Semaphore) -> None:
+        async with slots:
+            attempt = 0
+            # Every item up to the cursor is written or still buffered (a failed flush keeps its batch)
+            cursor = self.cursors.get(source.id)
+            while True:
+                seen = 0
+                try:
+                    await self.limiter.acquire()
+                    async for item in source.fetch(cursor, self.window_start):
+                        cursor = self.task.cursor(item)
+                        await self._add(source.id, item)
+                        seen += 1
+                        if seen % PAGE_SIZE == 0:
+                            await self.limiter.acquire()
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if self.task.skip_error(e):
+                        break
+                    attempt = 0 if seen else attempt + 1
+                    if attempt > MAX_RETRIES:
+                        self.errors[source.id] = str(e)
+                        return
+                    await asyncio.sleep(self.retry_delay * 2 ** max(0, attempt - 1))
+            self._finished.append(source.id)
+            await self._flush()
+
+    async def run(self, sources: List[BackfillSource]) -> Dict[str, Any]:
+        """Read all sources; the report's ``status`` is ``done``, ``incomplete``, ``failed`` or ``locked``."""
+        if not await self.r.set(self.lock_key, "1", ex=LOCK_TTL, nx=True):
+            return self.report("locked")
+        try:
+            await self._prepare()
+            self._total = len(sources)
+            todo = [s for s in sources if s.id not in self.done]
+            await self._publish("running")
+            slots = asyncio.Semaphore(self.concurrency)
+            readers = [asyncio.ensure_future(self._read(s, slots)) for s in todo]
+            try:
+                await asyncio.gather(*readers)
+            except Exception as e:
+                for reader in readers:
+                    reader.cancel()
+                await asyncio.gather(*readers, return_exceptions=True)
+                self.errors["write"] = str(e)
+                await self._publish("failed")
+                return self.report("failed")
+            await self._flush()
+
+            if self.errors:
+                await self._publish("incomplete")
+                return self.report("incomplete")
+            await self.task.finish(self.r, self.gid, self.window_start)
+            await self.r.delete(self.checkpoint_key)
+            await self._publish("done")
+            return self.report("done")
+        finally:
+            await self.r.delete(self.lock_key)
@@ -0,0 +1,97 @@
+"""Pipelined, bounded-concurrency reads over many Redis keys.
+
+Most analytics read one sorted set per user.  Issuing those reads one key at a
+time multiplies the Redis round-trip by the number of users; here keys are
+split into pipeline chunks, a limited number of chunks are in flight at once
+and results are streamed back as chunks complete::
+
+    async for key, rows in iter_ranges(r, keys, start_ts, "+inf", withscores=True):
+        ...
+
+Each key may also be given as ``(key, start, end)`` to use its own score range.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Callable, Iterable, List, Tuple, Union
+
+PIPELINE_CHUNK = 200
+MAX_CONCURRENCY = 8
+
+KeySpec = Union[str, Tuple[str, Any, Any]]
+
+
+async def iter_pipelined(r: Any, keys: Iterable[Any], queue: Callable[[Any, Any], None],
+                         chunk_size: int = PIPELINE_CHUNK,
+                         concurrency: int = MAX_CONCURRENCY) -> AsyncIterator[Tuple[Any, Any]]:
+    """Run ``queue(pipe, key)`` for every key in pipelined chunks and yield ``(key, result)``.
+
+    ``queue`` must add exactly one command per key.  Results arrive in chunk
+    completion order, not in input order.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    chunk_size = max(1, chunk_size or PIPELINE_CHUNK)
+    sem = asyncio.Semaphore(max(1, concurrency or MAX_CONCURRENCY))
+
+    async def run(chunk: List[Any]):
+        async with sem:
+            async with r.pipeline(transaction=False) as pipe:
+                for key in chunk:
+                    queue(pipe, key)
+                return chunk, await pipe.execute()
+
+    tasks = [asyncio.ensure_future(run(keys[i:i + chunk_size])) for i in range(0, len(keys), chunk_size)]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            chunk, results = await fut
+            for key, result in zip(chunk, results):
+                yield key, result
+    finally:
+        # Consumer stopped early (break / exception) - drop the remaining reads
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def _split(spec: KeySpec, start: Any, end: Any) -> Tuple[str, Any, Any]:
+    if isinstance(spec, tuple):
+        return spec
+    return spec, start, end
+
+
+async def iter_ranges(r: Any, keys: Iterable[KeySpec], start: Any = "-inf", end: Any = "+inf",
+                      withscores: bool = False, chunk_size: int = PIPELINE_CHUNK,
+                      concurrency: int = MAX_CONCURRENCY) -> AsyncIterator[Tuple[str, list]]:
+    """Stream ``(key, ZRANGEBYSCORE key start end)`` for many keys."""
+    specs = [_split(spec, start, end) for spec in keys]
+
+    def queue(pipe, spec):
+        pipe.zrangebyscore(spec[0], spec[1], spec[2], withscores=withscores)
+
+    async for spec, rows in iter_pipelined(r, specs, queue, chunk_size, concurrency):
+        yield spec[0], rows
+
+
+async def read_ranges(r: Any, keys: Iterable[KeySpec], start: Any = "-inf", end: Any = "+inf",
+                      withscores: bool = False, chunk_size: int = PIPELINE_CHUNK,
+                      concurrency: int = MAX_CONCURRENCY) -> dict:
+    """Collect :func:`iter_ranges` into ``{key: rows}``."""
+    return {key: rows async for key, rows in iter_ranges(r, keys, start, end, withscores, chunk_size, concurrency)}
+
+
+async def zcards(r: Any, keys: Iterable[str], chunk_size: int = PIPELINE_CHUNK,
+                 concurrency: int = MAX_CONCURRENCY) -> dict:
+    """``{key: ZCARD key}`` for many keys."""
+    return {key: n async for key, n in iter_pipelined(r, keys, lambda pipe, k: pipe.zcard(k), chunk_size, concurrency)}
+
+
+async def first_scores(r: Any, keys: Iterable[str], chunk_size: int = PIPELINE_CHUNK,
+                       concurrency: int = MAX_CONCURRENCY) -> dict:
+    """``{key: lowest score or None}`` for many sorted sets."""
+    out: dict = {}
+    async for key, rows in iter_pipelined(r, keys, lambda pipe, k: pipe.zrange(k, 0, 0, withscores=True),
+                                          chunk_size, concurrency):
+        out[key] = float(rows[0][1]) if rows else None
+    return out
@@ -9,6 +9,10 @@ class Settings(BaseSettings):
     
     activity_inactivity_threshold_days: int = 14
     event_retention_days: int = 90
+    # Max stored events per guild, oldest trimmed first by the retention sweep (0 = no budget)
+    event_budget_per_guild: int = 0
+    # Bearer token required by GET /metrics (empty = only scrapes from localhost)
+    metrics_token: str = ""
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
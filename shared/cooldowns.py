@@ -0,0 +1,109 @@
+"""Cooldowns with timing-wheel expiry and a hard memory bound.
+
+The ingestion cooldowns used to live in a dict that was swept every few
+minutes by scanning every entry, so memory grew with the number of active
+users between sweeps and the sweep itself paused the event loop on large
+servers.  :class:`CooldownWheel` files each entry into the slot of the tick in
+which it expires (a hashed timing wheel).  Every call advances the wheel by the
+ticks that passed and drops only the entries of those slots, so insert and
+expiry are amortized O(1) and no call ever walks the whole table::
+
+    wheel = CooldownWheel("dau", max_entries=200_000)
+    if wheel.allow((gid, uid, day), ttl_s=60):
+        ...  # first touch within the cooldown
+
+TTLs longer than the wheel span stay in their slot for additional rounds.
+Above ``max_entries`` the oldest entry is evicted: its cooldown ends early,
+which costs at most one redundant write.  Size and eviction counts are
+exported through :mod:`shared.metrics`.
+"""
+from __future__ import annotations
+
+import math
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from shared.metrics import REGISTRY
+
+DEFAULT_SPAN = 300.0
+DEFAULT_RESOLUTION = 1.0
+DEFAULT_MAX_ENTRIES = 200_000
+
+ENTRIES = REGISTRY.gauge("cooldown_entries", "Active entries in a cooldown wheel")
+CAPACITY = REGISTRY.gauge("cooldown_capacity", "Entry limit of a cooldown wheel")
+EXPIRED = REGISTRY.counter("cooldown_expired", "Cooldown entries reclaimed by the timing wheel")
+EVICTED = REGISTRY.counter("cooldown_evicted", "Cooldown entries evicted early by the memory bound")
+
+
+class CooldownWheel:
+    def __init__(self, name: str, span: float = DEFAULT_SPAN, resolution: float = DEFAULT_RESOLUTION,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.name = name
+        self.resolution = resolution
+        self.size = max(1, int(math.ceil(span / resolution)))
+        self.max_entries = max_entries
+        # key -> expiry; insertion order is expiry order for a fixed TTL, so eviction pops the front
+        self._exp: Dict[Hashable, float] = {}
+        # Slot entries whose expiry no longer matches _exp are stale and dropped when reached
+        self._slots: List[List[Tuple[Hashable, float]]] = [[] for _ in range(self.size)]
+        self._tick: Optional[int] = None
+        self._expired = EXPIRED.labels(wheel=name)
+        self._evicted = EVICTED.labels(wheel=name)
+        ENTRIES.labels(wheel=name).set_function(lambda: len(self._exp))
+        CAPACITY.labels(wheel=name).set(max_entries)
+
+    def __len__(self) -> int:
+        return len(self._exp)
+
+    def allow(self, key: Hashable, ttl_s: float, now: Optional[float] = None) -> bool:
+        """True (and start the cooldown) unless ``key`` is still cooling down."""
+        t = time.monotonic() if now is None else now
+        self.advance(t)
+        expires = self._exp.get(key)
+        if expires is not None:
+            if t < expires:
+                return False
+            del self._exp[key]
+        elif len(self._exp) >= self.max_entries:
+            del self._exp[next(iter(self._exp))]
+            self._evicted.inc()
+        expires = t + ttl_s
+        self._exp[key] = expires
+        # Filed one tick late so that reaching the slot means the entry has expired
+        self._slots[(int(expires // self.resolution) + 1) % self.size].append((key, expires))
+        return True
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """Expire the slots of the ticks passed since the last call; returns entries reclaimed."""
+        t = time.monotonic() if now is None else now
+        tick = int(t // self.resolution)
+        if self._tick is None:
+            self._tick = tick
+            return 0
+        if tick <= self._tick:
+            return 0
+        reclaimed = 0
+        # After a gap longer than one round every slot is visited exactly once
+        for current in range(max(self._tick + 1, tick - self.size + 1), tick + 1):
+            reclaimed += self._expire_slot(current % self.size, t)
+        self._tick = tick
+        if reclaimed:
+            self._expired.inc(reclaimed)
+        return reclaimed
+
+    def _expire_slot(self, idx: int, t: float) -> int:
+        entries = self._slots[idx]
+        if not entries:
+            return 0
+        keep: List[Tuple[Hashable, float]] = []
+        reclaimed = 0
+        for key, expires in entries:
+            if self._exp.get(key) != expires:
+                continue
+            if expires <= t:
+                del self._exp[key]
+                reclaimed += 1
+            else:
+                keep.append((key, expires))  # later round
+        self._slots[idx] = keep
+        return reclaimed
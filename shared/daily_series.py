@@ -0,0 +1,100 @@
+"""Finalized per-day series (DAU, message total, hourly vector).
+
+A closed day's HLL and hourly hash never change again, so the day-close job
+(:func:`shared.hll_pyramid.close_days`) freezes them into one hash per guild
+and month: ``stats:series:{gid}:{YYYYMM}`` with ``YYYYMMDD:dau``,
+``YYYYMMDD:msgs`` and ``YYYYMMDD:hourly`` (24 comma separated counts).
+
+Readers fetch a whole chart with one ``HMGET`` per month and only touch the
+live ``hll:dau`` / ``stats:hourly`` keys for today or for days that were never
+finalized (e.g. before this series existed).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, List, Sequence
+
+from shared.keys import K_DAILY_SERIES, K_DAU, K_HOURLY, day_key
+
+SERIES_METRICS = ("dau", "msgs", "hourly")
+
+# A few bytes per day; long-range charts are the point of the series.
+SERIES_TTL = 800 * 86400
+
+
+def hourly_vector(h_data: Dict[str, Any]) -> List[int]:
+    """Turn a ``stats:hourly`` hash into a 24 item list."""
+    vec = [0] * 24
+    for hour, count in (h_data or {}).items():
+        try:
+            h = int(hour)
+            if 0 <= h < 24:
+                vec[h] = int(float(count))
+        except (TypeError, ValueError):
+            continue
+    return vec
+
+
+def series_fields(d: date, dau: int, h_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields written for one finalized day."""
+    vec = hourly_vector(h_data)
+    ds = day_key(d)
+    return {
+        f"{ds}:dau": int(dau or 0),
+        f"{ds}:msgs": sum(vec),
+        f"{ds}:hourly": ",".join(str(v) for v in vec),
+    }
+
+
+def queue_finalize(pipe: Any, gid: Any, fields_by_day: Dict[date, Dict[str, Any]]) -> None:
+    """Queue HSETs for finalized days on a pipeline (not executed)."""
+    by_month: Dict[str, Dict[str, Any]] = defaultdict(dict)
+    for d, fields in fields_by_day.items():
+        by_month[d.strftime("%Y%m")].update(fields)
+    for month, mapping in by_month.items():
+        key = K_DAILY_SERIES(gid, month)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, SERIES_TTL)
+
+
+async def read_series(r: Any, gid: Any, days: Sequence[date], metric: str) -> List[Any]:
+    """Return ``metric`` for each day, falling back to live keys when not finalized.
+
+    ``dau`` and ``msgs`` are ints, ``hourly`` is a 24 item list.
+    """
+    months: Dict[str, List[date]] = defaultdict(list)
+    for d in days:
+        months[d.strftime("%Y%m")].append(d)
+
+    found: Dict[date, Any] = {}
+    for month, month_days in months.items():
+        values = await r.hmget(K_DAILY_SERIES(gid, month), [f"{day_key(d)}:{metric}" for d in month_days])
+        for d, value in zip(month_days, values):
+            if value is not None:
+                found[d] = value
+
+    missing = [d for d in days if d not in found]
+    if missing:
+        async with r.pipeline(transaction=False) as pipe:
+            for d in missing:
+                if metric == "dau":
+                    pipe.pfcount(K_DAU(gid, day_key(d)))
+                else:
+                    pipe.hgetall(K_HOURLY(gid, day_key(d)))
+            live = await pipe.execute()
+        for d, value in zip(missing, live):
+            if metric == "dau":
+                found[d] = value
+            else:
+                vec = hourly_vector(value)
+                found[d] = sum(vec) if metric == "msgs" else vec
+
+    out = []
+    for d in days:
+        value = found.get(d, 0)
+        if metric == "hourly":
+            out.append(value if isinstance(value, list) else [int(v) for v in str(value).split(",")])
+        else:
+            out.append(int(value or 0))
+    return out
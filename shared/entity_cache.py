@@ -0,0 +1,125 @@
+"""Process-local metadata cache for users, channels and guild roles.
+
+Leaderboards, exports and health views hydrate names row by row
+(``HGETALL user:info:{uid}``).  :class:`EntityCache` keeps recently used hashes
+in an LRU with a TTL and resolves the misses of a :meth:`EntityCache.get_many`
+call in one pipelined round-trip::
+
+    users = await entity_cache(r).get_many("user", uids)
+    name = users[uid].get("name")
+
+One cache exists per process (see :func:`entity_cache`); the client passed in
+only resolves its misses.  Unknown entities are remembered for ``miss_ttl``
+seconds only, so a profile written shortly after a miss shows up quickly.
+Writers in the same process call :meth:`EntityCache.invalidate`; changes made by
+other processes become visible after ``ttl`` seconds.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from shared.keys import K_CHANNEL_INFO, K_GUILD_ROLES, K_USER_INFO
+
+ENTITY_KEYS: Dict[str, Callable[[Any], str]] = {
+    "user": K_USER_INFO,
+    "channel": K_CHANNEL_INFO,
+    "roles": K_GUILD_ROLES,
+}
+
+DEFAULT_MAXSIZE = 20000
+DEFAULT_TTL = 300
+MISS_TTL = 5
+
+
+class EntityCache:
+    def __init__(self, r: Any = None, maxsize: int = DEFAULT_MAXSIZE, ttl: float = DEFAULT_TTL,
+                 miss_ttl: float = MISS_TTL):
+        self.r = r
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, str]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, kind: str, entity_id: str, now: float) -> Optional[Dict[str, str]]:
+        item = self._data.get((kind, entity_id))
+        if item is None:
+            return None
+        expires, value = item
+        if expires < now:
+            del self._data[(kind, entity_id)]
+            return None
+        self._data.move_to_end((kind, entity_id))
+        return value
+
+    def _store(self, kind: str, entity_id: str, value: Dict[str, str], now: float) -> None:
+        self._data[(kind, entity_id)] = (now + (self.ttl if value else self.miss_ttl), value)
+        self._data.move_to_end((kind, entity_id))
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_many(self, kind: str, ids: Iterable[Any], r: Any = None) -> Dict[str, Dict[str, str]]:
+        """Return ``{id: hash}`` for every id (``{}`` for unknown entities); misses are read through ``r``."""
+        key_fn = ENTITY_KEYS[kind]
+        now = time.monotonic()
+        out: Dict[str, Dict[str, str]] = {}
+        missing: Dict[str, None] = {}  # ordered set, ids may repeat
+        for raw_id in ids:
+            entity_id = str(raw_id)
+            if entity_id in out or entity_id in missing:
+                continue
+            value = self._lookup(kind, entity_id, now)
+            if value is None:
+                missing[entity_id] = None
+            else:
+                out[entity_id] = value
+        self.hits += len(out)
+        self.misses += len(missing)
+
+        if missing:
+            async with (r if r is not None else self.r).pipeline(transaction=False) as pipe:
+                for entity_id in missing:
+                    pipe.hgetall(key_fn(entity_id))
+                results = await pipe.execute()
+            for entity_id, value in zip(missing, results):
+                value = value or {}
+                self._store(kind, entity_id, value, now)
+                out[entity_id] = value
+        return out
+
+    async def get(self, kind: str, entity_id: Any, r: Any = None) -> Dict[str, str]:
+        return (await self.get_many(kind, [entity_id], r))[str(entity_id)]
+
+    def invalidate(self, kind: str, entity_id: Any) -> None:
+        self._data.pop((kind, str(entity_id)), None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class _ClientView:
+    """The process-wide cache with misses read through one client."""
+
+    def __init__(self, cache: EntityCache, r: Any):
+        self.cache = cache
+        self.r = r
+
+    async def get_many(self, kind: str, ids: Iterable[Any]) -> Dict[str, Dict[str, str]]:
+        return await self.cache.get_many(kind, ids, self.r)
+
+    async def get(self, kind: str, entity_id: Any) -> Dict[str, str]:
+        return await self.cache.get(kind, entity_id, self.r)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.cache, name)
+
+
+_cache = EntityCache()
+
+
+def entity_cache(r: Any) -> _ClientView:
+    """The process-wide :class:`EntityCache`, resolving misses through ``r``."""
+    return _ClientView(_cache, r)
@@ -0,0 +1,109 @@
+"""Compact, versioned encoding of ``events:*`` sorted-set members.
+
+Members used to be JSON objects (``{"mid": ..., "len": ..., "reply": ...}``).
+The compact form is a short tag followed by ``|`` separated positional fields:
+
+* ``m1|mid|len|reply|reactions|title`` - message (``reactions`` empty when unknown)
+* ``v1|duration|start_ts``             - voice session
+* ``a1|type|id``                       - moderation action
+
+All Redis clients in the project use ``decode_responses=True``, so the codec
+stays ASCII/UTF-8 text instead of packed binary.  ``decode_event`` also accepts
+legacy JSON members, which keeps unmigrated keys readable while
+``scripts/migrate_event_codec.py`` rewrites them.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Dict
+
+MSG_TAG = "m1"
+VOICE_TAG = "v1"
+ACTION_TAG = "a1"
+
+
+def _num(value: Any) -> str:
+    if value is None or value == "":
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def encode_event(kind: str, data: Dict[str, Any]) -> str:
+    """Encode a decoded event dict for ``events:{kind}:*``."""
+    if kind == "msg":
+        reactions = _num(data.get("reaction_count")) if "reaction_count" in data else ""
+        return "|".join((
+            MSG_TAG,
+            _num(data.get("mid", data.get("id", ""))),
+            _num(data.get("len", 0) or 0),
+            "1" if data.get("reply") else "0",
+            reactions,
+            str(data.get("title") or "").replace("\n", " "),
+        ))
+    if kind == "voice":
+        return "|".join((VOICE_TAG, _num(int(data.get("duration", 0) or 0)), _num(data.get("ts", ""))))
+    if kind == "action":
+        return "|".join((ACTION_TAG, str(data.get("type") or data.get("action") or "unknown"), _num(data.get("id", ""))))
+    raise ValueError(f"Unknown event kind: {kind}")
+
+
+def _int_or_none(value: str):
+    if value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+def decode_event(member: Any) -> Dict[str, Any]:
+    """Decode a member in either format; returns ``{}`` when unreadable.
+
+    The result has the same keys the JSON members used, so callers can keep
+    using ``data.get("len")``, ``data["duration"]``, ``data.get("type")``.
+    """
+    if isinstance(member, bytes):
+        member = member.decode("utf-8", "replace")
+    if not isinstance(member, str) or not member:
+        return {}
+    if member[0] == "{":
+        try:
+            data = json.loads(member)
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    tag = member[:2]
+    if tag == MSG_TAG:
+        parts = member.split("|", 5)
+        if len(parts) < 4:
+            return {}
+        data = {"mid": _int_or_none(parts[1]), "len": int(parts[2] or 0), "reply": parts[3] == "1"}
+        if len(parts) > 4 and parts[4] != "":
+            data["reaction_count"] = int(parts[4])
+        if len(parts) > 5 and parts[5]:
+            data["title"] = parts[5]
+        return data
+    if tag == VOICE_TAG:
+        parts = member.split("|")
+        if len(parts) < 2:
+            return {}
+        return {"duration": int(parts[1] or 0), "ts": _int_or_none(parts[2]) if len(parts) > 2 else None}
+    if tag == ACTION_TAG:
+        parts = member.split("|", 2)
+        if len(parts) < 2:
+            return {}
+        return {"type": parts[1], "id": _int_or_none(parts[2]) if len(parts) > 2 else None}
+    return {}
+
+
+def is_compact(member: Any) -> bool:
+    """True when ``member`` already uses the compact encoding."""
+    if isinstance(member, bytes):
+        member = member.decode("utf-8", "replace")
+    return isinstance(member, str) and member[:2] in (MSG_TAG, VOICE_TAG, ACTION_TAG) and member[2:3] == "|"
@@ -0,0 +1,62 @@
+"""Per-guild member index for the ``events:{kind}:{gid}:{uid}`` sorted sets.
+
+Readers used to discover users with ``SCAN events:msg:{gid}:*``, which walks
+the whole keyspace regardless of guild size.  Writers now add the uid to
+``events:members:{gid}:{kind}`` next to every ZADD and readers iterate that set
+instead.  Guilds ingested before the index existed are rebuilt lazily with a
+single SCAN the first time they are read.
+"""
+from __future__ import annotations
+
+from typing import Any, List, Set
+
+from shared.keys import K_EVENT_MEMBERS, K_EVENT_MEMBERS_BUILT
+
+EVENT_KINDS = ("msg", "voice", "action")
+
+
+def event_key(gid: Any, kind: str, uid: Any) -> str:
+    return f"events:{kind}:{gid}:{uid}"
+
+
+def index_member(r: Any, gid: Any, kind: str, uid: Any):
+    """Register uid in the guild index.  Works on clients and pipelines.
+
+    Returns the awaitable from the client, or the pipeline itself when called
+    on a pipeline, so callers simply ``await`` it when not pipelining.
+    """
+    return r.sadd(K_EVENT_MEMBERS(gid, kind), str(uid))
+
+
+async def rebuild_members(r: Any, gid: Any, kind: str) -> int:
+    """Populate the index from existing event keys (one-off SCAN)."""
+    prefix = f"events:{kind}:{gid}:"
+    batch: List[str] = []
+    added = 0
+    async for key in r.scan_iter(f"{prefix}*"):
+        batch.append(key[len(prefix):])
+        if len(batch) >= 500:
+            added += await r.sadd(K_EVENT_MEMBERS(gid, kind), *batch)
+            batch = []
+    if batch:
+        added += await r.sadd(K_EVENT_MEMBERS(gid, kind), *batch)
+    await r.set(K_EVENT_MEMBERS_BUILT(gid, kind), "1")
+    return added
+
+
+async def event_members(r: Any, gid: Any, kind: str) -> Set[str]:
+    """Return user IDs that have ``events:{kind}:{gid}:*`` data."""
+    if not await r.exists(K_EVENT_MEMBERS_BUILT(gid, kind)):
+        await rebuild_members(r, gid, kind)
+    return set(await r.smembers(K_EVENT_MEMBERS(gid, kind)))
+
+
+async def event_keys(r: Any, gid: Any, kind: str) -> List[str]:
+    """Return event sorted-set keys for every indexed member of the guild."""
+    return [event_key(gid, kind, uid) for uid in sorted(await event_members(r, gid, kind))]
+
+
+async def drop_member(r: Any, gid: Any, uid: Any) -> None:
+    """Remove uid from every index of the guild (GDPR deletion)."""
+    for kind in EVENT_KINDS:
+        await r.srem(K_EVENT_MEMBERS(gid, kind), str(uid))
@@ -0,0 +1,299 @@
+"""Per-guild Redis Streams event log with consumer-group aggregators.
+
+The bot cogs append one compact entry per gateway event to
+``stream:events:{gid}``.  Derived data (raw event sorted sets, dashboard
+counters, DAU HLLs, health indexes) is maintained by :class:`StreamAggregator` subclasses, each reading the streams
+through its own consumer group::
+
+    append(pipe, gid, {"type": "touch", "uid": uid, "ts": ts})
+
+    consumer = StreamConsumer(r, DauAggregator())
+    await consumer.run_forever()
+
+Every aggregator applies a batch and ``XACK``s it in one ``MULTI`` so a batch
+is counted once per group even when a consumer dies mid-way; its entries stay
+pending and are reclaimed by another consumer after ``claim_idle_ms``.  A
+consumer that was only slow may still apply the batch it lost, so groups whose
+writes are not idempotent also record the applied entry IDs in
+``stream:applied:{group}:{gid}`` within the same ``MULTI`` (``WATCH``ed) and
+skip entries already there; IDs are kept for ``APPLIED_TTL`` seconds.  Any
+number of processes may consume the same group (``python -m
+scripts.stream_aggregator``).  A new aggregator starts at the beginning of the
+retained stream, and :func:`replay` rewinds an existing one, so aggregates
+can be back-populated from history.
+
+Streams are trimmed behind the slowest group (:func:`trim_acknowledged`, run
+by every consumer each ``CLAIM_INTERVAL``): entries still unread or pending in
+any group are kept.  ``STREAM_MAXLEN`` only caps a stream whose group has
+stopped consuming; entries it trims before a group applied them are counted in
+``stream_trimmed_unread`` and logged.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from redis.exceptions import ResponseError, WatchError
+
+from shared.keys import K_EVENT_STREAM, K_EVENT_STREAMS, K_STREAM_APPLIED
+from shared.metrics import REGISTRY, SIZE_BUCKETS
+
+# Safety cap for a stream whose group stopped consuming (days of traffic of a busy guild)
+STREAM_MAXLEN = 2000000
+READ_COUNT = 500
+BLOCK_MS = 2000
+CLAIM_IDLE_MS = 60000
+CLAIM_INTERVAL = 30.0
+# How long a non-idempotent group remembers applied entry IDs (bounds how late a stalled consumer may finish)
+APPLIED_TTL = 3600
+WATCH_RETRIES = 3
+
+Entry = Tuple[str, Dict[str, str]]
+
+ENTRIES = REGISTRY.counter("stream_entries", "Stream entries acknowledged per aggregator group")
+APPLY_SECONDS = REGISTRY.histogram("stream_apply_seconds", "Time to apply and ack one batch per group")
+APPLY_BATCH = REGISTRY.histogram("stream_batch_size", "Entries per applied batch", buckets=SIZE_BUCKETS)
+TRIMMED_UNREAD = REGISTRY.counter("stream_trimmed_unread",
+                                  "Entries trimmed by STREAM_MAXLEN before the group applied them")
+
+
+def append(pipe: Any, gid: Any, fields: Dict[str, Any], maxlen: int = STREAM_MAXLEN) -> None:
+    """Queue ``XADD`` of one event (``None`` fields are left out) on a pipeline."""
+    pipe.xadd(K_EVENT_STREAM(gid), {k: str(v) for k, v in fields.items() if v is not None},
+              maxlen=maxlen, approximate=True)
+    pipe.sadd(K_EVENT_STREAMS(), str(gid))
+
+
+class StreamAggregator:
+    """Maintains one family of derived keys from the event streams."""
+    group: str = ""
+    types: Tuple[str, ...] = ()
+    # Applying an entry twice leaves the same keys (SET/ZADD/PFADD/SETBIT); required by :func:`replay`
+    idempotent: bool = True
+
+    def accepts(self, fields: Dict[str, str]) -> bool:
+        return not self.types or fields.get("type") in self.types
+
+    async def prepare(self, r: Any, gid: str, entries: Sequence[Entry]) -> None:
+        """Reads :meth:`apply` depends on, done before the ``MULTI`` (e.g. ID lookups)."""
+
+    def apply(self, pipe: Any, gid: str, entries: Sequence[Entry]) -> None:
+        """Queue the writes for a batch of entries of one guild (not executed)."""
+        raise NotImplementedError
+
+
+class StreamConsumer:
+    def __init__(self, r: Any, aggregator: StreamAggregator, consumer: Optional[str] = None,
+                 count: int = READ_COUNT, block_ms: int = BLOCK_MS, claim_idle_ms: int = CLAIM_IDLE_MS):
+        self.r = r
+        self.aggregator = aggregator
+        self.group = aggregator.group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.count = count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.stats: Counter = Counter()
+        self._known: set = set()
+        self._last_claim = 0.0
+
+    async def ensure_group(self, stream: str, start_id: str = "0") -> None:
+        try:
+            await self.r.xgroup_create(stream, self.group, id=start_id, mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._known.add(stream)
+
+    async def streams(self) -> List[str]:
+        """Streams of all guilds, creating this group on streams seen for the first time."""
+        streams = sorted(K_EVENT_STREAM(gid) for gid in await self.r.smembers(K_EVENT_STREAMS()))
+        for stream in streams:
+            if stream not in self._known:
+                await self.ensure_group(stream)
+        return streams
+
+    async def process(self, stream: str, entries: Sequence[Entry]) -> int:
+        """Apply a batch and acknowledge it atomically; returns the number of entries acked."""
+        ids = [eid for eid, _ in entries]
+        relevant = [(eid, fields) for eid, fields in entries if fields and self.aggregator.accepts(fields)]
+        if not ids:
+            return 0
+        # Entries trimmed by STREAM_MAXLEN while pending come back without fields (Redis < 7)
+        self.count_trimmed(stream, sum(1 for _, fields in entries if not fields))
+        gid = stream.rsplit(":", 1)[1]
+        started = time.perf_counter()
+        if relevant:
+            await self.aggregator.prepare(self.r, gid, relevant)
+        if self.aggregator.idempotent:
+            async with self.r.pipeline(transaction=True) as pipe:
+                if relevant:
+                    self.aggregator.apply(pipe, gid, relevant)
+                pipe.xack(stream, self.group, *ids)
+                await pipe.execute()
+        else:
+            relevant = await self._apply_once(stream, gid, ids, relevant)
+        APPLY_SECONDS.labels(group=self.group).observe(time.perf_counter() - started)
+        APPLY_BATCH.labels(group=self.group).observe(len(ids))
+        ENTRIES.labels(group=self.group).inc(len(ids))
+        self.stats["processed"] += len(relevant)
+        self.stats["acked"] += len(ids)
+        return len(ids)
+
+    async def _apply_once(self, stream: str, gid: str, ids: List[str],
+                          relevant: List[Entry]) -> List[Entry]:
+        """Apply the entries no consumer of the group has applied yet, then ack ``ids``.
+
+        Another consumer may have claimed and applied the same entries while
+        this one was stalled; the ``WATCH`` on the applied set aborts the
+        ``MULTI`` when it commits first, and the retry skips its entries.
+        """
+        applied = K_STREAM_APPLIED(self.group, gid)
+        for _ in range(WATCH_RETRIES):
+            async with self.r.pipeline(transaction=True) as pipe:
+                await pipe.watch(applied)
+                todo = relevant
+                if relevant:
+                    seen = await pipe.zmscore(applied, [eid for eid, _ in relevant])
+                    todo = [entry for entry, score in zip(relevant, seen) if score is None]
+                pipe.multi()
+                if todo:
+                    now = time.time()
+                    self.aggregator.apply(pipe, gid, todo)
+                    pipe.zadd(applied, {eid: now for eid, _ in todo})
+                    pipe.zremrangebyscore(applied, "-inf", now - APPLIED_TTL)
+                    pipe.expire(applied, APPLIED_TTL)
+                pipe.xack(stream, self.group, *ids)
+                try:
+                    await pipe.execute()
+                except WatchError:
+                    continue
+            self.stats["duplicates"] += len(relevant) - len(todo)
+            return todo
+        raise WatchError(f"Applied set {applied} kept changing")
+
+    def count_trimmed(self, stream: str, lost: int) -> None:
+        """Record entries this group lost to ``STREAM_MAXLEN`` before applying them."""
+        if not lost:
+            return
+        TRIMMED_UNREAD.labels(group=self.group).inc(lost)
+        self.stats["trimmed"] += lost
+        print(f"[EventStream] Group '{self.group}' lost {lost} entries of {stream} trimmed before they were applied")
+
+    async def claim_stale(self, streams: Iterable[str]) -> int:
+        """Take over entries a dead consumer read but never acknowledged."""
+        done = 0
+        for stream in streams:
+            start = "0-0"
+            while True:
+                res = await self.r.xautoclaim(stream, self.group, self.consumer, self.claim_idle_ms,
+                                              start_id=start, count=self.count)
+                start, entries = res[0], res[1]
+                # Redis 7 drops trimmed pending entries from the PEL and lists their IDs instead
+                self.count_trimmed(stream, len(res[2]) if len(res) > 2 else 0)
+                if entries:
+                    self.stats["claimed"] += len(entries)
+                    done += await self.process(stream, entries)
+                if not entries or start in ("0-0", b"0-0"):
+                    break
+        return done
+
+    async def run_once(self, block_ms: Optional[int] = None) -> int:
+        """Read and apply one round of new entries from every guild stream; returns entries acked."""
+        streams = await self.streams()
+        if not streams:
+            if block_ms is None or block_ms > 0:
+                await asyncio.sleep((self.block_ms if block_ms is None else block_ms) / 1000)
+            return 0
+        done = 0
+        loop = asyncio.get_event_loop()
+        if loop.time() - self._last_claim >= CLAIM_INTERVAL:
+            self._last_claim = loop.time()
+            done += await self.claim_stale(streams)
+            for stream in streams:
+                await trim_acknowledged(self.r, stream)
+        block = self.block_ms if block_ms is None else block_ms
+        resp = await self.r.xreadgroup(self.group, self.consumer, {s: ">" for s in streams},
+                                       count=self.count, block=block or None)
+        for stream, entries in resp or []:
+            done += await self.process(stream, entries)
+        return done
+
+    async def drain(self) -> int:
+        """Apply everything currently in the streams (tests, one-off replays)."""
+        total = 0
+        while True:
+            n = await self.run_once(block_ms=0)
+            if not n:
+                return total
+            total += n
+
+    async def run_forever(self) -> None:
+        print(f"[EventStream] Consumer {self.consumer} of group '{self.group}' started.")
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[EventStream] Group '{self.group}' failed: {e}")
+                await asyncio.sleep(1)
+
+
+def _stream_id(eid: str) -> Tuple[int, int]:
+    ms, _, seq = eid.partition("-")
+    return int(ms), int(seq or 0)
+
+
+async def trim_acknowledged(r: Any, stream: str) -> int:
+    """Trim the entries every group of ``stream`` has acknowledged; returns the number removed.
+
+    A group keeps everything from its oldest pending entry on, or after its
+    last delivered entry when nothing is pending.  Streams without groups are
+    left alone.
+    """
+    keep = []
+    for info in await r.xinfo_groups(stream):
+        if int(info.get("pending") or 0):
+            keep.append((await r.xpending(stream, info["name"]))["min"])
+        else:
+            keep.append(info["last-delivered-id"])
+    if not keep:
+        return 0
+    min_id = min(keep, key=_stream_id)
+    if min_id in ("0-0", b"0-0"):
+        return 0
+    return await r.xtrim(stream, minid=min_id, approximate=True)
+
+
+async def replay(r: Any, group: str, gids: Optional[Iterable[Any]] = None, from_id: str = "0") -> int:
+    """Rewind ``group`` to ``from_id`` on the given (default: all) guild streams.
+
+    The group is recreated, so entries pending for its consumers are dropped.
+    Only replay groups whose aggregator is ``idempotent``: counters would count
+    the retained entries a second time.
+    """
+    gids = list(gids) if gids is not None else list(await r.smembers(K_EVENT_STREAMS()))
+    rewound = 0
+    for gid in gids:
+        stream = K_EVENT_STREAM(gid)
+        if not await r.exists(stream):
+            continue
+        try:
+            await r.xgroup_destroy(stream, group)
+        except ResponseError:
+            pass
+        await r.xgroup_create(stream, group, id=from_id, mkstream=True)
+        rewound += 1
+    return rewound
+
+
+def start_consumers(r: Any, aggregators: Sequence[StreamAggregator],
+                    consumer: Optional[str] = None) -> List[asyncio.Task]:
+    """Run one consumer task per aggregator in the current event loop."""
+    loop = asyncio.get_event_loop()
+    return [loop.create_task(StreamConsumer(r, agg, consumer).run_forever()) for agg in aggregators]
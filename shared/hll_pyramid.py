@@ -0,0 +1,162 @@
+"""HyperLogLog pyramid for unique-user counts over arbitrary date ranges.
+
+The bot writes one ``hll:dau:{gid}:{YYYYMMDD}`` sketch per day.  Once a day is
+closed it is merged into a Monday-aligned weekly sketch and a calendar-month
+sketch.  A range is then covered greedily by whole months, whole weeks and the
+remaining days, so a 30-day window needs a handful of keys instead of 30 and a
+year needs ~12 instead of 365.  ``PFCOUNT`` over several keys returns the size
+of their union, so no temporary ``PFMERGE`` is needed at read time.
+
+Closing is incremental and idempotent: ``close_days`` merges every day since
+``hll:closed:{gid}`` and is safe to call from both the bot and the web.  The
+same job freezes each closed day into :mod:`shared.daily_series`.
+
+Only the last ``DAY_RETENTION_DAYS`` days still have daily sketches, so the
+first build (or one after a longer pause) starts there and records that day in
+``hll:since:{gid}``.  Weeks and months that begin before it are incomplete and
+ranges fall back to day keys for them.  Pyramids built before this key existed
+have none and are treated as complete.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from shared.daily_series import queue_finalize, series_fields
+from shared.keys import K_DAU, K_HLL_CLOSED, K_HLL_MONTH, K_HLL_SINCE, K_HLL_WEEK, K_HOURLY, day_key
+
+# Daily sketches are kept for 40 days by the bot; merged levels outlive them.
+DAY_RETENTION_DAYS = 40
+WEEK_TTL = 120 * 86400
+MONTH_TTL = 400 * 86400
+
+# Late PFADDs from the ingestion queue can land shortly after midnight.
+CLOSE_GRACE = timedelta(minutes=15)
+
+
+def _parse_day(value: Any) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def closable_day(now: Optional[datetime] = None) -> date:
+    """Latest day that can no longer receive writes."""
+    now = now or datetime.now(timezone.utc)
+    return (now - CLOSE_GRACE).date() - timedelta(days=1)
+
+
+def _month_end(d: date) -> date:
+    nxt = date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+    return nxt - timedelta(days=1)
+
+
+async def close_days(r: Any, gid: Any, now: Optional[datetime] = None) -> date:
+    """Merge every closed, not yet merged day into its week and month sketch
+    and write its finalized DAU / message series.
+
+    Returns the last closed day.
+    """
+    last = closable_day(now)
+    done = _parse_day(await r.get(K_HLL_CLOSED(gid)))
+    start = done + timedelta(days=1) if done else last - timedelta(days=DAY_RETENTION_DAYS - 1)
+    start = max(start, last - timedelta(days=DAY_RETENTION_DAYS - 1))
+    if start > last:
+        return done
+    # Days before start were never merged (first build) or are gone (gap): coverage restarts here
+    restarted = done is None or start > done + timedelta(days=1)
+
+    closing = [start + timedelta(days=i) for i in range((last - start).days + 1)]
+    async with r.pipeline(transaction=False) as pipe:
+        for d in closing:
+            pipe.pfcount(K_DAU(gid, day_key(d)))
+            pipe.hgetall(K_HOURLY(gid, day_key(d)))
+        snapshot = await pipe.execute()
+
+    async with r.pipeline(transaction=False) as pipe:
+        for d in closing:
+            dk = K_DAU(gid, day_key(d))
+            wk = K_HLL_WEEK(gid, day_key(d - timedelta(days=d.weekday())))
+            mk = K_HLL_MONTH(gid, d.strftime("%Y%m"))
+            # Destination listed as a source too: not every Redis flavour unions it implicitly
+            pipe.pfmerge(wk, wk, dk)
+            pipe.expire(wk, WEEK_TTL)
+            pipe.pfmerge(mk, mk, dk)
+            pipe.expire(mk, MONTH_TTL)
+        queue_finalize(pipe, gid, {
+            d: series_fields(d, snapshot[2 * i], snapshot[2 * i + 1]) for i, d in enumerate(closing)
+        })
+        pipe.set(K_HLL_CLOSED(gid), day_key(last))
+        if restarted:
+            pipe.set(K_HLL_SINCE(gid), day_key(start))
+        await pipe.execute()
+    return last
+
+
+async def coverage(r: Any, gid: Any, now: Optional[datetime] = None) -> Tuple[Optional[date], Optional[date]]:
+    """Close pending days; returns ``(first, last)`` day merged into the weeks and months."""
+    closed = await close_days(r, gid, now)
+    return _parse_day(await r.get(K_HLL_SINCE(gid))), closed
+
+
+def plan_range(gid: Any, start: date, end: date, closed_through: Optional[date],
+               closed_from: Optional[date] = None) -> List[str]:
+    """Cover ``[start, end]`` with the fewest pyramid keys.
+
+    Weekly and monthly sketches are only used when every day they contain is
+    inside the range and was merged into them, i.e. lies between
+    ``closed_from`` and ``closed_through``.
+    """
+    keys: List[str] = []
+    cur = start
+    while cur <= end:
+        if closed_from and cur < closed_from:
+            keys.append(K_DAU(gid, day_key(cur)))
+            cur += timedelta(days=1)
+            continue
+        if closed_through and cur.day == 1:
+            m_end = _month_end(cur)
+            if m_end <= end and m_end <= closed_through:
+                keys.append(K_HLL_MONTH(gid, cur.strftime("%Y%m")))
+                cur = m_end + timedelta(days=1)
+                continue
+        if closed_through and cur.weekday() == 0:
+            w_end = cur + timedelta(days=6)
+            if w_end <= end and w_end <= closed_through:
+                keys.append(K_HLL_WEEK(gid, day_key(cur)))
+                cur = w_end + timedelta(days=1)
+                continue
+        keys.append(K_DAU(gid, day_key(cur)))
+        cur += timedelta(days=1)
+    return keys
+
+
+async def range_uniques(r: Any, gid: Any, start: date, end: date) -> int:
+    """Unique users active anywhere in ``[start, end]``."""
+    since, closed = await coverage(r, gid)
+    keys = plan_range(gid, start, end, closed, since)
+    return int(await r.pfcount(*keys)) if keys else 0
+
+
+async def uniques_series(r: Any, gid: Any, days: Sequence[date],
+                         windows: Iterable[int] = (1, 7, 30)) -> Dict[int, List[int]]:
+    """Rolling unique counts ending on each of ``days`` for every window size.
+
+    All counts are fetched in one pipeline, e.g. DAU/WAU/MAU arrays for a chart.
+    """
+    windows = list(windows)
+    since, closed = await coverage(r, gid)
+    async with r.pipeline(transaction=False) as pipe:
+        for w in windows:
+            for d in days:
+                pipe.pfcount(*plan_range(gid, d - timedelta(days=w - 1), d, closed, since))
+        results = await pipe.execute()
+
+    out: Dict[int, List[int]] = {}
+    n = len(days)
+    for i, w in enumerate(windows):
+        out[w] = [int(v or 0) for v in results[i * n:(i + 1) * n]]
+    return out
@@ -0,0 +1,206 @@
+"""Write-behind ingestion bus shared by the bot cogs.
+
+One Discord message used to cause separate Redis round-trips from every cog
+that listens to it.  Cogs now *emit* writes to a single bus instead; a worker
+coalesces everything emitted within ``max_wait_ms`` (or up to ``max_batch``
+writes) into one non-transactional pipeline::
+
+    bus = get_ingest_bus(bot)
+    bus.emit("dau", lambda pipe: pipe.pfadd(key, uid))             # drop when full
+    await bus.emit_wait("event", lambda pipe: pipe.zadd(...))       # wait when full
+
+``emit`` never blocks the gateway handler; when the queue is full the write is
+dropped and counted in ``stats["dropped:{kind}"]``.  ``emit_wait`` applies
+backpressure instead and is meant for source-of-truth data (raw events).
+
+``once_key`` makes a write conditional on ``SET once_key NX`` so two bot
+processes receiving the same gateway event count it once.  The guards of a
+whole batch are checked in one extra pipeline before the writes.
+
+A batch that fails is queued again (after ``RETRY_DELAY`` times the attempt)
+up to ``MAX_ATTEMPTS`` times before its writes are dropped; guards it already
+holds are not checked again.  ``on_done`` runs once the write is applied, e.g.
+to remember what was written.
+
+Queue depth, batch sizes, latencies and drops are exported through
+:mod:`shared.metrics`.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Any, Callable, List, NamedTuple, Optional
+
+from shared.metrics import REGISTRY, SIZE_BUCKETS
+
+QUEUE_MAXSIZE = 50000
+BATCH_MAX = 500
+BATCH_MAX_WAIT_MS = 50
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 0.5
+
+QUEUE_DEPTH = REGISTRY.gauge("ingest_queue_depth", "Writes waiting in the ingest bus queue")
+QUEUE_CAPACITY = REGISTRY.gauge("ingest_queue_capacity", "Maximum size of the ingest bus queue")
+BATCH_SIZE = REGISTRY.histogram("ingest_batch_size", "Writes per flushed pipeline", buckets=SIZE_BUCKETS)
+FLUSH_SECONDS = REGISTRY.histogram("ingest_flush_seconds", "Time to flush one batch, guards included")
+PIPELINE_SECONDS = REGISTRY.histogram("redis_pipeline_seconds", "Redis pipeline round-trip of the ingest bus")
+WRITES = REGISTRY.counter("ingest_writes", "Writes applied by the ingest bus")
+DROPS = REGISTRY.counter("ingest_drops", "Writes not applied, by reason")
+WAITS = REGISTRY.counter("ingest_backpressure_waits", "emit_wait calls that found the queue full")
+
+
+class IngestWrite(NamedTuple):
+    kind: str
+    apply: Callable[[Any], None]
+    once_key: Optional[str] = None
+    once_ttl: int = 10
+    on_done: Optional[Callable[[], None]] = None
+    attempts: int = 0
+
+
+class IngestBus:
+    def __init__(self, r: Any, max_batch: int = BATCH_MAX, max_wait_ms: int = BATCH_MAX_WAIT_MS,
+                 maxsize: int = QUEUE_MAXSIZE):
+        self.r = r
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.stats: Counter = Counter()
+        self.errors: deque = deque(maxlen=5)
+        self._task: Optional[asyncio.Task] = None
+        QUEUE_DEPTH.set_function(self.queue.qsize)
+        QUEUE_CAPACITY.set(maxsize)
+
+    def emit(self, kind: str, apply: Callable[[Any], None], once_key: Optional[str] = None,
+             once_ttl: int = 10, on_done: Optional[Callable[[], None]] = None) -> bool:
+        """Queue a write without waiting; returns False when it was dropped."""
+        try:
+            self.queue.put_nowait(IngestWrite(kind, apply, once_key, once_ttl, on_done))
+        except asyncio.QueueFull:
+            self.stats[f"dropped:{kind}"] += 1
+            DROPS.labels(reason="queue_full", kind=kind).inc()
+            return False
+        self.stats[f"emitted:{kind}"] += 1
+        return True
+
+    async def emit_wait(self, kind: str, apply: Callable[[Any], None], once_key: Optional[str] = None,
+                        once_ttl: int = 10, on_done: Optional[Callable[[], None]] = None) -> None:
+        """Queue a write, waiting for space when the queue is full (backpressure)."""
+        if self.queue.full():
+            self.stats[f"waited:{kind}"] += 1
+            WAITS.labels(kind=kind).inc()
+        await self.queue.put(IngestWrite(kind, apply, once_key, once_ttl, on_done))
+        self.stats[f"emitted:{kind}"] += 1
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._worker())
+        return self._task
+
+    async def stop(self) -> None:
+        """Flush what is queued and stop the worker."""
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def flush(self) -> None:
+        """Write everything queued so far (shutdown, tests)."""
+        while not self.queue.empty():
+            await self._write(self._drain([]))
+
+    def _drain(self, batch: List[IngestWrite]) -> List[IngestWrite]:
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch:
+                self._drain(batch)
+                remaining = deadline - loop.time()
+                if len(batch) >= self.max_batch or remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._write(batch)
+
+    async def _write(self, batch: List[IngestWrite]) -> None:
+        if not batch:
+            return
+        taken = len(batch)
+        started = time.perf_counter()
+        BATCH_SIZE.observe(taken)
+        try:
+            guarded = [w for w in batch if w.once_key]
+            if guarded:
+                async with self.r.pipeline(transaction=False) as pipe:
+                    for w in guarded:
+                        pipe.set(w.once_key, "1", ex=w.once_ttl, nx=True)
+                    with PIPELINE_SECONDS.labels(stage="guard").time():
+                        acquired = await pipe.execute()
+                skip = {id(w) for w, ok in zip(guarded, acquired) if not ok}
+                if skip:
+                    self.stats["deduplicated"] += len(skip)
+                    DROPS.labels(reason="duplicate", kind="any").inc(len(skip))
+                # The guards are ours now; a retry must not find them taken
+                batch = [w._replace(once_key=None) for w in batch if id(w) not in skip]
+
+            async with self.r.pipeline(transaction=False) as pipe:
+                for w in batch:
+                    w.apply(pipe)
+                with PIPELINE_SECONDS.labels(stage="write").time():
+                    await pipe.execute()
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+            for kind, n in Counter(w.kind for w in batch).items():
+                WRITES.labels(kind=kind).inc(n)
+            for w in batch:
+                if w.on_done is not None:
+                    w.on_done()
+        except Exception as e:
+            self.errors.append(str(e))
+            print(f"[IngestBus] Batch write failed ({len(batch)} writes): {e}")
+            await self._retry(batch)
+        finally:
+            FLUSH_SECONDS.observe(time.perf_counter() - started)
+            for _ in range(taken):
+                self.queue.task_done()
+
+    async def _retry(self, batch: List[IngestWrite]) -> None:
+        """Queue the writes of a failed batch again; drop those out of attempts or queue space."""
+        attempt = max(w.attempts for w in batch) + 1
+        await asyncio.sleep(RETRY_DELAY * attempt)
+        failed = 0
+        for w in batch:
+            if w.attempts + 1 >= MAX_ATTEMPTS:
+                failed += 1
+                continue
+            try:
+                self.queue.put_nowait(w._replace(attempts=w.attempts + 1))
+                self.stats["retried"] += 1
+            except asyncio.QueueFull:
+                failed += 1
+        if failed:
+            self.stats["failed"] += failed
+            DROPS.labels(reason="write_failed", kind="any").inc(failed)
+
+
+def get_ingest_bus(bot: Any) -> IngestBus:
+    """The bot-wide bus on the shared Redis client, created and started on first use."""
+    bus = getattr(bot, "ingest_bus", None)
+    if bus is None:
+        from shared.redis_client import shared_client
+        bus = IngestBus(shared_client())
+        bot.ingest_bus = bus
+        bus.start()
+    return bus
@@ -0,0 +1,353 @@
+"""Redis-backed job queue for backfills and heavy admin tasks.
+
+The dashboard used to start a backfill by spawning a script per click and ran
+the guild data deletion inline in the request.  Jobs are now records in Redis
+that a :class:`JobWorker` in the process that can run them (the bot for Discord
+history, the web app for keyspace cleanup) claims and executes::
+
+    job, created = await enqueue(r, "backfill", gid, {"days": 30})
+    await cancel(r, job["id"])
+
+    worker = JobWorker(r, {"backfill": run_backfill}, concurrency=2)
+    worker.start()                                     # on startup
+    await worker.stop()                                # on shutdown
+
+Enqueueing is idempotent per ``(kind, guild)``: while a job is queued or
+running, ``job:key:{kind}:{gid}`` points at it and a second enqueue returns
+that job instead of creating another one.  A worker runs at most
+``concurrency`` jobs and a guild runs at most ``per_guild`` jobs across all
+workers (``lock:jobs:{gid}:{slot}`` slots).  While a job runs, the worker
+heartbeats it and polls its ``cancel`` flag; a job whose worker died is put
+back into the queue after ``STALE_AFTER`` seconds.
+
+Handlers are ``async handler(ctx)`` and report progress with
+:meth:`JobContext.progress`, which stores it on the job record and in
+``backfill:progress:{gid}`` for the dashboard.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from redis.exceptions import WatchError
+
+from shared.keys import K_BACKFILL_PROGRESS, K_JOB, K_JOB_KEY, K_JOB_QUEUE, K_JOB_SLOT, K_JOBS_RUNNING
+from shared.metrics import REGISTRY
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+ACTIVE = (QUEUED, RUNNING)
+
+DEFAULT_CONCURRENCY = 2
+DEFAULT_PER_GUILD = 1
+POLL_INTERVAL = 2.0
+SLOT_TTL = 60
+STALE_AFTER = 90
+JOB_TTL = 7 * 86400
+PROGRESS_TTL = 86400
+SCAN_DEPTH = 50            # queued jobs looked at per claim
+
+FINISHED = REGISTRY.counter("jobs", "Finished jobs by kind and status")
+RUNNING_JOBS = REGISTRY.gauge("jobs_running", "Jobs running in a worker")
+
+Handler = Callable[["JobContext"], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def _decode(raw: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    if not raw:
+        return None
+    job: Dict[str, Any] = dict(raw)
+    job["params"] = json.loads(raw.get("params") or "{}")
+    for field in ("progress", "result"):
+        job[field] = json.loads(raw[field]) if raw.get(field) else None
+    for field in ("created_at", "started_at", "finished_at"):
+        job[field] = float(raw[field]) if raw.get(field) else None
+    job["cancel"] = raw.get("cancel") == "1"
+    return job
+
+
+async def get_job(r: Any, job_id: str) -> Optional[Dict[str, Any]]:
+    return _decode(await r.hgetall(K_JOB(job_id)))
+
+
+async def active_job(r: Any, kind: str, gid: Any) -> Optional[Dict[str, Any]]:
+    """The queued or running job of a kind for a guild."""
+    job_id = await r.get(K_JOB_KEY(kind, gid))
+    job = await get_job(r, job_id) if job_id else None
+    return job if job and job["status"] in ACTIVE else None
+
+
+async def enqueue(r: Any, kind: str, gid: Any, params: Optional[Dict[str, Any]] = None
+                  ) -> Tuple[Dict[str, Any], bool]:
+    """Queue a job unless one of the same kind is active for the guild; returns ``(job, created)``."""
+    key = K_JOB_KEY(kind, gid)
+    async with r.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(key)
+                current = await pipe.get(key)
+                if current:
+                    job = _decode(await pipe.hgetall(K_JOB(current)))
+                    if job and job["status"] in ACTIVE:
+                        return job, False
+                job_id = uuid.uuid4().hex[:16]
+                record = {"id": job_id, "kind": kind, "gid": str(gid), "status": QUEUED,
+                          "params": json.dumps(params or {}), "created_at": time.time()}
+                pipe.multi()
+                pipe.hset(K_JOB(job_id), mapping=record)
+                # A job nobody picks up expires, and with it the idempotency key
+                pipe.expire(K_JOB(job_id), JOB_TTL)
+                pipe.set(key, job_id, ex=JOB_TTL)
+                pipe.rpush(K_JOB_QUEUE(kind), job_id)
+                await pipe.execute()
+                return _decode({k: str(v) for k, v in record.items()}), True
+            except WatchError:
+                continue
+
+
+async def _delete_if(r: Any, key: str, value: str) -> bool:
+    """Delete ``key`` only while it still holds ``value``."""
+    async with r.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(key)
+            if await pipe.get(key) != value:
+                return False
+            pipe.multi()
+            pipe.delete(key)
+            await pipe.execute()
+            return True
+        except WatchError:
+            return False
+
+
+async def _publish(r: Any, job: Dict[str, Any], status: str, progress: Optional[Dict[str, Any]],
+                   error: Optional[str] = None) -> None:
+    payload = {**(progress or {}), "job_id": job["id"], "kind": job["kind"], "job_status": status}
+    if error:
+        payload["error"] = error
+    await r.set(K_BACKFILL_PROGRESS(job["gid"]), json.dumps(payload), ex=PROGRESS_TTL)
+
+
+async def _close(r: Any, job: Dict[str, Any], status: str, result: Optional[Dict[str, Any]] = None,
+                 error: Optional[str] = None, progress: Optional[Dict[str, Any]] = None) -> None:
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(K_JOB(job["id"]), mapping={"status": status, "finished_at": time.time(),
+                                             "result": json.dumps(result) if result is not None else "",
+                                             "error": error or ""})
+        pipe.expire(K_JOB(job["id"]), JOB_TTL)
+        pipe.zrem(K_JOBS_RUNNING(), job["id"])
+        await pipe.execute()
+    await _delete_if(r, K_JOB_KEY(job["kind"], job["gid"]), job["id"])
+    await _publish(r, job, status, progress if progress is not None else job.get("progress"), error)
+    FINISHED.labels(kind=job["kind"], status=status).inc()
+
+
+async def cancel(r: Any, job_id: str) -> Optional[Dict[str, Any]]:
+    """Cancel a queued job now, or ask the worker of a running job to stop it."""
+    job = await get_job(r, job_id)
+    if job is None or job["status"] not in ACTIVE:
+        return job
+    if job["status"] == QUEUED and await r.lrem(K_JOB_QUEUE(job["kind"]), 1, job_id):
+        await _close(r, job, CANCELLED)
+    else:
+        await r.hset(K_JOB(job_id), "cancel", 1)
+    return await get_job(r, job_id)
+
+
+class JobContext:
+    """What a handler gets: the job, its parameters and a progress reporter."""
+
+    def __init__(self, r: Any, job: Dict[str, Any]):
+        self.r = r
+        self.job = job
+        self.id = job["id"]
+        self.kind = job["kind"]
+        self.gid = job["gid"]
+        self.params = job["params"]
+        self.last_progress: Optional[Dict[str, Any]] = None
+        self.cancelled = False
+
+    async def progress(self, report: Dict[str, Any]) -> None:
+        self.last_progress = dict(report)
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.hset(K_JOB(self.id), "progress", json.dumps(report))
+                pipe.set(K_BACKFILL_PROGRESS(self.gid),
+                         json.dumps({**report, "job_id": self.id, "kind": self.kind, "job_status": RUNNING}),
+                         ex=PROGRESS_TTL)
+                await pipe.execute()
+        except Exception as e:
+            print(f"[Jobs] Progress update of {self.id} failed: {e}")
+
+
+class JobWorker:
+    def __init__(self, r: Any, handlers: Dict[str, Handler], *, concurrency: int = DEFAULT_CONCURRENCY,
+                 per_guild: int = DEFAULT_PER_GUILD, accepts: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                 poll_interval: float = POLL_INTERVAL, name: str = "worker"):
+        self.r = r
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.per_guild = per_guild
+        self.accepts = accepts
+        self.poll_interval = poll_interval
+        self.name = name
+        self._running: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._recovered_at = 0.0
+        RUNNING_JOBS.labels(worker=name).set_function(lambda: len(self._running))
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.ensure_future(self._loop())
+        return self._task
+
+    async def stop(self) -> None:
+        """Stop claiming and put the running jobs back into the queue."""
+        self._stopping = True
+        if self._task:
+            self._task.cancel()
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*([self._task] if self._task else []), *tasks, return_exceptions=True)
+
+    async def join(self) -> None:
+        """Wait for the jobs that are running now."""
+        await asyncio.gather(*list(self._running.values()), return_exceptions=True)
+
+    async def _loop(self) -> None:
+        while not self._stopping:
+            try:
+                if time.monotonic() - self._recovered_at >= STALE_AFTER / 3:
+                    self._recovered_at = time.monotonic()
+                    await self.recover_stale()
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Jobs] {self.name} poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def run_once(self) -> int:
+        """Claim and start queued jobs up to the free capacity; returns how many were started."""
+        started = 0
+        for kind in self.handlers:
+            while len(self._running) < self.concurrency and not self._stopping:
+                job = await self._claim(kind)
+                if job is None:
+                    break
+                task = asyncio.ensure_future(self._execute(job))
+                self._running[job["id"]] = task
+                task.add_done_callback(lambda _t, job_id=job["id"]: self._running.pop(job_id, None))
+                started += 1
+        return started
+
+    async def _acquire_slot(self, job: Dict[str, Any]) -> Optional[int]:
+        for slot in range(self.per_guild):
+            if await self.r.set(K_JOB_SLOT(job["gid"], slot), job["id"], ex=SLOT_TTL, nx=True):
+                return slot
+        return None
+
+    async def _release_slot(self, job: Dict[str, Any]) -> None:
+        await _delete_if(self.r, K_JOB_SLOT(job["gid"], job["slot"]), job["id"])
+
+    async def _claim(self, kind: str) -> Optional[Dict[str, Any]]:
+        queue = K_JOB_QUEUE(kind)
+        for job_id in await self.r.lrange(queue, 0, SCAN_DEPTH - 1):
+            job = await get_job(self.r, job_id)
+            if job is None or job["status"] != QUEUED:
+                await self.r.lrem(queue, 1, job_id)
+                continue
+            if self.accepts and not self.accepts(job):
+                continue
+            slot = await self._acquire_slot(job)
+            if slot is None:
+                continue  # the guild is busy; younger jobs of other guilds may run
+            job["slot"] = slot
+            # Whoever removes the ID from the queue owns the job (another worker, cancel())
+            if not await self.r.lrem(queue, 1, job_id):
+                await self._release_slot(job)
+                continue
+            now = time.time()
+            async with self.r.pipeline(transaction=True) as pipe:
+                pipe.hset(K_JOB(job_id), mapping={"status": RUNNING, "started_at": now,
+                                                  "worker": self.name, "slot": slot})
+                pipe.zadd(K_JOBS_RUNNING(), {job_id: now})
+                await pipe.execute()
+            job.update(status=RUNNING, started_at=now, worker=self.name)
+            return job
+        return None
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        ctx = JobContext(self.r, job)
+        task = asyncio.ensure_future(self.handlers[job["kind"]](ctx))
+        watcher = asyncio.ensure_future(self._watch(ctx, task))
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if not ctx.cancelled:
+                # Worker shutdown: another worker picks the job up again
+                await self._requeue(job)
+                raise
+            await _close(self.r, job, CANCELLED, progress=ctx.last_progress)
+        except Exception as e:
+            print(f"[Jobs] {job['kind']} job {job['id']} failed: {e}")
+            await _close(self.r, job, FAILED, error=str(e), progress=ctx.last_progress)
+        else:
+            await _close(self.r, job, DONE, result=result, progress=ctx.last_progress)
+        finally:
+            watcher.cancel()
+            await self._release_slot(job)
+
+    async def _watch(self, ctx: JobContext, task: asyncio.Future) -> None:
+        """Heartbeat the job and its guild slot; cancel the handler when asked to."""
+        job = ctx.job
+        while not task.done():
+            await asyncio.sleep(self.poll_interval)
+            try:
+                async with self.r.pipeline(transaction=False) as pipe:
+                    pipe.hget(K_JOB(job["id"]), "cancel")
+                    pipe.zadd(K_JOBS_RUNNING(), {job["id"]: time.time()})
+                    pipe.expire(K_JOB_SLOT(job["gid"], job["slot"]), SLOT_TTL)
+                    pipe.expire(K_JOB(job["id"]), JOB_TTL)
+                    pipe.expire(K_JOB_KEY(job["kind"], job["gid"]), JOB_TTL)
+                    flag = (await pipe.execute())[0]
+            except Exception as e:
+                print(f"[Jobs] Heartbeat of {job['id']} failed: {e}")
+                continue
+            if flag == "1":
+                ctx.cancelled = True
+                task.cancel()
+                return
+
+    async def _requeue(self, job: Dict[str, Any]) -> None:
+        try:
+            async with self.r.pipeline(transaction=True) as pipe:
+                pipe.hset(K_JOB(job["id"]), mapping={"status": QUEUED, "worker": ""})
+                pipe.zrem(K_JOBS_RUNNING(), job["id"])
+                pipe.lpush(K_JOB_QUEUE(job["kind"]), job["id"])
+                await pipe.execute()
+        except Exception as e:
+            print(f"[Jobs] Requeue of {job['id']} failed: {e}")
+
+    async def recover_stale(self, now: Optional[float] = None) -> int:
+        """Requeue running jobs whose worker stopped heartbeating; returns how many."""
+        cutoff = (now if now is not None else time.time()) - STALE_AFTER
+        recovered = 0
+        for job_id in await self.r.zrangebyscore(K_JOBS_RUNNING(), "-inf", cutoff):
+            # Only the worker that removes the entry recovers the job
+            if not await self.r.zrem(K_JOBS_RUNNING(), job_id):
+                continue
+            job = await get_job(self.r, job_id)
+            if job is None or job["status"] != RUNNING:
+                continue
+            if job["cancel"]:
+                await _close(self.r, job, CANCELLED)
+            else:
+                await self._requeue(job)
+            recovered += 1
+        return recovered
@@ -10,10 +10,30 @@ def K_DAU(gid: int, d: str) -> str:
     """Daily Active Users HLL key."""
     return f"hll:dau:{gid}:{d}"
 
+def K_HLL_WEEK(gid: int, monday: str) -> str:
+    """Weekly unique users HLL (Monday-aligned, merged from closed days)."""
+    return f"hll:wau:{gid}:{monday}"
+
+def K_HLL_MONTH(gid: int, month: str) -> str:
+    """Calendar month unique users HLL (merged from closed days)."""
+    return f"hll:mau:{gid}:{month}"
+
+def K_HLL_CLOSED(gid: int) -> str:
+    """Last day (YYYYMMDD) already merged into the weekly/monthly HLLs."""
+    return f"hll:closed:{gid}"
+
+def K_HLL_SINCE(gid: int) -> str:
+    """First day (YYYYMMDD) of the unbroken run merged into the weekly/monthly HLLs."""
+    return f"hll:since:{gid}"
+
 def K_HOURLY(gid: int, d: str) -> str:
     """Hourly message counts hash key."""
     return f"stats:hourly:{gid}:{d}"
 
+def K_DAILY_SERIES(gid: int, month: str) -> str:
+    """Finalized per-day DAU, message total and hourly vector for one month."""
+    return f"stats:series:{gid}:{month}"
+
 def K_MSGLEN(gid: int) -> str:
     """Message length distribution hash key."""
     return f"stats:msglen:{gid}"
@@ -27,7 +47,7 @@ def K_TOTAL_MSGS(gid: int) -> str:
     return f"stats:total_msgs:{gid}"
 
 def K_BACKFILL_PROGRESS(gid: int) -> str:
-    """Backfill progress status key."""
+    """JSON progress of the running or last backfill or job of a guild (read by the dashboard)."""
     return f"backfill:progress:{gid}"
 
 def K_LOGCHAN(gid: int) -> str:
@@ -38,6 +58,14 @@ def K_USER_INFO(uid: int) -> str:
     """Cached user info hash key."""
     return f"user:info:{uid}"
 
+def K_CHANNEL_INFO(cid: int) -> str:
+    """Cached channel info hash key."""
+    return f"channel:info:{cid}"
+
+def K_GUILD_ROLES(gid: int) -> str:
+    """Role ID -> role name hash of a guild."""
+    return f"guild:roles:{gid}"
+
 def K_EVENTS_MSG(gid: int, uid: int) -> str:
     """User message events sorted set key."""
     return f"events:msg:{gid}:{uid}"
@@ -50,6 +78,42 @@ def K_EVENTS_ACTION(gid: int, uid: int) -> str:
     """User mod action events sorted set key."""
     return f"events:action:{gid}:{uid}"
 
+def K_EVENT_MEMBERS(gid: int, kind: str) -> str:
+    """Set of user IDs with an events:{kind}:{gid}:{uid} sorted set."""
+    return f"events:members:{gid}:{kind}"
+
+def K_EVENT_MEMBERS_BUILT(gid: int, kind: str) -> str:
+    """Marker that the member index was rebuilt from legacy event keys."""
+    return f"events:members_built:{gid}:{kind}"
+
+def K_ROLLUP(gid: int, month: str) -> str:
+    """Daily event rollups for one month (fields "YYYYMMDD:metric")."""
+    return f"stats:rollup:{gid}:{month}"
+
+def K_ROLLUP_SINCE(gid: int) -> str:
+    """Timestamp of the first rollup write; earlier days fall back to raw events."""
+    return f"stats:rollup_since:{gid}"
+
+def K_INGEST_WATERMARK(gid: int) -> str:
+    """Counter bumped on every event ingest; cached results are valid for one value."""
+    return f"stats:watermark:{gid}"
+
+def K_RESULT_CACHE(name: str, gid: int, digest: str) -> str:
+    """Shared tier of the result cache (JSON {"t": token, "v": value})."""
+    return f"cache:result:{name}:{gid}:{digest}"
+
+def K_SNAPSHOT(gid: int, name: str) -> str:
+    """Precomputed analytics snapshot (JSON {"computed_at": ts, "data": ...})."""
+    return f"snapshot:{gid}:{name}"
+
+def K_SNAPSHOT_META(gid: int) -> str:
+    """Snapshot bookkeeping hash (computed_at, watermark, duration)."""
+    return f"snapshot:meta:{gid}"
+
+def K_SNAPSHOT_DUE() -> str:
+    """Sorted set guild_id -> timestamp when its snapshots are due."""
+    return "snapshot:due"
+
 def K_DISCOURSE_CONF(gid: int) -> str:
     """Discourse guild configuration hash key."""
     return f"discourse:conf:{gid}"
@@ -61,3 +125,87 @@ def K_USER_DISCOURSE(uid: int) -> str:
 def K_DISCOURSE_IDS() -> str:
     """Set of all registered Discourse guild IDs."""
     return "discourse:ids"
+
+def K_RETENTION_REPORT(gid: int) -> str:
+    """Hash with counts reclaimed by the last retention sweep of a guild."""
+    return f"retention:last:{gid}"
+
+def K_RETENTION_LOCK(gid: int) -> str:
+    """Short lock so only one process sweeps a guild per interval."""
+    return f"lock:retention:{gid}"
+
+def K_EVENT_STREAM(gid: int) -> str:
+    """Per-guild append-only event log (Redis Stream) read by the aggregators."""
+    return f"stream:events:{gid}"
+
+def K_EVENT_STREAMS() -> str:
+    """Set of guild IDs that have an event stream."""
+    return "stream:guilds"
+
+def K_STREAM_APPLIED(group: str, gid: int) -> str:
+    """ZSET of stream entry IDs a non-idempotent group has applied (score = apply time)."""
+    return f"stream:applied:{group}:{gid}"
+
+def K_METRICS_INSTANCE(instance: str) -> str:
+    """Latest metrics snapshot (JSON) published by one bot process."""
+    return f"metrics:instance:{instance}"
+
+def K_METRICS_INSTANCES() -> str:
+    """Set of process names that published metrics."""
+    return "metrics:instances"
+
+def K_TOPK(dim: str, gid: int, res: str, bucket: str) -> str:
+    """Space-Saving summary of one hour ("h", YYYYMMDDHH) or day ("d", YYYYMMDD): item -> "count:err"."""
+    return f"topk:{dim}:{res}:{gid}:{bucket}"
+
+def K_BACKFILL_CHECKPOINT(job: str, gid: int) -> str:
+    """Backfill checkpoint hash: meta, c:{source} last item id, d:{source} done, n:{counter}."""
+    return f"backfill:checkpoint:{job}:{gid}"
+
+def K_BACKFILL_LOCK(job: str, gid: int) -> str:
+    """Lock held while a backfill job runs for a guild."""
+    return f"lock:backfill:{job}:{gid}"
+
+def K_JOB(job_id: str) -> str:
+    """Job record hash: kind, gid, params, status, timestamps, progress, result, error, cancel."""
+    return f"job:{job_id}"
+
+def K_JOB_KEY(kind: str, gid: int) -> str:
+    """ID of the queued or running job of a kind for a guild (idempotency key)."""
+    return f"job:key:{kind}:{gid}"
+
+def K_JOB_QUEUE(kind: str) -> str:
+    """List of queued job IDs of a kind, oldest first."""
+    return f"jobs:queue:{kind}"
+
+def K_JOBS_RUNNING() -> str:
+    """Sorted set of running job IDs scored by their last heartbeat."""
+    return "jobs:running"
+
+def K_JOB_SLOT(gid: int, slot: int) -> str:
+    """Per-guild job slot held (with TTL) by the running job's ID."""
+    return f"lock:jobs:{gid}:{slot}"
+
+def K_MARKOV_COUNTS(gid: int, segment: str) -> str:
+    """Hash of a guild segment's Markov counts per day: t:{YYYYMMDD} transitions into the day, s:{YYYYMMDD} states."""
+    return f"markov:counts:{gid}:{segment}"
+
+def K_MARKOV_SEGMENTS(gid: int) -> str:
+    """Set of segments (all, cohort:YYYY-MM, role:{id}) with stored Markov counts."""
+    return f"markov:segments:{gid}"
+
+def K_BITMAP_INDEX(gid: int) -> str:
+    """Hash of user ID -> dense bit index in the guild's activity bitmaps."""
+    return f"bitmap:index:{gid}"
+
+def K_BITMAP_SEQ(gid: int) -> str:
+    """Counter of bit indexes handed out in a guild (size of its bitmaps)."""
+    return f"bitmap:seq:{gid}"
+
+def K_ACTIVE_BITMAP(gid: int, d: str) -> str:
+    """Bitmap of users (by bit index) active on a UTC day YYYYMMDD."""
+    return f"bitmap:active:{gid}:{d}"
+
+def K_BITMAP_TMP(gid: int, token: str) -> str:
+    """Prefix of the scratch bitmaps of one cohort query."""
+    return f"bitmap:tmp:{gid}:{token}"
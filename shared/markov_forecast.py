@@ -0,0 +1,184 @@
+"""Markov state forecasts from stored daily transition counts.
+
+Rebuilding the transition matrix meant rescanning every user's events.  Now
+the snapshot worker stores each day's transition counts (``t:{YYYYMMDD}``, a
+flattened ``K x K`` matrix of the moves into that day) and state distribution
+(``s:{YYYYMMDD}``) per segment in ``markov:counts:{gid}:{segment}``.  The
+matrix of any trailing window is the sum of its days, so a forecast is one
+pipelined ``HMGET`` per segment plus a few ``K x K`` products::
+
+    counts = daily_counts(states, {"all": np.arange(n), "cohort:2025-03": rows})
+    await record(r, gid, day_labels, counts, daily_distribution(states, segments))
+
+    forecasts = await load_forecasts(r, gid, window=30, horizons=30)
+    forecasts["all"]["forecast"][6]                # distribution in 7 days
+
+Segments (``all``, join cohorts, roles) may overlap; all of them are counted
+with one ``np.bincount`` and forecast together: :func:`forecast_horizons`
+stacks the matrix powers ``P^1 .. P^N`` of every segment and applies them to
+the segments' current distributions in one ``einsum``.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from shared.keys import K_MARKOV_COUNTS, K_MARKOV_SEGMENTS
+from shared.models import CommunityModels, UserState
+
+K = len(UserState)
+SEGMENT_ALL = "all"
+DEFAULT_WINDOW = 30
+DEFAULT_HORIZONS = 30
+COUNTS_TTL = 120 * 86400
+MIN_TRANSITIONS = 5       # fewer observed moves give no forecast
+
+
+def _segment_rows(segments: Mapping[str, np.ndarray]):
+    names = list(segments)
+    rows = [np.asarray(segments[name], dtype=np.int64) for name in names]
+    codes = np.repeat(np.arange(len(names)), [len(r) for r in rows])
+    return names, (np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)), codes
+
+
+def daily_counts(states: np.ndarray, segments: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """``(days - 1, K, K)`` counts per segment; entry ``i`` holds the moves from column ``i`` into ``i + 1``.
+
+    ``segments`` maps a name to the state rows of its members; states < 0 (before
+    a user's observation start) are skipped.
+    """
+    names, rows, codes = _segment_rows(segments)
+    days = states.shape[1]
+    prev, nxt = states[rows, :-1], states[rows, 1:]
+    day = np.broadcast_to(np.arange(days - 1), prev.shape)
+    seg = np.broadcast_to(codes[:, None], prev.shape)
+    valid = (prev >= 0) & (nxt >= 0)
+    flat = ((seg[valid] * (days - 1) + day[valid]) * K + prev[valid]) * K + nxt[valid]
+    counts = np.bincount(flat, minlength=len(names) * (days - 1) * K * K)
+    counts = counts.reshape(len(names), days - 1, K, K)
+    return {name: counts[i] for i, name in enumerate(names)}
+
+
+def daily_distribution(states: np.ndarray, segments: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """``(days, K)`` number of members in each state per day and segment."""
+    names, rows, codes = _segment_rows(segments)
+    days = states.shape[1]
+    sub = states[rows]
+    day = np.broadcast_to(np.arange(days), sub.shape)
+    seg = np.broadcast_to(codes[:, None], sub.shape)
+    valid = sub >= 0
+    flat = (seg[valid] * days + day[valid]) * K + sub[valid]
+    dist = np.bincount(flat, minlength=len(names) * days * K).reshape(len(names), days, K)
+    return {name: dist[i] for i, name in enumerate(names)}
+
+
+def day_labels(end: datetime, days: int) -> List[str]:
+    """``YYYYMMDD`` of each column of a matrix whose last column is ``end``'s day."""
+    return [(end - timedelta(days=days - 1 - i)).strftime("%Y%m%d") for i in range(days)]
+
+
+def _encode(values: np.ndarray) -> str:
+    return ",".join(str(int(v)) for v in np.ravel(values))
+
+
+def _decode(raw: Optional[str], shape) -> Optional[np.ndarray]:
+    if not raw:
+        return None
+    return np.array([int(v) for v in raw.split(",")], dtype=np.int64).reshape(shape)
+
+
+async def record(r: Any, gid: Any, labels: Sequence[str], counts: Mapping[str, np.ndarray],
+                 distributions: Mapping[str, np.ndarray], first: int = 0) -> int:
+    """Store the days from column ``first`` on; returns the number of fields written.
+
+    Re-recording a day overwrites it, so the latest (most complete) run wins.
+    """
+    written = 0
+    async with r.pipeline(transaction=False) as pipe:
+        for name, per_day in counts.items():
+            mapping = {f"t:{labels[i + 1]}": _encode(per_day[i]) for i in range(max(0, first - 1), len(per_day))}
+            dist = distributions.get(name)
+            if dist is not None:
+                mapping.update({f"s:{labels[i]}": _encode(dist[i]) for i in range(first, len(dist))})
+            if not mapping:
+                continue
+            key = K_MARKOV_COUNTS(gid, name)
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, COUNTS_TTL)
+            pipe.sadd(K_MARKOV_SEGMENTS(gid), name)
+            written += len(mapping)
+        pipe.expire(K_MARKOV_SEGMENTS(gid), COUNTS_TTL)
+        await pipe.execute()
+    return written
+
+
+def forecast_horizons(matrices: np.ndarray, vectors: np.ndarray, horizons: int) -> np.ndarray:
+    """``(S, horizons, K)`` distributions after 1..horizons steps for ``S`` matrices and start vectors."""
+    matrices = np.asarray(matrices, dtype=float)
+    powers = np.empty((horizons,) + matrices.shape)
+    powers[0] = matrices
+    for h in range(1, horizons):
+        powers[h] = powers[h - 1] @ matrices
+    return np.einsum("sk,hskj->shj", np.asarray(vectors, dtype=float), powers)
+
+
+async def load_counts(r: Any, gid: Any, segments: Iterable[str], window: int = DEFAULT_WINDOW,
+                      end: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+    """Summed transition counts of the trailing ``window`` days and the latest stored distribution."""
+    segments = list(segments)
+    labels = day_labels(end or datetime.now(), window)
+    fields = [f"t:{d}" for d in labels] + [f"s:{d}" for d in reversed(labels)]
+    async with r.pipeline(transaction=False) as pipe:
+        for name in segments:
+            pipe.hmget(K_MARKOV_COUNTS(gid, name), fields)
+        rows = await pipe.execute()
+
+    out = {}
+    for name, values in zip(segments, rows):
+        total = np.zeros((K, K), dtype=np.int64)
+        days = 0
+        for raw in values[:window]:
+            counts = _decode(raw, (K, K))
+            if counts is not None:
+                total += counts
+                days += 1
+        current = next((d for d in (_decode(raw, (K,)) for raw in values[window:]) if d is not None), None)
+        out[name] = {"counts": total, "days": days, "current": current}
+    return out
+
+
+async def load_forecasts(r: Any, gid: Any, segments: Optional[Iterable[str]] = None,
+                         window: int = DEFAULT_WINDOW, horizons: int = DEFAULT_HORIZONS,
+                         end: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+    """Forecasts for 1..horizons days per segment (all stored segments by default).
+
+    Each entry has ``transitions``, ``days`` (stored days in the window),
+    ``current`` and ``forecast`` (``horizons`` distributions as shares of
+    members) or ``forecast: None`` when fewer than ``MIN_TRANSITIONS`` moves
+    were observed.
+    """
+    if segments is None:
+        segments = sorted(await r.smembers(K_MARKOV_SEGMENTS(gid)))
+    loaded = await load_counts(r, gid, segments, window, end)
+    usable = [name for name, v in loaded.items()
+              if v["counts"].sum() >= MIN_TRANSITIONS and v["current"] is not None and v["current"].sum() > 0]
+
+    out = {}
+    for name, v in loaded.items():
+        out[name] = {
+            "transitions": int(v["counts"].sum()),
+            "days": v["days"],
+            "current": v["current"].tolist() if v["current"] is not None else None,
+            "matrix": None,
+            "forecast": None,
+        }
+    if usable:
+        matrices = np.stack([CommunityModels.normalize_transitions(loaded[n]["counts"]) for n in usable])
+        vectors = np.stack([loaded[n]["current"] / loaded[n]["current"].sum() for n in usable])
+        forecasts = forecast_horizons(matrices, vectors, horizons)
+        for i, name in enumerate(usable):
+            out[name]["matrix"] = matrices[i].tolist()
+            out[name]["forecast"] = forecasts[i].tolist()
+    return out
@@ -0,0 +1,254 @@
+"""Process metrics in Prometheus text format, pushed through Redis.
+
+The bot keeps counters, gauges and histograms in a process-local
+:class:`Registry` (no client library needed) and periodically publishes a
+snapshot to ``metrics:instance:{name}``.  The web app merges the snapshots of
+all live bot processes and serves them on ``GET /metrics``, adding an
+``instance`` label::
+
+    BATCH_SIZE = REGISTRY.histogram("ingest_batch_size", "Writes per pipeline", buckets=(1, 10, 100))
+    BATCH_SIZE.observe(len(batch))
+    DROPS.labels(reason="queue_full", kind="dau").inc()
+
+    await publish(r, "bot-1")                         # bot, every few seconds
+    await publish_forever(r, "stream-aggregator-1")   # standalone scripts
+    text = render(await collect(r))                   # web
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from shared.keys import K_METRICS_INSTANCE, K_METRICS_INSTANCES
+
+PREFIX = "communitymetrics_"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+PUBLISH_TTL = 60
+PUBLISH_INTERVAL = 15
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = PREFIX + name
+        self.help = help
+        self._children: Dict[LabelKey, Any] = {}
+
+    def labels(self, **labels: Any):
+        key = _label_key(labels)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        out = []
+        for key, child in self._children.items():
+            for suffix, extra, value in child.samples():
+                out.append((self.name + suffix, {**dict(key), **extra}, value))
+        return out
+
+    # Unlabelled use: metric.inc() / metric.set() / metric.observe()
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.labels(), attr)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self.fn: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        """Read the value from ``fn`` at collection time (queue depth etc.)."""
+        self.fn = fn
+
+    def samples(self):
+        return [("", {}, float(self.fn()) if self.fn else self.value)]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def samples(self):
+        # Counters are exposed with the conventional _total suffix
+        return [(name if name.endswith("_total") else name + "_total", labels, value)
+                for name, labels, value in super().samples()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def samples(self):
+        out, running = [], 0
+        for bound, n in zip(self.buckets, self.counts):
+            running += n
+            out.append(("_bucket", {"le": _fmt(bound)}, running))
+        out.append(("_bucket", {"le": "+Inf"}, self.count))
+        out.append(("_sum", {}, self.sum))
+        out.append(("_count", {}, self.count))
+        return out
+
+
+class _Timer:
+    def __init__(self, hist: _HistogramValue):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get(self, cls, name: str, help: str, **kwargs) -> Any:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help, **kwargs)
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """JSON-serialisable families: ``{"name", "type", "help", "samples": [[name, labels, value]]}``."""
+        return [{"name": m.name, "type": m.kind, "help": m.help, "samples": m.samples()}
+                for m in self._metrics.values()]
+
+
+REGISTRY = Registry()
+
+
+def _fmt(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(families: Iterable[Dict[str, Any]]) -> str:
+    """Prometheus text exposition (version 0.0.4) of snapshot families."""
+    lines = []
+    for fam in families:
+        lines.append(f"# HELP {fam['name']} {_escape(fam['help'])}")
+        lines.append(f"# TYPE {fam['name']} {fam['type']}")
+        for name, labels, value in fam["samples"]:
+            label_str = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_str}}} {_fmt(value)}" if label_str else f"{name} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+async def publish(r: Any, instance: str, registry: Registry = REGISTRY, ttl: int = PUBLISH_TTL) -> None:
+    """Store this process's snapshot; it disappears ``ttl`` s after the process stops publishing."""
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.set(K_METRICS_INSTANCE(instance), json.dumps(registry.snapshot()), ex=ttl)
+        pipe.sadd(K_METRICS_INSTANCES(), instance)
+        await pipe.execute()
+
+
+async def publish_forever(r: Any, instance: str, interval: float = PUBLISH_INTERVAL,
+                          registry: Registry = REGISTRY) -> None:
+    """Publish every ``interval`` seconds until cancelled (processes without a scheduler of their own)."""
+    while True:
+        try:
+            await publish(r, instance, registry)
+        except Exception as e:
+            print(f"[Metrics] Publish of {instance} failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def collect(r: Any) -> List[Dict[str, Any]]:
+    """Merge the snapshots of all live instances into families with an ``instance`` label."""
+    instances = sorted(await r.smembers(K_METRICS_INSTANCES()))
+    if not instances:
+        return []
+    raws = await r.mget([K_METRICS_INSTANCE(i) for i in instances])
+    stale = [i for i, raw in zip(instances, raws) if raw is None]
+    if stale:
+        await r.srem(K_METRICS_INSTANCES(), *stale)
+
+    merged: Dict[str, Dict[str, Any]] = {}
+    for instance, raw in zip(instances, raws):
+        if raw is None:
+            continue
+        try:
+            families = json.loads(raw)
+        except ValueError:
+            continue
+        for fam in families:
+            target = merged.setdefault(fam["name"], {**fam, "samples": []})
+            target["samples"].extend((name, {"instance": instance, **labels}, value)
+                                     for name, labels, value in fam["samples"])
+    return list(merged.values())
@@ -1,7 +1,8 @@
 import numpy as np
 from datetime import datetime, timedelta
-from typing import List, Dict, Tuple, Optional
+from typing import Any, List, Dict, Tuple, Optional
 from enum import IntEnum
+from statistics import NormalDist
 
 class UserState(IntEnum):
     NEW = 0
@@ -9,6 +10,35 @@ class UserState(IntEnum):
     PASSIVE = 2
     INACTIVE = 3
 
+def _z_score(alpha: float) -> float:
+    return NormalDist().inv_cdf(1 - alpha / 2)
+
+
+def _km_sorted(d: np.ndarray, e: np.ndarray, z: float) -> Dict[str, np.ndarray]:
+    """Kaplan-Meier over durations sorted ascending (no per-time masks)."""
+    times, first, counts = np.unique(d, return_index=True, return_counts=True)
+    if not len(times):
+        empty = np.zeros(0)
+        return {"times": empty, "at_risk": empty.astype(np.int64), "events": empty.astype(np.int64),
+                "survival": empty, "lower": empty, "upper": empty}
+    events = np.add.reduceat(e.astype(np.int64), first)
+    # Everyone with a duration >= t is at risk at t
+    at_risk = len(d) - np.r_[0, np.cumsum(counts)[:-1]]
+    survival = np.cumprod(1.0 - events / at_risk)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        greenwood = np.cumsum(np.where(at_risk > events, events / (at_risk * (at_risk - events)), np.inf))
+        log_s = np.log(survival)
+        half_width = z * np.sqrt(greenwood) / np.abs(log_s)
+        lower = survival ** np.exp(half_width)
+        upper = survival ** np.exp(-half_width)
+    # Before the first event the band is degenerate at 1; after the curve reaches 0 it stays at 0
+    lower = np.where(log_s == 0, 1.0, np.where(survival == 0, 0.0, lower))
+    upper = np.where(log_s == 0, 1.0, np.where(survival == 0, 0.0, upper))
+    return {"times": times, "at_risk": at_risk, "events": events,
+            "survival": survival, "lower": lower, "upper": upper}
+
+
 class CommunityModels:
     """
     Mathematical implementations of Markov Chains and Survival Analysis
@@ -20,24 +50,22 @@ class CommunityModels:
         """
         Calculates the transition probability matrix based strictly on historical data.
         """
-        matrix = np.zeros((num_states, num_states))
-        
-        # Count transitions
-        for start, end in transitions:
-            matrix[start][end] += 1
-            
-        # Normalize to probabilities
-        for i in range(num_states):
-            row_sum = np.sum(matrix[i])
-            if row_sum > 0:
-                matrix[i] = matrix[i] / row_sum
-            else:
-                # BP requirement: Do not use artificial probabilities (e.g., matrix[i][i] = 1.0)
-                # for missing data. The row remains all zeros. This means if a system enters
-                # an unobserved state, the prediction will explicitly yield zeros (undefined)
-                # rather than fabricating a false continuation.
-                pass
-                
+        pairs = np.asarray(transitions, dtype=np.int64).reshape(-1, 2)
+        counts = np.bincount(pairs[:, 0] * num_states + pairs[:, 1], minlength=num_states * num_states)
+        return CommunityModels.normalize_transitions(counts.reshape(num_states, num_states))
+
+    @staticmethod
+    def normalize_transitions(counts: np.ndarray) -> np.ndarray:
+        """
+        Row-normalizes a matrix of transition counts into probabilities.
+        """
+        counts = np.asarray(counts, dtype=float)
+        row_sums = counts.sum(axis=1, keepdims=True)
+        # BP requirement: Do not use artificial probabilities (e.g., matrix[i][i] = 1.0)
+        # for missing data. The row remains all zeros. This means if a system enters
+        # an unobserved state, the prediction will explicitly yield zeros (undefined)
+        # rather than fabricating a false continuation.
+        matrix = np.divide(counts, row_sums, out=np.zeros_like(counts), where=row_sums > 0)
         return matrix
 
     @staticmethod
@@ -50,6 +78,52 @@ class CommunityModels:
             result = np.dot(result, matrix)
         return result
 
+    @staticmethod
+    def kaplan_meier(durations, event_observed, alpha: float = 0.05) -> Dict[str, np.ndarray]:
+        """
+        Kaplan-Meier estimator over sorted arrays, O(n log n).
+        Returns arrays over the distinct times: times, at_risk, events, survival and the
+        (1 - alpha) Greenwood confidence band (log-log transformed, so it stays within [0, 1]).
+        Censored observations leave the risk set after the events of their time.
+        """
+        d = np.asarray(durations, dtype=float)
+        e = np.asarray(event_observed, dtype=bool)
+        order = np.argsort(d, kind="stable")
+        return _km_sorted(d[order], e[order], _z_score(alpha))
+
+    @staticmethod
+    def kaplan_meier_cohorts(durations, event_observed, cohorts, alpha: float = 0.05) -> Dict[Any, Dict[str, np.ndarray]]:
+        """
+        Kaplan-Meier curves of many cohorts (join month, role, ...) in one call.
+        cohorts: label of each observation. Sorts once by (cohort, duration) and
+        splits the sorted arrays, so the cost stays O(n log n) for any number of cohorts.
+        """
+        d = np.asarray(durations, dtype=float)
+        e = np.asarray(event_observed, dtype=bool)
+        labels, codes = np.unique(np.asarray(cohorts), return_inverse=True)
+        if not len(d):
+            return {}
+        order = np.lexsort((d, codes))
+        d, e, codes = d[order], e[order], codes[order]
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        z = _z_score(alpha)
+        return {
+            labels[codes[start]].item(): _km_sorted(d[start:end], e[start:end], z)
+            for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(d)])
+        }
+
+    @staticmethod
+    def curve_by_day(km: Dict[str, np.ndarray], field: str = "survival") -> Dict[int, float]:
+        """
+        Collapses a curve to whole days: the value at the end of each day that has an observation.
+        """
+        times = km["times"]
+        if not len(times):
+            return {}
+        days = np.trunc(times).astype(np.int64)
+        last = np.r_[days[1:] != days[:-1], True]
+        return dict(zip(days[last].tolist(), km[field][last].tolist()))
+
     @staticmethod
     def calculate_survival_rate(durations: List[int], event_observed: List[bool]) -> Dict[int, float]:
         """
@@ -57,31 +131,9 @@ class CommunityModels:
         durations: list of days since observation started until last activity or event.
         event_observed: True if the user actually dropped activity (event occurred), False if censored (still active).
         """
-        if not durations:
+        if not len(durations):
             return {}
-
-        sorted_indices = np.argsort(durations)
-        d = np.array(durations)[sorted_indices]
-        e = np.array(event_observed)[sorted_indices]
-
-        unique_times = np.unique(d)
-        survival_curve = {}
-        s_t = 1.0
-        n_at_risk = len(d)
-
-        for t in unique_times:
-            # Number of events at time t
-            n_events = np.sum((d == t) & e)
-            # Number of censored at time t (handled at the end of the interval)
-            n_censored = np.sum((d == t) & ~e)
-            
-            if n_at_risk > 0:
-                s_t *= (1 - n_events / n_at_risk)
-                
-            survival_curve[int(t)] = float(s_t)
-            n_at_risk -= (n_events + n_censored)
-
-        return survival_curve
+        return CommunityModels.curve_by_day(CommunityModels.kaplan_meier(durations, event_observed))
 
     @staticmethod
     def estimate_median_survival(survival_curve: Dict[int, float]) -> Optional[int]:
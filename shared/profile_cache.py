@@ -0,0 +1,73 @@
+"""Change detection for the ``user:info:{uid}`` profile writes of the bot.
+
+The bot refreshes a user's profile hash (name, avatar, roles, joined_at) on
+every message, voice update and audit entry, which for active users means
+thousands of identical ``HSET`` calls per hour.  :class:`ProfileCache` keeps
+a fingerprint of each field last written per user in a bounded LRU, so only
+fields that actually changed are written::
+
+    changed = cache.diff(uid, mapping)
+    if changed and bus.emit("user_info", lambda pipe: pipe.hset(key, mapping=changed)):
+        cache.mark(uid, changed)
+
+Every ``resync`` seconds the full profile is written again, which repairs the
+hash after writers the cache cannot see (web hydration).  Code that deletes a
+profile calls :meth:`ProfileCache.invalidate`, so the next event writes it in
+full (GDPR deletion).
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+PROFILE_CACHE_SIZE = 50000
+PROFILE_RESYNC = 86400
+
+
+class ProfileCache:
+    def __init__(self, maxsize: int = PROFILE_CACHE_SIZE, resync: float = PROFILE_RESYNC):
+        self.maxsize = maxsize
+        self.resync = resync
+        # uid -> ({field: hash(value)}, time of the last full write)
+        self._data: "OrderedDict[Any, Tuple[Dict[str, int], float]]" = OrderedDict()
+        self.written = 0
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def diff(self, uid: Any, mapping: Dict[str, str], force: bool = False,
+             now: Optional[float] = None) -> Dict[str, str]:
+        """Fields of ``mapping`` that differ from what was last written for ``uid``."""
+        now = now if now is not None else time.time()
+        entry = self._data.get(uid)
+        if entry is None or force or now - entry[1] >= self.resync:
+            return dict(mapping)
+        self._data.move_to_end(uid)
+        changed = {f: v for f, v in mapping.items() if entry[0].get(f) != hash(v)}
+        if not changed:
+            self.skipped += 1
+        return changed
+
+    def mark(self, uid: Any, fields: Dict[str, str], full: Optional[bool] = None,
+             now: Optional[float] = None) -> None:
+        """Record that ``fields`` were written for ``uid``.
+
+        ``full`` defaults to whether this was the first write or a resync, i.e.
+        whether :meth:`diff` returned the whole profile.
+        """
+        now = now if now is not None else time.time()
+        entry = self._data.get(uid)
+        if full is None:
+            full = entry is None or now - entry[1] >= self.resync
+        hashes = dict(entry[0]) if entry else {}
+        hashes.update({f: hash(v) for f, v in fields.items()})
+        self._data[uid] = (hashes, now if full or entry is None else entry[1])
+        self._data.move_to_end(uid)
+        self.written += 1
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, uid: Any) -> None:
+        self._data.pop(uid, None)
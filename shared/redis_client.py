@@ -1,16 +1,213 @@
 # Redis connection pooling
+"""One Redis connection manager per process, shared by the bot and the web app.
+
+``get_redis()`` used to build a new client and send ``PING`` on every call,
+and every bot cog opened its own pool.  Now all callers share one pool and one
+client (:func:`shared_client` for synchronous setup code such as cog
+constructors).  Health is checked lazily - at most one ``PING`` per
+``HEALTH_INTERVAL`` seconds, shared by concurrent callers - and every command
+has a socket timeout.
+
+A circuit breaker watches connection errors and timeouts of all commands and
+pipelines.  After ``FAILURE_THRESHOLD`` consecutive failures it opens and
+commands fail immediately with :class:`RedisUnavailable` instead of each
+waiting for a socket timeout; after ``RESET_TIMEOUT`` seconds one probe is let
+through.  :mod:`shared.result_cache` serves its last local results while the
+breaker is open.
+"""
+import asyncio
 import os
 import logging
+import time
+from typing import Optional
+
 import redis.asyncio as redis
 import redis as redis_sync
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ConnectionError as RedisConnectionError, RedisError, TimeoutError as RedisTimeoutError
 from shared.config import settings
+from shared.metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
+HEALTH_INTERVAL = 5.0
+SOCKET_TIMEOUT = 5.0
+CONNECT_TIMEOUT = 2.0
+MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 10.0
+
+BREAKER_STATE = REGISTRY.gauge("redis_breaker_open", "1 while the Redis circuit breaker is open")
+BREAKER_REJECTED = REGISTRY.counter("redis_breaker_rejected", "Commands failed fast by the open circuit breaker")
+REDIS_ERRORS = REGISTRY.counter("redis_errors", "Redis connection errors and timeouts")
+POOL_IN_USE = REGISTRY.gauge("redis_pool_in_use", "Connections currently checked out of the shared pool")
+POOL_IDLE = REGISTRY.gauge("redis_pool_idle", "Idle connections in the shared pool")
+POOL_MAX = REGISTRY.gauge("redis_pool_max", "Connection limit of the shared pool")
+
+_TRANSIENT = (RedisConnectionError, RedisTimeoutError, asyncio.TimeoutError, OSError)
+
 _pool = None  # global connection pool
+_manager = None
 _fake_redis = None
 _fake_redis_sync = None
 
+
+class RedisUnavailable(RuntimeError):
+    """Redis is down or the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """False while open; after ``reset_timeout`` lets a single probe through (half-open)."""
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.warning("Redis is reachable again, closing circuit breaker")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        BREAKER_STATE.set(0)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        REDIS_ERRORS.inc()
+        if self._probing or self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.error(f"Redis failed {self.failures}x, opening circuit breaker for {self.reset_timeout}s")
+            self.opened_at = time.monotonic()
+            self._probing = False
+            BREAKER_STATE.set(1)
+
+    def release_probe(self) -> None:
+        """Let the next call probe again after one that ended without an answer either way (cancelled)."""
+        self._probing = False
+
+
+async def _guarded(breaker: CircuitBreaker, call):
+    """Await ``call`` and report its outcome to ``breaker``.
+
+    Errors returned by the server (``ResponseError``, ``WatchError``, ...) prove
+    it is reachable and count as a success.
+    """
+    try:
+        result = await call
+    except _TRANSIENT:
+        breaker.record_failure()
+        raise
+    except RedisError:
+        breaker.record_success()
+        raise
+    except BaseException:
+        breaker.release_probe()
+        raise
+    breaker.record_success()
+    return result
+
+
+class _GuardedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        breaker = self._breaker
+        if not breaker.allow():
+            BREAKER_REJECTED.inc()
+            await self.reset()
+            raise RedisUnavailable("Service Unavailable: Redis circuit breaker is open")
+        return await _guarded(breaker, super().execute(raise_on_error))
+
+
+class GuardedRedis(redis.Redis):
+    """``redis.Redis`` whose commands and pipelines go through the circuit breaker."""
+
+    breaker: CircuitBreaker
+
+    async def execute_command(self, *args, **options):
+        if not self.breaker.allow():
+            BREAKER_REJECTED.inc()
+            raise RedisUnavailable("Service Unavailable: Redis circuit breaker is open")
+        return await _guarded(self.breaker, super().execute_command(*args, **options))
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> Pipeline:
+        pipe = _GuardedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe._breaker = self.breaker
+        return pipe
+
+
+class RedisManager:
+    """Shared pool, shared client, lazy health check and circuit breaker."""
+
+    def __init__(self, url: str, health_interval: float = HEALTH_INTERVAL, breaker: Optional[CircuitBreaker] = None,
+                 max_connections: int = MAX_CONNECTIONS, socket_timeout: float = SOCKET_TIMEOUT):
+        self.url = url
+        self.health_interval = health_interval
+        self.breaker = breaker or CircuitBreaker()
+        self.pool = redis.ConnectionPool.from_url(
+            url, decode_responses=True, max_connections=max_connections,
+            socket_timeout=socket_timeout, socket_connect_timeout=CONNECT_TIMEOUT,
+            health_check_interval=30,
+        )
+        self.client = GuardedRedis(connection_pool=self.pool)
+        self.client.breaker = self.breaker
+        self._checked_at = 0.0
+        self._check: Optional[asyncio.Future] = None
+        POOL_IN_USE.set_function(lambda: len(getattr(self.pool, "_in_use_connections", ())))
+        POOL_IDLE.set_function(lambda: len(getattr(self.pool, "_available_connections", ())))
+        POOL_MAX.set(max_connections)
+
+    async def get(self) -> redis.Redis:
+        """The shared client; raises :class:`RedisUnavailable` when Redis is known to be down."""
+        if time.monotonic() - self._checked_at >= self.health_interval:
+            await self._health_check()
+        # The periodic PING doubles as the half-open probe that closes the breaker
+        if self.breaker.is_open:
+            BREAKER_REJECTED.inc()
+            raise RedisUnavailable(f"Service Unavailable: Redis at {self.url} is unreachable")
+        return self.client
+
+    async def _health_check(self) -> None:
+        # Concurrent callers share one PING instead of each sending their own
+        if self._check is not None:
+            await asyncio.shield(self._check)
+            return
+        self._check = asyncio.ensure_future(self._ping())
+        try:
+            await asyncio.shield(self._check)
+        finally:
+            self._check = None
+
+    async def _ping(self) -> None:
+        self._checked_at = time.monotonic()
+        try:
+            await self.client.ping()
+        except RedisUnavailable:
+            pass
+        except Exception as e:
+            logger.error(f"Redis health check failed at {self.url}: {e}")
+
+    def pool_stats(self) -> dict:
+        return {
+            "in_use": len(getattr(self.pool, "_in_use_connections", ())),
+            "idle": len(getattr(self.pool, "_available_connections", ())),
+            "max": self.pool.max_connections,
+            "breaker_open": self.breaker.is_open,
+        }
+
+
 def _should_use_fakeredis() -> bool:
     if settings.environment == "test":
         return True
@@ -18,41 +215,51 @@ def _should_use_fakeredis() -> bool:
         return True
     return False
 
-async def get_redis() -> redis.Redis:
-    """Get Redis client from connection pool. Fails fast in production if offline."""
-    global _pool, _fake_redis
-    
-    if _fake_redis is not None:
-        return _fake_redis
 
-    if _should_use_fakeredis():
+def _fake_client():
+    global _fake_redis
+    if _fake_redis is None:
         try:
             import fakeredis.aioredis
             _fake_redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
-            return _fake_redis
         except ImportError:
             logger.error("fakeredis not installed!")
             raise
+    return _fake_redis
+
+
+def redis_manager() -> RedisManager:
+    """The process-wide manager for ``settings.redis_url``."""
+    global _manager, _pool
+    if _manager is None:
+        _manager = RedisManager(settings.redis_url)
+        _pool = _manager.pool
+    return _manager
+
+
+def shared_client() -> redis.Redis:
+    """The shared client without a health check, for synchronous setup code (bot cogs)."""
+    if _should_use_fakeredis():
+        return _fake_client()
+    return redis_manager().client
+
+
+async def get_redis() -> redis.Redis:
+    """Get the shared Redis client. Fails fast while Redis is known to be offline."""
+    if _fake_redis is not None or _should_use_fakeredis():
+        return _fake_client()
+    return await redis_manager().get()
 
-    if _pool is None:
-        _pool = redis.ConnectionPool.from_url(settings.redis_url, decode_responses=True)
-        
-    client = redis.Redis(connection_pool=_pool)
-    try:
-        await client.ping()
-        return client
-    except (redis.exceptions.ConnectionError, ConnectionRefusedError) as e:
-        logger.error(f"Redis connection failed at {settings.redis_url}")
-        raise RuntimeError(f"Service Unavailable: Redis connection failed. {e}")
 
 async def get_redis_client() -> redis.Redis:
     """backwards compat alias"""
     return await get_redis()
 
+
 def get_redis_sync() -> redis_sync.Redis:
     """Sync Redis client for maintenance scripts"""
     global _fake_redis_sync
-    
+
     if _fake_redis_sync is not None:
         return _fake_redis_sync
 
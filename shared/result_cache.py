@@ -0,0 +1,199 @@
+"""Two-tier result cache for expensive service and repository calls.
+
+``@cached_result("engagement")`` on an async method caches its return value:
+
+* in-process LRU (one per process, like :mod:`shared.entity_cache`),
+* shared Redis tier (``cache:result:{name}:{gid}:{digest}``) so every web
+  worker benefits from one computation,
+* single-flight: concurrent identical calls in one process await the same
+  computation instead of starting N of them.
+
+Entries are valid for one *ingest token* - the guild's
+``stats:watermark:{gid}`` counter (bumped by every rollup write, i.e. every
+ingested event) plus the global ``config:weights_version``.  A result is
+recomputed only after new data or new weights arrive.  ``max_age`` still bounds
+every entry because results over relative windows ("last 30 days") and inputs
+outside the event stream (presence, member counts) change without an ingest.
+
+Cache failures never fail the call - the method is simply executed.  While
+Redis is unreachable (see :mod:`shared.redis_client`) the last local result is
+served instead, whatever its token or age.
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from shared.keys import K_INGEST_WATERMARK, K_RESULT_CACHE
+from shared.redis_client import RedisUnavailable
+
+WEIGHTS_VERSION_KEY = "config:weights_version"
+LOCAL_MAXSIZE = 512
+# Result of a flight whose leader was cancelled: its waiters start a new one
+_RETRY = object()
+
+
+def bump_watermark(r: Any, gid: Any) -> Any:
+    """INCR the guild's ingest watermark (works on a client or a pipeline)."""
+    return r.incr(K_INGEST_WATERMARK(gid))
+
+
+async def ingest_token(r: Any, gid: Any) -> str:
+    watermark, weights_version = await r.mget(K_INGEST_WATERMARK(gid), WEIGHTS_VERSION_KEY)
+    return f"{watermark or 0}|{weights_version or 0}"
+
+
+def default_cacheable(value: Any) -> bool:
+    """Skip empty results and the fallback dicts returned after an error."""
+    if not value:
+        return False
+    if isinstance(value, dict) and ("error" in value or value.get("reason") == "calculation_error"):
+        return False
+    return True
+
+
+class _Store:
+    def __init__(self, maxsize: int = LOCAL_MAXSIZE):
+        self.maxsize = maxsize
+        self.local: "OrderedDict[str, Tuple[str, float, Any]]" = OrderedDict()
+        self.inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get(self, key: str, token: str) -> Tuple[bool, Any]:
+        item = self.local.get(key)
+        if item is None:
+            return False, None
+        item_token, expires, value = item
+        # Outdated entries stay in the LRU as the fallback for degraded Redis
+        if item_token != token or expires < time.monotonic():
+            return False, None
+        self.local.move_to_end(key)
+        return True, value
+
+    def stale(self, key: str) -> Tuple[bool, Any]:
+        item = self.local.get(key)
+        return (False, None) if item is None else (True, item[2])
+
+    def put(self, key: str, token: str, value: Any, max_age: float) -> None:
+        self.local[key] = (token, time.monotonic() + max_age, value)
+        self.local.move_to_end(key)
+        while len(self.local) > self.maxsize:
+            self.local.popitem(last=False)
+
+
+_store = _Store()
+
+
+def result_store(r: Any = None) -> _Store:
+    """The process-wide store (``r`` is accepted for callers holding a client)."""
+    return _store
+
+
+def _redis_unavailable(exc: BaseException) -> bool:
+    return isinstance(exc, (RedisUnavailable, RedisConnectionError, RedisTimeoutError, OSError))
+
+
+async def _client_of(obj: Any) -> Any:
+    repo = getattr(obj, "repo", None) or obj
+    return await repo.get_client()
+
+
+def cached_result(name: str, max_age: float = 300, guild_arg: str = "guild_id",
+                  cacheable: Callable[[Any], bool] = default_cacheable):
+    """Decorate an async method whose owner has ``get_client()`` or ``repo.get_client()``."""
+
+    def decorator(fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            key = None
+            store = result_store()
+            try:
+                bound = sig.bind(self, *args, **kwargs)
+                bound.apply_defaults()
+                params = {k: v for k, v in bound.arguments.items() if k != "self"}
+                gid = params.get(guild_arg)
+                digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+                key = K_RESULT_CACHE(name, gid, digest)
+                r = await _client_of(self)
+                token = await ingest_token(r, gid)
+            except Exception as e:
+                if key is not None and _redis_unavailable(e):
+                    found, value = store.stale(key)
+                    if found:
+                        store.stale_hits += 1
+                        return copy.deepcopy(value)
+                print(f"Result cache unavailable for {name}: {e}")
+                return await fn(self, *args, **kwargs)
+
+            hit, value = store.get(key, token)
+            if hit:
+                store.hits += 1
+                return copy.deepcopy(value)
+
+            flight_key = (key, token)
+            pending = store.inflight.get(flight_key)
+            while pending is not None:
+                value = await asyncio.shield(pending)
+                if value is not _RETRY:
+                    return copy.deepcopy(value)
+                pending = store.inflight.get(flight_key)
+
+            future = asyncio.get_running_loop().create_future()
+            store.inflight[flight_key] = future
+            try:
+                value = await _load_or_compute(r, store, key, token, max_age, cacheable,
+                                               lambda: fn(self, *args, **kwargs))
+                future.set_result(value)
+                return copy.deepcopy(value)
+            except asyncio.CancelledError:
+                # The cancellation belongs to this caller only; waiters recompute
+                future.set_result(_RETRY)
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                # Waiters re-raise; mark retrieved so an unawaited future does not warn
+                future.exception()
+                raise
+            finally:
+                store.inflight.pop(flight_key, None)
+
+        return wrapper
+
+    return decorator
+
+
+async def _load_or_compute(r, store: _Store, key: str, token: str, max_age: float,
+                           cacheable: Callable[[Any], bool], compute) -> Any:
+    try:
+        raw = await r.get(key)
+        payload = json.loads(raw) if raw else None
+        if isinstance(payload, dict) and payload.get("t") == token and "v" in payload:
+            store.shared_hits += 1
+            store.put(key, token, payload["v"], max_age)
+            return payload["v"]
+    except Exception as e:
+        print(f"Result cache read error ({key}): {e}")
+
+    store.misses += 1
+    value = await compute()
+    if cacheable(value):
+        store.put(key, token, value, max_age)
+        try:
+            await r.set(key, json.dumps({"t": token, "v": value}), ex=int(max_age))
+        except Exception as e:
+            print(f"Result cache write error ({key}): {e}")
+    return value
@@ -0,0 +1,152 @@
+"""Background retention for the ``events:*`` sorted sets.
+
+Ingestion used to run ``ZREMRANGEBYSCORE key -inf cutoff`` after every single
+event.  Writes are now a pure append and :func:`sweep_guild` expires old events
+on a schedule instead, walking the guild's member index in pipelined batches::
+
+    report = await sweep_guild(r, gid, settings.event_retention_days,
+                               max_events=settings.event_budget_per_guild)
+
+With ``max_events`` the guild is additionally trimmed to a budget of stored
+events, oldest first across all users and kinds.  The cutoff timestamp for the
+trim is found by bisecting over pipelined ``ZCOUNT`` calls, so no events are
+read.  Users whose sorted set became empty are dropped from the member index;
+their sets are watched and counted again first, so a user whose first event
+arrives during the sweep stays indexed.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional
+
+from redis.exceptions import WatchError
+
+from shared.batch_reader import MAX_CONCURRENCY, PIPELINE_CHUNK, first_scores, iter_pipelined, zcards
+from shared.event_index import EVENT_KINDS, event_keys
+from shared.keys import K_EVENT_MEMBERS, K_RETENTION_LOCK, K_RETENTION_REPORT
+from shared.result_cache import bump_watermark
+
+SWEEP_INTERVAL = 3600
+WATCH_RETRIES = 3
+# Trim cutoff precision; events within one second of it may be trimmed together
+TRIM_RESOLUTION = 1.0
+
+
+async def _remove_before(r: Any, keys: List[str], cutoff: Any, inclusive: bool = True,
+                         chunk_size: int = PIPELINE_CHUNK, concurrency: int = MAX_CONCURRENCY) -> int:
+    bound = cutoff if inclusive else f"({cutoff}"
+    removed = 0
+    async for _, n in iter_pipelined(r, keys, lambda pipe, k: pipe.zremrangebyscore(k, "-inf", bound),
+                                     chunk_size, concurrency):
+        removed += int(n or 0)
+    return removed
+
+
+async def _count_before(r: Any, keys: List[str], cutoff: float, chunk_size: int,
+                        concurrency: int) -> int:
+    total = 0
+    async for _, n in iter_pipelined(r, keys, lambda pipe, k: pipe.zcount(k, "-inf", f"({cutoff}"),
+                                     chunk_size, concurrency):
+        total += int(n or 0)
+    return total
+
+
+async def _forget_empty(r: Any, gid: Any, kind: str, keys: List[str], chunk_size: int,
+                        concurrency: int) -> int:
+    """SREM the users of ``keys`` from the member index if their set is still empty.
+
+    The sets are ``WATCH``ed before they are counted, so the removal is aborted
+    (and the chunk checked again) when an event is written in between.
+    """
+    prefix = f"events:{kind}:{gid}:"
+    removed = 0
+    for i in range(0, len(keys), chunk_size):
+        chunk = keys[i:i + chunk_size]
+        for _ in range(WATCH_RETRIES):
+            async with r.pipeline(transaction=True) as pipe:
+                await pipe.watch(*chunk)
+                sizes = await zcards(r, chunk, chunk_size, concurrency)
+                empty = [k[len(prefix):] for k in chunk if not sizes.get(k)]
+                if not empty:
+                    break
+                pipe.multi()
+                pipe.srem(K_EVENT_MEMBERS(gid, kind), *empty)
+                try:
+                    await pipe.execute()
+                except WatchError:
+                    continue
+                removed += len(empty)
+                break
+    return removed
+
+
+async def _trim_cutoff(r: Any, keys: List[str], excess: int, now: float,
+                       chunk_size: int, concurrency: int) -> Optional[float]:
+    """Smallest timestamp ``t`` with at least ``excess`` events scored below ``t``."""
+    lowest = [s for s in (await first_scores(r, keys, chunk_size, concurrency)).values() if s is not None]
+    if not lowest:
+        return None
+    lo, hi = min(lowest), max(now, max(lowest)) + TRIM_RESOLUTION
+    while hi - lo > TRIM_RESOLUTION:
+        mid = (lo + hi) / 2
+        if await _count_before(r, keys, mid, chunk_size, concurrency) >= excess:
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+async def sweep_guild(r: Any, gid: Any, retention_days: Optional[int], max_events: int = 0,
+                      now: Optional[float] = None, chunk_size: int = PIPELINE_CHUNK,
+                      concurrency: int = MAX_CONCURRENCY) -> Dict[str, int]:
+    """Expire events older than ``retention_days`` and enforce the ``max_events`` budget.
+
+    Returns counts of what was reclaimed: ``expired`` and ``trimmed`` events,
+    ``emptied`` keys and the ``remaining`` events of the guild.
+    """
+    now = now if now is not None else time.time()
+    keys_by_kind = {kind: await event_keys(r, gid, kind) for kind in EVENT_KINDS}
+    all_keys = [k for keys in keys_by_kind.values() for k in keys]
+    report = {"expired": 0, "trimmed": 0, "emptied": 0, "remaining": 0}
+
+    if retention_days:
+        report["expired"] = await _remove_before(r, all_keys, now - retention_days * 86400,
+                                                 chunk_size=chunk_size, concurrency=concurrency)
+
+    sizes = await zcards(r, all_keys, chunk_size, concurrency)
+    total = sum(int(n or 0) for n in sizes.values())
+    if max_events and total > max_events:
+        live = [k for k in all_keys if sizes.get(k)]
+        cutoff = await _trim_cutoff(r, live, total - max_events, now, chunk_size, concurrency)
+        if cutoff is not None:
+            report["trimmed"] = await _remove_before(r, live, cutoff, inclusive=False,
+                                                     chunk_size=chunk_size, concurrency=concurrency)
+            sizes.update(await zcards(r, live, chunk_size, concurrency))
+            total -= report["trimmed"]
+    report["remaining"] = total
+
+    for kind, keys in keys_by_kind.items():
+        empty = [k for k in keys if not sizes.get(k)]
+        if empty:
+            report["emptied"] += await _forget_empty(r, gid, kind, empty, chunk_size, concurrency)
+
+    async with r.pipeline(transaction=False) as pipe:
+        if report["expired"] or report["trimmed"]:
+            bump_watermark(pipe, gid)
+        pipe.hset(K_RETENTION_REPORT(gid), mapping={"swept_at": now, **report})
+        await pipe.execute()
+    return report
+
+
+async def sweep_guilds(r: Any, guild_ids: List[Any], retention_days: Optional[int], max_events: int = 0,
+                       lock_ttl: int = SWEEP_INTERVAL // 2) -> Dict[str, Dict[str, int]]:
+    """Sweep several guilds; a guild swept by another process within ``lock_ttl`` is skipped."""
+    reports: Dict[str, Dict[str, int]] = {}
+    for gid in guild_ids:
+        if not await r.set(K_RETENTION_LOCK(gid), "1", ex=lock_ttl, nx=True):
+            continue
+        try:
+            reports[str(gid)] = await sweep_guild(r, gid, retention_days, max_events)
+        except Exception as e:
+            print(f"[Retention] Sweep failed for guild {gid}: {e}")
+    return reports
@@ -0,0 +1,164 @@
+"""Write-time daily rollups of the raw ``events:*`` sorted sets.
+
+Ingestion increments small per-day counters next to every event so that the
+web services can answer range questions from O(days) hash fields instead of
+JSON-decoding every event in the range.  Rollups live in one hash per guild and
+month (``stats:rollup:{gid}:{YYYYMM}``) with ``YYYYMMDD:metric`` fields, so a
+30-day window is one or two ``HMGET`` calls.
+
+Days that started before the first rollup write (``stats:rollup_since:{gid}``)
+are computed from the raw events, which keeps guilds ingested before rollups
+existed correct without a migration.
+"""
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from shared.aggregation import DailyMetrics, aggregate
+from shared.keys import K_ROLLUP, K_ROLLUP_SINCE, day_key
+from shared.result_cache import bump_watermark
+
+ACTION_TYPES = ("ban", "kick", "unban", "timeout", "role_update", "msg_delete", "verification")
+
+MESSAGE_METRICS = ("msgs", "msg_len", "replies", "reactions", "reaction_msgs")
+VOICE_METRICS = ("voice_seconds", "voice_sessions")
+ACTION_METRICS = tuple(f"action:{t}" for t in ACTION_TYPES) + ("action:other",)
+METRICS = MESSAGE_METRICS + VOICE_METRICS + ACTION_METRICS
+
+# Rollups are a few hundred bytes per day, so they outlive the raw events.
+ROLLUP_TTL = 400 * 86400
+
+
+def event_metrics(kind: str, data: Dict[str, Any]) -> Dict[str, int]:
+    """Map one decoded event to the rollup counters it contributes to."""
+    if kind == "msg":
+        out = {"msgs": 1, "msg_len": int(data.get("len", 0) or 0)}
+        if data.get("reply"):
+            out["replies"] = 1
+        if "reaction_count" in data:
+            out["reaction_msgs"] = 1
+            out["reactions"] = int(data.get("reaction_count") or 0)
+        return out
+    if kind == "voice":
+        return {"voice_seconds": int(data.get("duration", 0) or 0), "voice_sessions": 1}
+    if kind == "action":
+        action_type = data.get("type") or data.get("action")
+        if action_type not in ACTION_TYPES:
+            action_type = "other"
+        return {f"action:{action_type}": 1}
+    return {}
+
+
+def add_event(delta: Counter, kind: str, data: Dict[str, Any], ts: float) -> None:
+    """Accumulate an event into a ``{"YYYYMMDD:metric": n}`` delta."""
+    d = day_key(datetime.fromtimestamp(ts))
+    for metric, value in event_metrics(kind, data).items():
+        if value:
+            delta[f"{d}:{metric}"] += value
+
+
+def _by_month(delta: Dict[str, int]) -> Dict[str, Dict[str, int]]:
+    months: Dict[str, Dict[str, int]] = defaultdict(dict)
+    for field, value in delta.items():
+        if value:
+            months[field[:6]][field] = int(value)
+    return months
+
+
+def queue_rollup(pipe: Any, gid: Any, delta: Dict[str, int], now: Optional[float] = None) -> None:
+    """Queue HINCRBY commands for ``delta`` on a pipeline (not executed)."""
+    for month, fields in _by_month(delta).items():
+        key = K_ROLLUP(gid, month)
+        for field, value in fields.items():
+            pipe.hincrby(key, field, value)
+        pipe.expire(key, ROLLUP_TTL)
+    pipe.set(K_ROLLUP_SINCE(gid), now if now is not None else datetime.now().timestamp(), nx=True)
+    bump_watermark(pipe, gid)
+
+
+async def apply_rollup(r: Any, gid: Any, delta: Dict[str, int], now: Optional[float] = None) -> None:
+    """Same as :func:`queue_rollup` for callers that are not pipelining."""
+    for month, fields in _by_month(delta).items():
+        key = K_ROLLUP(gid, month)
+        for field, value in fields.items():
+            await r.hincrby(key, field, value)
+        await r.expire(key, ROLLUP_TTL)
+    await r.set(K_ROLLUP_SINCE(gid), now if now is not None else datetime.now().timestamp(), nx=True)
+    await bump_watermark(r, gid)
+
+
+def _day_range(start_dt: datetime, end_dt: datetime) -> List[datetime]:
+    days = []
+    current = start_dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    while current <= end_dt:
+        days.append(current)
+        current += timedelta(days=1)
+    return days
+
+
+async def raw_day_metrics(r: Any, gid: Any, days: Iterable[datetime]) -> Dict[str, Counter]:
+    """Compute rollups for ``days`` by decoding the raw event sorted sets."""
+    days = sorted(days)
+    out: Dict[str, Counter] = {day_key(d): Counter() for d in days}
+    if not days:
+        return out
+    ts_start = days[0].timestamp()
+    ts_end = (days[-1] + timedelta(days=1)).timestamp() - 0.001
+    acc = DailyMetrics(event_metrics, days=list(out))
+    await aggregate(r, gid, [acc], ts_start, ts_end)
+    return acc.result()
+
+
+async def read_rollups(r: Any, gid: Any, start_dt: datetime, end_dt: datetime) -> Dict[str, Counter]:
+    """Return ``{YYYYMMDD: Counter(metric -> value)}`` for every day in the range."""
+    days = _day_range(start_dt, end_dt)
+    since_raw = await r.get(K_ROLLUP_SINCE(gid))
+    since = float(since_raw) if since_raw is not None else None
+
+    covered = [d for d in days if since is not None and d.timestamp() >= since]
+    legacy = [d for d in days if d not in covered]
+
+    out: Dict[str, Counter] = {day_key(d): Counter() for d in days}
+    months: Dict[str, List[str]] = defaultdict(list)
+    for d in covered:
+        months[d.strftime("%Y%m")].extend(f"{day_key(d)}:{m}" for m in METRICS)
+    for month, fields in months.items():
+        values = await r.hmget(K_ROLLUP(gid, month), fields)
+        for field, value in zip(fields, values):
+            if value:
+                d, metric = field.split(":", 1)
+                out[d][metric] = int(value)
+
+    if legacy:
+        out.update(await raw_day_metrics(r, gid, legacy))
+    return out
+
+
+def sum_rollups(per_day: Dict[str, Counter]) -> Counter:
+    """Collapse per-day rollups into range totals."""
+    total: Counter = Counter()
+    for metrics in per_day.values():
+        total.update(metrics)
+    return total
+
+
+async def rebuild_rollup_days(r: Any, gid: Any, days: Iterable[datetime]) -> None:
+    """Overwrite stored rollups for ``days`` with values recomputed from raw events.
+
+    Used after bulk imports (backfill) that add events to days already
+    covered by live rollups.
+    """
+    days = sorted({d.replace(hour=0, minute=0, second=0, microsecond=0) for d in days})
+    if not days:
+        return
+    recomputed = await raw_day_metrics(r, gid, days)
+    for d, metrics in recomputed.items():
+        key = K_ROLLUP(gid, d[:6])
+        await r.hdel(key, *[f"{d}:{m}" for m in METRICS])
+        mapping = {f"{d}:{m}": v for m, v in metrics.items() if v}
+        if mapping:
+            await r.hset(key, mapping=mapping)
+            await r.expire(key, ROLLUP_TTL)
+    await bump_watermark(r, gid)
@@ -0,0 +1,188 @@
+"""Aggregators that turn the guild event streams into the keys read by the web.
+
+Entry types appended by the bot cogs (all values are strings):
+
+``event``       raw activity event: ``kind`` (msg/voice/action), ``uid``, ``ts``,
+                ``member`` (:mod:`shared.event_codec`), for messages also
+                ``cid`` and ``len``  (ActivityMonitor)
+``touch``       activity without a stored event (interactions, long voice
+                sessions): ``uid``, ``ts``  (ActivityHLLOptCog)
+``health_msg``  message metadata for the community health analytics
+                (CommunityHealthTracker)
+
+``event`` messages and ``touch`` entries feed both the DAU HLLs and the exact
+activity bitmaps.
+
+Counters take the day and hour from the entry timestamp in UTC, so a new
+group reading a stream from the start reproduces the live values.  The
+``events`` (rollups) and ``dashboard`` groups increment counters and cannot be
+replayed over their existing keys.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Set, Tuple
+
+from shared.activity_bitmap import queue_active, user_indexes
+from shared.config import settings
+from shared.event_codec import decode_event
+from shared.event_index import index_member
+from shared.event_stream import StreamAggregator
+from shared.keys import K_DAU, K_HEATMAP, K_HOURLY, K_MSGLEN, K_TOTAL_MSGS, day_key
+from shared.rollups import add_event, queue_rollup
+
+DAU_TTL = 40 * 86400
+DASHBOARD_TTL = 60 * 86400
+MSG_LEN_BUCKETS = ((0, 0), (10, 5), (50, 30), (100, 75), (200, 150))
+
+
+def _utc(ts: str) -> datetime:
+    return datetime.fromtimestamp(float(ts), timezone.utc)
+
+
+def msg_len_bucket(msg_len: int) -> int:
+    for limit, bucket in MSG_LEN_BUCKETS:
+        if msg_len <= limit:
+            return bucket
+    return 250
+
+
+class EventStoreAggregator(StreamAggregator):
+    """Raw ``events:{kind}:{gid}:{uid}`` sorted sets, member index and daily rollups.
+
+    The bot writes the raw event and index itself as well; adding them again is a no-op.
+    """
+    group = "events"
+    types = ("event",)
+    idempotent = False
+
+    def apply(self, pipe, gid, entries):
+        delta: Counter = Counter()
+        indexed: Set[Tuple[str, str]] = set()
+        for _, f in entries:
+            kind, uid, ts = f["kind"], f["uid"], float(f["ts"])
+            pipe.zadd(f"events:{kind}:{gid}:{uid}", {f["member"]: ts})
+            if (kind, uid) not in indexed:
+                indexed.add((kind, uid))
+                index_member(pipe, gid, kind, uid)
+            add_event(delta, kind, decode_event(f["member"]), ts)
+        queue_rollup(pipe, gid, delta)
+
+
+class DashboardAggregator(StreamAggregator):
+    """Hourly/heatmap/length counters, channel totals and message leaderboards."""
+    group = "dashboard"
+    types = ("event",)
+    idempotent = False
+
+    def accepts(self, fields):
+        return fields.get("type") == "event" and fields.get("kind") == "msg"
+
+    def apply(self, pipe, gid, entries):
+        for _, f in entries:
+            now = _utc(f["ts"])
+            queue_dashboard_stats(pipe, gid, f.get("cid", ""), f["uid"], day_key(now), now.hour,
+                                  now.weekday(), int(f.get("len") or 0))
+
+
+def queue_dashboard_stats(pipe: Any, gid: Any, cid: Any, uid: Any, today: str, hour: int, weekday: int,
+                          msg_len: int) -> None:
+    pipe.hincrby(K_HOURLY(gid, today), hour, 1)
+    pipe.expire(K_HOURLY(gid, today), DASHBOARD_TTL)
+    pipe.zincrby(K_MSGLEN(gid), 1, msg_len_bucket(msg_len))
+    pipe.hincrby(K_HEATMAP(gid), f"{weekday}_{hour}", 1)
+    pipe.expire(K_HEATMAP(gid), DASHBOARD_TTL)
+    pipe.incr(K_TOTAL_MSGS(gid))
+
+    channel_key = f"stats:channel:{gid}:{cid}:{today}"
+    pipe.incr(channel_key)
+    pipe.expire(channel_key, DASHBOARD_TTL)
+    pipe.zincrby(f"stats:channel_total:{gid}", 1, f"{cid}")
+
+    pipe.zincrby(f"leaderboard:messages:{gid}", 1, f"{uid}")
+    user_daily_key = f"stats:user_daily:{gid}:{today}"
+    pipe.zincrby(user_daily_key, 1, f"{uid}")
+    pipe.expire(user_daily_key, DASHBOARD_TTL)
+
+    user_len_key = f"leaderboard:msg_lengths:{gid}:{uid}"
+    pipe.lpush(user_len_key, msg_len)
+    pipe.ltrim(user_len_key, 0, 99)
+    pipe.expire(user_len_key, 30 * 86400)
+
+    channel_hourly_key = f"stats:channel_hourly:{gid}:{cid}"
+    pipe.hincrby(channel_hourly_key, hour, 1)
+    pipe.expire(channel_hourly_key, DASHBOARD_TTL)
+
+
+class DauAggregator(StreamAggregator):
+    """Daily unique users HLLs from messages and ``touch`` entries."""
+    group = "dau"
+    types = ("event", "touch")
+
+    def accepts(self, fields):
+        kind = fields.get("type")
+        return kind == "touch" or (kind == "event" and fields.get("kind") == "msg")
+
+    def apply(self, pipe, gid, entries):
+        per_day: Dict[str, Set[str]] = {}
+        for _, f in entries:
+            per_day.setdefault(day_key(_utc(f["ts"])), set()).add(f["uid"])
+        for d, uids in per_day.items():
+            pipe.pfadd(K_DAU(gid, d), *sorted(uids))
+            pipe.expire(K_DAU(gid, d), DAU_TTL, nx=True)
+
+
+class ActivityBitmapAggregator(DauAggregator):
+    """Exact per-day activity bitmaps (:mod:`shared.activity_bitmap`) from the same entries as DAU."""
+    group = "bitmap"
+
+    def __init__(self):
+        self._indexes: Dict[str, int] = {}
+
+    async def prepare(self, r, gid, entries):
+        self._indexes = await user_indexes(r, gid, (f["uid"] for _, f in entries))
+
+    def apply(self, pipe, gid, entries):
+        per_day: Dict[str, Set[int]] = {}
+        for _, f in entries:
+            per_day.setdefault(day_key(_utc(f["ts"])), set()).add(self._indexes[f["uid"]])
+        for d, indexes in per_day.items():
+            queue_active(pipe, gid, d, sorted(indexes))
+
+
+class HealthAggregator(StreamAggregator):
+    """``health:message`` hashes and the message indexes of the health analytics."""
+    group = "health"
+    types = ("health_msg",)
+
+    def apply(self, pipe, gid, entries):
+        ttl = settings.event_retention_days * 86400
+        channels: Dict[str, str] = {}
+        for _, f in entries:
+            mid, uid, cid, created = f["mid"], f["uid"], f["cid"], float(f["ts"])
+            key = f"health:message:{gid}:{mid}"
+            pipe.hset(key, mapping={
+                "message_id": mid,
+                "author_id": uid,
+                "channel_id": cid,
+                "created_at": f["ts"],
+                "reply_to": f.get("reply_to", ""),
+                "reply_author_id": f.get("reply_author_id", ""),
+                "is_question": f.get("q", "0"),
+                "reaction_count": f.get("reactions", "0"),
+            })
+            pipe.expire(key, ttl)
+            pipe.zadd(f"health:messages:{gid}", {mid: created})
+            pipe.zadd(f"health:user_messages:{gid}:{uid}", {mid: created})
+            channels[cid] = f.get("cname", cid)
+        for cid, name in channels.items():
+            pipe.hset(f"channel:info:{cid}", mapping={"name": name, "guild_id": str(gid)})
+
+
+def default_aggregators() -> List[StreamAggregator]:
+    return [EventStoreAggregator(), DashboardAggregator(), DauAggregator(), ActivityBitmapAggregator(),
+            HealthAggregator()]
+
+
+AGGREGATORS = {agg.group: type(agg) for agg in default_aggregators()}
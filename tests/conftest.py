@@ -0,0 +1,12 @@
+import pytest
+
+from shared.entity_cache import entity_cache
+from shared.result_cache import result_store
+
+
+@pytest.fixture(autouse=True)
+def _fresh_process_caches():
+    # The local cache tiers are process-wide; every test starts with its own fake Redis
+    result_store().local.clear()
+    entity_cache(None).clear()
+    yield
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import fakeredis.aioredis
+from fakeredis.commands_mixins.bitmap_mixin import BitmapCommandsMixin
+
+from shared.activity_bitmap import (active_counts, cohort_retention, day_range, forget_user, mark_active,
+                                    retained, user_indexes)
+from shared.event_stream import StreamConsumer, append
+from shared.stream_aggregators import ActivityBitmapAggregator
+
+END = datetime(2026, 3, 31, 12, tzinfo=timezone.utc)
+
+
+def _padded_bitop(op, *keys):
+    # Redis zero-pads shorter and missing operands; fakeredis truncates to the shortest one
+    values = [k.value or b"" for k in keys]
+    width = max(len(v) for v in values)
+    ans = values[0].ljust(width, b"\0")
+    for value in values[1:]:
+        ans = bytes(op(a, b) for a, b in zip(ans, value.ljust(width, b"\0")))
+    return ans
+
+
+@pytest.fixture
+async def fake_r(monkeypatch):
+    monkeypatch.setattr(BitmapCommandsMixin, "_bitop", staticmethod(_padded_bitop))
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+def _day(days_ago):
+    return (END - timedelta(days=days_ago)).strftime("%Y%m%d")
+
+
+async def test_indexes_are_dense_and_stable(fake_r):
+    first = await user_indexes(fake_r, 1, [10, 11, 10])
+    again = await user_indexes(fake_r, 1, ["11", 12])
+    assert first == {"10": 0, "11": 1}
+    assert again == {"11": 1, "12": 2}
+    assert await user_indexes(fake_r, 2, [12]) == {"12": 0}
+
+    # A concurrent writer that claimed the user first wins
+    await fake_r.hset("bitmap:index:1", "13", 7)
+    assert (await user_indexes(fake_r, 1, [13, 14]))["13"] == 7
+
+
+async def test_exact_dau_wau_mau(fake_r):
+    # User indexes far apart so the bitmaps of different days have different lengths
+    await mark_active(fake_r, 1, {_day(0): [1], _day(3): [1, 2], _day(20): [3], _day(40): [4]})
+    await user_indexes(fake_r, 1, range(100, 2000))
+    await mark_active(fake_r, 1, {_day(6): [1999], _day(29): [1500, 3]})
+
+    assert await active_counts(fake_r, 1, END) == {"dau": 1, "wau": 3, "mau": 5}
+    assert await active_counts(fake_r, 9, END) == {"dau": 0, "wau": 0, "mau": 0}
+    assert await retained(fake_r, 1, day_range(END - timedelta(days=7), 7), day_range(END, 7)) == (0, 0)
+    assert await retained(fake_r, 1, [_day(29), _day(20)], day_range(END, 30)) == (2, 2)
+    assert not await fake_r.keys("bitmap:tmp:*")
+
+
+async def test_cohort_retention_matches_python_sets(fake_r):
+    activity = {
+        1: [30, 25, 12, 3],      # before the first week: excluded from every cohort
+        2: [20, 13, 6],
+        3: [19, 1],
+        4: [18],
+        5: [10, 2],
+        6: [5],
+    }
+    await user_indexes(fake_r, 1, range(500, 900))
+    day_uids = {}
+    for uid, days in activity.items():
+        for d in days:
+            day_uids.setdefault(_day(d), []).append(uid if uid != 6 else 899)
+    await mark_active(fake_r, 1, day_uids)
+
+    out = await cohort_retention(fake_r, 1, weeks=3, end=END, lookback_days=7)
+    assert out["weeks"] == ["2026-03-11", "2026-03-18", "2026-03-25"]
+    assert [c["retained"] for c in out["cohorts"]] == [[3, 1, 2], [1, 1], [1]]
+    assert out["cohorts"][0]["retention_pct"] == [100.0, 33.3, 66.7]
+    assert not await fake_r.keys("bitmap:tmp:*")
+
+
+async def test_aggregator_sets_bits_from_stream(fake_r):
+    ts = END.timestamp()
+    async with fake_r.pipeline(transaction=False) as pipe:
+        append(pipe, 1, {"type": "event", "kind": "msg", "uid": 10, "ts": ts, "member": "m"})
+        append(pipe, 1, {"type": "event", "kind": "voice", "uid": 11, "ts": ts, "member": "v"})
+        append(pipe, 1, {"type": "touch", "uid": 12, "ts": ts - 86400})
+        await pipe.execute()
+    assert await StreamConsumer(fake_r, ActivityBitmapAggregator(), "test").drain() == 3
+
+    assert await fake_r.hgetall("bitmap:index:1") == {"10": "0", "12": "1"}
+    assert await active_counts(fake_r, 1, END) == {"dau": 1, "wau": 2, "mau": 2}
+
+    assert await forget_user(fake_r, 1, 12)
+    assert await active_counts(fake_r, 1, END) == {"dau": 1, "wau": 1, "mau": 1}
+    assert not await forget_user(fake_r, 1, 12)
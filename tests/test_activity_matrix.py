@@ -0,0 +1,76 @@
+import numpy as np
+
+from shared.activity_matrix import ActivityMatrix, OUTSIDE, state_distribution, transition_counts
+from shared.models import CommunityModels, UserState
+
+END = 100 * 86400.0
+
+
+def _reference_states(active_days, start, days=30):
+    """Per-day loop of the original Markov code (with the latest earlier active day)."""
+    out = {}
+    for day in range(max(0, start), days):
+        earlier = [d for d in sorted(active_days) if d <= day]
+        since = day - earlier[-1] if earlier else day - start
+        if since == 0 and day == start:
+            out[day] = UserState.NEW
+        elif since <= 2:
+            out[day] = UserState.ACTIVE
+        elif since <= 7:
+            out[day] = UserState.PASSIVE
+        else:
+            out[day] = UserState.INACTIVE
+    return out
+
+
+def test_matrix_places_timestamps_in_day_columns():
+    timelines = {
+        1: [END - 10, END - 86400 - 10],        # today and yesterday
+        2: [END - 29 * 86400 - 5],              # oldest column
+        3: [END - 30 * 86400 - 5],              # outside the window
+    }
+    m = ActivityMatrix.from_timestamps(timelines, END, days=30)
+
+    assert m.uids == [1, 2]
+    assert m.active[0, 29] and m.active[0, 28] and m.active[0].sum() == 2
+    assert m.active[1, 0] and m.active[1].sum() == 1
+    assert m.dau()[29] == 1 and m.active_day_counts().tolist() == [2, 1]
+    assert len(ActivityMatrix.from_timestamps(timelines, END, days=30, only_active=False)) == 3
+
+
+def test_states_and_transitions_match_reference_loop():
+    rng = np.random.default_rng(5)
+    timelines, first_seen, expected = {}, {}, []
+    for uid in range(200):
+        days = sorted(set(rng.integers(0, 30, rng.integers(1, 8)).tolist()))
+        timelines[uid] = [END - (29 - d) * 86400 - 3600 for d in days]
+        start = int(rng.integers(-10, days[0] + 1))
+        first_seen[uid] = END - (29 - start) * 86400 - 7200
+        expected.append(_reference_states(days, start))
+
+    m = ActivityMatrix.from_timestamps(timelines, END, days=30)
+    states = m.states(m.start_index(first_seen))
+
+    ref_counts = np.zeros((4, 4), dtype=int)
+    for row, ref in zip(states, expected):
+        for day in range(30):
+            assert row[day] == ref.get(day, OUTSIDE)
+        seq = [ref[d] for d in sorted(ref)]
+        for a, b in zip(seq, seq[1:]):
+            ref_counts[a, b] += 1
+    counts = transition_counts(states)
+    np.testing.assert_array_equal(counts, ref_counts)
+    assert state_distribution(states) == np.bincount([ref[29] for ref in expected], minlength=4).tolist()
+
+    pairs = [(a, b) for a in range(4) for b in range(4) for _ in range(ref_counts[a, b])]
+    np.testing.assert_allclose(CommunityModels.normalize_transitions(counts),
+                               CommunityModels.calculate_markov_matrix(pairs, num_states=4))
+
+
+def test_retained_share():
+    active = np.zeros((3, 14), dtype=bool)
+    active[0, [1, 9]] = True
+    active[1, 2] = True
+    active[2, 10] = True
+    m = ActivityMatrix([1, 2, 3], active, END)
+    assert m.retained((0, 7), (7, 14)) == 0.5
@@ -0,0 +1,70 @@
+import pytest
+import fakeredis.aioredis
+from datetime import datetime
+
+from shared.aggregation import (
+    aggregate, ChatSessionizer, WeightedActions, VoiceTime, LengthStats,
+    ReplyRatio, WeekdayDistribution, UserTimestamps,
+)
+from shared.event_codec import encode_event
+from shared.event_index import index_member
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+async def _add(r, gid, uid, kind, event, ts):
+    await r.zadd(f"events:{kind}:{gid}:{uid}", {encode_event(kind, event): ts})
+    await index_member(r, gid, kind, uid)
+
+
+@pytest.mark.asyncio
+async def test_single_pass_feeds_all_accumulators(fake_r):
+    base = datetime(2026, 3, 2, 12, 0).timestamp()  # Monday
+    await fake_r.set("events:members_built:1:msg", "1")
+    await fake_r.set("events:members_built:1:voice", "1")
+    await fake_r.set("events:members_built:1:action", "1")
+
+    # User 10: two messages in one session, one after a long gap
+    await _add(fake_r, 1, 10, "msg", {"mid": 1, "len": 10}, base)
+    await _add(fake_r, 1, 10, "msg", {"mid": 2, "len": 20, "reply": True}, base + 60)
+    await _add(fake_r, 1, 10, "msg", {"mid": 3, "len": 0}, base + 86400 + 3600)
+    await _add(fake_r, 1, 11, "msg", {"mid": 4, "len": 30}, base + 10)
+    await _add(fake_r, 1, 10, "voice", {"duration": 120}, base)
+    await _add(fake_r, 1, 11, "action", {"type": "ban", "id": 5}, base)
+
+    weights = {"session_base": 100, "char_weight": 1, "msg_weight": 0, "reply_weight": 50,
+               "chat_time": 1, "bans": 300, "voice_time": 2}
+    chat = ChatSessionizer(weights)
+    actions = WeightedActions(weights)
+    voice = VoiceTime(weights)
+    lengths = LengthStats()
+    replies = ReplyRatio()
+    weekday = WeekdayDistribution()
+    stamps = UserTimestamps(("msg",))
+
+    await aggregate(fake_r, 1, [chat, actions, voice, lengths, replies, weekday, stamps], chunk_size=1)
+
+    assert chat.result() == {"10": 100 + 10 + 20 + 50 + 100, "11": 130.0}
+    assert actions.result()["per_user"]["11"] == {"actions": 1, "weighted": 300.0}
+    assert actions.result()["by_type"]["ban"] == 1
+    assert voice.result()["per_user"]["10"] == {"seconds": 120, "weighted": 240.0}
+    assert lengths.result() == {"count": 4, "total_len": 60, "avg_len": 15.0}
+    assert replies.result()["replies"] == 1
+    assert weekday.result()[0] == 3 and weekday.result()[1] == 1
+    assert stamps.result()["10"] == [base, base + 60, base + 86400 + 3600]
+
+
+@pytest.mark.asyncio
+async def test_range_limits_fetched_events(fake_r):
+    await fake_r.set("events:members_built:1:msg", "1")
+    await _add(fake_r, 1, 10, "msg", {"mid": 1, "len": 5}, 1000)
+    await _add(fake_r, 1, 10, "msg", {"mid": 2, "len": 7}, 5000)
+
+    lengths = LengthStats()
+    await aggregate(fake_r, 1, [lengths], start=2000, end="+inf")
+    assert lengths.result()["total_len"] == 7
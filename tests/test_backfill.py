@@ -0,0 +1,130 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+import fakeredis.aioredis
+
+from shared.backfill import BackfillEngine, BackfillSource, BackfillTask, RateLimiter
+
+
+class Forbidden(Exception):
+    pass
+
+
+class RecordingTask(BackfillTask):
+    job = "test"
+
+    def __init__(self):
+        self.resets = 0
+        self.finished = 0
+
+    def skip_error(self, exc):
+        return isinstance(exc, Forbidden)
+
+    async def reset(self, r, gid):
+        self.resets += 1
+
+    async def apply(self, pipe, gid, batch):
+        for sid, item in batch:
+            pipe.zadd(f"items:{gid}:{sid}", {str(item.id): item.id})
+        return {"seen": len(batch)}
+
+    async def finish(self, r, gid, window_start):
+        self.finished += 1
+
+
+def _source(sid, ids, fail_at=None, calls=None):
+    async def fetch(cursor, window_start):
+        if calls is not None:
+            calls.append((sid, cursor))
+        for i in ids:
+            if cursor is not None and i <= cursor:
+                continue
+            if fail_at is not None and i == fail_at:
+                raise ConnectionError("gateway hiccup")
+            yield SimpleNamespace(id=i)
+    return BackfillSource(sid, fetch)
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+def _engine(r, task, **kwargs):
+    return BackfillEngine(r, 1, task, 1000.0, batch_size=7, limiter=RateLimiter(rate=1000),
+                          retry_delay=0, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_reads_all_sources_and_cleans_up(fake_r):
+    task = RecordingTask()
+
+    async def denied(cursor, start):
+        raise Forbidden()
+        yield
+
+    report = await _engine(fake_r, task).run([_source("a", range(1, 31)), _source("b", range(100, 120)),
+                                              BackfillSource("c", denied)])
+    assert report["status"] == "done"
+    assert report["processed"] == 50 and report["counts"]["seen"] == 50
+    assert report["sources_done"] == 3
+    assert await fake_r.zcard("items:1:a") == 30 and await fake_r.zcard("items:1:b") == 20
+    assert task.resets == 1 and task.finished == 1
+    assert not await fake_r.exists("backfill:checkpoint:test:1", "lock:backfill:test:1")
+    assert json.loads(await fake_r.get("backfill:progress:1"))["status"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_interrupted_run_resumes_from_checkpoint(fake_r):
+    task = RecordingTask()
+    report = await _engine(fake_r, task).run([_source("a", range(1, 31), fail_at=13), _source("b", range(100, 105))])
+    # Retries exhausted on "a" (it keeps failing at the same item): the checkpoint survives
+    assert report["status"] == "incomplete" and "a" in report["errors"]
+    state = await fake_r.hgetall("backfill:checkpoint:test:1")
+    assert state["d:b"] == "1" and state["c:a"] == "12"
+    assert task.finished == 0
+
+    calls = []
+    resumed = RecordingTask()
+    engine = BackfillEngine(fake_r, 1, resumed, 1000.0 + 3600, batch_size=7, limiter=RateLimiter(rate=1000),
+                            retry_delay=0)
+    report = await engine.run([_source("a", range(1, 31), calls=calls), _source("b", range(100, 105), calls=calls)])
+    assert report["status"] == "done" and report["resumed"]
+    assert engine.window_start == 1000.0          # the original window is kept
+    assert [sid for sid, _ in calls] == ["a"]      # finished source skipped
+    assert calls[0][1] == 12                       # continued after the checkpoint
+    assert resumed.resets == 0
+    assert report["counts"]["seen"] == 35          # counters carried over
+    assert await fake_r.zcard("items:1:a") == 30
+
+
+@pytest.mark.asyncio
+async def test_restart_and_lock(fake_r):
+    await fake_r.hset("backfill:checkpoint:test:1", mapping={"meta": json.dumps({"window_start": 1000.0}), "d:a": 1})
+    task = RecordingTask()
+    report = await _engine(fake_r, task, restart=True).run([_source("a", range(1, 4))])
+    assert report["status"] == "done" and not report["resumed"] and task.resets == 1
+
+    await fake_r.set("lock:backfill:test:1", "1")
+    assert (await _engine(fake_r, RecordingTask()).run([_source("a", range(1, 4))]))["status"] == "locked"
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_the_batch(fake_r):
+    class FlakyTask(RecordingTask):
+        failures = 1
+
+        async def apply(self, pipe, gid, batch):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("Redis hiccup")
+            return await super().apply(pipe, gid, batch)
+
+    # Sources of one batch share its fate: "b" never sees the error raised in the reader of "a"
+    engine = _engine(fake_r, FlakyTask())
+    report = await engine.run([_source("a", range(1, 31)), _source("b", range(100, 130))])
+    assert report["status"] == "done" and report["counts"]["seen"] == 60
+    assert await fake_r.zcard("items:1:a") == 30 and await fake_r.zcard("items:1:b") == 30
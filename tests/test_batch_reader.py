@@ -0,0 +1,49 @@
+import pytest
+import fakeredis.aioredis
+
+from shared.batch_reader import iter_ranges, read_ranges, zcards, first_scores
+from web.backend.repositories.redis_repo import RedisRepository
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_ranges_stream_every_key_across_chunks(fake_r):
+    keys = []
+    for uid in range(25):
+        key = f"events:msg:1:{uid}"
+        await fake_r.zadd(key, {f"a{uid}": 100, f"b{uid}": 200, f"c{uid}": 300})
+        keys.append(key)
+
+    seen = {}
+    async for key, rows in iter_ranges(fake_r, keys, 150, "+inf", chunk_size=4, concurrency=2):
+        seen[key] = rows
+    assert set(seen) == set(keys)
+    assert seen["events:msg:1:3"] == ["b3", "c3"]
+
+    # Per-key ranges override the shared one
+    rows = await read_ranges(fake_r, [("events:msg:1:0", 0, 150), "events:msg:1:1"], 250, "+inf", withscores=True)
+    assert rows == {"events:msg:1:0": [("a0", 100.0)], "events:msg:1:1": [("c1", 300.0)]}
+
+
+@pytest.mark.asyncio
+async def test_cards_and_first_scores(fake_r):
+    await fake_r.zadd("k1", {"x": 5, "y": 7})
+    assert await zcards(fake_r, ["k1", "missing"]) == {"k1": 2, "missing": 0}
+    assert await first_scores(fake_r, ["k1", "missing"]) == {"k1": 5.0, "missing": None}
+
+
+@pytest.mark.asyncio
+async def test_repository_reader_uses_its_client(fake_r, monkeypatch):
+    await fake_r.zadd("k1", {"x": 5})
+    repo = RedisRepository()
+
+    async def client():
+        return fake_r
+    monkeypatch.setattr(repo, "get_client", client)
+    assert [item async for item in repo.iter_ranges(["k1"])] == [("k1", ["x"])]
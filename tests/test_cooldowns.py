@@ -0,0 +1,55 @@
+from shared.cooldowns import CooldownWheel
+from shared.metrics import REGISTRY
+
+
+def test_cooldown_blocks_until_ttl():
+    wheel = CooldownWheel("test-ttl", span=10, resolution=1)
+    assert wheel.allow("a", 5, now=100.0)
+    assert not wheel.allow("a", 5, now=104.9)
+    assert wheel.allow("a", 5, now=105.0)
+    assert not wheel.allow("a", 5, now=106.0)
+
+
+def test_entries_expire_as_the_wheel_turns():
+    wheel = CooldownWheel("test-expiry", span=10, resolution=1)
+    for i in range(100):
+        wheel.allow(i, 3, now=100.0 + i * 0.01)
+    assert len(wheel) == 100
+    assert wheel.advance(102.0) == 0
+    assert wheel.advance(105.0) == 100
+    assert len(wheel) == 0
+    assert all(not slot for slot in wheel._slots)
+
+
+def test_ttl_longer_than_span_and_idle_gaps():
+    wheel = CooldownWheel("test-rounds", span=4, resolution=1)
+    wheel.allow("long", 10, now=0.0)
+    wheel.allow("short", 2, now=0.0)
+    assert wheel.advance(5.0) == 1  # "short" gone, "long" waits for a later round
+    assert not wheel.allow("long", 10, now=9.0)
+    assert wheel.advance(1000.0) == 1
+    assert len(wheel) == 0
+
+
+def test_restart_of_expired_key_leaves_no_duplicate():
+    wheel = CooldownWheel("test-restart", span=10, resolution=1)
+    wheel.allow("a", 1, now=0.0)
+    assert wheel.allow("a", 1, now=1.5)  # expired but not yet reclaimed
+    assert wheel.advance(2.0) == 0      # stale slot entry dropped, new one still live
+    assert len(wheel) == 1
+    assert wheel.advance(4.0) == 1
+
+
+def test_memory_bound_evicts_oldest_and_exports_metrics():
+    wheel = CooldownWheel("test-bound", span=60, resolution=1, max_entries=3)
+    for i, key in enumerate("abcd"):
+        assert wheel.allow(key, 60, now=float(i))
+    assert len(wheel) == 3
+    assert wheel.allow("a", 60, now=4.0)  # evicted early
+    assert not wheel.allow("d", 60, now=4.0)
+
+    samples = {(name, labels.get("wheel")): value
+               for fam in REGISTRY.snapshot() for name, labels, value in fam["samples"]}
+    assert samples[("communitymetrics_cooldown_entries", "test-bound")] == 3
+    assert samples[("communitymetrics_cooldown_capacity", "test-bound")] == 3
+    assert samples[("communitymetrics_cooldown_evicted_total", "test-bound")] == 2
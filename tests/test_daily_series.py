@@ -0,0 +1,47 @@
+import pytest
+import fakeredis.aioredis
+from datetime import datetime, timedelta, timezone
+
+from shared.daily_series import read_series
+from shared.hll_pyramid import close_days
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_closed_days_are_frozen_and_today_stays_live(fake_r):
+    today = datetime.now(timezone.utc).date()
+    yesterday = today - timedelta(days=2)  # safely past the close grace period
+    ys = yesterday.strftime("%Y%m%d")
+    ts = today.strftime("%Y%m%d")
+
+    await fake_r.pfadd(f"hll:dau:1:{ys}", "a", "b", "c")
+    await fake_r.hset(f"stats:hourly:1:{ys}", mapping={"9": 4, "21": 6})
+    await fake_r.pfadd(f"hll:dau:1:{ts}", "a")
+
+    await close_days(fake_r, 1)
+    assert await fake_r.hget(f"stats:series:1:{yesterday.strftime('%Y%m')}", f"{ys}:dau") == "3"
+
+    # Live keys of the closed day are no longer needed
+    await fake_r.delete(f"hll:dau:1:{ys}", f"stats:hourly:1:{ys}")
+
+    assert await read_series(fake_r, 1, [yesterday, today], "dau") == [3, 1]
+    assert await read_series(fake_r, 1, [yesterday], "msgs") == [10]
+    hourly = (await read_series(fake_r, 1, [yesterday], "hourly"))[0]
+    assert len(hourly) == 24 and hourly[9] == 4 and hourly[21] == 6
+
+
+@pytest.mark.asyncio
+async def test_unfinalized_days_fall_back_to_live_keys(fake_r):
+    d = datetime.now(timezone.utc).date() - timedelta(days=3)
+    ds = d.strftime("%Y%m%d")
+    await fake_r.pfadd(f"hll:dau:1:{ds}", "x", "y")
+    await fake_r.hset(f"stats:hourly:1:{ds}", mapping={"0": 2})
+
+    assert await read_series(fake_r, 1, [d], "dau") == [2]
+    assert await read_series(fake_r, 1, [d], "msgs") == [2]
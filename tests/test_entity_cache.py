@@ -0,0 +1,91 @@
+import pytest
+import fakeredis.aioredis
+
+from shared.entity_cache import EntityCache, entity_cache
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_get_many_hydrates_and_caches(fake_r):
+    await fake_r.hset("user:info:1", mapping={"name": "Alice"})
+    await fake_r.hset("channel:info:7", mapping={"name": "general"})
+    cache = EntityCache(fake_r)
+
+    users = await cache.get_many("user", [1, "2", 1])
+    assert users == {"1": {"name": "Alice"}, "2": {}}
+    assert cache.misses == 2
+
+    # Served from memory even after Redis changes, until invalidated
+    await fake_r.hset("user:info:1", "name", "Alicia")
+    assert (await cache.get("user", 1))["name"] == "Alice"
+    cache.invalidate("user", 1)
+    assert (await cache.get("user", 1))["name"] == "Alicia"
+
+    assert (await cache.get("channel", 7))["name"] == "general"
+
+
+@pytest.mark.asyncio
+async def test_lru_and_ttl_eviction(fake_r):
+    await fake_r.hset("user:info:1", "name", "A")
+    cache = EntityCache(fake_r, maxsize=2)
+    await cache.get_many("user", [1, 2, 3])
+    assert ("user", "1") not in cache._data
+
+    cache = EntityCache(fake_r, ttl=-1)
+    await cache.get("user", 1)
+    await fake_r.hset("user:info:1", "name", "B")
+    assert (await cache.get("user", 1))["name"] == "B"
+
+
+@pytest.mark.asyncio
+async def test_one_cache_per_process_and_short_lived_misses(fake_r, monkeypatch):
+    other = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    assert entity_cache(other).cache is entity_cache(fake_r).cache
+    entity_cache(fake_r).clear()
+
+    clock = 1000.0
+    monkeypatch.setattr("shared.entity_cache.time.monotonic", lambda: clock)
+    assert await entity_cache(fake_r).get("user", 5) == {}
+    # Hits are shared by every client of the process
+    await fake_r.hset("user:info:6", "name", "F")
+    assert await entity_cache(fake_r).get("user", 6) == {"name": "F"}
+    assert await entity_cache(other).get("user", 6) == {"name": "F"}
+
+    await fake_r.hset("user:info:5", "name", "E")
+    assert await entity_cache(fake_r).get("user", 5) == {}
+    clock += 10
+    assert await entity_cache(fake_r).get("user", 5) == {"name": "E"}
+    entity_cache(fake_r).clear()
+    await other.aclose()
+
+
+class _CountingId(str):
+    """Id whose comparisons are counted: a linear dedupe compares each id about once."""
+
+    compared = 0
+
+    def __eq__(self, other):
+        _CountingId.compared += 1
+        return str.__eq__(self, other)
+
+    __hash__ = str.__hash__
+
+    def __str__(self):
+        return self
+
+
+@pytest.mark.asyncio
+async def test_get_many_dedupes_large_id_lists_in_linear_time(fake_r):
+    ids = [_CountingId(i) for i in range(5000)]
+    cache = EntityCache(fake_r, maxsize=50000)
+    _CountingId.compared = 0
+    users = await cache.get_many("user", ids + ids[:100])
+    assert len(users) == 5000 and cache.misses == 5000
+    # A list membership test would compare ~n²/2 = 1.25e7 times
+    assert _CountingId.compared < 5 * len(ids)
@@ -0,0 +1,44 @@
+import json
+import pytest
+import fakeredis.aioredis
+
+from shared.event_codec import encode_event, decode_event, is_compact
+from shared.event_index import index_member
+from scripts.migrate_event_codec import migrate_guild
+
+
+def test_roundtrip_matches_json_shape():
+    msg = {"mid": 1234567890123456789, "len": 42, "reply": True}
+    assert decode_event(encode_event("msg", msg)) == msg
+
+    topic = {"id": "17", "title": "Jak na to | FAQ", "source": "discourse", "reaction_count": 3}
+    decoded = decode_event(encode_event("msg", topic))
+    assert decoded["reaction_count"] == 3 and decoded["title"] == "Jak na to | FAQ"
+
+    assert decode_event(encode_event("voice", {"duration": 3600, "ts": 1700000000})) == {"duration": 3600, "ts": 1700000000}
+    assert decode_event(encode_event("action", {"type": "ban", "id": 5})) == {"type": "ban", "id": 5}
+
+
+def test_compact_is_smaller_and_legacy_still_decodes():
+    msg = {"mid": 1234567890123456789, "len": 42, "reply": False}
+    assert len(encode_event("msg", msg)) < len(json.dumps(msg))
+    assert decode_event(json.dumps(msg)) == msg
+    assert decode_event("garbage") == {}
+    assert not is_compact(json.dumps(msg))
+
+
+@pytest.mark.asyncio
+async def test_migration_rewrites_json_members_in_place():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    await r.zadd("events:msg:1:10", {json.dumps({"mid": 1, "len": 5, "reply": False}): 100.0,
+                                     encode_event("msg", {"mid": 2, "len": 6}): 200.0})
+    await index_member(r, 1, "msg", 10)
+    await r.set("events:members_built:1:msg", "1")
+
+    assert (await migrate_guild(r, 1, batch_size=1))["msg"] == 1
+    members = await r.zrange("events:msg:1:10", 0, -1, withscores=True)
+    assert all(is_compact(m) for m, _ in members)
+    assert [s for _, s in members] == [100.0, 200.0]
+    # Idempotent
+    assert (await migrate_guild(r, 1))["msg"] == 0
+    await r.aclose()
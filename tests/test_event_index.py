@@ -0,0 +1,66 @@
+import pytest
+import fakeredis.aioredis
+from shared.event_index import index_member, event_members, event_keys, drop_member
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_index_member_is_read_back(fake_r):
+    await fake_r.zadd("events:msg:1:42", {"{}": 1.0})
+    await index_member(fake_r, 1, "msg", 42)
+    await fake_r.set("events:members_built:1:msg", "1")
+
+    assert await event_members(fake_r, 1, "msg") == {"42"}
+    assert await event_keys(fake_r, 1, "msg") == ["events:msg:1:42"]
+
+
+@pytest.mark.asyncio
+async def test_legacy_keys_are_rebuilt_once_per_guild(fake_r):
+    # Data written before the index existed, plus another guild that must not leak in
+    await fake_r.zadd("events:msg:1:10", {"{}": 1.0})
+    await fake_r.zadd("events:msg:1:discourse", {"{}": 1.0})
+    await fake_r.zadd("events:msg:2:99", {"{}": 1.0})
+
+    assert await event_members(fake_r, 1, "msg") == {"10", "discourse"}
+    assert await fake_r.exists("events:members_built:1:msg")
+
+    # A key appearing without going through the writer is not picked up again
+    await fake_r.zadd("events:msg:1:11", {"{}": 1.0})
+    assert await event_members(fake_r, 1, "msg") == {"10", "discourse"}
+    assert await event_members(fake_r, 1, "voice") == set()
+
+
+@pytest.mark.asyncio
+async def test_drop_member_clears_all_kinds(fake_r):
+    for kind in ("msg", "voice", "action"):
+        await index_member(fake_r, 1, kind, 7)
+    await drop_member(fake_r, 1, 7)
+
+    for kind in ("msg", "voice", "action"):
+        assert await fake_r.smembers(f"events:members:1:{kind}") == set()
+
+
+@pytest.mark.asyncio
+async def test_deep_stats_reads_index(fake_r):
+    from unittest.mock import AsyncMock
+    from web.backend.repositories.redis_repo import RedisRepository
+    import json, time
+
+    repo = RedisRepository()
+    repo.get_client = AsyncMock(return_value=fake_r)
+    repo.get_cached_roles = AsyncMock(return_value=[])
+
+    now = time.time()
+    await fake_r.zadd("events:action:5:1", {json.dumps({"type": "ban"}): now})
+    await index_member(fake_r, 5, "action", 1)
+    await fake_r.set("events:members_built:5:action", "1")
+
+    stats = await repo.get_deep_stats_redis(5)
+    assert stats["leaderboard"][0]["user_id"] == "1"
+    assert stats["leaderboard"][0]["action_count"] == 1
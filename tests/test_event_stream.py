@@ -0,0 +1,159 @@
+import asyncio
+import pytest
+import fakeredis.aioredis
+from datetime import datetime, timezone
+
+from shared.event_codec import encode_event
+from shared.event_index import event_members
+from shared.event_stream import StreamConsumer, append, replay, trim_acknowledged
+from shared.stream_aggregators import (
+    DashboardAggregator, DauAggregator, EventStoreAggregator, HealthAggregator,
+)
+
+TS = datetime(2026, 3, 2, 14, 30, tzinfo=timezone.utc).timestamp()  # Monday
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+async def _append(r, gid, *entries):
+    async with r.pipeline(transaction=False) as pipe:
+        for fields in entries:
+            append(pipe, gid, fields)
+        await pipe.execute()
+
+
+def _msg(uid, mid, length, ts=TS, cid=7):
+    return {"type": "event", "kind": "msg", "uid": uid, "ts": ts, "cid": cid, "len": length,
+            "member": encode_event("msg", {"mid": mid, "len": length, "reply": False})}
+
+
+@pytest.mark.asyncio
+async def test_aggregators_build_derived_keys(fake_r):
+    await _append(fake_r, 1,
+                  _msg(10, 1, 20),
+                  _msg(10, 2, 300),
+                  {"type": "touch", "uid": 11, "ts": TS},
+                  {"type": "event", "kind": "voice", "uid": 12, "ts": TS,
+                   "member": encode_event("voice", {"duration": 600, "ts": int(TS)})},
+                  {"type": "health_msg", "mid": 1, "uid": 10, "cid": 7, "cname": "general", "ts": TS,
+                   "reply_to": "", "reply_author_id": "", "q": "1", "reactions": 2})
+
+    for agg in (EventStoreAggregator(), DashboardAggregator(), DauAggregator(), HealthAggregator()):
+        assert await StreamConsumer(fake_r, agg, "test").drain() == 5
+
+    assert await fake_r.zcard("events:msg:1:10") == 2
+    assert await event_members(fake_r, 1, "voice") == {"12"}
+    assert await fake_r.hget("stats:rollup:1:202603", "20260302:msgs") == "2"
+
+    assert await fake_r.hget("stats:hourly:1:20260302", "14") == "2"
+    assert await fake_r.hget("stats:heatmap:1", "0_14") == "2"
+    assert await fake_r.get("stats:total_msgs:1") == "2"
+    assert await fake_r.zscore("stats:msglen:1", "250") == 1
+    assert await fake_r.zscore("leaderboard:messages:1", "10") == 2
+
+    assert await fake_r.pfcount("hll:dau:1:20260302") == 2  # user 10 (messages) and 11 (touch)
+
+    assert await fake_r.hget("health:message:1:1", "is_question") == "1"
+    assert await fake_r.zscore("health:user_messages:1:10", "1") == TS
+    assert await fake_r.hget("channel:info:7", "name") == "general"
+
+
+@pytest.mark.asyncio
+async def test_groups_consume_independently_and_ack(fake_r):
+    await _append(fake_r, 1, _msg(10, 1, 5))
+    a = StreamConsumer(fake_r, DashboardAggregator(), "a")
+    b = StreamConsumer(fake_r, DashboardAggregator(), "b")
+    assert await a.drain() == 1
+    assert await b.drain() == 0  # same group: already delivered
+    assert (await fake_r.xpending("stream:events:1", "dashboard"))["pending"] == 0
+
+    await StreamConsumer(fake_r, DauAggregator(), "a").drain()
+    assert await fake_r.get("stats:total_msgs:1") == "1"
+    assert await fake_r.pfcount("hll:dau:1:20260302") == 1
+
+
+@pytest.mark.asyncio
+async def test_unacked_entries_are_reclaimed(fake_r):
+    await _append(fake_r, 1, _msg(10, 1, 5))
+    dead = StreamConsumer(fake_r, DashboardAggregator(), "dead")
+    await dead.streams()
+    # Read but never applied/acked: the consumer died mid-batch
+    await fake_r.xreadgroup("dashboard", "dead", {"stream:events:1": ">"}, count=10)
+
+    alive = StreamConsumer(fake_r, DashboardAggregator(), "alive", claim_idle_ms=0)
+    assert await alive.run_once(block_ms=0) == 1
+    assert await fake_r.get("stats:total_msgs:1") == "1"
+    assert alive.stats["claimed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_claimed_from_a_slow_consumer_is_counted_once(fake_r):
+    await _append(fake_r, 1, _msg(10, 1, 5), _msg(10, 2, 5))
+    stream = "stream:events:1"
+    slow = StreamConsumer(fake_r, DashboardAggregator(), "slow")
+    await slow.streams()
+    entries = (await fake_r.xreadgroup("dashboard", "slow", {stream: ">"}, count=10))[0][1]
+
+    # The slow consumer stalls before its MULTI while another one claims and applies the batch
+    resume = asyncio.Event()
+
+    async def stalled_prepare(r, gid, batch):
+        await resume.wait()
+
+    slow.aggregator.prepare = stalled_prepare
+    task = asyncio.ensure_future(slow.process(stream, entries))
+    await asyncio.sleep(0)
+    fast = StreamConsumer(fake_r, DashboardAggregator(), "fast", claim_idle_ms=0)
+    assert await fast.run_once(block_ms=0) == 2
+    resume.set()
+    assert await task == 2
+
+    assert await fake_r.get("stats:total_msgs:1") == "2"
+    assert slow.stats["duplicates"] == 2 and slow.stats["processed"] == 0
+    assert (await fake_r.xpending(stream, "dashboard"))["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_replay_back_populates(fake_r):
+    await _append(fake_r, 1, _msg(10, 1, 5), _msg(11, 2, 5))
+    consumer = StreamConsumer(fake_r, DauAggregator(), "a")
+    await consumer.drain()
+    await fake_r.delete("hll:dau:1:20260302")
+
+    assert await replay(fake_r, "dau") == 1
+    await StreamConsumer(fake_r, DauAggregator(), "b").drain()
+    assert await fake_r.pfcount("hll:dau:1:20260302") == 2
+
+
+@pytest.mark.asyncio
+async def test_trim_keeps_entries_of_the_slowest_group(fake_r):
+    await _append(fake_r, 1, *[_msg(10, i, 5) for i in range(4)])
+    stream = "stream:events:1"
+    await StreamConsumer(fake_r, DauAggregator(), "a").drain()
+    dashboard = StreamConsumer(fake_r, DashboardAggregator(), "a")
+    await dashboard.streams()
+    assert await trim_acknowledged(fake_r, stream) == 0      # dashboard has read nothing
+
+    # Dashboard read two entries and applied one of them
+    read = await fake_r.xreadgroup("dashboard", "a", {stream: ">"}, count=2)
+    await fake_r.xack(stream, "dashboard", read[0][1][0][0])
+    await trim_acknowledged(fake_r, stream)
+    assert (await fake_r.xrange(stream))[0][0] == read[0][1][1][0]   # the pending one is the oldest kept
+    assert await fake_r.xlen(stream) == 3
+
+
+@pytest.mark.asyncio
+async def test_trimmed_pending_entries_are_counted(fake_r):
+    consumer = StreamConsumer(fake_r, DauAggregator(), "a")
+    assert await consumer.process("stream:events:1", [("1-0", {}), ("2-0", _msg(10, 1, 5))]) == 2
+    assert consumer.stats["trimmed"] == 1 and consumer.stats["processed"] == 1
+
+
+def test_counter_groups_refuse_replay():
+    assert not EventStoreAggregator.idempotent and not DashboardAggregator.idempotent
+    assert DauAggregator.idempotent and HealthAggregator.idempotent
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from shared.forecasting import (backtest, forecast, forecast_many, holt_winters_forecast, naive_forecast, ols_fit,
+                                ols_forecast)
+
+
+def _weekly(n=4, days=84, seed=1):
+    rng = np.random.default_rng(seed)
+    t = np.arange(days)
+    return np.stack([50 + 0.5 * t + 10 * np.sin(2 * np.pi * t / 7) + rng.normal(0, 2, days) for _ in range(n)])
+
+
+def _reference_hw(y, alpha, beta, gamma, phi, horizon, m=7):
+    """Scalar Holt-Winters loop with the module's initialization."""
+    level = y[:m].mean()
+    trend = (y[m:2 * m].mean() - level) / m
+    season = list(y[:m] - level)
+    for i, obs in enumerate(y):
+        old = season[i % m]
+        new_level = alpha * (obs - old) + (1 - alpha) * (level + phi * trend)
+        trend = beta * (new_level - level) + (1 - beta) * phi * trend
+        season[i % m] = gamma * (obs - new_level) + (1 - gamma) * old
+        level = new_level
+    return [level + sum(phi ** k for k in range(1, h + 1)) * trend + season[(len(y) - 1 + h) % m]
+            for h in range(1, horizon + 1)]
+
+
+def test_ols_matches_polyfit_and_interval_widens():
+    y = _weekly(3, 30)
+    intercept, slope, _ = ols_fit(y)
+    for row in range(3):
+        expected_slope, expected_intercept = np.polyfit(np.arange(30), y[row], 1)
+        assert slope[row] == pytest.approx(expected_slope)
+        assert intercept[row] == pytest.approx(expected_intercept)
+
+    fc = ols_forecast(y, 5)
+    np.testing.assert_allclose(fc.mean, intercept[:, None] + slope[:, None] * np.arange(30, 35))
+    width = fc.upper - fc.lower
+    assert (np.diff(width, axis=1) > 0).all()
+
+
+def test_holt_winters_batch_matches_scalar_loop():
+    y = _weekly()
+    fc = holt_winters_forecast(y, 10)
+    assert fc.mean.shape == (4, 10) and fc.params.shape == (4, 4)
+    for row in range(4):
+        np.testing.assert_allclose(fc.mean[row], _reference_hw(y[row], *fc.params[row], 10))
+    assert (fc.lower <= fc.mean).all() and (fc.mean <= fc.upper).all()
+
+    # A single-row grid fixes the parameters
+    fixed = holt_winters_forecast(y[:1], 3, grid=np.array([[0.5, 0.1, 0.2, 0.9]]))
+    np.testing.assert_allclose(fixed.mean[0], _reference_hw(y[0], 0.5, 0.1, 0.2, 0.9, 3))
+    with pytest.raises(ValueError):
+        holt_winters_forecast(y[:, :13], 3)
+
+
+def test_auto_method_and_named_batches():
+    y = _weekly(2, 30)
+    assert forecast(y, 7).method == "holt_winters"
+    assert forecast(y[:, :10], 7).method == "ols"
+    assert naive_forecast(y, 9).mean[:, 7].tolist() == y[:, 23].tolist()
+
+    out = forecast_many({"msgs": y[0], "dau": y[1, :10], "empty": [], "flat": [0, 0, 0]}, horizon=3)
+    assert list(out) == ["msgs", "dau", "empty", "flat"]
+    assert out["msgs"]["method"] == "holt_winters" and out["dau"]["method"] == "ols"
+    assert out["empty"] is None
+    assert out["flat"] == {"method": "ols", "forecast": [0.0] * 3, "lower": [0.0] * 3, "upper": [0.0] * 3}
+
+
+def test_backtest_prefers_seasonal_model_on_weekly_series():
+    report = backtest(_weekly(), horizon=7, folds=4)
+    assert {name: r["folds"] for name, r in report.items()} == {"naive": 4, "ols": 4, "holt_winters": 4}
+    hw, ols = report["holt_winters"], report["ols"]
+    assert (hw["mae"] < ols["mae"]).all()
+    assert hw["smape"].shape == (4,) and 0.5 <= hw["coverage"].mean() <= 1
+
+    short = backtest(_weekly(1, 20), horizon=7, folds=2)
+    assert short["holt_winters"]["folds"] == 0 and short["holt_winters"]["mae"] is None
+    assert short["ols"]["folds"] == 2
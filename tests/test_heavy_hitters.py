@@ -0,0 +1,99 @@
+import random
+from collections import Counter
+from datetime import datetime, timezone
+
+import pytest
+import fakeredis.aioredis
+
+from shared.heavy_hitters import HeavyHitterTracker, SpaceSaving, top_k
+
+NOW = datetime(2026, 3, 2, 14, 30, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+def _zipf_stream(n, universe, seed):
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(universe)]
+    return rng.choices(range(universe), weights=weights, k=n)
+
+
+def _check_bounds(ss, truth):
+    for key, count in ss.c.items():
+        assert count - ss.err[key] <= truth[key] <= count
+    # Unmonitored items never exceed the minimum counter
+    for key, count in truth.items():
+        if key not in ss.c:
+            assert count <= ss.min_count
+
+
+def test_exact_below_capacity():
+    ss = SpaceSaving(k=4)
+    for key in [1, 2, 1, 3, 1, 2]:
+        ss.update(key)
+    assert ss.top(3) == [(1, 3), (2, 2), (3, 1)]
+    assert all(e == 0 for e in ss.err.values())
+
+
+def test_min_pointer_and_error_bounds_on_skewed_stream():
+    stream = _zipf_stream(5000, 400, seed=1)
+    ss = SpaceSaving(k=32)
+    for i, key in enumerate(stream):
+        ss.update(key, 1 if i % 50 else 3)
+        assert ss._min == min(ss.c.values())
+    truth = Counter()
+    for i, key in enumerate(stream):
+        truth[key] += 1 if i % 50 else 3
+    _check_bounds(ss, truth)
+    assert {k for k, _ in ss.top(3)} == {k for k, _ in truth.most_common(3)}
+
+
+def test_merge_keeps_guarantees():
+    a_stream, b_stream = _zipf_stream(3000, 300, seed=2), _zipf_stream(3000, 300, seed=3)
+    a, b = SpaceSaving(16), SpaceSaving(16)
+    for key in a_stream:
+        a.update(key)
+    for key in b_stream:
+        b.update(key)
+    merged = SpaceSaving.merge([a, b], k=16)
+    assert len(merged) == 16
+    _check_bounds(merged, Counter(a_stream) + Counter(b_stream))
+
+
+@pytest.mark.asyncio
+async def test_tracker_persists_and_survives_restart(fake_r):
+    ts = NOW.timestamp()
+    tracker = HeavyHitterTracker(k=8)
+    for uid in [1, 1, 2]:
+        tracker.update("users", 5, uid, now=ts)
+    assert await tracker.persist(fake_r, now=ts) == 2  # hour and day bucket
+
+    # A restarted process starts empty and merges with the persisted state
+    restarted = HeavyHitterTracker(k=8)
+    restarted.update("users", 5, 1, now=ts)
+    await restarted.persist(fake_r, now=ts)
+    assert await top_k(fake_r, 5, "users", "hour", now=NOW) == [
+        {"id": "1", "count": 3, "error": 0}, {"id": "2", "count": 1, "error": 0}]
+
+
+@pytest.mark.asyncio
+async def test_windows_merge_buckets(fake_r):
+    tracker = HeavyHitterTracker(k=8)
+    earlier = NOW.timestamp() - 3 * 3600
+    tracker.update("channels", 5, 7, now=earlier)
+    await tracker.persist(fake_r, now=earlier)
+    tracker.update("channels", 5, 7, now=NOW.timestamp())
+    tracker.update("channels", 5, 8, now=NOW.timestamp())
+    await tracker.persist(fake_r, now=NOW.timestamp())
+    assert tracker._live.keys() == {("channels", 5, "h", "2026030214"), ("channels", 5, "d", "20260302")}
+
+    assert [r["count"] for r in await top_k(fake_r, 5, "channels", "hour", now=NOW)] == [1, 1]
+    assert (await top_k(fake_r, 5, "channels", "day", now=NOW))[0] == {"id": "7", "count": 2, "error": 0}
+    assert (await top_k(fake_r, 5, "channels", "week", now=NOW))[0]["count"] == 2
+    with pytest.raises(ValueError):
+        await top_k(fake_r, 5, "channels", "month")
@@ -0,0 +1,70 @@
+import pytest
+import fakeredis.aioredis
+from datetime import date, datetime, timedelta, timezone
+
+from shared.hll_pyramid import close_days, plan_range, range_uniques, uniques_series
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+def test_plan_range_uses_months_and_weeks_when_closed():
+    # 2026-06-01 is a Monday; whole June plus the first full week of July
+    keys = plan_range(1, date(2026, 6, 1), date(2026, 7, 8), closed_through=date(2026, 7, 31))
+    assert keys[0] == "hll:mau:1:202606"
+    assert "hll:wau:1:20260706" not in keys  # week 6.-12.7. is not fully inside the range
+    assert keys[1:] == [f"hll:dau:1:202607{d:02d}" for d in range(1, 9)]
+
+    keys = plan_range(1, date(2026, 7, 6), date(2026, 7, 19), closed_through=date(2026, 7, 31))
+    assert keys == ["hll:wau:1:20260706", "hll:wau:1:20260713"]
+
+
+def test_plan_range_falls_back_to_days_when_open():
+    keys = plan_range(1, date(2026, 7, 6), date(2026, 7, 12), closed_through=date(2026, 7, 10))
+    assert keys == [f"hll:dau:1:202607{d:02d}" for d in range(6, 13)]
+
+
+def test_plan_range_uses_days_before_the_first_merged_day():
+    keys = plan_range(1, date(2026, 6, 1), date(2026, 7, 19), closed_through=date(2026, 7, 31),
+                      closed_from=date(2026, 6, 10))
+    # June 1-14 started before the pyramid (incomplete month and week of 8.6.); whole weeks follow
+    assert keys == [f"hll:dau:1:202606{d:02d}" for d in range(1, 15)] + [
+        "hll:wau:1:20260615", "hll:wau:1:20260622", "hll:wau:1:20260629", "hll:wau:1:20260706",
+        "hll:wau:1:20260713"]
+
+
+@pytest.mark.asyncio
+async def test_first_build_records_its_start(fake_r):
+    now = datetime(2026, 7, 20, 12, tzinfo=timezone.utc)
+    await close_days(fake_r, 1, now)
+    assert await fake_r.get("hll:since:1") == "20260610"   # 40 days up to 19.7.
+    await close_days(fake_r, 1, now + timedelta(days=1))
+    assert await fake_r.get("hll:since:1") == "20260610"
+    # A pause longer than the daily retention restarts the coverage
+    await close_days(fake_r, 1, now + timedelta(days=90))
+    assert await fake_r.get("hll:since:1") == "20260908"
+
+
+@pytest.mark.asyncio
+async def test_range_counts_match_plain_union(fake_r):
+    today = datetime.now(timezone.utc).date()
+    for i in range(35):
+        d = today - timedelta(days=i)
+        await fake_r.pfadd(f"hll:dau:1:{d.strftime('%Y%m%d')}", f"u{i % 12}", f"d{i}")
+
+    closed = await close_days(fake_r, 1)
+    assert closed <= today - timedelta(days=1)
+    assert await fake_r.get("hll:closed:1") == closed.strftime("%Y%m%d")
+
+    start = today - timedelta(days=29)
+    plain = await fake_r.pfcount(*[f"hll:dau:1:{(start + timedelta(days=i)).strftime('%Y%m%d')}" for i in range(30)])
+    assert await range_uniques(fake_r, 1, start, today) == plain
+
+    days = [today - timedelta(days=i) for i in range(3)]
+    series = await uniques_series(fake_r, 1, days, windows=(1, 7))
+    assert series[1][0] == await fake_r.pfcount(f"hll:dau:1:{today.strftime('%Y%m%d')}")
+    assert len(series[7]) == 3
@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+import fakeredis.aioredis
+
+from shared.ingest_bus import IngestBus
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_writes_from_many_emitters_are_coalesced(fake_r):
+    bus = IngestBus(fake_r, max_batch=50, max_wait_ms=20)
+    bus.start()
+    for i in range(120):
+        bus.emit("dau", lambda pipe, i=i: pipe.pfadd("hll:dau:1:20260101", str(i % 40)))
+        await bus.emit_wait("event", lambda pipe, i=i: pipe.zadd("events:msg:1:1", {f"m{i}": i}))
+    await bus.queue.join()
+
+    assert await fake_r.pfcount("hll:dau:1:20260101") == 40
+    assert await fake_r.zcard("events:msg:1:1") == 120
+    assert bus.stats["written"] == 240
+    # 240 writes in at most a handful of pipelines
+    assert bus.stats["batches"] <= 240 // 50 + 2
+    await bus.stop()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_and_counts(fake_r):
+    bus = IngestBus(fake_r, maxsize=2)
+    assert bus.emit("dashboard", lambda pipe: pipe.incr("a"))
+    assert bus.emit("dashboard", lambda pipe: pipe.incr("a"))
+    assert not bus.emit("dashboard", lambda pipe: pipe.incr("a"))
+    assert bus.stats["dropped:dashboard"] == 1
+    await bus.flush()
+    assert await fake_r.get("a") == "2"
+
+
+@pytest.mark.asyncio
+async def test_once_key_deduplicates_across_processes(fake_r):
+    first, second = IngestBus(fake_r), IngestBus(fake_r)
+    for bus in (first, second):
+        bus.emit("dashboard", lambda pipe: pipe.incr("stats:total_msgs:1"), once_key="lock:msg:99")
+        await bus.flush()
+    assert await fake_r.get("stats:total_msgs:1") == "1"
+    assert second.stats["deduplicated"] == 1
+
+
+def _failing_pipelines(monkeypatch, r, fail_calls):
+    real, calls = r.pipeline, [0]
+
+    def pipeline(*args, **kwargs):
+        pipe = real(*args, **kwargs)
+        calls[0] += 1
+        if calls[0] in fail_calls:
+            async def execute(*a, **kw):
+                raise ConnectionError("Redis down")
+            pipe.execute = execute
+        return pipe
+
+    monkeypatch.setattr(r, "pipeline", pipeline)
+    monkeypatch.setattr("shared.ingest_bus.RETRY_DELAY", 0)
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_retried_and_confirmed_once_written(fake_r, monkeypatch):
+    # Call 1 takes the guard, call 2 (the write) fails, call 3 retries without re-checking the guard
+    _failing_pipelines(monkeypatch, fake_r, {2})
+    bus = IngestBus(fake_r)
+    written = []
+    bus.emit("user_info", lambda pipe: pipe.incr("n"), once_key="lock:msg:1", on_done=lambda: written.append(1))
+    await bus.flush()
+    assert await fake_r.get("n") == "1"
+    assert written == [1]
+    assert bus.stats["retried"] == 1 and not bus.stats["failed"]
+
+
+@pytest.mark.asyncio
+async def test_writes_are_dropped_after_max_attempts(fake_r, monkeypatch):
+    _failing_pipelines(monkeypatch, fake_r, {1, 2, 3})
+    bus = IngestBus(fake_r)
+    written = []
+    bus.emit("user_info", lambda pipe: pipe.incr("n"), on_done=lambda: written.append(1))
+    await bus.flush()
+    assert bus.stats["failed"] == 1 and bus.stats["retried"] == 2
+    assert not written and await fake_r.get("n") is None
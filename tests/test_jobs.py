@@ -0,0 +1,163 @@
+import asyncio
+import json
+
+import pytest
+import fakeredis.aioredis
+
+from shared import jobs
+from shared.jobs import JobWorker, active_job, cancel, enqueue, get_job
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+async def test_enqueue_is_idempotent_per_kind_and_guild(fake_r):
+    first, created = await enqueue(fake_r, "backfill", 1, {"days": 30})
+    again, created_again = await enqueue(fake_r, "backfill", 1, {"days": 90})
+    other, _ = await enqueue(fake_r, "backfill", 2)
+
+    assert created and not created_again
+    assert again["id"] == first["id"] and again["params"] == {"days": 30}
+    assert other["id"] != first["id"]
+    assert await fake_r.lrange("jobs:queue:backfill", 0, -1) == [first["id"], other["id"]]
+    assert (await active_job(fake_r, "backfill", 1))["id"] == first["id"]
+
+
+async def test_worker_runs_job_and_publishes_progress(fake_r):
+    async def handler(ctx):
+        await ctx.progress({"status": "running", "processed": 5})
+        return {"processed": ctx.params["n"]}
+
+    job, _ = await enqueue(fake_r, "count", 7, {"n": 5})
+    worker = JobWorker(fake_r, {"count": handler}, poll_interval=0.01)
+    assert await worker.run_once() == 1
+    await worker.join()
+
+    done = await get_job(fake_r, job["id"])
+    assert done["status"] == "done" and done["result"] == {"processed": 5}
+    assert done["progress"] == {"status": "running", "processed": 5}
+    published = json.loads(await fake_r.get("backfill:progress:7"))
+    assert published["job_id"] == job["id"] and published["job_status"] == "done"
+    # Finished jobs free the idempotency key and the guild slot
+    assert not await fake_r.exists("job:key:count:7", "lock:jobs:7:0")
+    again, created = await enqueue(fake_r, "count", 7)
+    assert created and again["id"] != job["id"]
+
+
+async def test_concurrency_limits(fake_r):
+    release = asyncio.Event()
+    started = []
+
+    async def handler(ctx):
+        started.append(ctx.gid)
+        await release.wait()
+
+    await enqueue(fake_r, "a", 1)
+    await enqueue(fake_r, "b", 1)
+    await enqueue(fake_r, "a", 2)
+    await enqueue(fake_r, "a", 3)
+    worker = JobWorker(fake_r, {"a": handler, "b": handler}, concurrency=2, poll_interval=0.01)
+    other = JobWorker(fake_r, {"a": handler, "b": handler}, concurrency=2, poll_interval=0.01)
+
+    assert await worker.run_once() == 2
+    await asyncio.sleep(0)
+    # Guild 1 already runs a job, so the second worker only takes guild 3
+    assert await other.run_once() == 1
+    await asyncio.sleep(0)
+    assert sorted(started) == ["1", "2", "3"]
+    assert await fake_r.lrange("jobs:queue:b", 0, -1) != []
+
+    release.set()
+    await worker.join()
+    await other.join()
+    assert await worker.run_once() == 1
+    await worker.join()
+    assert started.count("1") == 2
+
+
+async def test_cancel_queued_and_running(fake_r):
+    gate = asyncio.Event()
+
+    async def handler(ctx):
+        await ctx.progress({"status": "running", "processed": 1})
+        gate.set()
+        await asyncio.sleep(10)
+
+    queued, _ = await enqueue(fake_r, "slow", 1)
+    assert (await cancel(fake_r, queued["id"]))["status"] == "cancelled"
+    assert await fake_r.llen("jobs:queue:slow") == 0
+
+    running, _ = await enqueue(fake_r, "slow", 1)
+    worker = JobWorker(fake_r, {"slow": handler}, poll_interval=0.01)
+    await worker.run_once()
+    await gate.wait()
+    assert (await cancel(fake_r, running["id"]))["cancel"]
+    await asyncio.wait_for(worker.join(), 1)
+
+    job = await get_job(fake_r, running["id"])
+    assert job["status"] == "cancelled"
+    assert json.loads(await fake_r.get("backfill:progress:1"))["processed"] == 1
+
+
+async def test_failure_and_shutdown_requeue(fake_r):
+    async def broken(ctx):
+        raise RuntimeError("boom")
+
+    async def forever(ctx):
+        await asyncio.sleep(10)
+
+    failed, _ = await enqueue(fake_r, "broken", 1)
+    worker = JobWorker(fake_r, {"broken": broken, "forever": forever}, poll_interval=0.01)
+    await worker.run_once()
+    await worker.join()
+    job = await get_job(fake_r, failed["id"])
+    assert job["status"] == "failed" and job["error"] == "boom"
+
+    long, _ = await enqueue(fake_r, "forever", 1)
+    worker.start()
+    await asyncio.sleep(0.05)
+    assert (await get_job(fake_r, long["id"]))["status"] == "running"
+    await worker.stop()
+    assert (await get_job(fake_r, long["id"]))["status"] == "queued"
+    assert await fake_r.lrange("jobs:queue:forever", 0, -1) == [long["id"]]
+    assert not await fake_r.exists("lock:jobs:1:0")
+
+
+async def test_stale_running_job_is_requeued(fake_r):
+    job, _ = await enqueue(fake_r, "x", 1)
+    await fake_r.lrem("jobs:queue:x", 1, job["id"])
+    await fake_r.hset(f"job:{job['id']}", "status", "running")
+    await fake_r.zadd("jobs:running", {job["id"]: 1000.0})
+
+    worker = JobWorker(fake_r, {"x": lambda ctx: None})
+    assert await worker.recover_stale(now=1000.0 + jobs.STALE_AFTER + 1) == 1
+    assert (await get_job(fake_r, job["id"]))["status"] == "queued"
+    assert await fake_r.lrange("jobs:queue:x", 0, -1) == [job["id"]]
+
+
+async def test_delete_guild_data_leaves_no_guild_keys(fake_r):
+    from web.backend.services.jobs_service import delete_guild_data
+
+    families = ["stats:hourly:{}:20260301", "stats:day:20260301:{}:10", "stats:watermark:{}", "hll:dau:{}:20260301",
+                "events:msg:{}:10", "bitmap:active:{}:20260301", "stream:events:{}", "snapshot:{}:dashboard",
+                "snapshot:meta:{}", "topk:channels:day:{}:20260301", "markov:counts:{}:all",
+                "markov:segments:{}", "cache:result:engagement:{}:abc", "retention:last:{}"]
+    for gid in (5, 6):
+        for key in families:
+            await fake_r.set(key.format(gid), 1)
+        await fake_r.sadd("stream:guilds", gid)
+    await fake_r.set("stats:watermark:5", 41)
+
+    job, _ = await enqueue(fake_r, "delete_guild_data", 5)
+    await delete_guild_data(jobs.JobContext(fake_r, job))
+
+    left = [k for k in await fake_r.keys("*") if ":5:" in f"{k}:"]
+    # Only the bumped watermark and the job's own bookkeeping remain
+    assert sorted(left) == ["backfill:progress:5", "job:key:delete_guild_data:5", "stats:watermark:5"]
+    assert await fake_r.get("stats:watermark:5") == "42"
+    assert await fake_r.smembers("stream:guilds") == {"6"}
+    assert await fake_r.exists(*(key.format(6) for key in families)) == len(families)
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+import fakeredis.aioredis
+
+from shared.activity_matrix import transition_counts
+from shared.markov_forecast import (daily_counts, daily_distribution, day_labels, forecast_horizons,
+                                    load_counts, load_forecasts, record)
+from shared.models import CommunityModels
+
+END = datetime(2025, 3, 31, 12)
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+def _states(n=40, days=30, seed=2):
+    rng = np.random.default_rng(seed)
+    states = rng.integers(0, 4, (n, days)).astype(np.int8)
+    states[:5, :10] = -1     # observed from day 10 on
+    return states
+
+
+def test_daily_counts_per_overlapping_segment():
+    states = _states()
+    segments = {"all": np.arange(40), "odd": np.arange(1, 40, 2), "first": np.arange(10)}
+    counts = daily_counts(states, segments)
+    dist = daily_distribution(states, segments)
+
+    assert counts["all"].shape == (29, 4, 4)
+    np.testing.assert_array_equal(counts["all"].sum(axis=0), transition_counts(states))
+    np.testing.assert_array_equal(counts["odd"].sum(axis=0), transition_counts(states[1::2]))
+    np.testing.assert_array_equal(counts["first"][3], transition_counts(states[:10, 3:5]))
+    assert dist["all"][0].sum() == 35 and dist["all"][-1].sum() == 40
+    np.testing.assert_array_equal(dist["odd"][-1], np.bincount(states[1::2, -1], minlength=4))
+
+
+def test_forecast_horizons_match_repeated_steps():
+    rng = np.random.default_rng(4)
+    matrices = rng.random((3, 4, 4))
+    matrices /= matrices.sum(axis=2, keepdims=True)
+    vectors = rng.dirichlet(np.ones(4), 3)
+
+    out = forecast_horizons(matrices, vectors, 10)
+    assert out.shape == (3, 10, 4)
+    for s in range(3):
+        for h in (1, 7, 10):
+            expected = CommunityModels.predict_future_states(vectors[s], matrices[s], steps=h)
+            np.testing.assert_allclose(out[s, h - 1], expected)
+
+
+async def test_window_sums_stored_days(fake_r):
+    states = _states()
+    segments = {"all": np.arange(40), "cohort:2025-03": np.arange(20)}
+    labels = day_labels(END, 30)
+    counts = daily_counts(states, segments)
+    await record(fake_r, 5, labels, counts, daily_distribution(states, segments))
+
+    loaded = await load_counts(fake_r, 5, ["all"], window=7, end=END)
+    np.testing.assert_array_equal(loaded["all"]["counts"], counts["all"][-7:].sum(axis=0))
+    np.testing.assert_array_equal(loaded["all"]["current"], np.bincount(states[:, -1], minlength=4))
+    assert loaded["all"]["days"] == 7
+
+    # The next run only rewrites the settled days from its ``first`` column on
+    shifted = daily_counts(states[:, 1:], {"all": np.arange(40)})
+    await record(fake_r, 5, day_labels(END, 29), shifted, {}, first=20)
+    loaded = await load_counts(fake_r, 5, ["all"], window=29, end=END)
+    np.testing.assert_array_equal(loaded["all"]["counts"], counts["all"].sum(axis=0))
+
+    forecasts = await load_forecasts(fake_r, 5, window=30, horizons=14, end=END)
+    assert set(forecasts) == {"all", "cohort:2025-03"}
+    all_ = forecasts["all"]
+    matrix = CommunityModels.normalize_transitions(counts["all"].sum(axis=0))
+    current = np.bincount(states[:, -1], minlength=4) / 40
+    np.testing.assert_allclose(all_["matrix"], matrix)
+    np.testing.assert_allclose(all_["forecast"][13], CommunityModels.predict_future_states(current, matrix, 14))
+
+
+async def test_forecast_needs_stored_counts(fake_r):
+    forecasts = await load_forecasts(fake_r, 6, ["all"], end=END)
+    assert forecasts["all"]["forecast"] is None and forecasts["all"]["transitions"] == 0
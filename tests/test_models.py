@@ -74,5 +74,51 @@ class TestCommunityModels(unittest.TestCase):
         expectancy = CommunityModels.estimate_life_expectancy(curve)
         self.assertAlmostEqual(expectancy, 11.25)
 
+    def test_kaplan_meier_matches_reference_on_float_durations(self):
+        rng = np.random.default_rng(7)
+        durations = np.round(rng.exponential(20, 500), 3)
+        observed = rng.random(500) < 0.6
+
+        # Reference: the textbook loop over distinct times
+        expected, s_t, n_at_risk = [], 1.0, len(durations)
+        for t in np.unique(durations):
+            n_events = np.sum((durations == t) & observed)
+            s_t *= 1 - n_events / n_at_risk
+            expected.append(s_t)
+            n_at_risk -= np.sum(durations == t)
+
+        km = CommunityModels.kaplan_meier(durations, observed)
+        np.testing.assert_allclose(km["survival"], expected)
+        self.assertTrue(np.all(km["lower"] <= km["survival"] + 1e-12))
+        self.assertTrue(np.all(km["survival"] <= km["upper"] + 1e-12))
+
+        # Whole-day curve keeps the value at the end of each day
+        curve = CommunityModels.calculate_survival_rate(durations.tolist(), observed.tolist())
+        last_of_day = {int(t): s for t, s in zip(np.unique(durations), expected)}
+        self.assertEqual(curve.keys(), last_of_day.keys())
+        for day, s in last_of_day.items():
+            self.assertAlmostEqual(curve[day], s)
+
+    def test_kaplan_meier_greenwood_band(self):
+        km = CommunityModels.kaplan_meier([5, 10, 10, 15], [True, True, False, True])
+        # Log-log Greenwood interval at S(5) = 0.75 with 1 event among 4 at risk
+        self.assertAlmostEqual(km["lower"][0], 0.12795, places=4)
+        self.assertAlmostEqual(km["upper"][0], 0.96055, places=4)
+        self.assertEqual(km["lower"][-1], 0.0)
+
+    def test_kaplan_meier_cohorts_match_separate_curves(self):
+        rng = np.random.default_rng(3)
+        durations = rng.integers(0, 60, 300)
+        observed = rng.random(300) < 0.5
+        cohorts = rng.choice(["2025-01", "2025-02", "2025-03"], 300)
+
+        curves = CommunityModels.kaplan_meier_cohorts(durations, observed, cohorts)
+        self.assertEqual(sorted(curves), ["2025-01", "2025-02", "2025-03"])
+        for label, km in curves.items():
+            mask = cohorts == label
+            single = CommunityModels.kaplan_meier(durations[mask], observed[mask])
+            np.testing.assert_allclose(km["survival"], single["survival"])
+            self.assertEqual(km["at_risk"][0], mask.sum())
+
 if __name__ == '__main__':
     unittest.main()
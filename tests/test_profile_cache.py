@@ -0,0 +1,56 @@
+from shared.profile_cache import ProfileCache
+
+PROFILE = {"name": "Alice", "avatar": "a.png", "roles": "1,2", "joined_at": "1700000000.0"}
+
+
+def test_unchanged_profile_is_skipped():
+    cache = ProfileCache()
+    assert cache.diff(1, PROFILE, now=0) == PROFILE
+    cache.mark(1, PROFILE, now=0)
+
+    assert cache.diff(1, dict(PROFILE), now=10) == {}
+    assert cache.diff(1, {**PROFILE, "roles": "1,2,3"}, now=10) == {"roles": "1,2,3"}
+    assert cache.skipped == 1
+
+
+def test_partial_write_keeps_other_fields():
+    cache = ProfileCache()
+    cache.mark(1, PROFILE, now=0)
+    cache.mark(1, {"name": "Alice2"}, now=5)
+    # A bare User update (no roles) does not look like a change
+    assert cache.diff(1, {"name": "Alice2", "avatar": "a.png"}, now=6) == {}
+
+
+def test_resync_and_force_write_full_profile():
+    cache = ProfileCache(resync=100)
+    cache.mark(1, PROFILE, now=0)
+    cache.mark(1, {"name": "Bob"}, now=50)
+    assert cache.diff(1, {**PROFILE, "name": "Bob"}, now=99) == {}
+    assert cache.diff(1, PROFILE, now=100) == PROFILE
+    assert cache.diff(1, PROFILE, force=True, now=10) == PROFILE
+
+
+def test_lru_bound():
+    cache = ProfileCache(maxsize=2)
+    cache.mark(1, PROFILE, now=0)
+    cache.mark(2, PROFILE, now=0)
+    cache.diff(1, PROFILE, now=1)  # touch 1
+    cache.mark(3, PROFILE, now=1)
+    assert len(cache) == 2
+    assert cache.diff(2, PROFILE, now=2) == PROFILE
+    assert cache.diff(1, PROFILE, now=2) == {}
+
+
+def test_gdpr_deletion_drops_the_cached_profile():
+    from unittest.mock import MagicMock
+    from bot.commands.gdpr import GDPRCommands
+
+    activity = MagicMock()
+    activity.profiles = ProfileCache()
+    activity.profiles.mark(42, PROFILE, now=0)
+    bot = MagicMock()
+    bot.get_cog.side_effect = lambda name: activity if name == "ActivityMonitor" else None
+
+    GDPRCommands(bot).forget_cached_profile("42")
+    # The next event rewrites the whole profile instead of seeing "no change"
+    assert activity.profiles.diff(42, PROFILE, now=10) == PROFILE
@@ -0,0 +1,87 @@
+import pytest
+import fakeredis.aioredis
+
+from shared.metrics import Registry, collect, publish, render
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+def test_render_counters_gauges_histograms():
+    reg = Registry()
+    drops = reg.counter("ingest_drops", "Drops")
+    drops.labels(reason="queue_full", kind="dau").inc(3)
+    depth = reg.gauge("ingest_queue_depth", "Depth")
+    depth.set_function(lambda: 7)
+    hist = reg.histogram("ingest_batch_size", "Batch", buckets=(1, 10))
+    for v in (1, 5, 50):
+        hist.observe(v)
+
+    text = render(reg.snapshot())
+    assert "# TYPE communitymetrics_ingest_drops counter" in text
+    assert 'communitymetrics_ingest_drops_total{kind="dau",reason="queue_full"} 3' in text
+    assert "communitymetrics_ingest_queue_depth 7" in text
+    assert 'communitymetrics_ingest_batch_size_bucket{le="1"} 1' in text
+    assert 'communitymetrics_ingest_batch_size_bucket{le="10"} 2' in text
+    assert 'communitymetrics_ingest_batch_size_bucket{le="+Inf"} 3' in text
+    assert "communitymetrics_ingest_batch_size_sum 56" in text
+    assert "communitymetrics_ingest_batch_size_count 3" in text
+
+
+@pytest.mark.asyncio
+async def test_publish_and_collect_merge_instances(fake_r):
+    for name, n in (("bot-a", 1), ("bot-b", 2)):
+        reg = Registry()
+        reg.counter("events", "Events").labels(guild="1", kind="msg").inc(n)
+        await publish(fake_r, name, reg)
+    await fake_r.sadd("metrics:instances", "gone")
+
+    text = render(await collect(fake_r))
+    assert text.count("# TYPE communitymetrics_events counter") == 1
+    assert 'communitymetrics_events_total{instance="bot-a",guild="1",kind="msg"} 1' in text
+    assert 'communitymetrics_events_total{instance="bot-b",guild="1",kind="msg"} 2' in text
+    assert await fake_r.smembers("metrics:instances") == {"bot-a", "bot-b"}
+
+
+@pytest.mark.asyncio
+async def test_ingest_bus_reports_batches(fake_r):
+    from shared.ingest_bus import BATCH_SIZE, IngestBus, WRITES
+    before = WRITES.labels(kind="metric_test").value
+    bus = IngestBus(fake_r)
+    bus.emit("metric_test", lambda pipe: pipe.incr("x"))
+    await bus.flush()
+    assert WRITES.labels(kind="metric_test").value == before + 1
+    assert BATCH_SIZE.labels().count >= 1
+
+
+def test_metrics_endpoint_requires_token_or_localhost(monkeypatch):
+    from fastapi.testclient import TestClient
+    from starlette.requests import Request
+
+    from shared.config import settings
+    from web.backend.main import app
+    from web.backend.routers import metrics as metrics_router
+
+    def local(host, headers=()):
+        return metrics_router.is_local(Request({"type": "http", "client": (host, 1234), "headers": list(headers)}))
+
+    assert local("127.0.0.1") and local("::1")
+    assert not local("10.0.0.5")
+    assert not local("127.0.0.1", [(b"x-forwarded-for", b"203.0.113.7")])
+
+    monkeypatch.setattr(settings, "metrics_token", "")
+    client = TestClient(app)
+    assert client.get("/metrics").status_code == 403
+
+    async def redis_client():
+        return fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+    monkeypatch.setattr(settings, "metrics_token", "s3cret")
+    monkeypatch.setattr(metrics_router, "get_redis_client", redis_client)
+    # The app turns 401 into a redirect to the login page
+    assert client.get("/metrics", follow_redirects=False).status_code == 302
+    assert client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
@@ -0,0 +1,121 @@
+import asyncio
+import pytest
+import fakeredis.aioredis
+
+from redis.exceptions import ResponseError
+
+from shared.redis_client import CircuitBreaker, GuardedRedis, RedisManager, RedisUnavailable, _guarded
+from shared.result_cache import bump_watermark, cached_result, result_store
+
+DOWN_URL = "redis://127.0.0.1:1/0"  # nothing listens there
+
+
+class Service:
+    def __init__(self, r):
+        self.r = r
+        self.calls = 0
+
+    async def get_client(self):
+        if isinstance(self.r, Exception):
+            raise self.r
+        return self.r
+
+    @cached_result("test_stale")
+    async def metric(self, guild_id: int):
+        self.calls += 1
+        return {"value": self.calls}
+
+
+def test_breaker_opens_and_probes_once(monkeypatch):
+    breaker = CircuitBreaker(threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+
+    clock = breaker.opened_at + 10
+    monkeypatch.setattr("shared.redis_client.time.monotonic", lambda: clock)
+    assert breaker.allow()          # half-open probe
+    assert not breaker.allow()      # only one at a time
+    breaker.record_failure()        # failed probe re-opens immediately
+    assert breaker.is_open
+
+    clock += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_half_open_probe_settles_on_server_errors_and_cancellation(monkeypatch):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock = breaker.opened_at + 10
+    monkeypatch.setattr("shared.redis_client.time.monotonic", lambda: clock)
+
+    async def fail(exc):
+        raise exc
+
+    # A cancelled probe frees the slot for the next caller
+    assert breaker.allow()
+    with pytest.raises(asyncio.CancelledError):
+        await _guarded(breaker, fail(asyncio.CancelledError()))
+    assert breaker.is_open and breaker.allow()
+
+    # An error reply means the server answered
+    with pytest.raises(ResponseError):
+        await _guarded(breaker, fail(ResponseError("WRONGTYPE")))
+    assert not breaker.is_open and breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_fails_fast_for_commands_and_pipelines():
+    manager = RedisManager(DOWN_URL, breaker=CircuitBreaker(threshold=1, reset_timeout=60))
+    client = manager.client
+    assert isinstance(client, GuardedRedis)
+    with pytest.raises(Exception) as first:
+        await client.get("k")
+    assert not isinstance(first.value, RedisUnavailable)  # the real connection error
+    assert manager.breaker.is_open
+
+    with pytest.raises(RedisUnavailable):
+        await client.get("k")
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.get("k")
+        with pytest.raises(RedisUnavailable):
+            await pipe.execute()
+    with pytest.raises(RedisUnavailable):
+        await manager.get()
+    await manager.pool.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_health_check_is_lazy_and_shared(monkeypatch):
+    manager = RedisManager(DOWN_URL, health_interval=60)
+    pings = []
+
+    async def ping():
+        pings.append(1)
+        await asyncio.sleep(0.01)
+        return True
+
+    monkeypatch.setattr(manager.client, "ping", ping)
+    await asyncio.gather(*(manager.get() for _ in range(10)))
+    await manager.get()
+    assert len(pings) == 1
+
+
+@pytest.mark.asyncio
+async def test_result_cache_serves_stale_while_redis_is_down():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    svc = Service(r)
+    assert await svc.metric(1) == {"value": 1}
+    await bump_watermark(r, 1)  # would normally invalidate the entry
+
+    svc.r = RedisUnavailable("breaker open")
+    assert await svc.metric(1) == {"value": 1}
+    assert svc.calls == 1
+    assert result_store(r).stale_hits == 1
+    # Nothing cached for other arguments: computed directly
+    assert await svc.metric(2) == {"value": 2}
+    await r.aclose()
@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+import fakeredis.aioredis
+
+from shared.result_cache import cached_result, bump_watermark, result_store
+
+
+class Service:
+    def __init__(self, r):
+        self.r = r
+        self.calls = 0
+
+    async def get_client(self):
+        return self.r
+
+    @cached_result("test_metric")
+    async def metric(self, guild_id: int, days: int = 7):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {"value": self.calls, "days": days}
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_compute_once(fake_r):
+    svc = Service(fake_r)
+    results = await asyncio.gather(*[svc.metric(1) for _ in range(10)])
+    assert svc.calls == 1
+    assert all(res == {"value": 1, "days": 7} for res in results)
+    # Same arguments passed differently hit the same entry
+    assert await svc.metric(guild_id=1, days=7) == {"value": 1, "days": 7}
+    assert svc.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_watermark_invalidates_only_its_guild(fake_r):
+    svc = Service(fake_r)
+    await svc.metric(1)
+    await svc.metric(2)
+    await bump_watermark(fake_r, 1)
+    assert (await svc.metric(1))["value"] == 3
+    assert (await svc.metric(2))["value"] == 2
+
+
+@pytest.mark.asyncio
+async def test_shared_tier_serves_other_processes(fake_r):
+    await Service(fake_r).metric(1)
+    # Simulate another worker: empty local tier, same Redis
+    result_store(fake_r).local.clear()
+    other = Service(fake_r)
+    assert await other.metric(1) == {"value": 1, "days": 7}
+    assert other.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_waiters(fake_r):
+    svc = Service(fake_r)
+    leader = asyncio.create_task(svc.metric(1))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(svc.metric(1))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == {"value": svc.calls, "days": 7}
+    assert leader.cancelled()
+    assert not result_store(fake_r).inflight
@@ -0,0 +1,92 @@
+import pytest
+import fakeredis.aioredis
+
+from shared.event_index import event_members, index_member
+from shared.retention import sweep_guild, sweep_guilds
+
+NOW = 1_800_000_000.0
+DAY = 86400
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+async def _add(r, gid, kind, uid, *timestamps):
+    await r.zadd(f"events:{kind}:{gid}:{uid}", {f"e{ts}": ts for ts in timestamps})
+    await index_member(r, gid, kind, uid)
+    await r.set(f"events:members_built:{gid}:{kind}", "1")
+
+
+@pytest.mark.asyncio
+async def test_expires_old_events_and_prunes_index(fake_r):
+    await _add(fake_r, 1, "msg", 10, NOW - 100 * DAY, NOW - DAY)
+    await _add(fake_r, 1, "msg", 11, NOW - 95 * DAY)
+    await _add(fake_r, 1, "voice", 10, NOW - 200 * DAY, NOW - 2 * DAY)
+
+    report = await sweep_guild(fake_r, 1, 90, now=NOW, chunk_size=1)
+
+    assert report == {"expired": 3, "trimmed": 0, "emptied": 1, "remaining": 2}
+    assert await event_members(fake_r, 1, "msg") == {"10"}
+    assert await fake_r.zcard("events:voice:1:10") == 1
+    assert await fake_r.get("stats:watermark:1") == "1"
+    assert (await fake_r.hgetall("retention:last:1"))["expired"] == "3"
+
+
+@pytest.mark.asyncio
+async def test_budget_trims_oldest_events_across_users(fake_r):
+    await _add(fake_r, 1, "msg", 10, NOW - 50, NOW - 40, NOW - 10)
+    await _add(fake_r, 1, "msg", 11, NOW - 45, NOW - 5)
+    await _add(fake_r, 1, "action", 12, NOW - 30)
+
+    report = await sweep_guild(fake_r, 1, 90, max_events=3, now=NOW)
+
+    assert report["trimmed"] == 3
+    assert report["remaining"] == 3
+    assert await fake_r.zrange("events:msg:1:10", 0, -1) == [f"e{NOW - 10}"]
+    assert await fake_r.zrange("events:msg:1:11", 0, -1) == [f"e{NOW - 5}"]
+    assert await fake_r.zcard("events:action:1:12") == 1
+
+
+@pytest.mark.asyncio
+async def test_nothing_to_reclaim_keeps_watermark(fake_r):
+    await _add(fake_r, 1, "msg", 10, NOW - 10)
+    report = await sweep_guild(fake_r, 1, 90, max_events=5, now=NOW)
+    assert report == {"expired": 0, "trimmed": 0, "emptied": 0, "remaining": 1}
+    assert await fake_r.get("stats:watermark:1") is None
+
+
+@pytest.mark.asyncio
+async def test_sweep_guilds_skips_locked_guild(fake_r):
+    await _add(fake_r, 1, "msg", 10, 1000)
+    await _add(fake_r, 2, "msg", 10, 1000)
+    await fake_r.set("lock:retention:2", "1")
+
+    reports = await sweep_guilds(fake_r, [1, 2], 90)
+
+    assert set(reports) == {"1"}
+    assert await fake_r.zcard("events:msg:2:10") == 1
+
+
+@pytest.mark.asyncio
+async def test_user_written_during_the_sweep_stays_indexed(fake_r, monkeypatch):
+    import shared.retention as retention
+
+    await _add(fake_r, 1, "msg", 10, NOW - 100 * DAY)
+    real_zcards, calls, raced = retention.zcards, [], []
+
+    async def zcards(r, keys, *args):
+        calls.append(keys)
+        if len(calls) == 2 and not raced:
+            # A new event lands after the WATCH but before the SREM; the count read just before it is 0
+            raced.append(await r.zadd("events:msg:1:10", {"new": NOW}))
+            return {"events:msg:1:10": 0}
+        return await real_zcards(r, keys, *args)
+
+    monkeypatch.setattr(retention, "zcards", zcards)
+    report = await sweep_guild(fake_r, 1, 90, now=NOW)
+    assert raced and report["emptied"] == 0
+    assert await event_members(fake_r, 1, "msg") == {"10"}
@@ -0,0 +1,82 @@
+import json
+import pytest
+import fakeredis.aioredis
+from collections import Counter
+from datetime import datetime, timedelta
+
+from shared.event_index import index_member
+from shared.event_codec import encode_event
+from shared.rollups import add_event, queue_rollup, apply_rollup, read_rollups, sum_rollups, rebuild_rollup_days
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+async def _write(r, gid, uid, kind, event, ts, since):
+    delta = Counter()
+    add_event(delta, kind, event, ts)
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.zadd(f"events:{kind}:{gid}:{uid}", {encode_event(kind, event): ts})
+        index_member(pipe, gid, kind, uid)
+        queue_rollup(pipe, gid, delta, now=since)
+        await pipe.execute()
+
+
+@pytest.mark.asyncio
+async def test_live_rollups_match_raw_events(fake_r):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    since = (today - timedelta(days=3)).timestamp()
+    ts = today.timestamp() + 3600
+
+    await _write(fake_r, 1, 10, "msg", {"mid": 1, "len": 12, "reply": True}, ts, since)
+    await _write(fake_r, 1, 11, "msg", {"id": "t", "reaction_count": 4}, ts, since)
+    await _write(fake_r, 1, 10, "voice", {"duration": 600}, ts, since)
+    await _write(fake_r, 1, 10, "action", {"type": "ban"}, ts, since)
+    await _write(fake_r, 1, 10, "action", {"type": "something_new"}, ts, since)
+
+    totals = sum_rollups(await read_rollups(fake_r, 1, today - timedelta(days=2), today))
+    assert totals["msgs"] == 2
+    assert totals["msg_len"] == 12
+    assert totals["replies"] == 1
+    assert totals["reactions"] == 4
+    assert totals["reaction_msgs"] == 1
+    assert totals["voice_seconds"] == 600
+    assert totals["action:ban"] == 1
+    assert totals["action:other"] == 1
+
+
+@pytest.mark.asyncio
+async def test_days_before_first_rollup_fall_back_to_raw(fake_r):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    old_ts = (today - timedelta(days=5)).timestamp() + 60
+    # Legacy event written without rollups or index
+    await fake_r.zadd("events:msg:1:10", {json.dumps({"len": 5}): old_ts})
+    # Rollups only started today
+    await apply_rollup(fake_r, 1, Counter({today.strftime("%Y%m%d") + ":msgs": 3}), now=today.timestamp())
+
+    per_day = await read_rollups(fake_r, 1, today - timedelta(days=6), today)
+    assert per_day[(today - timedelta(days=5)).strftime("%Y%m%d")]["msgs"] == 1
+    assert per_day[today.strftime("%Y%m%d")]["msgs"] == 3
+    assert sum_rollups(per_day)["msg_len"] == 5
+
+
+@pytest.mark.asyncio
+async def test_rebuild_overwrites_covered_days(fake_r):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    d = today.strftime("%Y%m%d")
+    await apply_rollup(fake_r, 1, Counter({f"{d}:msgs": 1}), now=today.timestamp())
+    # Backfill adds two more events for the same day directly to the sorted set
+    await fake_r.zadd("events:msg:1:10", {json.dumps({"len": 1}): today.timestamp() + 10,
+                                          json.dumps({"len": 2}): today.timestamp() + 20,
+                                          json.dumps({"len": 3}): today.timestamp() + 30})
+    await index_member(fake_r, 1, "msg", 10)
+    await fake_r.set("events:members_built:1:msg", "1")
+
+    await rebuild_rollup_days(fake_r, 1, [today])
+    totals = sum_rollups(await read_rollups(fake_r, 1, today, today))
+    assert totals["msgs"] == 3
+    assert totals["msg_len"] == 6
@@ -0,0 +1,65 @@
+import pytest
+import fakeredis.aioredis
+
+from web.backend.services.snapshot_service import SnapshotService
+
+
+class FakeAnalytics:
+    def __init__(self):
+        self.calls = 0
+
+    async def _result(self, *args, **kwargs):
+        self.calls += 1
+        return {"value": self.calls}
+
+    get_trend_analysis = get_engagement_score = get_security_score = _result
+    get_data_quality_score = get_health_research_data = _result
+
+
+class FakeRepo:
+    def __init__(self, r):
+        self.r = r
+
+    async def get_client(self):
+        return self.r
+
+
+@pytest.fixture
+async def fake_r():
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    yield r
+    await r.aclose()
+
+
+@pytest.mark.asyncio
+async def test_snapshots_are_served_from_storage(fake_r):
+    analytics = FakeAnalytics()
+    svc = SnapshotService(analytics, FakeRepo(fake_r))
+
+    first = await svc.get_or_compute(1, "security")
+    again = await svc.get_or_compute(1, "security")
+    assert first["data"] == again["data"] == {"value": 1}
+    assert analytics.calls == 1
+    assert again["computed_at"] > 0
+
+
+@pytest.mark.asyncio
+async def test_active_guilds_are_due_sooner(fake_r):
+    analytics = FakeAnalytics()
+    svc = SnapshotService(analytics, FakeRepo(fake_r), active_interval=60, idle_interval=3600)
+    await fake_r.sadd("bot:guilds", "1", "2")
+
+    assert await svc.run_due() == 2
+    assert analytics.calls == 10
+    # Nothing is due right after a run
+    assert await svc.run_due() == 0
+
+    # Guild 1 receives events, guild 2 stays quiet
+    await fake_r.incr("stats:watermark:1")
+    await svc.compute(1)
+    await svc.compute(2)
+    due = dict(await fake_r.zrange("snapshot:due", 0, -1, withscores=True))
+    assert due["1"] + 3000 < due["2"]
+
+    await svc.request_refresh(2)
+    assert await fake_r.zscore("snapshot:due", "2") == 0
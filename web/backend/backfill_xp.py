@@ -6,6 +6,8 @@ import math
 import random
 sys.path.append('/root/discord-bot')
 from shared.redis_client import REDIS_URL
+from shared.event_index import event_members
+from shared.batch_reader import iter_ranges
 
 
 
@@ -32,12 +34,10 @@ async def backfill_xp():
     cursor = "0"
     processed_users = 0
     
-    async for key in r.scan_iter(match=f"events:msg:{guild_id}:*"):
+    keys = [f"events:msg:{guild_id}:{uid}" for uid in await event_members(r, guild_id, "msg")]
+    async for key, msgs in iter_ranges(r, keys, withscores=True):
         uid = key.split(":")[-1]
         
-        
-        msgs = await r.zrange(key, 0, -1, withscores=True)
-        
         total_xp = 0
         last_xp_time = 0
         
@@ -2,6 +2,7 @@ from ..repositories.base import BaseRepository
 from ..repositories.redis_repo import RedisRepository
 from ..services.base import BaseAnalyticsService
 from ..services.analytics_service import DefaultAnalyticsService
+from ..services.snapshot_service import SnapshotService
 
 class AppContainer:
     """
@@ -11,11 +12,13 @@ class AppContainer:
     """
     repo: BaseRepository = None
     analytics: BaseAnalyticsService = None
+    snapshots: SnapshotService = None
 
     @classmethod
     def init(cls, repo_override: BaseRepository = None, analytics_override: BaseAnalyticsService = None):
         cls.repo = repo_override or RedisRepository()
         cls.analytics = analytics_override or DefaultAnalyticsService(repo=cls.repo)
+        cls.snapshots = SnapshotService(cls.analytics, cls.repo)
 
 # Initialize the default production dependencies immediately
 AppContainer.init()
@@ -46,10 +46,15 @@ async def hydrate_users():
     missing_count = 0
     updated_count = 0
     
-    async with httpx.AsyncClient() as client:
+    # Current info for every user in one round-trip; the cache is not worth it for a one-off script
+    async with r.pipeline(transaction=False) as pipe:
         for uid in users:
+            pipe.hgetall(f"user:info:{uid}")
+        infos = await pipe.execute()
+
+    async with httpx.AsyncClient() as client:
+        for uid, info in zip(users, infos):
             
-            info = await r.hgetall(f"user:info:{uid}")
             if not info or not info.get("username"):
                 missing_count += 1
                 try:
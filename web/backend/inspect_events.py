@@ -4,15 +4,16 @@ import redis.asyncio as redis
 import sys
 sys.path.append('/root/discord-bot')
 from shared.redis_client import REDIS_URL
+from shared.event_index import event_keys
 import json
 
 async def inspect_events():
     r = redis.from_url(REDIS_URL, decode_responses=True)
     guild_id = 615171377783242769
     
-    print("Scanning for message events...")
+    print("Reading message event index...")
     keys = []
-    async for key in r.scan_iter(f"events:msg:{guild_id}:*"):
+    for key in await event_keys(r, guild_id, "msg"):
         keys.append(key)
         if len(keys) >= 5: break
         
@@ -24,6 +24,7 @@ import redis.asyncio as redis
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 from collections import defaultdict
+from contextlib import asynccontextmanager
 import secrets
 import httpx
 import sys
@@ -92,7 +93,23 @@ except ImportError:
 
 # OTP email auth removed – přihlášení pouze přes Discord OAuth2 nebo Demo
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The job worker runs the queued delete_guild_data jobs (backfill jobs run in the bot)
+    from .services.jobs_service import create_web_worker
+    worker = None
+    try:
+        worker = create_web_worker(await get_redis_client())
+        worker.start()
+    except Exception as e:
+        print(f"Job worker not started: {e}")
+    yield
+    if worker is not None:
+        await worker.stop()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="CommunityMetrics API",
     version="1.0.0",
     docs_url="/api/docs",
@@ -116,12 +133,14 @@ from .routers.settings import router as settings_router
 from .routers.pages import router as pages_router
 from .routers.api import router as api_router
 from .routers.community_health import router as community_health_router
+from .routers.metrics import router as metrics_router
 
 app.include_router(auth_router)
 app.include_router(settings_router)
 app.include_router(pages_router)
 app.include_router(api_router)
 app.include_router(community_health_router)
+app.include_router(metrics_router)
 
 
 
@@ -1,11 +1,17 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator, Iterable, Tuple
+
+from shared.batch_reader import MAX_CONCURRENCY, PIPELINE_CHUNK, iter_ranges
 
 class BaseRepository(ABC):
     """
     Abstract base class for data access.
     Allows swapping Redis with PostgreSQL or Mock databases for testing.
     """
+
+    # Batch reads: keys per pipeline and pipelines in flight at once
+    range_chunk_size: int = PIPELINE_CHUNK
+    range_concurrency: int = MAX_CONCURRENCY
     
     @abstractmethod
     async def get_client(self):
@@ -47,4 +53,15 @@ class BaseRepository(ABC):
     async def get_cached_roles(self, guild_id: int) -> List[Dict[str, str]]:
         pass
         
+    async def iter_ranges(self, keys: Iterable[Any], start: Any = "-inf", end: Any = "+inf",
+                          withscores: bool = False) -> AsyncIterator[Tuple[str, list]]:
+        """
+        Streams (key, rows) score-range reads for many sorted sets.
+        Keys may be plain names or (key, start, end) tuples with their own range.
+        """
+        r = await self.get_client()
+        async for key, rows in iter_ranges(r, keys, start, end, withscores,
+                                           self.range_chunk_size, self.range_concurrency):
+            yield key, rows
+
     # the rest of the functions from redis_repo...
@@ -2,10 +2,18 @@ import redis.asyncio as redis
 from typing import Dict, Any, List
 import json
 from datetime import datetime, timedelta
+from collections import defaultdict
 import httpx
 import os
 from pathlib import Path
 from shared.redis_client import get_redis_client as get_redis
+from shared.hll_pyramid import uniques_series
+from shared.daily_series import read_series
+from shared.entity_cache import entity_cache
+from shared.result_cache import cached_result
+from shared.aggregation import (
+    aggregate, ChatSessionizer, LengthStats, ReplyRatio, VoiceTime, WeekdayDistribution, WeightedActions,
+)
 
 DATA_DIR = Path(__file__).resolve().parent.parent.parent / "data"
 
@@ -151,18 +159,8 @@ class RedisRepository(BaseRepository):
                 curr += timedelta(days=1)
 
             
-            pipe = r.pipeline()
-            debug_keys = []
-            for d in date_list:
-                d_str = d.strftime("%Y%m%d")
-                k = f"hll:dau:{guild_id}:{d_str}"
-                pipe.pfcount(k)
-                debug_keys.append(k)
-            
-            results = await pipe.execute()
-            # print(f"DEBUG: {guild_id}, {results}")
-            
-            dau_data = results
+            # Closed days come from the finalized series, only today hits the live HLL
+            dau_data = await read_series(r, guild_id, [d.date() for d in date_list], "dau")
             dau_labels = [d.strftime("%Y-%m-%d") for d in date_list]
                 
             avg_dau = sum(dau_data) / len(dau_data) if dau_data else 0
@@ -182,20 +180,13 @@ class RedisRepository(BaseRepository):
             pass
 
 
+    @cached_result("deep_stats", max_age=300)
     async def get_deep_stats_redis(self, guild_id: int, start_date: str = None, end_date: str = None, role_id: str = "all") -> Dict[str, Any]:
         # Detailní statistiky pro dashboard, počítáme skóre podle vah
         r = await self.get_client()
         
-        
-        cache_key = f"stats:deep:{guild_id}:{start_date}:{end_date}:{role_id}:v5_weighted"
-        
         try:
             
-            cached = await r.get(cache_key)
-            if cached:
-                 return json.loads(cached)
-                 
-            
             now = datetime.now()
             if start_date:
                 start_dt = datetime.strptime(start_date, "%Y-%m-%d")
@@ -211,123 +202,48 @@ class RedisRepository(BaseRepository):
             ts_end = end_dt.timestamp()
             
             
-            weights = await get_action_weights(r)
+            from ..utils import get_action_weights
+            weights = await get_action_weights()
             
             
             staff_stats = defaultdict(lambda: {"actions": 0, "voice_time": 0, "weighted": 0.0})
-            action_counts = Counter()
-            
-            
-            async for key in r.scan_iter(f"events:action:{guild_id}:*"):
-                uid = key.split(":")[-1]
-                
-                
-                events = await r.zrangebyscore(key, ts_start, ts_end)
-                
-                for event_json in events:
-                    try:
-                        data = json.loads(event_json)
-                        action_type = data.get("type", "unknown")
-                        
-                        
-                        
-                        metric_map = {
-                            "ban": "bans", "kick": "kicks", "timeout": "timeouts",
-                            "unban": "unbans", "role_update": "role_updates",
-                            "msg_delete": "msg_deleted",
-                            "verification": "verifications"
-                        }
-                        w_key = metric_map.get(action_type, action_type + "s") 
-                        
-                        weight = weights.get(w_key, 0)
-                        
-                        
-                        staff_stats[uid]["actions"] += 1
-                        staff_stats[uid]["weighted"] += float(weight)
-                        
-                        action_counts[action_type] += 1
-                        
-                    except (json.JSONDecodeError, KeyError):
-                        continue
-
-            
-            async for key in r.scan_iter(f"events:voice:{guild_id}:*"):
-                uid = key.split(":")[-1]
-                
-                headers = await r.zrangebyscore(key, ts_start, ts_end)
-                for h_json in headers:
-                    try:
-                        data = json.loads(h_json)
-                        duration = data.get("duration", 0)
-                        
-                        w = duration * weights.get("voice_time", 1)
-                        staff_stats[uid]["weighted"] += float(w)
-                        staff_stats[uid]["voice_time"] += duration
-                    except: continue
 
-            
-            
-            async for key in r.scan_iter(f"events:msg:{guild_id}:*"):
-                uid = key.split(":")[-1]
-                
-                
-                messages = await r.zrangebyscore(key, ts_start, ts_end, withscores=True)
-                
-                last_msg_ts = 0
-                raw_chat_time = 0
-                SESSION_GAP = 300 
-                
-                w_session = weights.get("session_base", 180)
-                w_char = weights.get("char_weight", 1)
-                w_msg = weights.get("msg_weight", 0)
-                w_reply = weights.get("reply_weight", 60)
-                w_chat_multiplier = weights.get("chat_time", 1)
-                
-                msg_count = 0
-                
-                for msg_json, score in messages:
-                    try:
-                        msg_data = json.loads(msg_json)
-                        msg_ts = float(score)
-                        
-                        
-                        if last_msg_ts == 0 or (msg_ts - last_msg_ts) > SESSION_GAP:
-                            raw_chat_time += w_session
-                        
-                        last_msg_ts = msg_ts
-                        
-                        
-                        content_add = (msg_data.get("len", 0) * w_char) + w_msg
-                        if msg_data.get("reply"): content_add += w_reply
-                        
-                        raw_chat_time += content_add
-                            
-                        msg_count += 1
-                    except: continue
-                
-                if raw_chat_time > 0:
-                    weighted_chat = raw_chat_time * w_chat_multiplier
-                    staff_stats[uid]["weighted"] += float(weighted_chat)
-                    
-                    
-                    
-                    
+            # One pass over action/voice/msg events feeds every metric below
+            actions_acc = WeightedActions(weights)
+            voice_acc = VoiceTime(weights)
+            chat_acc = ChatSessionizer(weights)
+            length_acc, reply_acc, weekday_acc = LengthStats(), ReplyRatio(), WeekdayDistribution()
+            await aggregate(r, guild_id, [actions_acc, voice_acc, chat_acc, length_acc, reply_acc, weekday_acc],
+                            ts_start, ts_end, chunk_size=self.range_chunk_size, concurrency=self.range_concurrency)
+
+            action_result = actions_acc.result()
+            action_counts = action_result["by_type"]
+            for uid, a in action_result["per_user"].items():
+                staff_stats[uid]["actions"] += a["actions"]
+                staff_stats[uid]["weighted"] += a["weighted"]
+            for uid, v in voice_acc.result()["per_user"].items():
+                staff_stats[uid]["voice_time"] += v["seconds"]
+                staff_stats[uid]["weighted"] += v["weighted"]
+            for uid, chat_weighted in chat_acc.result().items():
+                staff_stats[uid]["weighted"] += chat_weighted
+
 
-            
             final_leaderboard = []
             total_time_seconds = 0
             
             
             
-            roles_data = await get_cached_roles(guild_id)
+            roles_data = await self.get_cached_roles(guild_id)
 
             all_roles = {str(r["id"]): r["name"] for r in roles_data}
             
+            user_infos = await entity_cache(r).get_many(
+                "user", [uid for uid, stats_data in staff_stats.items() if stats_data["weighted"] > 0])
             for uid, stats_data in staff_stats.items():
                 if stats_data["weighted"] <= 0:
                     continue
                     
-                user_info = await r.hgetall(f"user:info:{uid}") or {}
+                user_info = user_infos[str(uid)]
                 
                 
                 if role_id and role_id != "all":
@@ -395,60 +311,18 @@ class RedisRepository(BaseRepository):
             dau_wau_ratio = []
             dau_mau_ratio = []
             
-            for d in date_list_dt:
-                d_str = d.strftime("%Y%m%d")
-                
-                # WAU (last 7 days)
-                wau_keys = [K_DAU(guild_id, (d - timedelta(days=i)).strftime("%Y%m%d")) for i in range(7)]
-                wau_val = await r.pfcount(*wau_keys)
+            series = await uniques_series(r, guild_id, [d.date() for d in date_list_dt], windows=(1, 7, 30))
+            for dau_val, wau_val, mau_val in zip(series[1], series[7], series[30]):
                 wau_data.append(wau_val)
-                
-                # MAU (last 30 days)
-                mau_keys = [K_DAU(guild_id, (d - timedelta(days=i)).strftime("%Y%m%d")) for i in range(30)]
-                mau_val = await r.pfcount(*mau_keys)
                 mau_data.append(mau_val)
-                
-                # DAU for this day
-                dau_val = await r.pfcount(K_DAU(guild_id, d_str))
-                
                 dau_wau_ratio.append(round((dau_val / max(1, wau_val)) * 100, 1))
                 dau_mau_ratio.append(round((dau_val / max(1, mau_val)) * 100, 1))
 
             # --- Weekly Activity (Radar Chart) ---
             # 0=Monday, 6=Sunday
-            weekly_counts = [0] * 7
-            total_msgs_count = 0
-            total_len = 0
-            replies_count = 0
-
-            # We can use the message events we already scanned or just scan again for specific period
-            async for key in r.scan_iter(f"events:msg:{guild_id}:*"):
-                messages = await r.zrangebyscore(key, ts_start, ts_end)
-                for msg_json in messages:
-                    try:
-                        msg_data = json.loads(msg_json)
-                        total_msgs_count += 1
-                        total_len += msg_data.get("len", 0)
-                        if msg_data.get("reply"):
-                            replies_count += 1
-                    except: continue
-
-            # Weekly dist from heatmap data if available, or just use hourly keys
-            # Let's reuse heatmap logic from get_redis_dashboard_stats if possible
-            # Actually, get_redis_dashboard_stats already calculates heatmap.
-            # But we need it here for the radar chart if we want to stay in deep_stats.
-            # Alternatively, we can let main.py handle it.
-            # Let's just calculate it here to be sure.
-            for d in date_list_dt:
-                d_str = d.strftime("%Y%m%d")
-                day_idx = d.weekday()
-                h_data = await r.hgetall(f"stats:hourly:{guild_id}:{d_str}")
-                if h_data:
-                    day_total = sum(int(float(c)) for c in h_data.values())
-                    weekly_counts[day_idx] += day_total
-
-            avg_msg_len = round(total_len / max(1, total_msgs_count), 1)
-            reply_ratio = round((replies_count / max(1, total_msgs_count)) * 100, 1)
+            weekly_counts = weekday_acc.result()
+            avg_msg_len = length_acc.result()["avg_len"]
+            reply_ratio = reply_acc.result()["ratio_pct"]
             
             daily_weighted_series = []
             if total_hours_period > 0:
@@ -481,7 +355,6 @@ class RedisRepository(BaseRepository):
                 "leaderboard": final_leaderboard
             }
             
-            await r.setex(cache_key, 300, json.dumps(stats)) 
             return stats
             
         except Exception as e:
@@ -493,17 +366,13 @@ class RedisRepository(BaseRepository):
             pass
 
 
+    @cached_result("dashboard_stats", max_age=60)
     async def get_redis_dashboard_stats(self, guild_id: int, start_date: str = None, end_date: str = None, role_id: str = None) -> Dict[str, Any]:
         # Základní statistiky pro dashboard přímo z Redis
         r = await self.get_client()
-        cache_key = f"stats:cache:dashboard:{guild_id}:{start_date}:{end_date}:{role_id}:v4"
         
         try:
             
-            cached = await r.get(cache_key)
-            if cached:
-                return json.loads(cached)
-
             
             
             
@@ -626,12 +495,15 @@ class RedisRepository(BaseRepository):
             }
             
             
-            await r.setex(cache_key, 60, json.dumps(stats))
             return stats
             
         except Exception as e:
             print(f"Error fetching Redis dashboard stats: {e}")
+            import traceback
+            traceback.print_exc()
+            # Details stay in the log; the "error" key also keeps the fallback out of the result cache
             return {
+                "error": "Statistiky se nepodařilo načíst",
                 "hourly_activity": [0] * 24,
                 "hourly_labels": [f"{h}:00" for h in range(24)],
                 "msglen_labels": [],
@@ -739,7 +611,7 @@ class RedisRepository(BaseRepository):
         # Načtení rolí z Redis cache nebo Discord API
         r = await self.get_client()
         try:
-            role_map = await r.hgetall(f"guild:roles:{guild_id}")
+            role_map = dict(await entity_cache(r).get("roles", guild_id))
             if not role_map:
                 
                 async with httpx.AsyncClient() as client:
@@ -754,6 +626,7 @@ class RedisRepository(BaseRepository):
                             rname = r_data["name"]
                             role_map[rid] = rname
                             await r.hset(f"guild:roles:{guild_id}", rid, rname)
+                        entity_cache(r).invalidate("roles", guild_id)
             
             
             return [{"id": k, "name": v} for k, v in sorted(role_map.items(), key=lambda x: x[1])]
@@ -1,7 +1,14 @@
-from fastapi import APIRouter, Request, Depends, HTTPException, Form
+from fastapi import APIRouter, Request, Depends, HTTPException, Form, Query
 from typing import Optional, List, Dict, Any
 from fastapi.responses import JSONResponse
 import datetime
+from shared.activity_bitmap import DEFAULT_WEEKS, MAX_WEEKS, active_counts, cohort_retention
+from shared.entity_cache import entity_cache
+from shared.heavy_hitters import WINDOWS, top_k
+from shared.jobs import active_job, cancel, enqueue, get_job
+from shared.keys import K_BACKFILL_PROGRESS
+from shared.markov_forecast import SEGMENT_ALL, forecast_horizons, load_forecasts
+from shared.models import UserState
 
 router = APIRouter(tags=["api"])
 
@@ -199,8 +206,9 @@ async def get_xp_leaderboard(request: Request):
     
     
     current_rank = 1
+    user_infos = await entity_cache(r).get_many("user", [uid for uid, _ in top_users])
     for i, (uid, xp) in enumerate(top_users, 1):
-        user_info = await r.hgetall(f"user:info:{uid}") or {}
+        user_info = user_infos[str(uid)]
         username = user_info.get("username", "Unknown")
         
         
@@ -280,187 +288,90 @@ async def get_predictions_data(request: Request, _=Depends(require_auth)):
         avg_monthly_joins = 0
         avg_monthly_leaves = 0
     
-    from ..utils import get_health_research_data
-    research_data = await get_health_research_data(guild_id)
+    from ..utils import get_snapshot, get_channel_distribution
+    from shared.activity_bitmap import active_counts
+    from shared.daily_series import read_series
+    from shared.forecasting import forecast_many, ols_fit
+    from shared.keys import day_key
+    research_data = (await get_snapshot(guild_id, "health_research"))["data"] or {}
     
-    if research_data.get("success"):
-        p_stay_active = research_data.get("retention_pct", 0) / 100.0 if research_data.get("retention_pct") is not None else 0
-        p_inactive = research_data.get("inactivity_risk_pct", 0) / 100.0 if research_data.get("inactivity_risk_pct") is not None else 0
-        predicted_growth_30d = round(avg_monthly_growth)
-        predicted_members_30d = current_members + predicted_growth_30d
+    # Daily series of the last 30 days: messages, DAU and the top channels
+    hist_dates = [end_dt - datetime.timedelta(days=29-i) for i in range(30)]
+    daily = {"msgs": await read_series(r, guild_id, [d.date() for d in hist_dates], "msgs")}
+    
+    act = await get_activity_stats(guild_id, days=30)
+    daus = act.get('dau_data', [])
+    dau_labels = act.get('dau_labels', [])
+    avg_dau = act.get('avg_dau', 0)
+    daily["dau"] = daus
+    
+    top_channels = []
+    try:
+        dist = await get_channel_distribution(int(guild_id), days=30)
+        top_channels = [str(d['channel_id']) for d in dist[:5]]
+        async with r.pipeline(transaction=False) as pipe:
+            for cid in top_channels:
+                for d in hist_dates:
+                    pipe.get(f"stats:channel:{guild_id}:{cid}:{day_key(d)}")
+            raw = await pipe.execute()
+        for i, cid in enumerate(top_channels):
+            daily[f"channel:{cid}"] = [int(float(v or 0)) for v in raw[i * 30:(i + 1) * 30]]
+    except Exception as e:
+        print(f"Error loading channel series: {e}")
+        top_channels = []
+    
+    # One batched fit for all daily series; 90 days cover the MAU outlook, charts show the first 7
+    daily_fc = forecast_many(daily, horizon=90)
+    # Monthly joins and leaves (yearly seasonality once two years of history exist)
+    monthly_fc = forecast_many({"joins": joins_history[-24:], "leaves": leaves_history[-24:]}, horizon=6, season=12)
+    
+    if monthly_fc["joins"] and monthly_fc["leaves"]:
+        net_growth = [j - l for j, l in zip(monthly_fc["joins"]["forecast"], monthly_fc["leaves"]["forecast"])]
     else:
-        predicted_growth_30d = round(avg_monthly_growth)
-        predicted_members_30d = current_members + predicted_growth_30d
+        net_growth = [avg_monthly_growth] * 6
+    predicted_growth_30d = round(net_growth[0])
+    predicted_members_30d = current_members + predicted_growth_30d
     
     # Růst v procentech
     growth_pct = round((predicted_growth_30d / max(1, current_members) * 100), 2)
     
-    
     forecast_dates = []
     forecast_members = []
-    
     running_total = current_members
-    for i in range(1, 7):  
+    for i, growth in enumerate(net_growth, start=1):
         future_date = end_dt + datetime.timedelta(days=30*i)
         forecast_dates.append(future_date.strftime("%Y-%m"))
-        running_total += round(avg_monthly_growth)
+        running_total += round(growth)
         forecast_members.append(running_total)
     
-    
     history_dates = dates[-12:] if len(dates) > 12 else dates
     history_members = stats.get('total', [])[-12:] if len(stats.get('total', [])) > 12 else stats.get('total', [])
     
-    
     if not history_members:
         history_members = [current_members]
         history_dates = [end_dt.strftime("%Y-%m")]
     
-    
-    
-    from ..utils import get_redis
-    r = await get_redis()
-    
-    activity_history = []
-    hist_dates = []
-    
-    
-    for i in range(30):
-        d = end_dt - datetime.timedelta(days=29-i)
-        d_str = d.strftime("%Y%m%d")
-        
-        h_data = await r.hgetall(f"stats:hourly:{guild_id}:{d_str}")
-        daily_sum = sum(int(float(v)) for v in h_data.values())
-        activity_history.append(daily_sum)
-        hist_dates.append(d)
-        
-    
-    
-    act_x = list(range(len(activity_history)))
-    act_y = activity_history
-    n_act = len(act_y)
-    
-    if n_act > 1:
-        s_x = sum(act_x)
-        s_y = sum(act_y)
-        s_xy = sum(i*j for i, j in zip(act_x, act_y))
-        s_xx = sum(i*i for i in act_x)
-        try:
-            act_slope = (n_act*s_xy - s_x*s_y) / (n_act*s_xx - s_x**2)
-            act_intercept = (s_y - act_slope*s_x) / n_act
-        except:
-            act_slope = 0
-            act_intercept = sum(act_y)/n_act
-    else:
-        act_slope = 0
-        act_intercept = 0
-
-    
-    
-    weekday_totals = [0] * 7
-    weekday_counts = [0] * 7
-    
-    for i, val in enumerate(activity_history):
-        wd = hist_dates[i].weekday()
-        weekday_totals[wd] += val
-        weekday_counts[wd] += 1
-        
-    global_avg = sum(activity_history) / n_act if n_act > 0 else 1
-    if global_avg == 0: global_avg = 1
-    
-    seasonality_indices = []
-    for d in range(7):
-        avg_for_day = weekday_totals[d] / weekday_counts[d] if weekday_counts[d] > 0 else global_avg
-        
-        seasonality_indices.append(avg_for_day / global_avg)
-        
-    
     today_weekday = end_dt.weekday()
-    forecast_activity = []
-    forecast_day_labels = []
     cz_days = ["Po", "Út", "St", "Čt", "Pá", "So", "Ne"]
-    
-    for i in range(1, 8):
-        
-        future_x = (n_act - 1) + i
-        
-        
-        trend_level = act_slope * future_x + act_intercept
-        if trend_level < 0: trend_level = 0
-        
-        
-        future_wd = (today_weekday + i) % 7
-        seasonal_adjust = seasonality_indices[future_wd]
-        
-        final_pred = trend_level * seasonal_adjust
-        
-        forecast_activity.append(round(final_pred))
-        forecast_day_labels.append(cz_days[future_wd])
-        
+    forecast_day_labels = [cz_days[(today_weekday + i) % 7] for i in range(1, 8)]
+    msgs_fc = daily_fc["msgs"]
+    forecast_activity = [round(v) for v in msgs_fc["forecast"][:7]]
     expected_msgs_tomorrow = forecast_activity[0]
     
-    
-    act = await get_activity_stats(guild_id, days=30)
-    daus = act.get('dau_data', [])
-    dau_labels = act.get('dau_labels', [])
-    avg_dau = act.get('avg_dau', 0)
-    
-    
-    dau_n = len(daus)
-    if dau_n > 1:
-        dau_x = list(range(dau_n))
-        dau_sum_x = sum(dau_x)
-        dau_sum_y = sum(daus)
-        dau_sum_xy = sum(i*j for i, j in zip(dau_x, daus))
-        dau_sum_xx = sum(i*i for i in dau_x)
-        try:
-            dau_slope = (dau_n*dau_sum_xy - dau_sum_x*dau_sum_y) / (dau_n*dau_sum_xx - dau_sum_x**2)
-            dau_intercept = (dau_sum_y - dau_slope*dau_sum_x) / dau_n
-        except:
-            dau_slope = 0
-            dau_intercept = avg_dau
+    dau_fc = daily_fc["dau"]
+    if dau_fc:
+        dau_forecast = [round(v) for v in dau_fc["forecast"][:7]]
+        dau_slope = float(ols_fit(daus)[1][0])
     else:
+        dau_forecast = [round(avg_dau)] * 7
         dau_slope = 0
-        dau_intercept = avg_dau
-    
-    
-    dau_weekday_totals = [0] * 7
-    dau_weekday_counts = [0] * 7
-    for i, val in enumerate(daus):
-        if i < len(hist_dates):
-            wd = hist_dates[i].weekday()
-            dau_weekday_totals[wd] += val
-            dau_weekday_counts[wd] += 1
-    
-    dau_global_avg = sum(daus) / dau_n if dau_n > 0 else 1
-    if dau_global_avg == 0: dau_global_avg = 1
-    
-    dau_seasonality = []
-    for d in range(7):
-        avg_for_day = dau_weekday_totals[d] / dau_weekday_counts[d] if dau_weekday_counts[d] > 0 else dau_global_avg
-        dau_seasonality.append(avg_for_day / dau_global_avg)
-    
-    
-    dau_forecast = []
-    dau_forecast_labels = []
-    for i in range(1, 8):
-        future_x = (dau_n - 1) + i
-        trend_level = dau_slope * future_x + dau_intercept
-        if trend_level < 0: trend_level = 0
-        
-        future_wd = (today_weekday + i) % 7
-        seasonal_adjust = dau_seasonality[future_wd] if future_wd < len(dau_seasonality) else 1
-        
-        final_dau = round(trend_level * seasonal_adjust)
-        dau_forecast.append(final_dau)
-        
-        future_date = end_dt + datetime.timedelta(days=i)
-        dau_forecast_labels.append(future_date.strftime("%Y-%m-%d"))
-    
+    dau_forecast_labels = [(end_dt + datetime.timedelta(days=i)).strftime("%Y-%m-%d") for i in range(1, 8)]
     expected_dau = dau_forecast[0] if dau_forecast else round(avg_dau)
     
-    
-    mau_key = f"hll:mau:{guild_id}:{end_dt.strftime('%Y%m')}"
-    mau = await r.pfcount(mau_key)
+    # Exact MAU from the activity bitmaps, then the month HLL
+    mau = (await active_counts(r, guild_id))["mau"]
+    if mau == 0:
+        mau = await r.pfcount(f"hll:mau:{guild_id}:{end_dt.strftime('%Y%m')}")
     if mau == 0:
         
         mau = round(avg_dau * 3.5) if avg_dau > 0 else 0
@@ -468,11 +379,11 @@ async def get_predictions_data(request: Request, _=Depends(require_auth)):
     
     dau_mau_ratio = round((avg_dau / mau * 100), 1) if mau > 0 else 0
     
-    
-    mau_growth_rate = 1.0 + (avg_monthly_growth / max(1, current_members)) if avg_monthly_growth > 0 else 1.0
+    # MAU follows the forecast DAU of each coming month at the current DAU/MAU ratio
     mau_forecast = [mau]
-    for i in range(1, 4):  
-        mau_forecast.append(round(mau_forecast[-1] * mau_growth_rate))
+    for i in range(3):
+        month_dau = sum(dau_fc["forecast"][30 * i:30 * (i + 1)]) / 30 if dau_fc else avg_dau
+        mau_forecast.append(round(mau * month_dau / avg_dau) if avg_dau > 0 else mau)
     
     
     if research_data.get("success"):
@@ -496,13 +407,18 @@ async def get_predictions_data(request: Request, _=Depends(require_auth)):
             "dates": forecast_dates,
             "members": forecast_members,
             "days": forecast_day_labels,
-            "activity": forecast_activity
+            "activity": forecast_activity,
+            "activity_lower": [round(v) for v in msgs_fc["lower"][:7]],
+            "activity_upper": [round(v) for v in msgs_fc["upper"][:7]],
+            "method": msgs_fc["method"]
         },
         "dau": {
             "history": daus,
             "history_labels": dau_labels,
             "forecast": dau_forecast,
             "forecast_labels": dau_forecast_labels,
+            "forecast_lower": [round(v) for v in dau_fc["lower"][:7]] if dau_fc else dau_forecast,
+            "forecast_upper": [round(v) for v in dau_fc["upper"][:7]] if dau_fc else dau_forecast,
             "avg": round(avg_dau),
             "trend": "up" if dau_slope > 0 else "down" if dau_slope < 0 else "stable"
         },
@@ -525,22 +441,15 @@ async def get_predictions_data(request: Request, _=Depends(require_auth)):
     }
     
     try:
-        from ..utils import get_channel_distribution
-        
-        dist = await get_channel_distribution(int(guild_id), days=30)
-        
         channels_info = await get_discord_channels(int(guild_id))
         cmap = {str(c['id']): c['name'] for c in channels_info}
         
         predicted_channels = []
-        total_baseline = sum(c['count'] for c in dist) if dist else 1
-        
-        for d in dist[:5]: 
-            share = d['count'] / total_baseline
-            pred_count = round(share * expected_msgs_tomorrow)
+        for cid in top_channels:
+            channel_fc = daily_fc.get(f"channel:{cid}")
             predicted_channels.append({
-                "name": cmap.get(str(d['channel_id']), f"#{d['channel_id']}"),
-                "count": pred_count
+                "name": cmap.get(cid, f"#{cid}"),
+                "count": round(channel_fc["forecast"][0]) if channel_fc else 0
             })
         
         res_dict["channels"] = predicted_channels
@@ -552,85 +461,29 @@ async def get_predictions_data(request: Request, _=Depends(require_auth)):
 
 
 @router.post("/api/trigger-backfill")
-async def trigger_backfill(request: Request, guild_id: Optional[str] = Form(None), _=Depends(require_admin)):
-    """Trigger manual backfill from dashboard (Admin only)."""
+async def trigger_backfill(request: Request, guild_id: Optional[str] = Form(None), days: int = Form(30),
+                           restart: bool = Form(False), _=Depends(require_admin)):
+    """Queue a history backfill for the bot (Admin only); repeated clicks return the running job."""
     await require_csrf(request)
 
-    target_gid = guild_id or request.session.get("guild_id")
-    print(f"DEBUG: trigger_backfill - Form guild_id: {guild_id}, Session guild_id: {request.session.get('guild_id')}, Resolved: {target_gid}")
-
+    target_gid = request.session.get("guild_id") or guild_id
     if not target_gid:
          return JSONResponse({"status": "error", "message": "No guild ID found in session or request"}, status_code=400)
     
     if target_gid == "demo-guild":
          return JSONResponse({"status": "error", "message": "Přístup odepřen: Akce není v demo režimu povolena."}, status_code=403)
 
-    
-    import subprocess
-    import sys
-    import os
-    
-    script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "scripts", "backfill_stats.py"))
-    token_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "config", "bot_token.py"))
-    
-    
-    primary_token = None
-    dashboard_token = None
-    if os.path.exists(token_path):
-        with open(token_path, 'r') as f:
-            for line in f:
-                if line.strip().startswith("TOKEN =") and "None" not in line:
-                    primary_token = line.split("=")[1].strip().strip('"').strip("'")
-                elif line.strip().startswith("DASHBOARD_TOKEN ="):
-                    dashboard_token = line.split("=")[1].strip().strip('"').strip("'")
-    
-    if not primary_token:
-        primary_token = os.getenv("BOT_TOKEN")
-    if not dashboard_token:
-        dashboard_token = os.getenv("DASHBOARD_TOKEN")
-    
-    
-    
-    
-    
     from ..utils import get_redis_client
     r = await get_redis_client()
-    
-    
-    primary_guilds = await r.smembers("bot:guilds:primary") or set()
-    dashboard_guilds = await r.smembers("bot:guilds:dashboard") or set()
-    
-    
-    if target_gid in primary_guilds:
-        bot_token_val = primary_token
-    elif target_gid in dashboard_guilds:
-        bot_token_val = dashboard_token
-    else:
-        # Fallback to dashboard token (safe default for new setups)
-        bot_token_val = dashboard_token or primary_token
-    
-    if os.path.exists(script_path) and bot_token_val:
-        cmd = [sys.executable, script_path, "--guild_id", str(target_gid), "--token", bot_token_val]
-        
-        # Log to file for debugging
-        log_path = os.path.join(os.path.dirname(script_path), "backfill.log")
-        
-        try:
-             with open(log_path, 'a') as log_file:
-                 log_file.write(f"\n\n=== Backfill triggered at {datetime.now().isoformat()} for guild {target_gid} ===\n")
-             
-             log_file_handle = open(log_path, 'a')
-             subprocess.Popen(cmd, stdout=log_file_handle, stderr=log_file_handle)
-             return JSONResponse({"status": "ok", "message": f"Backfill started for {target_gid}"})
-        except Exception as e:
-             return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
-    else:
-         return JSONResponse({"status": "error", "message": "Script or Token not found"}, status_code=500)
+
+    job, created = await enqueue(r, "backfill", target_gid, {"days": max(1, days), "restart": restart})
+    message = "Backfill naplánován" if created else "Backfill pro tento server už běží"
+    return JSONResponse({"status": "ok", "message": message, "created": created, "job": job})
 
 
 @router.get("/api/backfill-status")
 async def backfill_status(request: Request, _=Depends(require_admin)):
-    """Get the current progress of the backfill process."""
+    """Progress of the running or last backfill, with the state of its job."""
     guild_id = request.session.get("guild_id")
     if not guild_id:
         return JSONResponse({"status": "error", "message": "No guild selected"}, status_code=400)
@@ -638,19 +491,45 @@ async def backfill_status(request: Request, _=Depends(require_admin)):
     from ..utils import get_redis_client
     r = await get_redis_client()
     
-    progress_key = f"backfill:progress:{guild_id}"
-    data = await r.get(progress_key)
-    
-    if not data:
-        return JSONResponse({"status": "inactive"})
-    
     import json
-    return JSONResponse(json.loads(data))
+    data = await r.get(K_BACKFILL_PROGRESS(guild_id))
+    progress = json.loads(data) if data else {}
+    job = await active_job(r, "backfill", guild_id)
+    if job:
+        progress.update(job_id=job["id"], kind="backfill", job_status=job["status"])
+    if not progress:
+        return JSONResponse({"status": "inactive"})
+    return JSONResponse(progress)
+
+
+async def _guild_job(request: Request, job_id: str):
+    from ..utils import get_redis_client
+    r = await get_redis_client()
+    job = await get_job(r, job_id)
+    # Admins only see the jobs of the guild selected in their session
+    if job is None or job["gid"] != str(request.session.get("guild_id")):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return r, job
+
+
+@router.get("/api/jobs/{job_id}")
+async def job_status(request: Request, job_id: str, _=Depends(require_admin)):
+    """State, progress and result of a queued admin job."""
+    _, job = await _guild_job(request, job_id)
+    return JSONResponse(job)
+
+
+@router.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(request: Request, job_id: str, _=Depends(require_admin)):
+    """Cancel a queued job, or ask the worker to stop a running one."""
+    await require_csrf(request)
+    r, _ = await _guild_job(request, job_id)
+    return JSONResponse({"status": "ok", "job": await cancel(r, job_id)})
 
 
 @router.post("/api/delete-server-data")
 async def delete_server_data(request: Request, _=Depends(require_admin)):
-    """Delete all Redis data for the current server (Admin only)."""
+    """Queue deletion of all Redis data for the current server (Admin only)."""
     try:
         await require_csrf(request)
     except HTTPException:
@@ -665,31 +544,14 @@ async def delete_server_data(request: Request, _=Depends(require_admin)):
     
     from ..utils import get_redis_client
     r = await get_redis_client()
-    
-    
-    patterns = [
-        f"stats:*:{guild_id}*",
-        f"hll:*:{guild_id}*",
-        f"events:*:{guild_id}*",
-        f"backfill:*:{guild_id}*",
-        f"user:*:{guild_id}*",
-        f"daily:*:{guild_id}*",
-    ]
-    
-    deleted_count = 0
-    for pattern in patterns:
-        keys = []
-        async for key in r.scan_iter(pattern):
-            keys.append(key)
-        if keys:
-            deleted_count += await r.delete(*keys)
-    
-    
-    await r.srem("bot:guilds", guild_id)
-    
+
+    # The keyspace scan runs in the web job worker, not in the request
+    job, created = await enqueue(r, "delete_guild_data", guild_id)
     return JSONResponse({
-        "status": "ok", 
-        "message": f"Smazáno {deleted_count} klíčů pro server {guild_id}"
+        "status": "ok",
+        "message": f"Mazání dat serveru {guild_id} bylo naplánováno" if created else "Mazání dat už probíhá",
+        "created": created,
+        "job": job,
     })
 
 
@@ -784,25 +646,26 @@ async def get_analytics_tools(request: Request, start_date: Optional[str] = None
     except Exception as e:
         print(f"Error in analytics-tools initial check: {e}")
 
-    from ..utils import get_trend_analysis, get_engagement_score, get_insights
-    from ..services.analytics_service import DefaultAnalyticsService
-    from ..repositories.redis_repo import RedisRepository
+    from ..utils import get_engagement_score, get_insights, get_snapshot
     
     try:
-        trends = await get_trend_analysis(guild_id)
-        engagement = await get_engagement_score(guild_id, start_date=start_date, end_date=end_date)
+        trends_snap = await get_snapshot(guild_id, "trends")
+        # Custom periods are computed live, the default view comes from the snapshot
+        if start_date or end_date:
+            engagement = await get_engagement_score(guild_id, start_date=start_date, end_date=end_date)
+        else:
+            engagement = (await get_snapshot(guild_id, "engagement"))["data"]
         insights = await get_insights(guild_id)
         
-        repo = RedisRepository()
-        service = DefaultAnalyticsService(repo)
-        dqs = await service.get_data_quality_score(int(guild_id)) if str(guild_id).isdigit() else None
+        dqs = (await get_snapshot(int(guild_id), "dqs"))["data"] if str(guild_id).isdigit() else None
         
         return JSONResponse({
             "status": "ok",
-            "trends": trends,
+            "trends": trends_snap["data"],
             "engagement": engagement,
             "insights": insights,
-            "dqs": dqs
+            "dqs": dqs,
+            "computed_at": trends_snap["computed_at"]
         })
     except Exception as e:
          return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
@@ -927,13 +790,10 @@ async def export_data(
             voice_lb = await r.zrevrange(f"stats:voice_duration:{guild_id}", 0, -1, withscores=True)
             
             
-            pipe = r.pipeline()
-            for uid, _ in voice_lb:
-                pipe.hget(f"user:info:{uid}", "name")
-            names = await pipe.execute()
+            infos = await entity_cache(r).get_many("user", [uid for uid, _ in voice_lb])
             
-            for i, (uid, dur) in enumerate(voice_lb):
-                name = names[i] or f"User {uid}"
+            for uid, dur in voice_lb:
+                name = infos[str(uid)].get("name") or f"User {uid}"
                 dur = int(dur)
                 hours = dur // 3600
                 minutes = (dur % 3600) // 60
@@ -963,14 +823,10 @@ async def export_data(
             
             channels = await get_channel_distribution(guild_id, start_date=start_date, end_date=end_date)
             
-            pipe = r.pipeline()
-            cids = [c["channel_id"] for c in channels]
-            for cid in cids:
-                pipe.hget(f"channel:info:{cid}", "name")
-            names = await pipe.execute()
+            infos = await entity_cache(r).get_many("channel", [c["channel_id"] for c in channels])
             
-            for i, c in enumerate(channels):
-                name = names[i] or f"Channel {c['channel_id']}"
+            for c in channels:
+                name = infos[str(c["channel_id"])].get("name") or f"Channel {c['channel_id']}"
                 data_rows.append([c["channel_id"], name, c["count"]])
         
         elif export_type == "activity":
@@ -1008,13 +864,10 @@ async def export_data(
             lb_data = await get_leaderboard_data(guild_id, limit=limit, start_date=start_date, end_date=end_date)
             active_users = lb_data.get("leaderboard", [])
             
-            pipe = r.pipeline()
-            for u in active_users:
-                pipe.hgetall(f"user:info:{u['user_id']}")
-            infos = await pipe.execute()
+            infos = await entity_cache(r).get_many("user", [u["user_id"] for u in active_users])
             
-            for i, u in enumerate(active_users):
-                info = infos[i] or {}
+            for u in active_users:
+                info = infos[str(u["user_id"])]
                 joined = info.get("joined_at", "")
                 roles = info.get("roles", "") 
                 data_rows.append([u["user_id"], u["name"], u["total_messages"], joined, roles])
@@ -1248,9 +1101,9 @@ async def api_security_score(request: Request, _=Depends(require_auth)):
                 "insights": [i["text"] for i in s["insights"]]
             })
 
-        print(f"[DEBUG] Calculating score for guild {guild_id}")
-        score_data = await get_security_score(guild_id)
-        print(f"[DEBUG] Score result: {score_data}")
+        snapshot = await get_snapshot(guild_id, "security")
+        score_data = dict(snapshot["data"] or {})
+        score_data["computed_at"] = snapshot["computed_at"]
         return JSONResponse(score_data)
     except HTTPException as he:
         print(f"[ERROR] Security Score HTTP Error: {he.detail}")
@@ -1337,6 +1190,70 @@ async def api_channel_distribution(request: Request, start_date=None, end_date=N
     return await get_channel_stats(request, start_date, end_date, role_id)
 
 
+@router.get("/api/top-entities")
+async def api_top_entities(request: Request, window: str = "day", limit: int = 10):
+    """Approximate top users and channels of the last hour/day/week (Space-Saving summaries)."""
+    gid = get_guild_id(request)
+    if gid == "demo-guild":
+        return {
+            "window": window,
+            "users": [{"id": "demo-1", "name": "Demo User 1", "count": 240, "error": 0}],
+            "channels": [{"id": "1", "name": "obecné", "count": 1450, "error": 0}],
+        }
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(WINDOWS)}")
+    r = await get_redis_client()
+    limit = max(1, min(limit, 32))
+    users = await top_k(r, gid, "users", window, n=limit)
+    channels = await top_k(r, gid, "channels", window, n=limit)
+    cache = entity_cache(r)
+    user_infos = await cache.get_many("user", [u["id"] for u in users])
+    channel_infos = await cache.get_many("channel", [c["id"] for c in channels])
+    for u in users:
+        u["name"] = user_infos[u["id"]].get("name") or f"User {u['id']}"
+    for c in channels:
+        c["name"] = channel_infos[c["id"]].get("name") or f"#{c['id']}"
+    return {"window": window, "users": users, "channels": channels}
+
+
+@router.get("/api/markov-forecast")
+async def api_markov_forecast(request: Request, window: int = 30, horizons: int = 30, segment: Optional[List[str]] = Query(None)):
+    """State forecasts for 1..horizons days per segment from the stored daily transition counts."""
+    gid = get_guild_id(request)
+    window = max(1, min(window, 120))
+    horizons = max(1, min(horizons, 90))
+    if gid == "demo-guild":
+        matrix = [[0.0, 0.6, 0.3, 0.1], [0.0, 0.8, 0.15, 0.05], [0.0, 0.2, 0.6, 0.2], [0.0, 0.05, 0.05, 0.9]]
+        forecast = forecast_horizons([matrix], [[0.05, 0.45, 0.3, 0.2]], horizons)[0]
+        return {"window": window, "horizons": horizons, "states": [s.name.lower() for s in UserState],
+                "segments": {SEGMENT_ALL: {"transitions": 4200, "days": window, "current": [35, 315, 210, 140],
+                                           "matrix": matrix, "forecast": forecast.tolist()}}}
+    r = await get_redis_client()
+    segments = await load_forecasts(r, gid, segment, window=window, horizons=horizons)
+    return {"window": window, "horizons": horizons, "states": [s.name.lower() for s in UserState],
+            "segments": segments}
+
+
+@router.get("/api/retention-cohorts")
+async def api_retention_cohorts(request: Request, weeks: int = DEFAULT_WEEKS):
+    """Exact DAU/WAU/MAU and the weekly cohort retention matrix from the activity bitmaps."""
+    gid = get_guild_id(request)
+    weeks = max(1, min(weeks, MAX_WEEKS))
+    if gid == "demo-guild":
+        today = datetime.date.today()
+        cohorts = []
+        for w in range(weeks):
+            users = 40 + 5 * w
+            kept = [users] + [round(users * 0.55 * 0.85 ** (k - 1)) for k in range(1, weeks - w)]
+            cohorts.append({"week": (today - datetime.timedelta(days=7 * (weeks - w) - 1)).isoformat(),
+                            "users": users, "retained": kept,
+                            "retention_pct": [round(100 * n / users, 1) for n in kept]})
+        return {"active_users": {"dau": 120, "wau": 410, "mau": 980},
+                "weeks": [c["week"] for c in cohorts], "lookback_days": 28, "cohorts": cohorts}
+    r = await get_redis_client()
+    return {"active_users": await active_counts(r, gid), **await cohort_retention(r, gid, weeks)}
+
+
 @router.get("/api/health-research")
 async def api_health_research(request: Request):
     """API endpoint pro výzkumná data (Markov, Survival)."""
@@ -1374,4 +1291,18 @@ async def api_health_research(request: Request):
                 "inactive": 110
             }
         }
-    return await get_health_research_data(gid)
+    snapshot = await get_snapshot(gid, "health_research")
+    data = dict(snapshot["data"] or {})
+    data["computed_at"] = snapshot["computed_at"]
+    return data
+
+
+@router.post("/api/snapshots/refresh")
+async def api_refresh_snapshots(request: Request, _=Depends(require_auth)):
+    """Ruční přepočet snapshotů analytiky aktuálního serveru (proběhne na pozadí)."""
+    await require_csrf(request)
+    guild_id = get_guild_id(request)
+    if guild_id == "demo-guild":
+        return {"status": "ok"}
+    await request_snapshot_refresh(guild_id)
+    return {"status": "ok", "message": "Přepočet byl zařazen do fronty."}
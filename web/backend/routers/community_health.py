@@ -11,6 +11,7 @@ from pydantic import BaseModel, Field
 import time
 
 from shared.community_health import api_key_digest, generate_api_key, normalise_config
+from shared.entity_cache import entity_cache
 from shared.redis_client import get_redis_client
 from ..services.community_health_service import CommunityHealthService
 from ..utils import get_sidebar_context
@@ -275,8 +276,9 @@ async def api_v1_channels(days: int = 30, ctx: dict = Depends(api_key_context)):
     start = end - timedelta(days=max(1, min(days, 365)))
     rows = await get_channel_distribution(gid, start_date=start.strftime("%Y-%m-%d"), end_date=end.strftime("%Y-%m-%d"))
     r = await get_redis_client()
+    infos = await entity_cache(r).get_many("channel", [row.get("channel_id") for row in rows])
     for row in rows:
-        row["name"] = await r.hget(f"channel:info:{row.get('channel_id')}", "name") or f"Channel {row.get('channel_id')}"
+        row["name"] = infos[str(row.get("channel_id"))].get("name") or f"Channel {row.get('channel_id')}"
     return {"items": rows}
 
 
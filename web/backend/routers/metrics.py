@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from shared.config import settings
+from shared.metrics import collect, render
+from shared.redis_client import get_redis_client
+
+router = APIRouter(tags=["metrics"])
+
+LOOPBACK = {"127.0.0.1", "::1"}
+
+
+def is_local(request: Request) -> bool:
+    """Direct request from this host; a proxy on the same host forwards remote clients from loopback."""
+    if request.headers.get("x-forwarded-for") or request.headers.get("forwarded"):
+        return False
+    return request.client is not None and request.client.host in LOOPBACK
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics(request: Request, authorization: Optional[str] = Header(None)):
+    """Bot ingestion metrics (published to Redis by every bot process) in Prometheus text format.
+
+    Requires ``Authorization: Bearer METRICS_TOKEN``; without a configured token
+    only scrapes from localhost are served.
+    """
+    if settings.metrics_token:
+        expected = f"Bearer {settings.metrics_token}"
+        if not authorization or not secrets.compare_digest(authorization, expected):
+            raise HTTPException(401, "Invalid metrics token")
+    elif not is_local(request):
+        raise HTTPException(403, "Metrics are only served to localhost without METRICS_TOKEN")
+    r = await get_redis_client()
+    return PlainTextResponse(render(await collect(r)), media_type="text/plain; version=0.0.4")
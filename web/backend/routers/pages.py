@@ -16,6 +16,7 @@ def require_auth(request: Request):
 
 # ... missing imports (get_sidebar_context etc will be added later or imported from utils)
 from ..utils import *
+from shared.entity_cache import entity_cache
 import os
 from ..demo_data import get_demo_stats, get_demo_user_activity
 from collections import defaultdict
@@ -633,8 +634,9 @@ async def leaderboard_page(request: Request, _=Depends(require_auth)):
 
     import math
     current_rank = 1
+    user_infos = await entity_cache(r).get_many("user", [uid for uid, _ in top_users])
     for i, (uid, xp) in enumerate(top_users, 1):
-        user_info = await r.hgetall(f"user:info:{uid}") or {}
+        user_info = user_infos[str(uid)]
         xp = int(xp)
         
         
@@ -743,14 +745,15 @@ async def user_activity_page(request: Request, uid: str, start_date: str = None,
              return RedirectResponse(url="/select-server")
         
         
-        info = await r.hgetall(f"user:info:{uid}")
+        cache = entity_cache(r)
+        info = await cache.get("user", uid)
         if info:
             user_info["name"] = info.get("name", f"User {uid}")
             user_info["avatar"] = info.get("avatar", "")
             if "roles" in info and info["roles"]:
                 
                 role_ids = info["roles"].split(",")
-                all_roles = await r.hgetall(f"guild:roles:{gid}")
+                all_roles = await cache.get("roles", gid)
                 user_info["roles"] = [all_roles.get(rid, f"Role {rid}") for rid in role_ids if rid in all_roles]
 
         
@@ -950,17 +953,18 @@ async def _dashboard_logic(request: Request, start_date: str = None, end_date: s
              top_users = await r.zrevrange(xp_key, 0, 49, withscores=True) 
              
              leaderboard_data = []
+             u_infos = await entity_cache(r).get_many("user", [uid_str for uid_str, _ in top_users])
+             xp_conf = await r.hgetall("config:xp_formula")
              for i, (uid_str, xp_score) in enumerate(top_users, 1):
                  uid = str(uid_str)
                  xp = int(float(xp_score))
                  
-                 u_info = await r.hgetall(f"user:info:{uid}") or {}
+                 u_info = u_infos[uid]
                  username = u_info.get("username") or u_info.get("name") or f"Uživatel {uid[:5]}..."
                  avatar = u_info.get("avatar")
                  
                  # Výpočet levelu na základě XP
                  
-                 xp_conf = await r.hgetall("config:xp_formula")
                  a = int(xp_conf.get("a", 50))
                  b = int(xp_conf.get("b", 200)) 
                  c_const = int(xp_conf.get("c", 100))
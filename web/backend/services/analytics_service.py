@@ -1,8 +1,24 @@
 from typing import Dict, Any, List
+from collections import defaultdict
 from datetime import datetime, timedelta
 import redis.asyncio as redis
 import numpy as np
 
+from shared.event_index import event_keys, event_members
+from shared.event_codec import decode_event
+from shared.rollups import read_rollups, sum_rollups
+from shared.hll_pyramid import range_uniques
+from shared.daily_series import read_series
+from shared.forecasting import backtest, forecast
+from shared.aggregation import aggregate, UserTimestamps
+from shared.activity_bitmap import active_counts, day_range, retained
+from shared.activity_matrix import PASSIVE_MAX_GAP, ActivityMatrix, state_distribution, transition_counts
+from shared.markov_forecast import (SEGMENT_ALL, daily_counts, daily_distribution, day_labels,
+                                    forecast_horizons, record as record_markov)
+from shared.batch_reader import first_scores, zcards
+from shared.entity_cache import entity_cache
+from shared.result_cache import cached_result
+
 # Imports from data layer
 # Removed direct repo import
 # 
@@ -12,6 +28,33 @@ import numpy as np
 from .base import BaseAnalyticsService
 from ..repositories.base import BaseRepository
 
+# Smaller join-month cohorts give curves too noisy to show
+SURVIVAL_COHORT_MIN_USERS = 10
+# Role segments of the Markov forecast: the largest roles with enough members
+MARKOV_ROLE_SEGMENTS = 10
+MARKOV_SEGMENT_MIN_USERS = 20
+# Days ahead of the DAU projection in the trend analysis
+TREND_HORIZON = 7
+
+
+def markov_segments(guild_id, uids, first_seen, user_infos) -> Dict[str, np.ndarray]:
+    """Rows of the activity matrix per forecast segment: all, join month cohorts and the largest roles."""
+    segments = {SEGMENT_ALL: np.arange(len(uids))}
+    cohorts, roles = defaultdict(list), defaultdict(list)
+    for row, uid in enumerate(uids):
+        cohorts[datetime.fromtimestamp(first_seen[uid]).strftime("%Y-%m")].append(row)
+        for rid in (user_infos[str(uid)].get("roles") or "").split(","):
+            # The @everyone role has the guild's ID
+            if rid and rid != str(guild_id):
+                roles[rid].append(row)
+    for month, rows in cohorts.items():
+        segments[f"cohort:{month}"] = np.array(rows)
+    largest = sorted(roles.items(), key=lambda kv: len(kv[1]), reverse=True)[:MARKOV_ROLE_SEGMENTS]
+    for rid, rows in largest:
+        if len(rows) >= MARKOV_SEGMENT_MIN_USERS:
+            segments[f"role:{rid}"] = np.array(rows)
+    return segments
+
 class DefaultAnalyticsService(BaseAnalyticsService):
     def __init__(self, repo: BaseRepository):
         self.repo = repo
@@ -61,7 +104,10 @@ class DefaultAnalyticsService(BaseAnalyticsService):
             
             avg_dau = sum(dau_30d_vals) / len(dau_30d_vals)
             
-            trend_projection = int(avg_dau * (1 + (growth_30d / 100)))
+            # DAU in TREND_HORIZON days; validated when the history allows a backtest of the method
+            fc = forecast(dau_30d_vals, TREND_HORIZON)
+            check = backtest(dau_30d_vals, TREND_HORIZON, folds=2, methods=(fc.method,))[fc.method]
+            trend_projection = int(round(float(fc.mean[0, -1])))
             
             return {
                 "available": True,
@@ -71,8 +117,11 @@ class DefaultAnalyticsService(BaseAnalyticsService):
                 "avg_dau": int(avg_dau),
                 "trend_projection": trend_projection,
                 "prediction": trend_projection,
-                "projection_method": "simple_extrapolation",
-                "validated_prediction": False
+                "prediction_interval": [int(round(float(fc.lower[0, -1]))), int(round(float(fc.upper[0, -1])))],
+                "projection_horizon_days": TREND_HORIZON,
+                "projection_method": fc.method,
+                "validated_prediction": check["folds"] > 0,
+                "backtest_smape": round(float(check["smape"][0]), 1) if check["folds"] else None
             }
         except Exception as e:
             print(f"Trend error: {e}")
@@ -89,6 +138,7 @@ class DefaultAnalyticsService(BaseAnalyticsService):
             pass
 
 
+    @cached_result("engagement", max_age=300)
     async def get_engagement_score(self, guild_id: int, start_date: str = None, end_date: str = None) -> Dict[str, Any]:
         """
         Calculate Engagement Score using formula:
@@ -161,23 +211,11 @@ class DefaultAnalyticsService(BaseAnalyticsService):
                 }
             
             # 2. Messages (M) & 3. Reactions (R)
-            total_msgs = 0
-            total_reactions = 0
-            has_message_data = False
-            has_reaction_data = False
-            
-            async for key in r.scan_iter(f"events:msg:{guild_id}:*"):
-                events = await r.zrangebyscore(key, ts_start, ts_end)
-                for evt_json in events:
-                    has_message_data = True
-                    try:
-                        data = json.loads(evt_json)
-                        total_msgs += 1
-                        reactions = int(data.get("reaction_count", 0))
-                        if reactions > 0 or "reaction_count" in data:
-                            has_reaction_data = True
-                        total_reactions += reactions
-                    except: pass
+            rollup = sum_rollups(await read_rollups(r, guild_id, start_dt, end_dt))
+            total_msgs = rollup["msgs"]
+            total_reactions = rollup["reactions"]
+            has_message_data = total_msgs > 0
+            has_reaction_data = rollup["reaction_msgs"] > 0
             
             if has_message_data:
                 val_m = total_msgs / max(1, avg_dau * days_diff) # Msgs per DAU
@@ -214,17 +252,8 @@ class DefaultAnalyticsService(BaseAnalyticsService):
                 }
             
             # 4. Voice (V)
-            total_voice_seconds = 0
-            has_voice_data = False
-            
-            async for key in r.scan_iter(f"events:voice:{guild_id}:*"):
-                has_voice_data = True
-                events = await r.zrangebyscore(key, ts_start, ts_end)
-                for evt_json in events:
-                    try:
-                        data = json.loads(evt_json)
-                        total_voice_seconds += data.get("duration", 0)
-                    except: pass
+            total_voice_seconds = rollup["voice_seconds"]
+            has_voice_data = bool(await event_members(r, guild_id, "voice"))
             
             if has_voice_data:
                 val_v = (total_voice_seconds / days_diff / 3600) / max(1, avg_dau) # Hours per DAU
@@ -274,6 +303,7 @@ class DefaultAnalyticsService(BaseAnalyticsService):
             pass
 
 
+    @cached_result("security", max_age=300)
     async def get_security_score(self, guild_id: int, days: int = 7) -> Dict[str, Any]:
         """
         Calculate security score based on multiple factors:
@@ -350,10 +380,7 @@ class DefaultAnalyticsService(BaseAnalyticsService):
             now = datetime.now()
             start_ts = (now - timedelta(days=days)).timestamp()
             
-            dau_sum = 0
-            for i in range(days):
-                d_str = (now - timedelta(days=i)).strftime("%Y%m%d")
-                dau_sum += await r.pfcount(f"hll:dau:{guild_id}:{d_str}")
+            dau_sum = sum(await read_series(r, guild_id, [(now - timedelta(days=i)).date() for i in range(days)], "dau"))
             avg_dau = dau_sum / days
             
             if total_members is not None and total_members > 0:
@@ -378,11 +405,10 @@ class DefaultAnalyticsService(BaseAnalyticsService):
                 reply_score = None
             
             total_voice_seconds = 0
-            async for key in r.scan_iter(f"events:voice:{guild_id}:*"):
-                events = await r.zrangebyscore(key, start_ts, "+inf")
+            async for _key, events in self.repo.iter_ranges(await event_keys(r, guild_id, "voice"), start_ts, "+inf"):
                 for evt_json in events:
                     try:
-                        data = json.loads(evt_json)
+                        data = decode_event(evt_json)
                         total_voice_seconds += data.get("duration", 0)
                     except: pass
                     
@@ -411,12 +437,9 @@ class DefaultAnalyticsService(BaseAnalyticsService):
             else:
                 engagement_score = None
             
-            mod_actions_count = 0
-            mod_keys_found = False
-            async for key in r.scan_iter(f"events:action:{guild_id}:*"):
-                mod_keys_found = True
-                mod_actions_count += await r.zcard(key)
-            mod_actions = mod_actions_count if mod_keys_found else None
+            action_cards = await zcards(r, await event_keys(r, guild_id, "action"),
+                                        self.repo.range_chunk_size, self.repo.range_concurrency)
+            mod_actions = sum(action_cards.values()) if action_cards else None
             
             if mod_actions is not None and total_members is not None and total_members > 0:
                 actions_per_100_users = (mod_actions / total_members) * 100
@@ -469,8 +492,7 @@ class DefaultAnalyticsService(BaseAnalyticsService):
             net_growth = month_joins - month_leaves
             growth_rate = (net_growth / max(1, total_members)) * 100 if total_members else 0
             
-            mau_keys = [f"hll:dau:{guild_id}:{(now - timedelta(days=j)).strftime('%Y%m%d')}" for j in range(30)]
-            mau = await r.pfcount(*mau_keys)
+            mau = await range_uniques(r, guild_id, (now - timedelta(days=29)).date(), now.date())
             stickiness = (avg_dau / max(1, mau)) * 100 if mau > 0 else 0
             
             avg_msg_length = 0
@@ -638,6 +660,7 @@ class DefaultAnalyticsService(BaseAnalyticsService):
         return insights
 
 
+    @cached_result("data_quality", max_age=900)
     async def get_data_quality_score(self, guild_id: int) -> Dict[str, Any]:
         """
         Evaluate Data Quality Score (DQS) based on history length, number of events,
@@ -654,13 +677,12 @@ class DefaultAnalyticsService(BaseAnalyticsService):
             first_seen = now.timestamp()
             total_msgs = 0
             
-            async for key in r.scan_iter(f"events:msg:{guild_id}:*"):
-                msgs = await r.zrange(key, 0, 0, withscores=True)
-                if msgs:
-                    ts = float(msgs[0][1])
-                    if ts < first_seen:
-                        first_seen = ts
-                total_msgs += await r.zcard(key)
+            msg_keys = await event_keys(r, guild_id, "msg")
+            chunk, concurrency = self.repo.range_chunk_size, self.repo.range_concurrency
+            for ts in (await first_scores(r, msg_keys, chunk, concurrency)).values():
+                if ts is not None and ts < first_seen:
+                    first_seen = ts
+            total_msgs = sum((await zcards(r, msg_keys, chunk, concurrency)).values())
                 
             history_days = (now.timestamp() - first_seen) / 86400.0
             
@@ -678,7 +700,7 @@ class DefaultAnalyticsService(BaseAnalyticsService):
                 
             # 3. Required event types (moderation)
             mod_keys_found = False
-            async for key in r.scan_iter(f"events:action:{guild_id}:*"):
+            for key in await event_keys(r, guild_id, "action"):
                 mod_keys_found = True
                 break
             
@@ -687,11 +709,8 @@ class DefaultAnalyticsService(BaseAnalyticsService):
                 reasons.append("Moderační data nejsou dostupná.")
                 
             # 4. Voice events
-            has_voice = False
-            async for key in r.scan_iter(f"events:voice:{guild_id}:*"):
-                if await r.zcard(key) > 0:
-                    has_voice = True
-                    break
+            voice_cards = await zcards(r, await event_keys(r, guild_id, "voice"), chunk, concurrency)
+            has_voice = any(n > 0 for n in voice_cards.values())
             if not has_voice:
                 score -= 10
                 reasons.append("Chybí události z hlasových kanálů.")
@@ -760,9 +779,10 @@ class DefaultAnalyticsService(BaseAnalyticsService):
         return defaults
 
 
+    @cached_result("health_research", max_age=900)
     async def get_health_research_data(self, guild_id: int) -> dict:
         import numpy as np
-        from datetime import datetime, timedelta
+        from datetime import datetime, timedelta, timezone
         from shared.models import CommunityModels, UserState
         import json
         
@@ -775,35 +795,32 @@ class DefaultAnalyticsService(BaseAnalyticsService):
             # 1. Total Members & DAU
             total_members_str = await r.get(f"presence:total:{guild_id}")
             total_members = int(total_members_str) if total_members_str is not None else None
-            dau = await r.pfcount(f"hll:dau:{guild_id}:{today_str}")
+            # Exact counts from the activity bitmaps; the HLL until the bitmaps have data
+            active_users = None
+            weekly_retention = None
+            try:
+                active_users = await active_counts(r, guild_id)
+                utc_now = datetime.now(timezone.utc)
+                last_week, kept = await retained(r, guild_id, day_range(utc_now - timedelta(days=7), 7),
+                                                 day_range(utc_now, 7))
+                weekly_retention = kept / last_week if last_week else None
+            except Exception as e:
+                print(f"Reading activity bitmaps failed for guild {guild_id}: {e}")
+            if active_users and active_users["mau"]:
+                dau = active_users["dau"]
+            else:
+                dau = await r.pfcount(f"hll:dau:{guild_id}:{today_str}")
             activity_rate = (dau / total_members) if total_members is not None and total_members > 0 else None
             
             # Moderation Intervention Index (MII)
             weights = await self.get_mii_weights()
             weighted_mod_actions = 0
-            ts_30d_ago = (now - timedelta(days=30)).timestamp()
-            
-            async for key in r.scan_iter(f"events:action:{guild_id}:*"):
-                events = await r.zrangebyscore(key, ts_30d_ago, "+inf")
-                for evt_json in events:
-                    try:
-                        data = json.loads(evt_json)
-                        action_type = data.get("type") or data.get("action") or "unknown"
-                        if action_type in weights:
-                            weighted_mod_actions += weights[action_type]
-                        elif action_type.endswith("s") and action_type[:-1] in weights:
-                            weighted_mod_actions += weights[action_type[:-1]]
-                    except: pass
+            rollup = sum_rollups(await read_rollups(r, guild_id, now - timedelta(days=30), now))
+            for metric, count in rollup.items():
+                if metric.startswith("action:") and metric[7:] in weights:
+                    weighted_mod_actions += weights[metric[7:]] * count
                     
-            total_interactions_30d = 0
-            async for key in r.scan_iter(f"events:msg:{guild_id}:*"):
-                msgs = await r.zrangebyscore(key, ts_30d_ago, "+inf")
-                total_interactions_30d += len(msgs)
-                for m_json in msgs:
-                    try:
-                        m_data = json.loads(m_json)
-                        total_interactions_30d += int(m_data.get("reaction_count", 0))
-                    except: pass
+            total_interactions_30d = rollup["msgs"] + rollup["reactions"]
             
             if total_interactions_30d > 0:
                 mii = weighted_mod_actions / total_interactions_30d
@@ -811,74 +828,41 @@ class DefaultAnalyticsService(BaseAnalyticsService):
                 mii = None
             
             # 2. Extract User Timelines for ML Models
-            user_activity = {} # uid -> list of active days (0 to 29, where 29 is today)
-            user_first_observed_activity = {}
-            user_last_seen = {}
-            
-            ts_30d_ago = (now - timedelta(days=30)).timestamp()
-            
-            async for key in r.scan_iter(f"events:msg:{guild_id}:*"):
-                uid = key.split(":")[-1]
-                first_msg = await r.zrange(key, 0, 0, withscores=True)
-                if first_msg:
-                    user_first_observed_activity[uid] = float(first_msg[0][1])
-                else:
-                    continue
-                    
-                msgs = await r.zrangebyscore(key, ts_30d_ago, "+inf", withscores=True)
-                if not msgs: continue
-                
-                last_ts = float(msgs[-1][1])
-                user_last_seen[uid] = last_ts
-                
-                # Map activity to last 30 days
-                active_days = set()
-                for msg_json, score in msgs:
-                    ts = float(score)
-                    if ts >= ts_30d_ago:
-                        days_ago = (now - datetime.fromtimestamp(ts)).days
-                        day_idx = 29 - days_ago
-                        if 0 <= day_idx <= 29:
-                            active_days.add(day_idx)
-                user_activity[uid] = active_days
+            # Single pass: full message history per user serves Markov and survival
+            timeline_acc = UserTimestamps(("msg",))
+            await aggregate(r, guild_id, [timeline_acc],
+                            chunk_size=self.repo.range_chunk_size, concurrency=self.repo.range_concurrency)
+            user_timestamps = timeline_acc.result()
+
+            # Users x last 30 days (column 29 is today), only users active in that window
+            activity = ActivityMatrix.from_timestamps(user_timestamps, end_ts=ts_now, days=30)
 
             # 3. Build Markov Transitions (4 states)
-            transitions = []
-            current_distribution = [0, 0, 0, 0] # New, Active, Passive, Inactive
-            
             basis_member_join = 0
             basis_first_observed = 0
-            
-            for uid, active_days in user_activity.items():
-                prev_state = None
-                
-                join_ts_str = await r.hget(f"user:info:{uid}", "joined_at")
+            first_seen = {}
+            user_infos = await entity_cache(r).get_many("user", activity.uids)
+            for uid in activity.uids:
+                join_ts_str = user_infos[str(uid)].get("joined_at")
                 if join_ts_str:
-                    first_observed_ts = float(join_ts_str)
+                    first_seen[uid] = float(join_ts_str)
                     basis_member_join += 1
                 else:
-                    first_observed_ts = user_first_observed_activity.get(uid, ts_30d_ago)
+                    first_seen[uid] = user_timestamps[uid][0]
                     basis_first_observed += 1
 
-                first_observed_date = datetime.fromtimestamp(first_observed_ts)
-                first_observed_day_idx = 29 - (now - first_observed_date).days
-                
-                for day_idx in range(max(0, first_observed_day_idx), 30):
-                    last_active_before_or_on = [d for d in active_days if d <= day_idx]
-                    days_since = day_idx - last_active_before_or_on[-1] if last_active_before_or_on else (day_idx - first_observed_day_idx)
-                    
-                    state = UserState.INACTIVE
-                    if days_since == 0 and day_idx == first_observed_day_idx: state = UserState.NEW
-                    elif days_since <= 2: state = UserState.ACTIVE
-                    elif days_since <= 7: state = UserState.PASSIVE
-                    else: state = UserState.INACTIVE
-                    
-                    if prev_state is not None:
-                        transitions.append((prev_state.value, state.value))
-                    prev_state = state
-                    
-                    if day_idx == 29: # Today
-                        current_distribution[state.value] += 1
+            states = activity.states(activity.start_index(first_seen))
+            transition_matrix_counts = transition_counts(states)
+            current_distribution = state_distribution(states)
+
+            # Daily counts per segment feed the stored forecasts (/api/markov-forecast)
+            try:
+                segments = markov_segments(guild_id, activity.uids, first_seen, user_infos)
+                await record_markov(r, guild_id, day_labels(now, activity.days),
+                                    daily_counts(states, segments), daily_distribution(states, segments),
+                                    first=PASSIVE_MAX_GAP + 1)
+            except Exception as e:
+                print(f"Storing Markov counts failed for guild {guild_id}: {e}")
                         
             # 4. Markov Prediction
             p_stay_active = None
@@ -894,12 +878,12 @@ class DefaultAnalyticsService(BaseAnalyticsService):
             else:
                 global_new_state_basis = "first_observed_activity"
 
-            if len(transitions) >= 5:
-                matrix = CommunityModels.calculate_markov_matrix(transitions, num_states=4)
+            if transition_matrix_counts.sum() >= 5:
+                matrix = CommunityModels.normalize_transitions(transition_matrix_counts)
                 total_users = sum(current_distribution)
                 if total_users > 0:
                     current_vec = np.array(current_distribution) / total_users
-                    future_vec = CommunityModels.predict_future_states(current_vec, matrix, steps=7)
+                    future_vec = forecast_horizons(matrix[None], current_vec[None], 7)[0, -1]
                     if np.isclose(future_vec.sum(), 1.0):
                         p_stay_active = future_vec[UserState.ACTIVE.value] + future_vec[UserState.PASSIVE.value]
                         p_inactive = future_vec[UserState.INACTIVE.value]
@@ -919,14 +903,12 @@ class DefaultAnalyticsService(BaseAnalyticsService):
             ACTIVITY_INACTIVITY_THRESHOLD_SECONDS = ACTIVITY_INACTIVITY_THRESHOLD_DAYS * 86400
             durations = []
             event_observed = []
+            join_months = []
             global_first_seen = ts_now
             
-            async for key in r.scan_iter(f"events:msg:{guild_id}:*"):
-                msgs = await r.zrange(key, 0, -1, withscores=True)
-                if not msgs: continue
-                
-                timestamps = [float(score) for _, score in msgs]
+            for timestamps in user_timestamps.values():
                 observation_start = timestamps[0]
+                join_months.append(datetime.fromtimestamp(observation_start).strftime("%Y-%m"))
                 if observation_start < global_first_seen:
                     global_first_seen = observation_start
                 
@@ -958,10 +940,24 @@ class DefaultAnalyticsService(BaseAnalyticsService):
             life_exp = 0.0
             median_survival = None
             curve = {}
+            curve_ci = None
+            cohorts = {}
             if history_days >= 30 and durations:
-                curve = CommunityModels.calculate_survival_rate(durations, event_observed)
+                km = CommunityModels.kaplan_meier(durations, event_observed)
+                curve = CommunityModels.curve_by_day(km)
+                curve_ci = {"lower": CommunityModels.curve_by_day(km, "lower"),
+                            "upper": CommunityModels.curve_by_day(km, "upper"), "level": 0.95}
                 life_exp = CommunityModels.estimate_life_expectancy(curve)
                 median_survival = CommunityModels.estimate_median_survival(curve)
+                # Join-month cohorts, all from one sort
+                for month, cohort_km in CommunityModels.kaplan_meier_cohorts(durations, event_observed, join_months).items():
+                    size = int(cohort_km["at_risk"][0])
+                    if size < SURVIVAL_COHORT_MIN_USERS:
+                        continue
+                    cohort_curve = CommunityModels.curve_by_day(cohort_km)
+                    cohorts[month] = {"users": size,
+                                      "median_days": CommunityModels.estimate_median_survival(cohort_curve),
+                                      "curve": cohort_curve}
             elif durations:
                 curve = {}
                 life_exp = None
@@ -989,6 +985,8 @@ class DefaultAnalyticsService(BaseAnalyticsService):
                 "mii_weighted_actions": weighted_mod_actions,
                 "mii_interactions": total_interactions_30d,
                 "retention_pct": round(p_stay_active * 100, 1) if p_stay_active is not None else None,
+                "active_users": active_users,
+                "weekly_retention_pct": round(weekly_retention * 100, 1) if weekly_retention is not None else None,
                 "inactivity_risk_pct": round(p_inactive * 100, 1) if p_inactive is not None else None,
                 "activity_survival_expectancy_days": round(life_exp, 1) if life_exp is not None else None,
                 "median_activity_survival_days": median_survival,
@@ -998,7 +996,9 @@ class DefaultAnalyticsService(BaseAnalyticsService):
                 "new_state_basis": global_new_state_basis,
                 "state_distribution": dist_dict,
                 "predicted_distribution": future_dist_api,
-                "survival_curve": curve
+                "survival_curve": curve,
+                "survival_curve_ci": curve_ci,
+                "survival_cohorts": cohorts
             }
         except Exception as e:
             print(f"Error computing health research data: {e}")
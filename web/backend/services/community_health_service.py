@@ -6,6 +6,7 @@ from collections import Counter, defaultdict
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 
+from shared.entity_cache import entity_cache
 from shared.community_health import conflict_severity, factual_role_evidence, normalise_config
 
 
@@ -31,21 +32,35 @@ class CommunityHealthService:
         cfg["support_channel_ids"] = sorted(await self.r.smembers(f"cfg:health:support_channels:{guild_id}"))
         return cfg
 
-    async def _user(self, uid: str | int | None) -> Dict[str, Any]:
+    @staticmethod
+    def _user_view(uid: str | int | None, info: Dict[str, str]) -> Dict[str, Any]:
         if not uid:
             return {"id": None, "name": "Neznámý uživatel", "avatar": None}
-        info = await self.r.hgetall(f"user:info:{uid}")
         return {
             "id": str(uid),
             "name": info.get("name") or info.get("username") or f"User {uid}",
             "avatar": info.get("avatar") or None,
         }
 
+    async def _users(self, uids) -> Dict[str, Dict[str, Any]]:
+        """Hydrate many users at once; keys are the ids as given (None stays None)."""
+        uids = list(uids)
+        infos = await entity_cache(self.r).get_many("user", [u for u in uids if u])
+        return {uid: self._user_view(uid, infos.get(str(uid), {}) if uid else {}) for uid in uids}
+
+    async def _user(self, uid: str | int | None) -> Dict[str, Any]:
+        return (await self._users([uid]))[uid]
+
+    async def _channel_names(self, channel_ids) -> Dict[Any, str]:
+        channel_ids = list(channel_ids)
+        infos = await entity_cache(self.r).get_many("channel", [c for c in channel_ids if c])
+        return {
+            cid: (infos.get(str(cid), {}).get("name") or f"Channel {cid}") if cid else "Neznámý kanál"
+            for cid in channel_ids
+        }
+
     async def _channel_name(self, channel_id: str | int | None) -> str:
-        if not channel_id:
-            return "Neznámý kanál"
-        name = await self.r.hget(f"channel:info:{channel_id}", "name")
-        return name or f"Channel {channel_id}"
+        return (await self._channel_names([channel_id]))[channel_id]
 
     async def conflict_summary(self, guild_id: int | str, days: int = 30, start_date: str = None, end_date: str = None, limit: int = 25) -> Dict[str, Any]:
         start_ts, end_ts = self._range(days, start_date, end_date)
@@ -72,10 +87,9 @@ class CommunityHealthService:
                 last_at = max(last_at, float(event.get("created_at") or 0))
             if not actions:
                 continue
-            target, moderator = await self._user(target_id), await self._user(moderator_id)
             rows.append({
-                "target": target,
-                "moderator": moderator,
+                "target": target_id,
+                "moderator": moderator_id,
                 "event_count": len(actions),
                 "actions": dict(Counter(actions)),
                 "severity": conflict_severity(actions),
@@ -85,6 +99,9 @@ class CommunityHealthService:
             })
         rows.sort(key=lambda row: (row["event_count"], row["last_event_at"]), reverse=True)
         repeated = sum(1 for row in rows if row["is_repeated"])
+        users = await self._users([row[f] for row in rows[:limit] for f in ("target", "moderator")])
+        for row in rows[:limit]:
+            row["target"], row["moderator"] = users[row["target"]], users[row["moderator"]]
         return {
             "period": {"start": start_ts, "end": end_ts},
             "pairs": rows[:limit],
@@ -115,12 +132,11 @@ class CommunityHealthService:
                 response_times.append(response_seconds)
             if overdue:
                 ignored_by_user[item.get("author_id", "unknown")] += 1
-            author = await self._user(item.get("author_id"))
             rows.append({
                 "message_id": mid,
-                "author": author,
+                "author": item.get("author_id"),
                 "channel_id": item.get("channel_id"),
-                "channel_name": await self._channel_name(item.get("channel_id")),
+                "channel_name": None,
                 "created_at": created,
                 "status": status,
                 "overdue": overdue,
@@ -129,9 +145,13 @@ class CommunityHealthService:
             })
         open_count = sum(1 for row in rows if row["status"] == "open")
         overdue_count = sum(1 for row in rows if row["overdue"])
-        repeat_users = []
-        for uid, count in ignored_by_user.most_common(10):
-            repeat_users.append({"user": await self._user(uid), "overdue_requests": count})
+        top_ignored = ignored_by_user.most_common(10)
+        users = await self._users([row["author"] for row in rows] + [uid for uid, _ in top_ignored])
+        channel_names = await self._channel_names([row["channel_id"] for row in rows])
+        for row in rows:
+            row["author"] = users[row["author"]]
+            row["channel_name"] = channel_names[row["channel_id"]]
+        repeat_users = [{"user": users[uid], "overdue_requests": count} for uid, count in top_ignored]
         return {
             "items": rows[:limit],
             "total": len(rows),
@@ -150,7 +170,7 @@ class CommunityHealthService:
             item = await self.r.hgetall(f"health:departure:{guild_id}:{departure_id}")
             if not item:
                 continue
-            user = await self._user(item.get("user_id"))
+            user = item.get("user_id")
             mod_events = int(item.get("recent_moderation_events") or 0)
             help_requests = int(item.get("recent_help_requests") or 0)
             rows.append({
@@ -163,6 +183,9 @@ class CommunityHealthService:
                 "has_preceding_negative_signal": bool(mod_events or help_requests),
                 "notice": "Systém zobrazuje pouze časovou posloupnost a neurčuje příčinu odchodu.",
             })
+        users = await self._users([row["user"] for row in rows])
+        for row in rows:
+            row["user"] = users[row["user"]]
         return {
             "items": rows,
             "total": len(rows),
@@ -178,7 +201,10 @@ class CommunityHealthService:
             count = int(await self.r.zcount(key, start_ts, end_ts))
             if count:
                 counts.append(count)
-                rows.append({"moderator": await self._user(uid), "actions": count})
+                rows.append({"moderator": uid, "actions": count})
+        users = await self._users([row["moderator"] for row in rows])
+        for row in rows:
+            row["moderator"] = users[row["moderator"]]
         avg = sum(counts) / len(counts) if counts else 0
         # Descriptive flag, not a performance judgement.
         threshold = max(5, avg * 1.75) if counts else 5
@@ -0,0 +1,70 @@
+"""
+Jobs executed by the web process (see ``shared/jobs.py``).
+
+Deleting a guild's data scans the whole keyspace, so the dashboard queues a
+``delete_guild_data`` job instead of running the scan inside the request. The
+worker is started with the app and runs one job per guild at a time.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict
+
+from shared.jobs import JobContext, JobWorker
+from shared.keys import K_EVENT_STREAMS, K_INGEST_WATERMARK
+from shared.result_cache import bump_watermark
+
+DELETE_BATCH = 500
+
+
+def guild_data_patterns(gid: Any) -> list:
+    return [
+        f"stats:*:{gid}*",
+        f"hll:*:{gid}*",
+        f"events:*:{gid}*",
+        f"backfill:*:{gid}*",
+        f"user:*:{gid}*",
+        f"daily:*:{gid}*",
+        f"bitmap:*:{gid}*",
+        f"stream:events:{gid}",
+        f"stream:applied:*:{gid}",
+        f"snapshot:{gid}:*",
+        f"snapshot:meta:{gid}",
+        f"topk:*:{gid}:*",
+        f"markov:counts:{gid}:*",
+        f"markov:segments:{gid}",
+        f"cache:result:*:{gid}:*",
+        f"retention:last:{gid}",
+    ]
+
+
+async def delete_guild_data(ctx: JobContext) -> Dict[str, Any]:
+    r = ctx.r
+    # The watermark survives and is bumped below: a reset counter could match tokens of cached results
+    watermark = K_INGEST_WATERMARK(ctx.gid)
+    deleted = 0
+    for pattern in guild_data_patterns(ctx.gid):
+        batch = []
+        async for key in r.scan_iter(pattern, count=DELETE_BATCH):
+            if key == watermark:
+                continue
+            batch.append(key)
+            if len(batch) >= DELETE_BATCH:
+                deleted += await r.delete(*batch)
+                batch = []
+                await ctx.progress({"status": "running", "deleted": deleted, "pattern": pattern})
+        if batch:
+            deleted += await r.delete(*batch)
+        await ctx.progress({"status": "running", "deleted": deleted, "pattern": pattern})
+    await r.srem("bot:guilds", ctx.gid)
+    await r.srem(K_EVENT_STREAMS(), ctx.gid)
+    await bump_watermark(r, ctx.gid)
+    report = {"status": "done", "deleted": deleted}
+    await ctx.progress(report)
+    return report
+
+
+WEB_JOB_HANDLERS = {"delete_guild_data": delete_guild_data}
+
+
+def create_web_worker(r: Any) -> JobWorker:
+    return JobWorker(r, WEB_JOB_HANDLERS, concurrency=1, name="web")
@@ -0,0 +1,136 @@
+"""
+Background snapshots of the expensive per-guild analytics.
+
+Trend, engagement, security, DQS and health research models are recomputed by
+a scheduler (``scripts/snapshot_worker.py``) and stored as
+``snapshot:{gid}:{name}`` with their ``computed_at`` timestamp. Endpoints and
+the bot's /health command read the stored snapshot instead of running the
+models on every page load.
+
+Scheduling: ``snapshot:due`` holds the next due time per guild. Guilds whose
+ingest watermark moved since the previous run (new events arrived) are due
+again after ``active_interval``, quiet guilds after ``idle_interval``. A manual
+refresh moves the guild to the front of the queue.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from shared.keys import K_INGEST_WATERMARK, K_SNAPSHOT, K_SNAPSHOT_DUE, K_SNAPSHOT_META
+
+from .base import BaseAnalyticsService
+from ..repositories.base import BaseRepository
+
+SNAPSHOT_NAMES = ("trends", "engagement", "security", "dqs", "health_research")
+
+ACTIVE_INTERVAL = 5 * 60
+IDLE_INTERVAL = 60 * 60
+# Snapshots are kept well past the idle interval so a stalled worker degrades to stale data, not to live scans
+SNAPSHOT_TTL = 7 * 86400
+
+
+class SnapshotService:
+    def __init__(self, analytics: BaseAnalyticsService, repo: BaseRepository,
+                 active_interval: int = ACTIVE_INTERVAL, idle_interval: int = IDLE_INTERVAL):
+        self.analytics = analytics
+        self.repo = repo
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+
+    async def _compute_one(self, name: str, guild_id: int) -> Any:
+        if name == "trends":
+            return await self.analytics.get_trend_analysis(guild_id)
+        if name == "engagement":
+            return await self.analytics.get_engagement_score(guild_id)
+        if name == "security":
+            return await self.analytics.get_security_score(guild_id)
+        if name == "dqs":
+            return await self.analytics.get_data_quality_score(guild_id)
+        if name == "health_research":
+            return await self.analytics.get_health_research_data(guild_id)
+        raise ValueError(f"Unknown snapshot: {name}")
+
+    async def compute(self, guild_id: int, names: Iterable[str] = SNAPSHOT_NAMES) -> Dict[str, Any]:
+        """Recompute and store snapshots for one guild, then schedule its next run."""
+        r = await self.repo.get_client()
+        watermark = await r.get(K_INGEST_WATERMARK(guild_id)) or "0"
+        started = time.time()
+        results = {}
+        for name in names:
+            try:
+                data = await self._compute_one(name, guild_id)
+                payload = json.dumps({"computed_at": time.time(), "data": data}, default=float)
+                await r.set(K_SNAPSHOT(guild_id, name), payload, ex=SNAPSHOT_TTL)
+            except Exception as e:
+                print(f"Snapshot {name} failed for guild {guild_id}: {e}")
+                continue
+            results[name] = data
+
+        meta = await r.hgetall(K_SNAPSHOT_META(guild_id))
+        active = meta.get("watermark") != watermark
+        await r.hset(K_SNAPSHOT_META(guild_id), mapping={
+            "computed_at": started,
+            "watermark": watermark,
+            "duration": round(time.time() - started, 3),
+        })
+        interval = self.active_interval if active else self.idle_interval
+        await r.zadd(K_SNAPSHOT_DUE(), {str(guild_id): started + interval})
+        return results
+
+    async def get(self, guild_id: int, name: str) -> Optional[Dict[str, Any]]:
+        """Stored ``{"computed_at": ts, "data": ...}`` or None when not computed yet."""
+        r = await self.repo.get_client()
+        raw = await r.get(K_SNAPSHOT(guild_id, name))
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    async def get_or_compute(self, guild_id: int, name: str) -> Dict[str, Any]:
+        """Serve the snapshot; only a guild that has never been computed pays for a live run."""
+        snapshot = await self.get(guild_id, name)
+        if snapshot is not None:
+            return snapshot
+        data = (await self.compute(guild_id, [name])).get(name)
+        return {"computed_at": time.time(), "data": data}
+
+    async def request_refresh(self, guild_id: int) -> None:
+        """Manual refresh: make the guild due immediately."""
+        r = await self.repo.get_client()
+        await r.zadd(K_SNAPSHOT_DUE(), {str(guild_id): 0})
+
+    async def run_due(self, limit: int = 5) -> int:
+        """Compute the ``limit`` most overdue guilds; returns how many ran."""
+        r = await self.repo.get_client()
+        now = time.time()
+        # Newly joined guilds enter the queue as due now; existing entries are left alone
+        guilds = await r.smembers("bot:guilds")
+        if guilds:
+            await r.zadd(K_SNAPSHOT_DUE(), {gid: now for gid in guilds}, nx=True)
+
+        due = await r.zrangebyscore(K_SNAPSHOT_DUE(), "-inf", now, start=0, num=limit)
+        for gid in due:
+            if guilds and gid not in guilds:
+                await r.zrem(K_SNAPSHOT_DUE(), gid)
+                continue
+            try:
+                await self.compute(int(gid))
+            except Exception as e:
+                print(f"Snapshot run failed for guild {gid}: {e}")
+                await r.zadd(K_SNAPSHOT_DUE(), {gid: now + self.active_interval})
+        return len(due)
+
+    async def run_forever(self, poll_seconds: int = 30) -> None:
+        while True:
+            try:
+                ran = await self.run_due()
+            except Exception as e:
+                print(f"Snapshot scheduler error: {e}")
+                ran = 0
+            if not ran:
+                await asyncio.sleep(poll_seconds)
@@ -66,6 +66,15 @@ async def get_security_score(*args, **kwargs):
 async def get_trend_analysis(*args, **kwargs):
     return await AppContainer.analytics.get_trend_analysis(*args, **kwargs)
 
+
+async def get_snapshot(guild_id, name: str) -> dict:
+    """Precomputed analytics snapshot {"computed_at", "data"} (see SnapshotService)."""
+    return await AppContainer.snapshots.get_or_compute(guild_id, name)
+
+
+async def request_snapshot_refresh(guild_id) -> None:
+    await AppContainer.snapshots.request_refresh(guild_id)
+
 import json
 import os
 
@@ -84,6 +93,9 @@ sys.path.insert(0, str(ROOT))
 
 from shared.redis_client import get_redis
 from shared.config import settings
+from shared.event_codec import decode_event
+from shared.batch_reader import read_ranges
+from shared.entity_cache import entity_cache
 
 try:
     from config.dashboard_secrets import BOT_TOKEN
@@ -507,12 +519,17 @@ async def get_leaderboard_data(guild_id: int, limit: int = 15, start_date: str =
             top_users = await r.zrevrange(f"leaderboard:messages:{guild_id}", 0, limit - 1, withscores=True)
 
         leaderboard = []
-        for user_id_str, msg_count in top_users:
-            uid = int(float(user_id_str))
-            user_info = await r.hgetall(f"user:info:{uid}") or {}
+        uids = [int(float(user_id_str)) for user_id_str, _ in top_users]
+        user_infos = await entity_cache(r).get_many("user", uids)
+        async with r.pipeline(transaction=False) as pipe:
+            for uid in uids:
+                pipe.lrange(f"leaderboard:msg_lengths:{guild_id}:{uid}", 0, -1)
+            all_lengths = await pipe.execute()
+
+        for uid, (_, msg_count), lengths in zip(uids, top_users, all_lengths):
+            user_info = user_infos[str(uid)]
             name = user_info.get("name", f"User {uid}")
             
-            lengths = await r.lrange(f"leaderboard:msg_lengths:{guild_id}:{uid}", 0, -1)
             avg_len = sum(int(l) for l in lengths) / len(lengths) if lengths else 0
             
             leaderboard.append({
@@ -598,11 +615,12 @@ async def get_dashboard_team(guild_id: int) -> List[Dict[str, Any]]:
         
         user_ids = await r.smembers(f"dashboard:team:{guild_id}")
         team = []
+        user_infos = await entity_cache(r).get_many("user", user_ids)
         
         for uid in user_ids:
             perms = await r.smembers(f"dashboard:perms:{guild_id}:{uid}")
             
-            user_info = await r.hgetall(f"user:info:{uid}") or {}
+            user_info = user_infos[str(uid)]
             
             team.append({
                 "id": uid,
@@ -669,6 +687,7 @@ async def add_dashboard_user(guild_id: int, user_id: str, user_data: Dict[str, s
         
         if user_data:
              await r.hset(f"user:info:{user_id}", mapping=user_data)
+             entity_cache(r).invalidate("user", user_id)
              
         return True
     except Exception as e:
@@ -728,14 +747,18 @@ async def get_daily_stats(r: redis.Redis, gid: int, uid: int, day: datetime.date
     
     
     msg_key = f"events:msg:{gid}:{uid}"
-    messages = await r.zrangebyscore(msg_key, day_start, day_end, withscores=True)
+    voice_key = f"events:voice:{gid}:{uid}"
+    action_key = f"events:action:{gid}:{uid}"
+    # All three sorted sets in one round-trip
+    rows = await read_ranges(r, [msg_key, voice_key, action_key], day_start, day_end, withscores=True)
+    messages = rows[msg_key]
     
     last_msg_ts = 0
     raw_chat_time = 0
     SESSION_GAP = 300 
     
     for msg_json, score in messages:
-        msg_data = json.loads(msg_json)
+        msg_data = decode_event(msg_json)
         msg_ts = float(score)
         
         
@@ -754,19 +777,17 @@ async def get_daily_stats(r: redis.Redis, gid: int, uid: int, day: datetime.date
     stats["chat_time"] = raw_chat_time * weights.get("chat_time", 1)
     
     
-    voice_key = f"events:voice:{gid}:{uid}"
-    voice_sessions = await r.zrangebyscore(voice_key, day_start, day_end)
+    voice_sessions = rows[voice_key]
     
-    for vs_json in voice_sessions:
-        vs_data = json.loads(vs_json)
+    for vs_json, _ in voice_sessions:
+        vs_data = decode_event(vs_json)
         stats["voice_time"] += vs_data["duration"] * weights.get("voice_time", 1)
     
     
-    action_key = f"events:action:{gid}:{uid}"
-    actions = await r.zrangebyscore(action_key, day_start, day_end)
+    actions = rows[action_key]
     
-    for action_json in actions:
-        action_data = json.loads(action_json)
+    for action_json, _ in actions:
+        action_data = decode_event(action_json)
         action_type = action_data["type"]
         
         